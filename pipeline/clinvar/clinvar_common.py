@@ -104,7 +104,10 @@ def _preprocess_element_value(var_str):
     return re.sub(r'\s*\(p[^)]+\)', '', var_str)
 
 
-def _extract_genomic_coordinates_from_non_genomic_fields(meas_el, assemblies = [hgvs_utils.HgvsWrapper.GRCh38_Assem], hgvs_wrapper = hgvs_utils.HgvsWrapper.get_instance()):
+def _extract_genomic_coordinates_from_non_genomic_fields(meas_el, assemblies = [hgvs_utils.HgvsWrapper.GRCh38_Assem], hgvs_wrapper = None):
+    if hgvs_wrapper is None:
+        hgvs_wrapper = hgvs_utils.HgvsWrapper.get_instance()
+
     pref_el_lst = meas_el.findall('Name/ElementValue[@Type="Preferred"]')
 
     coords = {}
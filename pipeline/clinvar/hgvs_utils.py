@@ -9,8 +9,9 @@ import time
 
 # TODO: does not belong here. move to utilties or similar. but then need to change how luigi stuff is ran.
 class HGVSWrapper:
-    def __init__(self, hgvs_dp=hgvs.dataproviders.uta.connect(pooling=True)):
-        self.hgvs_dp = hgvs_dp
+    def __init__(self, hgvs_dp=None):
+        # connecting on instantiation rather than as default argument, i.e. on import
+        self.hgvs_dp = hgvs_dp if hgvs_dp is not None else hgvs.dataproviders.uta.connect(pooling=True)
         logging.info("Connecting to %s", self.hgvs_dp.url)
         self.hgvs_hp = hgvs.parser.Parser()
         self.hgvs_am = hgvs.assemblymapper.AssemblyMapper(self.hgvs_dp)
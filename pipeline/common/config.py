@@ -39,7 +39,7 @@ def get_genome_regions_symbol_dict(gene_config_df, start_col='start_hg38', end_c
     Used to return the gene symbol (e.g. BRCA1) of a given position.
 
     :param gene_config_df:
-    :return: dict[int, IntervalTree]
+    :return: dict[int, StaticIntervalIndex]
     '''
 
     def interval_tree_mapper(c, s, e):
@@ -64,3 +64,47 @@ def extract_gene_regions_dict(gene_config_df, start_col='start_hg38', end_col='e
             in
             gene_config_df.loc[:,
             ['chr', start_col, end_col, 'symbol']].values}
+
+
+def split_config(gene_config_df, shard_by='gene', start_col='start_hg38_legacy_variants', end_col='end_hg38_legacy_variants'):
+    '''
+    Splits gene metadata into shards of genes which can be processed independently, either one shard
+    per chromosome (shard_by='chr') or per gene (shard_by='gene'). Genes with overlapping regions
+    are kept in the same shard, such that every position belongs to at most one shard.
+
+    :param gene_config_df: gene metadata dataframe
+    :param shard_by: 'gene' or 'chr'
+    :return: dict[str, dataframe], shards ordered by chromosome and position
+    '''
+    if shard_by not in ('gene', 'chr'):
+        raise ValueError("Unknown shard type {}, expecting 'gene' or 'chr'".format(shard_by))
+
+    regions = sorted(extract_gene_regions_dict(gene_config_df, start_col, end_col).items(), key=lambda r: r[0])
+
+    groups = []  # list of [chr, end, symbols]
+    for region, payload in regions:
+        if shard_by == 'chr':
+            overlapping = groups and groups[-1][0] == region.chr
+        else:
+            overlapping = groups and groups[-1][0] == region.chr and region.start < groups[-1][1]
+
+        if overlapping:
+            groups[-1][1] = max(groups[-1][1], region.end)
+            groups[-1][2].append(payload['symbol'])
+        else:
+            groups.append([region.chr, region.end, [payload['symbol']]])
+
+    def shard_name(c, symbols):
+        return 'chr{}'.format(c) if shard_by == 'chr' else '_'.join(symbols)
+
+    return {shard_name(c, symbols): gene_config_df.loc[symbols] for c, _, symbols in groups}
+
+
+def save_config(gene_config_df, path):
+    '''
+    Writes gene metadata to a file which can be read with load_config
+
+    :param gene_config_df: gene metadata dataframe
+    :param path: config file path
+    '''
+    gene_config_df.to_csv(path, sep=',', index=False, na_rep='-')
@@ -0,0 +1,349 @@
+'''
+Local, in-process HGVS data provider.
+
+The transcripts, exon alignments and transcript/protein sequences relevant for the genes of a gene config
+are exported once from UTA into a compact file (see export_local_data or run this module as a script).
+LocalDataProvider serves the queries of the hgvs AssemblyMapper, VariantMapper and Normalizer from that file,
+such that no database connection is needed. Genomic sequences are fetched from seqrepo as before.
+'''
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+
+import hgvs
+import hgvs.dataproviders.uta
+from bioutils.assemblies import make_ac_name_map, make_name_ac_map
+from hgvs.dataproviders.interface import Interface
+from hgvs.dataproviders.seqfetcher import SeqFetcher
+from hgvs.exceptions import HGVSDataNotAvailableError, HGVSError
+
+from . import config
+
+FORMAT_VERSION = 1
+
+# assemblies and gene config columns of the regions to export alignments for
+ASSEMBLY_REGION_COLS = {'GRCh38.p11': ('start_hg38', 'end_hg38'),
+                        'GRCh37.p13': ('start_hg37', 'end_hg37')}
+
+
+# alignments overlapping a region. The UTA data provider only offers to query alignments containing a region
+OVERLAPPING_ALIGNMENTS_SQL = """
+    select tx_ac,alt_ac,alt_strand,alt_aln_method,min(start_i) as start_i,max(end_i) as end_i
+    from exon_set ES
+    join exon E on ES.exon_set_id=E.exon_set_id
+    where alt_ac=%s
+    group by tx_ac,alt_ac,alt_strand,alt_aln_method
+    having min(start_i) < %s and %s <= max(end_i)
+    order by tx_ac,alt_aln_method
+    """
+
+
+class Row(list):
+    '''
+    Database row accessible by column name and position, like the rows UTA returns
+    '''
+
+    def __init__(self, columns, values):
+        super().__init__(values)
+        self._columns = columns
+        self._index = {c: i for i, c in enumerate(columns)}
+
+    def __getitem__(self, item):
+        if isinstance(item, str):
+            return super().__getitem__(self._index[item])
+        return super().__getitem__(item)
+
+    def __contains__(self, column):
+        return column in self._index
+
+    def get(self, column, default=None):
+        return self[column] if column in self._index else default
+
+    def keys(self):
+        return list(self._columns)
+
+    def values(self):
+        return list(self)
+
+    def items(self):
+        return list(zip(self._columns, self))
+
+    def __reduce__(self):
+        return Row, (self._columns, list(self))
+
+
+def _table(rows):
+    '''
+    Compact representation of rows with identical columns: a list of column names and a list of values per row
+    '''
+    rows = list(rows)
+    if not rows:
+        return {'columns': [], 'rows': []}
+    columns = list(rows[0].keys())
+    return {'columns': columns, 'rows': [[r[c] for c in columns] for r in rows]}
+
+
+def _rows(table):
+    columns = table['columns']
+    return [Row(columns, values) for values in table['rows']]
+
+
+def _key(*parts):
+    return '|'.join(parts)
+
+
+def _seq_md5(seq):
+    return hashlib.md5(seq.encode('ascii')).hexdigest()
+
+
+class LocalDataProvider(Interface):
+    '''
+    HGVS data provider answering queries from a file written by export_local_data.
+
+    Queries for transcripts not contained in the file behave as if UTA didn't know them.
+    '''
+
+    required_version = "1.1"
+
+    def __init__(self, path):
+        '''
+        :param path: path of a file written by export_local_data
+        '''
+        self.url = "file://{}".format(path)
+
+        with open(path, 'rb') as f:
+            content = f.read()
+        data = json.loads(gzip.decompress(content))
+        self._digest = hashlib.sha256(content).hexdigest()
+
+        if data['format_version'] != FORMAT_VERSION:
+            raise ValueError("Unsupported format version {} of {}".format(data['format_version'], path))
+
+        self._data_version = data['data_version']
+        self._schema_version = data['schema_version']
+        self._gene_info = {g: Row(r['columns'], r['values']) for g, r in data['gene_info'].items()}
+        self._tx_for_gene = {g: _rows(t) for g, t in data['tx_for_gene'].items()}
+        self._tx_identity_info = {tx: Row(r['columns'], r['values']) for tx, r in data['tx_identity_info'].items()}
+        self._tx_info = {k: Row(r['columns'], r['values']) for k, r in data['tx_info'].items()}
+        self._tx_exons = {k: _rows(t) for k, t in data['tx_exons'].items()}
+        self._tx_mapping_options = {tx: _rows(t) for tx, t in data['tx_mapping_options'].items()}
+        self._similar_transcripts = {tx: _rows(t) for tx, t in data['similar_transcripts'].items()}
+        self._pro_ac = data['pro_ac']
+        self._alignments = {alt_ac: _rows(t) for alt_ac, t in data['alignments'].items()}
+        self._sequences = data['sequences']
+
+        self._protein_acs = {}
+        for ac in set(self._pro_ac.values()):
+            if ac in self._sequences:
+                self._protein_acs.setdefault(_seq_md5(self._sequences[ac]), []).append(ac)
+
+        self.seqfetcher = SeqFetcher()
+
+        super().__init__()
+
+    def __str__(self):
+        return "LocalDataProvider <data_version:{}; url={}>".format(self.data_version(), self.url)
+
+    def data_version(self):
+        '''
+        Version of the UTA data the file was exported from, marked as local data together with a digest of the file.
+        Exports of different genes or margins thus have different versions, which differ from UTA's own as well
+        '''
+        return "{}+local:{}".format(self._data_version, self._digest[:16])
+
+    def source_data_version(self):
+        '''
+        Version of the UTA data the file was exported from
+        '''
+        return self._data_version
+
+    def schema_version(self):
+        return self._schema_version
+
+    def get_seq(self, ac, start_i=None, end_i=None):
+        if ac in self._sequences:
+            return self._sequences[ac][start_i:end_i]
+        return self.seqfetcher.fetch_seq(ac, start_i, end_i)
+
+    def get_acs_for_protein_seq(self, seq):
+        md5 = _seq_md5(seq)
+        return sorted(self._protein_acs.get(md5, [])) + ["MD5_" + md5]
+
+    def get_assembly_map(self, assembly_name):
+        return make_ac_name_map(assembly_name)
+
+    def get_gene_info(self, gene):
+        return self._gene_info.get(gene)
+
+    def get_pro_ac_for_tx_ac(self, tx_ac):
+        return self._pro_ac.get(tx_ac)
+
+    def get_similar_transcripts(self, tx_ac):
+        return self._similar_transcripts.get(tx_ac, [])
+
+    def get_tx_exons(self, tx_ac, alt_ac, alt_aln_method):
+        rows = self._tx_exons.get(_key(tx_ac, alt_ac, alt_aln_method))
+        if not rows:
+            raise HGVSDataNotAvailableError(
+                "No tx_exons for (tx_ac={},alt_ac={},alt_aln_method={})".format(tx_ac, alt_ac, alt_aln_method))
+        return rows
+
+    def get_tx_for_gene(self, gene):
+        return self._tx_for_gene.get(gene, [])
+
+    def get_tx_for_region(self, alt_ac, alt_aln_method, start_i, end_i):
+        return self.get_alignments_for_region(alt_ac, start_i, end_i, alt_aln_method)
+
+    def get_alignments_for_region(self, alt_ac, start_i, end_i, alt_aln_method=None):
+        # same condition as the query of the UTA data provider
+        return [a for a in self._alignments.get(alt_ac, [])
+                if a['start_i'] < start_i and end_i <= a['end_i'] and
+                (alt_aln_method is None or a['alt_aln_method'] == alt_aln_method)]
+
+    def get_alignments_overlapping_region(self, alt_ac, start_i, end_i):
+        # in the order of OVERLAPPING_ALIGNMENTS_SQL
+        return sorted((a for a in self._alignments.get(alt_ac, []) if a['start_i'] < end_i and start_i <= a['end_i']),
+                      key=lambda a: (a['tx_ac'], a['alt_aln_method']))
+
+    def get_tx_identity_info(self, tx_ac):
+        if tx_ac not in self._tx_identity_info:
+            raise HGVSDataNotAvailableError("No transcript definition for (tx_ac={})".format(tx_ac))
+        return self._tx_identity_info[tx_ac]
+
+    def get_tx_info(self, tx_ac, alt_ac, alt_aln_method):
+        key = _key(tx_ac, alt_ac, alt_aln_method)
+        if key not in self._tx_info:
+            raise HGVSDataNotAvailableError(
+                "No tx_info for (tx_ac={},alt_ac={},alt_aln_method={})".format(tx_ac, alt_ac, alt_aln_method))
+        return self._tx_info[key]
+
+    def get_tx_mapping_options(self, tx_ac):
+        return self._tx_mapping_options.get(tx_ac, [])
+
+
+def alignments_overlapping_region(hdp, alt_ac, start_i, end_i):
+    '''
+    Alignments of transcripts to alt_ac overlapping a region, in contrast to get_alignments_for_region of the
+    data providers, which returns the alignments containing the region.
+
+    :param hdp: LocalDataProvider or UTA data provider
+    :return: rows with tx_ac, alt_ac, alt_strand, alt_aln_method, start_i and end_i
+    '''
+    if isinstance(hdp, LocalDataProvider):
+        return hdp.get_alignments_overlapping_region(alt_ac, start_i, end_i)
+    return hdp._fetchall(OVERLAPPING_ALIGNMENTS_SQL, [alt_ac, end_i, start_i])
+
+
+def _row_dict(row):
+    return {'columns': list(row.keys()), 'values': [row[c] for c in row.keys()]}
+
+
+def _gene_config_transcripts(gene_config_df):
+    acs = set()
+    for col in [config.HGVS_CDNA_DEFAULT_AC, config.SYNONYM_AC_COL]:
+        for value in gene_config_df[col].dropna():
+            acs.update(a for a in str(value).split(';') if a and a != '-')
+    return acs
+
+
+def export_local_data(hdp, gene_config_df, path, region_margin=0):
+    '''
+    Exports the data LocalDataProvider needs for the genes in gene_config_df from another data provider, usually UTA.
+
+    Exported are all transcripts of the genes, transcripts aligned to the gene regions in GRCh38 and GRCh37
+    and transcripts referenced in the gene config (default cDNA and synonym accessions) with their alignments,
+    exons and transcript and protein sequences.
+
+    :param hdp: UTA data provider to export from, i.e. hgvs.dataproviders.uta.connect()
+    :param gene_config_df: gene metadata dataframe
+    :param path: output path
+    :param region_margin: number of bases added to both sides of gene regions when looking up aligned transcripts
+    :return: number of exported transcripts
+    '''
+    data = {'format_version': FORMAT_VERSION,
+            'data_version': hdp.source_data_version() if isinstance(hdp, LocalDataProvider) else hdp.data_version(),
+            'schema_version': hdp.schema_version(),
+            'gene_info': {}, 'tx_for_gene': {}, 'tx_identity_info': {}, 'tx_info': {}, 'tx_exons': {},
+            'tx_mapping_options': {}, 'similar_transcripts': {}, 'pro_ac': {}, 'alignments': {}, 'sequences': {}}
+
+    tx_acs = _gene_config_transcripts(gene_config_df)
+
+    for gene in gene_config_df[config.SYMBOL_COL]:
+        gene_info = hdp.get_gene_info(gene)
+        if gene_info is not None:
+            data['gene_info'][gene] = _row_dict(gene_info)
+        tx_for_gene = hdp.get_tx_for_gene(gene)
+        data['tx_for_gene'][gene] = _table(tx_for_gene)
+        tx_acs.update(r['tx_ac'] for r in tx_for_gene)
+
+    alignments = {}
+    for assembly, (start_col, end_col) in ASSEMBLY_REGION_COLS.items():
+        name_ac_map = make_name_ac_map(assembly)
+        for _, gene in gene_config_df.iterrows():
+            alt_ac = name_ac_map[str(gene['chr'])]
+            for a in alignments_overlapping_region(hdp, alt_ac, int(gene[start_col]) - region_margin,
+                                                   int(gene[end_col]) + region_margin):
+                alignments.setdefault(alt_ac, {})[(a['tx_ac'], a['alt_aln_method'])] = a
+                tx_acs.add(a['tx_ac'])
+
+    for tx_ac in sorted(tx_acs):
+        try:
+            data['tx_identity_info'][tx_ac] = _row_dict(hdp.get_tx_identity_info(tx_ac))
+        except HGVSDataNotAvailableError:
+            logging.warning("No transcript definition for %s, skipping it", tx_ac)
+            continue
+
+        options = hdp.get_tx_mapping_options(tx_ac)
+        data['tx_mapping_options'][tx_ac] = _table(options)
+        for o in options:
+            key = _key(o['tx_ac'], o['alt_ac'], o['alt_aln_method'])
+            try:
+                data['tx_info'][key] = _row_dict(hdp.get_tx_info(o['tx_ac'], o['alt_ac'], o['alt_aln_method']))
+                exons = hdp.get_tx_exons(o['tx_ac'], o['alt_ac'], o['alt_aln_method'])
+            except HGVSError as e:
+                logging.warning("Skipping alignment %s: %s", key, e)
+                continue
+
+            data['tx_exons'][key] = _table(exons)
+            if o['alt_aln_method'] != 'transcript':
+                alignments.setdefault(o['alt_ac'], {}).setdefault(
+                    (tx_ac, o['alt_aln_method']),
+                    {'tx_ac': tx_ac, 'alt_ac': o['alt_ac'], 'alt_strand': exons[0]['alt_strand'],
+                     'alt_aln_method': o['alt_aln_method'],
+                     'start_i': min(e['alt_start_i'] for e in exons), 'end_i': max(e['alt_end_i'] for e in exons)})
+
+        data['similar_transcripts'][tx_ac] = _table(hdp.get_similar_transcripts(tx_ac))
+        data['sequences'][tx_ac] = hdp.get_seq(tx_ac)
+
+        pro_ac = hdp.get_pro_ac_for_tx_ac(tx_ac)
+        if pro_ac:
+            data['pro_ac'][tx_ac] = pro_ac
+            data['sequences'][pro_ac] = hdp.get_seq(pro_ac)
+
+    data['alignments'] = {alt_ac: _table(a.values()) for alt_ac, a in alignments.items()}
+
+    with gzip.open(path, 'wt') as f:
+        json.dump(data, f, default=str)
+
+    return len(data['tx_identity_info'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export HGVS data of the genes in a gene config from UTA")
+    parser.add_argument('-c', '--gene-config', required=True, help='gene config file')
+    parser.add_argument('-o', '--output', required=True, help='output file, e.g. hgvs_local_data.json.gz')
+    parser.add_argument('--region-margin', type=int, default=0,
+                        help='bases added to gene regions when looking up aligned transcripts')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    n = export_local_data(hgvs.dataproviders.uta.connect(), config.load_config(args.gene_config), args.output,
+                          args.region_margin)
+    logging.info("Exported %d transcripts to %s", n, args.output)
+
+
+if __name__ == "__main__":
+    main()
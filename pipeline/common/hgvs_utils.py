@@ -1,5 +1,10 @@
+import functools
+import inspect
 import logging
 import os
+import pickle
+import sqlite3
+import time
 
 import bioutils
 import hgvs
@@ -10,19 +15,215 @@ import hgvs.parser
 import hgvs.validator
 from hgvs.exceptions import HGVSError
 
+from .hgvs_data_provider import LocalDataProvider, alignments_overlapping_region
+from .utils import file_fingerprint
+
+
+class HgvsCache:
+    '''
+    Disk backed cache of HGVS conversions, persisting across pipeline runs.
+
+    Results are stored in a SQLite database keyed by the version of the underlying data
+    (see data_version), the operation, its arguments and the input HGVS string. Hence results computed
+    with a different UTA or SeqRepo release are never returned.
+
+    Processes may share a cache file: every process opens its own connection and SQLite serializes
+    concurrent writes. Once the cache holds more than max_entries results, the least recently used
+    ones are evicted.
+    '''
+
+    # last_used of a hit is only updated if older than this, avoiding a write per hit
+    TOUCH_INTERVAL_SECONDS = 24 * 3600
+
+    # number of insertions after which the size of the cache is checked
+    EVICTION_CHECK_INTERVAL = 1000
+
+    def __init__(self, path, data_version, max_entries=5000000):
+        '''
+        :param path: path of the SQLite database, created if it doesn't exist
+        :param data_version: str identifying the data conversions are computed from
+        :param max_entries: maximum number of results kept
+        '''
+        self.path = path
+        self.data_version = data_version
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self._conn = None
+        self._conn_pid = None
+        self._inserts = 0
+
+    def _connection(self):
+        # connections can't be shared with forked processes
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS conversions "
+                               "(key TEXT PRIMARY KEY, value BLOB NOT NULL, last_used REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS conversions_last_used ON conversions (last_used)")
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _key(self, operation, args, input_str):
+        return "\t".join([self.data_version, operation] + list(args) + [input_str])
+
+    def get_or_compute(self, operation, args, input_str, compute):
+        '''
+        Returns the cached result of an operation, computing and storing it on a miss.
+        Exceptions raised by compute are propagated and not cached.
+
+        :param operation: name of the operation, e.g. genomic_to_cdna
+        :param args: List[str]: further arguments the result depends on, e.g. the assembly
+        :param input_str: input HGVS string
+        :param compute: Function[[], object] computing the result, which needs to be picklable
+        '''
+        found, result = self.lookup(operation, args, input_str)
+        if found:
+            return result
+
+        result = compute()
+        self.store(operation, args, input_str, result)
+        return result
+
+    def lookup(self, operation, args, input_str):
+        '''
+        :return: Tuple[bool, object]: whether a result is cached and the result
+        '''
+        key = self._key(operation, args, input_str)
+        conn = self._connection()
+
+        row = conn.execute("SELECT value, last_used FROM conversions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None
+
+        self.hits += 1
+        value, last_used = row
+        now = time.time()
+        if now - last_used > self.TOUCH_INTERVAL_SECONDS:
+            conn.execute("UPDATE conversions SET last_used = ? WHERE key = ?", (now, key))
+        return True, pickle.loads(value)
+
+    def store(self, operation, args, input_str, result):
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO conversions (key, value, last_used) VALUES (?, ?, ?)",
+                     (self._key(operation, args, input_str), pickle.dumps(result), time.time()))
+        self._inserts += 1
+        if self._inserts % self.EVICTION_CHECK_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        '''
+        Removes the least recently used results in excess of max_entries
+
+        :return: number of removed results
+        '''
+        conn = self._connection()
+        n_excess = conn.execute("SELECT COUNT(*) FROM conversions").fetchone()[0] - self.max_entries
+        if n_excess <= 0:
+            return 0
+
+        conn.execute("DELETE FROM conversions WHERE key IN "
+                     "(SELECT key FROM conversions ORDER BY last_used LIMIT ?)", (n_excess,))
+        logging.info("Evicted %d results from HGVS cache %s", n_excess, self.path)
+        return n_excess
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hit_rate()}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_conn'] = None
+        state['_conn_pid'] = None
+        return state
+
+
+def data_version(hgvs_dp):
+    '''
+    Identifies the data HGVS conversions are computed from, i.e. the UTA and SeqRepo releases and the hgvs version
+    '''
+    seqrepo_dir = os.environ.get('HGVS_SEQREPO_DIR')
+    seqrepo_version = os.path.basename(os.path.realpath(seqrepo_dir)) if seqrepo_dir else "remote"
+    return "{}|{}|{}".format(hgvs_dp.data_version(), seqrepo_version, hgvs.__version__)
+
+
+def configured_data_version():
+    '''
+    Identifies the data HGVS conversions are computed from as configured by the environment, i.e. without connecting
+    to UTA: the UTA instance, the SeqRepo release, the contents of the local transcript data and the hgvs version.
+    It changes whenever data_version does, but not necessarily vice versa
+    '''
+    seqrepo_dir = os.environ.get('HGVS_SEQREPO_DIR')
+    local_data_path = os.environ.get('HGVS_LOCAL_DATA_PATH')
+    return "{}|{}|{}|{}".format(os.environ.get('UTA_DB_URL', "default"),
+                                os.path.realpath(seqrepo_dir) if seqrepo_dir else "remote",
+                                file_fingerprint(local_data_path) if local_data_path else "none",
+                                hgvs.__version__)
+
+
+def _cached_conversion(method):
+    '''
+    Decorator caching the results of a HgvsWrapper method in the conversion cache of the wrapper, if any.
+    The first argument of the method is the variant, which is keyed by its HGVS string.
+    '''
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.conversion_cache is None:
+            return method(self, *args, **kwargs)
+
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        v, *key_args = list(bound.arguments.values())[1:]
+
+        return self.conversion_cache.get_or_compute(method.__name__, [str(a) for a in key_args], str(v),
+                                                    lambda: method(self, *args, **kwargs))
+
+    return wrapper
+
 
 class HgvsWrapper:
     GRCh38_Assem = 'GRCh38'
     GRCh37_Assem = 'GRCh37'
 
-    def __init__(self):
+    def __init__(self, cache_path=None, local_data_path=None):
+        '''
+        :param cache_path: path of a HgvsCache for conversion results. If None, read HGVS_CACHE_PATH environment variable.
+          Without it, conversions aren't cached
+        :param local_data_path: path of transcript data exported by common.hgvs_data_provider to use instead of UTA.
+          If None, read HGVS_LOCAL_DATA_PATH environment variable. Without it, connect to UTA
+        '''
         logging.info("HGVS_SEQREPO_DIR: {}".format(os.environ.get('HGVS_SEQREPO_DIR', "Not set. Using public instance")))
 
-        self.hgvs_dp = hgvs.dataproviders.uta.connect()
-        logging.info("Using UTA instance at {}".format(self.hgvs_dp.url))
+        if not local_data_path:
+            local_data_path = os.environ.get('HGVS_LOCAL_DATA_PATH')
+
+        if local_data_path:
+            self.hgvs_dp = LocalDataProvider(local_data_path)
+            logging.info("Using local transcript data at {}".format(local_data_path))
+        else:
+            self.hgvs_dp = hgvs.dataproviders.uta.connect()
+            logging.info("Using UTA instance at {}".format(self.hgvs_dp.url))
+
+        if not cache_path:
+            cache_path = os.environ.get('HGVS_CACHE_PATH')
+
+        self.conversion_cache = None
+        if cache_path:
+            self.conversion_cache = HgvsCache(cache_path, data_version(self.hgvs_dp))
+            logging.info("Caching HGVS conversions in {}".format(cache_path))
 
         self.hgvs_parser = hgvs.parser.Parser()
         self.hgvs_norm = hgvs.normalizer.Normalizer(self.hgvs_dp)
+        self._normalizers = {self.hgvs_norm.shuffle_direction: self.hgvs_norm}
 
         assemblies = [self.GRCh37_Assem, self.GRCh38_Assem]
 
@@ -38,11 +239,23 @@ class HgvsWrapper:
                     m[s['name']] = s['refseq_ac']
             self.contig_maps[a] = m
 
+    def log_cache_stats(self, context):
+        if self.conversion_cache is not None:
+            logging.info("HGVS cache stats for %s: %s", context, self.conversion_cache.stats())
+
+    @_cached_conversion
     def genomic_to_cdna(self, hgvs_obj, assembly=GRCh38_Assem):
         am = self.hgvs_ams[assembly]
+        return self._genomic_to_cdna(am, hgvs_obj, am.relevant_transcripts)
 
+    @staticmethod
+    def _genomic_to_cdna(am, hgvs_obj, relevant_transcripts):
+        '''
+        Converts to the first of the relevant transcripts by accession. The data providers return them in no
+        particular order, which must not determine the transcript picked, see bulk_genomic_to_cdna
+        '''
         try:
-            tr = am.relevant_transcripts(hgvs_obj)
+            tr = sorted(relevant_transcripts(hgvs_obj))
 
             if tr:
                 return am.g_to_c(hgvs_obj, tr[0])
@@ -52,6 +265,75 @@ class HgvsWrapper:
 
         return None
 
+    def bulk_genomic_to_cdna(self, hgvs_objs, assembly=GRCh38_Assem):
+        '''
+        Converts a list of genomic variants like genomic_to_cdna, but looks up the relevant transcripts
+        once per genomic region instead of once per variant.
+
+        :param hgvs_objs: List[SequenceVariant], may contain None
+        :param assembly: assembly of the variants
+        :return: List[SequenceVariant]: cDNA variants, None for variants which couldn't be converted
+        '''
+        am = self.hgvs_ams[assembly]
+        results = [None] * len(hgvs_objs)
+
+        pending = []
+        for i, v in enumerate(hgvs_objs):
+            if v is None:
+                continue
+            if self.conversion_cache is not None:
+                found, results[i] = self.conversion_cache.lookup('genomic_to_cdna', [str(assembly)], str(v))
+                if found:
+                    continue
+            pending.append(i)
+
+        transcripts = self._relevant_transcripts([hgvs_objs[i] for i in pending], am.alt_aln_method)
+        for i, tr in zip(pending, transcripts):
+            results[i] = self._genomic_to_cdna(am, hgvs_objs[i], lambda _: tr)
+            if self.conversion_cache is not None:
+                self.conversion_cache.store('genomic_to_cdna', [str(assembly)], str(hgvs_objs[i]), results[i])
+
+        return results
+
+    # variants further apart than this are looked up in separate regions
+    REGION_MAX_GAP = 1000000
+
+    def _relevant_transcripts(self, hgvs_objs, alt_aln_method):
+        '''
+        Same as AssemblyMapper.relevant_transcripts for every variant, but querying the alignments overlapping
+        regions of nearby variants once, rather than the alignments containing every single variant
+
+        :return: List[List[str]]: transcript accessions per variant
+        '''
+        transcripts = [[] for _ in hgvs_objs]
+
+        by_ac = {}
+        for i, v in enumerate(hgvs_objs):
+            by_ac.setdefault(v.ac, []).append(i)
+
+        for alt_ac, idxs in by_ac.items():
+            idxs.sort(key=lambda i: hgvs_objs[i].posedit.pos.start.base)
+
+            regions = []
+            for i in idxs:
+                start, end = hgvs_objs[i].posedit.pos.start.base, hgvs_objs[i].posedit.pos.end.base
+                if regions and start - regions[-1][1] <= self.REGION_MAX_GAP:
+                    regions[-1][1] = max(regions[-1][1], end)
+                    regions[-1][2].append(i)
+                else:
+                    regions.append([start, end, [i]])
+
+            for region_start, region_end, region_idxs in regions:
+                alignments = [a for a in alignments_overlapping_region(self.hgvs_dp, alt_ac, region_start, region_end)
+                              if a['alt_aln_method'] == alt_aln_method]
+                for i in region_idxs:
+                    start, end = hgvs_objs[i].posedit.pos.start.base, hgvs_objs[i].posedit.pos.end.base
+                    # same condition as the data providers use to find alignments containing a variant
+                    transcripts[i] = [a['tx_ac'] for a in alignments if a['start_i'] < start and end <= a['end_i']]
+
+        return transcripts
+
+    @_cached_conversion
     def cdna_to_protein(self, hgvs_cdna):
         if not hgvs_cdna:
             return None
@@ -66,15 +348,50 @@ class HgvsWrapper:
 
         return None
 
+    @_cached_conversion
+    def normalize(self, v, shuffle_direction=3):
+        '''
+        Normalizes a variant, shifting it in 3' (shuffle_direction=3) or 5' direction (shuffle_direction=5).
+        Raises HGVSError if normalization fails.
+        '''
+        if shuffle_direction not in self._normalizers:
+            self._normalizers[shuffle_direction] = hgvs.normalizer.Normalizer(self.hgvs_dp,
+                                                                              shuffle_direction=shuffle_direction)
+        return self._normalizers[shuffle_direction].normalize(v)
+
     def normalizing(self, v):
         if v:
             try:
-                return self.hgvs_norm.normalize(v)
+                return self.normalize(v)
             except (hgvs.exceptions.HGVSError, IndexError) as e:
                 logging.info(
                     "Issues with normalizing " + str(v) + ": " + str(e))
         return None
 
+    def bulk_cdna_to_protein(self, hgvs_cdnas):
+        '''
+        Converts a list of cDNA variants like cdna_to_protein. Transcript alignments are cached by the data
+        provider and variant mapper, hence fetched once for all variants on the same transcript.
+
+        :return: List[str]: protein changes, None for variants which couldn't be converted
+        '''
+        return [self.cdna_to_protein(v) for v in hgvs_cdnas]
+
+    def bulk_normalize(self, hgvs_objs, shuffle_direction=3):
+        '''
+        Normalizes a list of variants like normalize. Variants which can't be normalized are logged individually.
+
+        :return: List[SequenceVariant]: normalized variants, None for variants which couldn't be normalized
+        '''
+        results = []
+        for v in hgvs_objs:
+            try:
+                results.append(self.normalize(v, shuffle_direction) if v is not None else None)
+            except (HGVSError, IndexError) as e:
+                logging.warning("Issue normalizing {}: {}".format(v, e))
+                results.append(None)
+        return results
+
     __instance = None
 
     def hg19_to_hg38(self, v):
@@ -119,6 +436,7 @@ class HgvsWrapper:
 
         return self.hgvs_ams[target_assembly].c_to_g(v_c)
 
+    @_cached_conversion
     def nm_to_genomic(self, v, target_assembly=GRCh38_Assem):
         return self.hgvs_ams[target_assembly].c_to_g(v)
 
@@ -0,0 +1,179 @@
+'''
+Liftover of variants between assemblies using UCSC chain files, replacing calls of "CrossMap.py vcf".
+
+The chain file is read once into an interval index of its aligned blocks per chromosome, such that
+batches of variants are converted in memory. Variants are converted like CrossMap does it, i.e.
+the reference allele is taken from the target assembly and variants mapping to several blocks,
+to no block at all or with identical reference and alternate allele after conversion are reported as unmapped.
+'''
+import gzip
+import logging
+from collections import defaultdict
+from typing import Iterable
+
+import pysam
+from bioutils.sequences import reverse_complement
+
+from common.utils import StaticIntervalIndex
+from common.variant_utils import VCFVariant
+
+FAIL_UNMAP = 'Fail(Unmap)'
+FAIL_MULTIPLE_HITS = 'Fail(Multiple_hits)'
+FAIL_REF_EQ_ALT = 'Fail(REF==ALT)'
+# indels mapping to the minus strand whose alleles can't be anchored at a preceding base, see convert_variant
+FAIL_MINUS_STRAND_INDEL = 'Fail(Minus_strand_indel)'
+
+
+def _strip_chr(c):
+    c = str(c)
+    return c[3:] if c.startswith('chr') else c
+
+
+def read_chain_file(chain_file):
+    '''
+    Reads the aligned blocks of a chain file
+
+    :param chain_file: path of a chain file, optionally gzipped
+    :return: Dict[str, List[Tuple[int, int, Tuple[str, int, int, str]]]]: for every source chromosome (without 'chr' prefix),
+      0-based half open source intervals and the target chromosome, start, end and strand they map to
+    '''
+    blocks = defaultdict(list)
+    opener = gzip.open if str(chain_file).endswith('.gz') else open
+
+    with opener(chain_file, 'rt') as f:
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+
+            if fields[0] == 'chain':
+                source_name, source_start = _strip_chr(fields[2]), int(fields[5])
+                target_name, target_size, target_strand, target_start = fields[7], int(fields[8]), fields[9], int(fields[10])
+                source_pos, target_pos = source_start, target_start
+            else:
+                size = int(fields[0])
+                if target_strand == '+':
+                    target_block = (target_name, target_pos, target_pos + size, target_strand)
+                else:
+                    # target coordinates of chains on the minus strand are on the reverse complement
+                    target_block = (target_name, target_size - target_pos - size, target_size - target_pos, target_strand)
+                blocks[source_name].append((source_pos, source_pos + size, target_block))
+
+                if len(fields) == 3:
+                    source_pos += size + int(fields[1])
+                    target_pos += size + int(fields[2])
+
+    return blocks
+
+
+class ChainLiftover:
+    '''
+    Converts variants from the source to the target assembly of a chain file
+    '''
+
+    def __init__(self, chain_file, target_ref_file):
+        '''
+        :param chain_file: path of a UCSC chain file, e.g. hg38ToHg19.over.chain.gz
+        :param target_ref_file: path of the fasta file of the target assembly, used to determine reference alleles
+        '''
+        self.chain_file = chain_file
+        self._index = {c: StaticIntervalIndex(b) for c, b in read_chain_file(chain_file).items()}
+        self._target_ref = pysam.FastaFile(target_ref_file)
+        self._target_ref_names = set(self._target_ref.references)
+
+    def map_interval(self, chr, start, end):
+        '''
+        Maps an interval to the target assembly. Intervals partially overlapping a block are truncated to that block.
+
+        :param start: 0-based start
+        :param end: 0-based exclusive end
+        :return: List[Tuple[str, int, int, str]]: target chromosome, start, end and strand of every block the interval maps to
+        '''
+        key = _strip_chr(chr)
+        if key not in self._index:
+            return []
+
+        mapped = []
+        for block in self._index[key].overlap(start, end):
+            target_chr, target_start, target_end, strand = block.data
+            offset = max(start, block.begin) - block.begin
+            size = min(end, block.end) - max(start, block.begin)
+            if strand == '+':
+                mapped.append((target_chr, target_start + offset, target_start + offset + size, strand))
+            else:
+                mapped.append((target_chr, target_end - offset - size, target_end - offset, strand))
+        return mapped
+
+    def _fetch_target(self, chr, start, end):
+        name = chr if chr in self._target_ref_names else ('chr' + chr if 'chr' + chr in self._target_ref_names
+                                                          else _strip_chr(chr))
+        return self._target_ref.fetch(name, start, end).upper()
+
+    def convert_variant(self, v: VCFVariant):
+        '''
+        Indels whose alleles share their first base, the anchor base of VCF, have the anchor base as their last
+        base once reverse complemented onto the minus strand. They are anchored at the base preceding them
+        on the target assembly instead. Multiallelic variants mixing anchored and other alleles can't be anchored and
+        fail to convert.
+
+        :return: Tuple[VCFVariant, str]: the converted variant and None, or None and the reason of the failure
+        '''
+        start = int(v.pos) - 1
+        mapped = self.map_interval(v.chr, start, start + len(v.ref))
+
+        if not mapped:
+            return None, FAIL_UNMAP
+        if len(mapped) > 1:
+            return None, FAIL_MULTIPLE_HITS
+
+        target_chr, target_start, target_end, strand = mapped[0]
+        ref = self._fetch_target(target_chr, target_start, target_end)
+        alts = v.alt.split(',')
+
+        if strand == '+':
+            alt = v.alt
+        elif any(len(a) != len(v.ref) for a in alts) and any(a[0] == v.ref[0] for a in alts):
+            if not all(a[0] == v.ref[0] for a in alts) or target_start == 0:
+                return None, FAIL_MINUS_STRAND_INDEL
+            anchor = self._fetch_target(target_chr, target_start - 1, target_start)
+            target_start -= 1
+            ref = anchor + ref[:-1]
+            alt = ','.join(anchor + reverse_complement(a[1:]) for a in alts)
+        else:
+            alt = ','.join(reverse_complement(a) for a in alts)
+
+        if ref == alt:
+            return None, FAIL_REF_EQ_ALT
+
+        # keeping the chromosome naming of the source variant
+        chr = target_chr if str(v.chr).startswith('chr') else _strip_chr(target_chr)
+        return VCFVariant(chr, target_start + 1, ref, alt), None
+
+    def convert_variants(self, vars: Iterable[VCFVariant]):
+        '''
+        :return: Tuple[List[VCFVariant], List[VCFVariant]]: converted variants, in the order of vars,
+          and variants which could not be converted
+        '''
+        converted = []
+        failed = []
+        for v in vars:
+            converted_var, failure = self.convert_variant(v)
+            if converted_var is not None:
+                converted.append(converted_var)
+            else:
+                logging.info("Could not lift over {} using {}: {}".format(v, self.chain_file, failure))
+                failed.append(v)
+        return converted, failed
+
+
+_instances = {}
+
+
+def get_liftover(chain_file, target_ref_file):
+    '''
+    :return: ChainLiftover: instance shared by all callers in this process, such that the chain file is read once
+    '''
+    key = (str(chain_file), str(target_ref_file))
+    if key not in _instances:
+        _instances[key] = ChainLiftover(chain_file, target_ref_file)
+    return _instances[key]
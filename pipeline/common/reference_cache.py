@@ -0,0 +1,192 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'BRCAREF1'
+_HEADER_LEN = struct.Struct('<8sQ')
+
+_BASES = 'ACGT'
+_BASE_CODES = {b: i for i, b in enumerate(_BASES)}
+
+# decoding table from a packed byte to its 4 bases, first base in the highest bits
+_DECODE_TABLE = np.array([[ord(_BASES[(byte >> shift) & 3]) for shift in (6, 4, 2, 0)] for byte in range(256)],
+                         dtype=np.uint8)
+
+# slices of up to this many bases are decoded from the mapped file directly, longer ones from the decoded region
+DIRECT_DECODE_MAX_LEN = 4096
+
+
+def cache_path(cache_dir, assembly_name, regions, margin):
+    '''
+    Path of the reference cache for preloaded regions of an assembly, i.e. of a gene config.
+
+    :param cache_dir: directory containing reference caches
+    :param assembly_name: assembly name, e.g. GRCh38.p11
+    :param regions: Iterable[ChrInterval]
+    :param margin: number of bases preloaded after the end of every region
+    :return: path
+    '''
+    key = json.dumps([assembly_name, margin, sorted({(int(c), int(s), int(e)) for c, s, e in regions})])
+    return os.path.join(cache_dir, "{}_{}.refcache".format(assembly_name, hashlib.sha256(key.encode()).hexdigest()[:16]))
+
+
+def _pack(seq):
+    codes = np.frombuffer(seq.upper().encode('ascii'), dtype=np.uint8)
+    packed_codes = np.zeros(len(codes), dtype=np.uint8)
+    for b, code in _BASE_CODES.items():
+        packed_codes[codes == ord(b)] = code
+
+    # padding to a multiple of 4 bases
+    packed_codes = np.concatenate([packed_codes, np.zeros(-len(codes) % 4, dtype=np.uint8)]).reshape(-1, 4)
+    return (packed_codes[:, 0] << 6 | packed_codes[:, 1] << 4 | packed_codes[:, 2] << 2 | packed_codes[:, 3]).tobytes()
+
+
+def _masked_runs(seq):
+    '''
+    Runs of characters which can't be represented in the 2 bit encoding, e.g. N or lower case bases
+
+    :return: List[Tuple[int, int, str]]: offset, length and character of every run
+    '''
+    runs = []
+    for i, c in enumerate(seq):
+        if c not in _BASE_CODES:
+            if runs and runs[-1][0] + runs[-1][1] == i and runs[-1][2] == c:
+                runs[-1][1] += 1
+            else:
+                runs.append([i, 1, c])
+    return [tuple(r) for r in runs]
+
+
+def build_reference_cache(path, assembly_name, region_seqs):
+    '''
+    Writes the sequences of genomic regions to a reference cache, which can be opened with ReferenceCache.
+
+    Bases are stored with 2 bits each. All other characters are stored as runs in the index (the N-mask).
+    The file is written to a temporary file first, such that processes building the same cache
+    concurrently never read partial files.
+
+    :param path: path of the cache file
+    :param assembly_name: assembly name
+    :param region_seqs: Iterable[Tuple[int, int, str]]: chromosome, start position and sequence of every region
+    '''
+    index = {'assembly': assembly_name, 'regions': []}
+    packed_seqs = []
+    offset = 0
+    for c, start, seq in region_seqs:
+        packed = _pack(seq)
+        index['regions'].append({'chr': int(c), 'start': int(start), 'length': len(seq),
+                                 'offset': offset, 'masked': _masked_runs(seq)})
+        packed_seqs.append(packed)
+        offset += len(packed)
+
+    index_bytes = json.dumps(index).encode('utf-8')
+
+    tmp_path = "{}.{}".format(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        f.write(_HEADER_LEN.pack(MAGIC, len(index_bytes)))
+        f.write(index_bytes)
+        for packed in packed_seqs:
+            f.write(packed)
+    os.replace(tmp_path, path)
+
+
+class ReferenceCache:
+    '''
+    Read only access to a reference cache written by build_reference_cache.
+
+    The file is memory mapped, hence processes opening the same cache share its pages instead of holding
+    a copy of every region each.
+    '''
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, index_len = _HEADER_LEN.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError("{} is not a reference cache".format(path))
+
+        index = json.loads(self._mmap[_HEADER_LEN.size:_HEADER_LEN.size + index_len].decode('utf-8'))
+        self.assembly_name = index['assembly']
+        self._regions = {(r['chr'], r['start']): r for r in index['regions']}
+
+        # view on the packed sequences, not copying any data
+        self._packed = np.frombuffer(self._mmap, dtype=np.uint8, offset=_HEADER_LEN.size + index_len)
+
+    def __contains__(self, chr_start):
+        return chr_start in self._regions
+
+    def region_seq(self, chr, start):
+        '''
+        :return: PackedSeq: sequence of the region starting at start
+        '''
+        return PackedSeq(self, self._regions[(int(chr), int(start))])
+
+    def decode(self, region, start, end):
+        '''
+        Decodes the bases [start, end) of a region, positions being relative to the start of the region
+        '''
+        first_byte, last_byte = region['offset'] + start // 4, region['offset'] + (end + 3) // 4
+        bases = _DECODE_TABLE[self._packed[first_byte:last_byte]].reshape(-1)[start % 4:start % 4 + end - start]
+
+        for run_offset, run_len, c in region['masked']:
+            if run_offset < end and run_offset + run_len > start:
+                if not bases.flags.writeable:
+                    bases = bases.copy()
+                bases[max(run_offset, start) - start:min(run_offset + run_len, end) - start] = ord(c)
+
+        return bases.tobytes().decode('ascii')
+
+
+class PackedSeq:
+    '''
+    Sequence of a region in a reference cache, supporting the operations of a string used on preloaded
+    sequences, i.e. len, indexing, slicing and iteration. Short slices are decoded from the mapped file,
+    whereas the entire region is decoded once and kept as a string for long slices and iteration.
+    '''
+
+    def __init__(self, cache, region):
+        self._cache = cache
+        self._region = region
+        self._decoded = None
+
+    def __len__(self):
+        return self._region['length']
+
+    def __str__(self):
+        if self._decoded is None:
+            self._decoded = self._cache.decode(self._region, 0, len(self))
+        return self._decoded
+
+    def __iter__(self):
+        return iter(str(self))
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1 or self._decoded is not None or stop - start > DIRECT_DECODE_MAX_LEN:
+                return str(self)[item]
+            return self._cache.decode(self._region, start, max(start, stop))
+
+        if self._decoded is not None:
+            return self._decoded[item]
+        i = item + len(self) if item < 0 else item
+        if not 0 <= i < len(self):
+            raise IndexError("sequence index out of range")
+        return self._cache.decode(self._region, i, i + 1)
+
+    def startswith(self, prefix, start=0):
+        return self[start:start + len(prefix)] == prefix
+
+    def __repr__(self):
+        return "PackedSeq(chr={}, start={}, length={})".format(self._region['chr'], self._region['start'], len(self))
@@ -5,6 +5,7 @@ from collections import namedtuple
 from biocommons.seqrepo import SeqRepo
 from bioutils import assemblies, seqfetcher
 
+from . import reference_cache
 from .utils import build_interval_trees_by_chr, ChrInterval
 
 SeqWithStart = namedtuple("SeqWithStart", "sequence, start")
@@ -17,6 +18,10 @@ class SeqRepoWrapper:
     Has a mechanism to preload certain genomic regions. Queries falling into these
     regions are then served from memory.
 
+    If a reference cache directory is given, preloaded regions are read from a memory mapped
+    reference cache (see common.reference_cache) built on first use, such that they are
+    neither fetched from seqrepo again nor copied into every process.
+
     '''
 
     ASSEMBLY_NAME_hg37 = 'GRCh37.p13'
@@ -24,12 +29,15 @@ class SeqRepoWrapper:
 
     DEFAULT_ASSY_NAME = ASSEMBLY_NAME_hg38
 
-    def __init__(self, seq_repo_path=None, regions_preload=None, preload_pos_margin=500, assembly_name=None):
+    def __init__(self, seq_repo_path=None, regions_preload=None, preload_pos_margin=500, assembly_name=None,
+                 reference_cache_dir=None):
         '''
         :param seq_repo_path: Path to local seqrepo directory. If None, read HGVS_SEQREPO_DIR environment variable
         :param regions_preload: Iterable[ChrInterval], optionally preload these genomic regions
         :param preload_pos_margin: adding margin at the end of a preloaded genome
           in order to have data to verify structural variants across the end of a gene
+        :param reference_cache_dir: directory of reference caches for preloaded regions.
+          If None, read REFERENCE_CACHE_DIR environment variable. Without it, preloaded regions are held in memory
         '''
 
         if not seq_repo_path:
@@ -47,11 +55,30 @@ class SeqRepoWrapper:
             self.assembly_name = self.DEFAULT_ASSY_NAME
         self.assy_map = assemblies.make_name_ac_map(self.assembly_name)
 
+        if not reference_cache_dir:
+            reference_cache_dir = os.environ.get("REFERENCE_CACHE_DIR")
+
         self.preloaded_regions = {}
-        if regions_preload:
+        if regions_preload and reference_cache_dir:
+            regions_preload = list(regions_preload)
+            cache = self._open_reference_cache(reference_cache_dir, regions_preload, preload_pos_margin)
+            self.preloaded_regions = build_interval_trees_by_chr(regions_preload,
+                                                                 lambda c, s, e: cache.region_seq(c, s))
+        elif regions_preload:
             self.preloaded_regions = build_interval_trees_by_chr(regions_preload,
                                                                  lambda c, s, e: self._fetch_seq(c, s, e + preload_pos_margin))
 
+    def _open_reference_cache(self, cache_dir, regions, margin):
+        path = reference_cache.cache_path(cache_dir, self.assembly_name, regions, margin)
+
+        if not os.path.exists(path):
+            logging.info("Building reference cache %s", path)
+            os.makedirs(cache_dir, exist_ok=True)
+            region_seqs = [(c, s, self._fetch_seq(c, s, e + margin)) for c, s, e in sorted(set(regions))]
+            reference_cache.build_reference_cache(path, self.assembly_name, region_seqs)
+
+        return reference_cache.ReferenceCache(path)
+
     def get_seq_at(self, chr, pos, length):
         return self.get_seq(chr, pos, pos + length)
 
@@ -111,6 +138,85 @@ class WholeSeqSeqProvider:
         return SeqWithStart(seq, first_pos)
 
 
+class RollingHashSeqProvider(WholeSeqSeqProvider):
+    '''
+    Whole sequence provider which additionally precomputes polynomial prefix hashes
+    of every preloaded region once.
+
+    This allows to obtain the hash of a gene sequence edited by a variant in
+    O(len(ref) + len(alt)) without building the edited string, see
+    RollingHashSeqProvider.edited_seq_hash.
+    '''
+
+    BASE = 131
+    MODULUS = (1 << 61) - 1
+
+    def __init__(self, seq_wrapper):
+        '''
+
+        :param seq_wrapper: SeqRepoWrapper instance with preloaded regions
+        '''
+        super().__init__(seq_wrapper)
+
+        # (chr, region start) -> prefix hashes of the region sequence
+        self._prefix_hashes = {}
+
+        max_len = 0
+        for c, tree in seq_wrapper.preloaded_regions.items():
+            for start, _, seq in tree:
+                self._prefix_hashes[(c, start)] = self._compute_prefix_hashes(seq)
+                max_len = max(max_len, len(seq))
+
+        self._powers = [1] * (max_len + 1)
+        for i in range(1, max_len + 1):
+            self._powers[i] = (self._powers[i - 1] * self.BASE) % self.MODULUS
+
+    @classmethod
+    def _compute_prefix_hashes(cls, seq):
+        prefix_hashes = [0] * (len(seq) + 1)
+        h = 0
+        for i, c in enumerate(seq):
+            h = (h * cls.BASE + ord(c)) % cls.MODULUS
+            prefix_hashes[i + 1] = h
+        return prefix_hashes
+
+    def _power(self, n):
+        if n < len(self._powers):
+            return self._powers[n]
+        return pow(self.BASE, n, self.MODULUS)
+
+    def seq_hash(self, seq):
+        '''
+        Polynomial hash of an arbitrary string, consistent with the hashes of the
+        preloaded regions.
+        '''
+        h = 0
+        for c in seq:
+            h = (h * self.BASE + ord(c)) % self.MODULUS
+        return h
+
+    def edited_seq_hash(self, chr, seq_start, pos_seq, len_ref, alt):
+        '''
+        Hash of seq[0:pos_seq] + alt + seq[pos_seq + len_ref:], where seq is the
+        preloaded region starting at seq_start.
+
+        :return: Tuple[int, int]: length of the edited sequence and its hash
+        '''
+        prefix_hashes = self._prefix_hashes[(chr, seq_start)]
+        seq_len = len(prefix_hashes) - 1
+
+        prefix_end = min(pos_seq, seq_len)
+        suffix_start = min(pos_seq + len_ref, seq_len)
+        suffix_len = seq_len - suffix_start
+        suffix_hash = (prefix_hashes[seq_len] -
+                       prefix_hashes[suffix_start] * self._power(suffix_len)) % self.MODULUS
+
+        h = (prefix_hashes[prefix_end] * self._power(len(alt)) + self.seq_hash(alt)) % self.MODULUS
+        h = (h * self._power(suffix_len) + suffix_hash) % self.MODULUS
+
+        return prefix_end + len(alt) + suffix_len, h
+
+
 class ChunkBasedSeqProvider:
     '''
     Sequence provider not returning sequence of an entire gene, but only of the 'chunk'
@@ -0,0 +1,48 @@
+import io
+
+import pytest
+
+from common import config
+
+GENE_CONFIG = '''symbol,entrez_id,chr,end_hg38,ensembl_id,start_hg38,start_hg38_legacy_variants,end_hg38_legacy_variants,synonyms_ac_col,hgvs_cdna_default_ac,start_hg37,end_hg37
+BRCA1,672,17,43125483,ENSG00000012048,43044295,43008077,43127866,NM_007294.2;NM_007300.3,NM_007294.3,41196312,41277500
+BRCA2,675,13,32400266,ENSG00000139618,32315474,32314514,32400266,U43746.1,NM_000059.3,32889617,32973809
+RAD51D,5892,17,35119860,ENSG00000185379,35092221,-,-,-,NM_002878.3,33426811,33446888
+OVERLAPPING,1,17,43130000,ENSG0,43120000,-,-,-,NM_1.1,1,2
+'''
+
+
+@pytest.fixture
+def gene_config_df():
+    return config.load_config(io.StringIO(GENE_CONFIG))
+
+
+def test_split_config_by_chr(gene_config_df):
+    shards = config.split_config(gene_config_df, 'chr')
+
+    assert list(shards.keys()) == ['chr13', 'chr17']
+    assert list(shards['chr17']['symbol']) == ['RAD51D', 'BRCA1', 'OVERLAPPING']
+
+
+def test_split_config_by_gene(gene_config_df):
+    shards = config.split_config(gene_config_df, 'gene')
+
+    # genes with overlapping regions end up in the same shard
+    assert list(shards.keys()) == ['BRCA2', 'RAD51D', 'BRCA1_OVERLAPPING']
+    assert list(shards['BRCA1_OVERLAPPING']['symbol']) == ['BRCA1', 'OVERLAPPING']
+
+
+def test_split_config_unknown_shard_type(gene_config_df):
+    with pytest.raises(ValueError):
+        config.split_config(gene_config_df, 'exon')
+
+
+def test_save_config(gene_config_df, tmp_path):
+    shard = config.split_config(gene_config_df, 'chr')['chr17']
+    config.save_config(shard, str(tmp_path / 'gene_config.txt'))
+
+    loaded = config.load_config(str(tmp_path / 'gene_config.txt'))
+
+    assert list(loaded['symbol']) == ['RAD51D', 'BRCA1', 'OVERLAPPING']
+    assert list(loaded['synonyms_ac_col']) == ['-', 'NM_007294.2;NM_007300.3', '-']
+    assert list(loaded['start_hg38_legacy_variants']) == list(shard['start_hg38_legacy_variants'])
@@ -0,0 +1,151 @@
+import gzip
+import json
+import random
+
+import hgvs.parser
+import hgvs.variantmapper
+import pandas as pd
+import pytest
+from hgvs.exceptions import HGVSDataNotAvailableError
+
+from common import hgvs_data_provider
+from common.hgvs_data_provider import LocalDataProvider
+from common.hgvs_utils import HgvsWrapper
+
+random.seed(42)
+GENOMIC_SEQ = ''.join(random.choice('ACGT') for _ in range(100))
+
+EXON_COLS = ['tx_ac', 'alt_ac', 'alt_strand', 'alt_aln_method', 'ord', 'tx_start_i', 'tx_end_i', 'alt_start_i',
+             'alt_end_i', 'cigar']
+TX_INFO_COLS = ['hgnc', 'cds_start_i', 'cds_end_i', 'tx_ac', 'alt_ac', 'alt_aln_method']
+TX_INFO = ['TEST', 5, 35, 'NM_TEST.1', 'NC_TEST.1', 'splign']
+
+
+def _local_data():
+    # transcript with two exons on a made up genomic sequence
+    return {'format_version': hgvs_data_provider.FORMAT_VERSION, 'data_version': 'uta_test', 'schema_version': '1.1',
+            'gene_info': {},
+            'tx_for_gene': {'TEST': {'columns': TX_INFO_COLS, 'rows': [TX_INFO]}},
+            'tx_identity_info': {'NM_TEST.1': {
+                'columns': ['tx_ac', 'alt_ac', 'alt_aln_method', 'cds_start_i', 'cds_end_i', 'lengths', 'hgnc'],
+                'values': ['NM_TEST.1', 'NM_TEST.1', 'transcript', 5, 35, [20, 20], 'TEST']}},
+            'tx_info': {'NM_TEST.1|NC_TEST.1|splign': {'columns': TX_INFO_COLS, 'values': TX_INFO}},
+            'tx_exons': {'NM_TEST.1|NC_TEST.1|splign': {'columns': EXON_COLS, 'rows': [
+                ['NM_TEST.1', 'NC_TEST.1', 1, 'splign', 0, 0, 20, 10, 30, '20='],
+                ['NM_TEST.1', 'NC_TEST.1', 1, 'splign', 1, 20, 40, 50, 70, '20=']]}},
+            'tx_mapping_options': {'NM_TEST.1': {'columns': ['tx_ac', 'alt_ac', 'alt_aln_method'],
+                                                 'rows': [['NM_TEST.1', 'NC_TEST.1', 'splign']]}},
+            'similar_transcripts': {}, 'pro_ac': {},
+            'alignments': {'NC_TEST.1': {
+                'columns': ['tx_ac', 'alt_ac', 'alt_strand', 'alt_aln_method', 'start_i', 'end_i'],
+                'rows': [['NM_TEST.1', 'NC_TEST.1', 1, 'splign', 10, 70]]}},
+            'sequences': {'NM_TEST.1': GENOMIC_SEQ[10:30] + GENOMIC_SEQ[50:70], 'NC_TEST.1': GENOMIC_SEQ}}
+
+
+@pytest.fixture()
+def local_data_path(tmp_path):
+    path = str(tmp_path / 'local_data.json.gz')
+    with gzip.open(path, 'wt') as f:
+        json.dump(_local_data(), f)
+    return path
+
+
+def _snv(pos):
+    ref = GENOMIC_SEQ[pos - 1]
+    return hgvs.parser.Parser().parse('NC_TEST.1:g.{}{}>{}'.format(pos, ref, 'C' if ref != 'C' else 'G'))
+
+
+def test_variant_mapping(local_data_path):
+    vm = hgvs.variantmapper.VariantMapper(LocalDataProvider(local_data_path))
+
+    exonic = vm.g_to_c(_snv(17), 'NM_TEST.1')
+    assert str(exonic).startswith('NM_TEST.1:c.2')
+    assert vm.c_to_g(exonic, 'NC_TEST.1') == _snv(17)
+
+    assert str(vm.g_to_c(_snv(40), 'NM_TEST.1')).startswith('NM_TEST.1:c.15+10')
+
+
+def test_queries(local_data_path):
+    hdp = LocalDataProvider(local_data_path)
+
+    assert [a['tx_ac'] for a in hdp.get_tx_for_region('NC_TEST.1', 'splign', 20, 21)] == ['NM_TEST.1']
+    assert hdp.get_tx_for_region('NC_TEST.1', 'splign', 5, 21) == []
+    assert hdp.get_tx_for_region('NC_TEST.1', 'blat', 20, 21) == []
+
+    # rows can be unpacked like UTA rows
+    _, _, _, tx_ac, alt_ac, method = hdp.get_tx_for_gene('TEST')[0]
+    assert (tx_ac, alt_ac, method) == ('NM_TEST.1', 'NC_TEST.1', 'splign')
+
+    with pytest.raises(HGVSDataNotAvailableError):
+        hdp.get_tx_exons('NM_OTHER.1', 'NC_TEST.1', 'splign')
+
+
+def test_data_version(local_data_path, tmp_path):
+    other_data = _local_data()
+    del other_data['tx_exons']['NM_TEST.1|NC_TEST.1|splign']
+    other_path = str(tmp_path / 'other_local_data.json.gz')
+    with gzip.open(other_path, 'wt') as f:
+        json.dump(other_data, f)
+
+    hdp = LocalDataProvider(local_data_path)
+    # results computed from exported subsets of UTA must not be mixed up with each other or with those of UTA
+    assert hdp.data_version().startswith('uta_test+local:')
+    assert hdp.data_version() != LocalDataProvider(other_path).data_version()
+    assert hdp.data_version() == LocalDataProvider(local_data_path).data_version()
+    assert hdp.source_data_version() == LocalDataProvider(other_path).source_data_version() == 'uta_test'
+
+
+def test_export_roundtrip(local_data_path, tmp_path):
+    gene_config = pd.DataFrame({'symbol': ['TEST'], 'chr': [13], 'start_hg38': [1], 'end_hg38': [100],
+                                'start_hg37': [1], 'end_hg37': [100], 'hgvs_cdna_default_ac': ['NM_TEST.1'],
+                                'synonyms_ac_col': ['-']})
+    exported_path = str(tmp_path / 'exported.json.gz')
+
+    assert hgvs_data_provider.export_local_data(LocalDataProvider(local_data_path), gene_config, exported_path) == 1
+
+    hdp = LocalDataProvider(exported_path)
+    assert hdp.source_data_version() == 'uta_test'
+    assert [list(r) for r in hdp.get_tx_exons('NM_TEST.1', 'NC_TEST.1', 'splign')] == \
+           _local_data()['tx_exons']['NM_TEST.1|NC_TEST.1|splign']['rows']
+    assert [a['tx_ac'] for a in hdp.get_tx_for_region('NC_TEST.1', 'splign', 20, 21)] == ['NM_TEST.1']
+
+
+def test_hgvs_wrapper_without_uta(local_data_path):
+    wrapper = HgvsWrapper(local_data_path=local_data_path)
+    assert isinstance(wrapper.hgvs_dp, LocalDataProvider)
+
+
+def test_bulk_conversions(local_data_path):
+    wrapper = HgvsWrapper(local_data_path=local_data_path)
+    variants = [_snv(17), None, _snv(5), _snv(40), _snv(60)]
+
+    bulk = wrapper.bulk_genomic_to_cdna(variants)
+    assert bulk == [wrapper.genomic_to_cdna(v) if v else None for v in variants]
+    assert str(bulk[0]).startswith('NM_TEST.1:c.2')
+    assert bulk[2] is None  # not within a transcript
+    assert str(bulk[4]).startswith('NM_TEST.1:c.')
+
+    assert wrapper.bulk_normalize(variants) == [v if v else None for v in variants]
+
+
+def test_bulk_conversions_pick_same_transcript(tmp_path, monkeypatch):
+    # the same transcript under a second accession, aligned after the first one
+    data = json.loads(json.dumps(_local_data()).replace('NM_TEST.1', 'NM_OTHER.1'))
+    local_data = _local_data()
+    for table in ['tx_for_gene', 'tx_identity_info', 'tx_info', 'tx_exons', 'tx_mapping_options', 'sequences']:
+        local_data[table].update(data[table])
+    local_data['alignments']['NC_TEST.1']['rows'] += data['alignments']['NC_TEST.1']['rows']
+    path = str(tmp_path / 'local_data.json.gz')
+    with gzip.open(path, 'wt') as f:
+        json.dump(local_data, f)
+
+    wrapper = HgvsWrapper(local_data_path=path)
+    variants = [_snv(17), _snv(60)]
+    bulk = wrapper.bulk_genomic_to_cdna(variants)
+    assert all(str(v).startswith('NM_OTHER.1:c.') for v in bulk)
+
+    # independent of the order the data provider returns the transcripts in
+    get_tx_for_region = wrapper.hgvs_dp.get_tx_for_region
+    for order in [1, -1]:
+        monkeypatch.setattr(wrapper.hgvs_dp, 'get_tx_for_region', lambda *args: get_tx_for_region(*args)[::order])
+        assert [wrapper.genomic_to_cdna(v) for v in variants] == bulk
@@ -2,6 +2,8 @@
 A few integration tests
 """
 
+import time
+
 import pytest
 from common import hgvs_utils
 from common.variant_utils import VCFVariant
@@ -65,3 +67,61 @@ def test_ng_to_genomic(ng, expected, hgvs_wrapper):
 
     s = hgvs_wrapper.ng_to_genomic(ng_obj)
     assert s == expected_obj
+
+
+def test_hgvs_cache(tmp_path):
+    cache = hgvs_utils.HgvsCache(str(tmp_path / "hgvs.db"), "v1")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return 'NM_000059.3:c.17_19delinsA'
+
+    for _ in range(3):
+        assert cache.get_or_compute('genomic_to_cdna', ['GRCh38'], 'NC_000013.11:g.32316477_32316479delinsA', compute) == \
+               'NM_000059.3:c.17_19delinsA'
+    assert len(calls) == 1
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'hit_rate': 2 / 3}
+
+    # persisted, but not shared with other data versions
+    assert hgvs_utils.HgvsCache(cache.path, "v1").get_or_compute('genomic_to_cdna', ['GRCh38'],
+                                                                'NC_000013.11:g.32316477_32316479delinsA', compute)
+    hgvs_utils.HgvsCache(cache.path, "v2").get_or_compute('genomic_to_cdna', ['GRCh38'],
+                                                         'NC_000013.11:g.32316477_32316479delinsA', compute)
+    assert len(calls) == 2
+
+
+def test_hgvs_cache_eviction(tmp_path):
+    cache = hgvs_utils.HgvsCache(str(tmp_path / "hgvs.db"), "v1", max_entries=2)
+
+    for v in ['a', 'b', 'c']:
+        cache.get_or_compute('normalize', [], v, lambda: None)
+        time.sleep(0.01)
+
+    assert cache.evict() == 1
+    cache.get_or_compute('normalize', [], 'a', lambda: 'recomputed')
+    assert cache.misses == 4
+
+
+def test_cached_conversion_skips_failures(tmp_path):
+    class Wrapper:
+        def __init__(self):
+            self.conversion_cache = hgvs_utils.HgvsCache(str(tmp_path / "hgvs.db"), "v1")
+            self.calls = 0
+
+        @hgvs_utils._cached_conversion
+        def convert(self, v, assembly='GRCh38'):
+            self.calls += 1
+            if v == 'invalid':
+                raise ValueError(v)
+            return v.upper()
+
+    w = Wrapper()
+    assert w.convert('x') == w.convert('x', assembly='GRCh38') == 'X'
+    assert w.convert('x', 'GRCh37') == 'X'
+    assert w.calls == 2
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            w.convert('invalid')
+    assert w.calls == 4
@@ -0,0 +1,58 @@
+"""
+Importing pipeline modules must not connect to UTA, SeqRepo or any other service. Those resources are
+created lazily (e.g. HgvsWrapper.get_instance()) by the code using them, otherwise every task spawned by
+the workflow and every test collection pays for them.
+"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+pipeline_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+IMPORT_WITHOUT_IO = """
+import importlib
+import pkgutil
+import socket
+import sys
+
+import psycopg2
+from biocommons.seqrepo import SeqRepo
+
+
+def forbidden(*args, **kwargs):
+    raise AssertionError("I/O on import")
+
+
+socket.socket.connect = forbidden
+socket.getaddrinfo = forbidden
+socket.create_connection = forbidden
+psycopg2.connect = forbidden
+SeqRepo.__init__ = forbidden
+
+package = importlib.import_module(sys.argv[1])
+for module in pkgutil.iter_modules(package.__path__):
+    if not module.name.startswith("test_"):
+        importlib.import_module(package.__name__ + "." + module.name)
+"""
+
+
+@pytest.mark.parametrize("package", ["common", "clinvar", "data_merging"])
+def test_import_does_not_do_io(package):
+    result = subprocess.run([sys.executable, "-c", IMPORT_WITHOUT_IO, package], cwd=pipeline_dir,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    assert result.returncode == 0, result.stdout
+
+
+@pytest.mark.parametrize("modules", [["common.liftover", "common.variant_utils"],
+                                     ["common.variant_utils", "common.liftover"]])
+def test_import_order(modules):
+    # common.liftover depends on common.variant_utils but not vice versa, such that they import in any order
+    check = "import importlib, sys\n" \
+            "importlib.import_module(sys.argv[1])\n" \
+            "assert sys.argv[1] != 'common.variant_utils' or 'common.liftover' not in sys.modules\n" \
+            "importlib.import_module(sys.argv[2])\n"
+    result = subprocess.run([sys.executable, "-c", check] + modules, cwd=pipeline_dir,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    assert result.returncode == 0, result.stdout
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+from bioutils.sequences import reverse_complement
+
+from common import liftover
+from common.variant_utils import VCFVariant
+
+random.seed(7)
+TARGET_SEQ = ''.join(random.choice('ACGT') for _ in range(100))
+TARGET_SEQ_2 = ''.join(random.choice('ACGT') for _ in range(40))
+
+# chr1 [0, 20) -> chrT [10, 30), gap, chr1 [25, 50) -> chrT [35, 60),
+# chr1 [60, 80) -> minus strand of chrT2 and chr1 [70, 75) -> chrT [80, 85), overlapping the previous block
+CHAIN = """chain 1000 chr1 100 + 0 50 chrT 100 + 10 60 1
+20 5 5
+25
+
+chain 900 chr1 100 + 60 80 chrT2 40 - 0 20 2
+20
+
+chain 500 chr1 100 + 70 75 chrT 100 + 80 85 3
+5
+"""
+
+
+@pytest.fixture()
+def lo(tmp_path):
+    chain_file = tmp_path / 'test.over.chain'
+    chain_file.write_text(CHAIN)
+    ref_file = tmp_path / 'target.fa'
+    ref_file.write_text(">chrT\n{}\n>chrT2\n{}\n".format(TARGET_SEQ, TARGET_SEQ_2))
+    return liftover.ChainLiftover(str(chain_file), str(ref_file))
+
+
+def test_read_chain_file(tmp_path):
+    chain_file = tmp_path / 'test.over.chain'
+    chain_file.write_text(CHAIN)
+
+    assert liftover.read_chain_file(str(chain_file))['1'] == [
+        (0, 20, ('chrT', 10, 30, '+')),
+        (25, 50, ('chrT', 35, 60, '+')),
+        (60, 80, ('chrT2', 20, 40, '-')),
+        (70, 75, ('chrT', 80, 85, '+'))]
+
+
+def test_convert_variant(lo):
+    ref = TARGET_SEQ[40]
+    alt = 'A' if ref != 'A' else 'C'
+    assert lo.convert_variant(VCFVariant('1', 31, 'N', alt)) == (VCFVariant('T', 41, ref, alt), None)
+    assert lo.convert_variant(VCFVariant('chr1', 31, 'N', alt)) == (VCFVariant('chrT', 41, ref, alt), None)
+
+    # reference allele is taken from the target assembly
+    assert lo.convert_variant(VCFVariant(1, 2, 'NN', 'N'))[0] == VCFVariant('T', 12, TARGET_SEQ[11:13], 'N')
+
+
+def test_convert_variant_minus_strand(lo):
+    # source position 63 is at offset 2 of the block, i.e. 3rd base from the end of the reverse complement
+    assert lo.convert_variant(VCFVariant(1, 63, 'N', 'AC')) == \
+           (VCFVariant('T2', 38, TARGET_SEQ_2[37], reverse_complement('AC')), None)
+
+
+def test_convert_indel_minus_strand(lo):
+    # the deleted G at source position 64 is at target position 37, which is anchored at the preceding base
+    assert lo.convert_variant(VCFVariant(1, 63, 'AG', 'A')) == \
+           (VCFVariant('T2', 36, TARGET_SEQ_2[35:37], TARGET_SEQ_2[35]), None)
+    # CT inserted after source position 63 is inserted as AG after target position 37
+    assert lo.convert_variant(VCFVariant(1, 63, 'A', 'ACT')) == \
+           (VCFVariant('T2', 37, TARGET_SEQ_2[36], TARGET_SEQ_2[36] + 'AG'), None)
+    assert lo.convert_variant(VCFVariant(1, 63, 'AG', 'A,GT')) == (None, liftover.FAIL_MINUS_STRAND_INDEL)
+
+
+def test_convert_variant_failures(lo):
+    assert lo.convert_variant(VCFVariant(1, 22, 'N', 'A')) == (None, liftover.FAIL_UNMAP)
+    assert lo.convert_variant(VCFVariant(2, 5, 'N', 'A')) == (None, liftover.FAIL_UNMAP)
+    assert lo.convert_variant(VCFVariant(1, 72, 'N', 'A')) == (None, liftover.FAIL_MULTIPLE_HITS)
+    assert lo.convert_variant(VCFVariant(1, 5, 'N', TARGET_SEQ[14])) == (None, liftover.FAIL_REF_EQ_ALT)
+
+
+def test_convert_variants(lo):
+    variants = [VCFVariant(1, 5, 'N', 'ACGT'), VCFVariant(1, 22, 'N', 'A'), VCFVariant(1, 40, 'N', 'ACGT')]
+
+    converted, failed = lo.convert_variants(variants)
+
+    assert [(v.chr, v.pos) for v in converted] == [('T', 15), ('T', 50)]
+    assert failed == [variants[1]]
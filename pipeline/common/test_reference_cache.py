@@ -0,0 +1,84 @@
+import os
+import random
+
+import bioutils
+import pytest
+from mock import patch
+
+from common import reference_cache, seq_utils
+from common.config import load_config, extract_gene_regions_dict
+from common.utils import ChrInterval
+
+pwd = os.path.dirname(os.path.realpath(__file__))
+
+
+@pytest.fixture
+def seqs():
+    random.seed(42)
+    seq1 = ''.join(random.choice('ACGT') for _ in range(1001))
+    seq2 = 'NNNN' + ''.join(random.choice('ACGT') for _ in range(50)) + 'NRN' + 'acgt' + 'GATTACA'
+    return {(13, 100): seq1, (17, 5000): seq2}
+
+
+@pytest.fixture
+def cache(seqs, tmp_path):
+    path = str(tmp_path / 'test.refcache')
+    reference_cache.build_reference_cache(path, 'GRCh38.p11', [(c, s, seq) for (c, s), seq in seqs.items()])
+    return reference_cache.ReferenceCache(path)
+
+
+def test_region_seq(cache, seqs):
+    for (c, s), seq in seqs.items():
+        packed = cache.region_seq(c, s)
+
+        assert len(packed) == len(seq)
+        assert str(packed) == seq
+        assert ''.join(packed) == seq
+
+
+def test_slices(cache, seqs):
+    for (c, s), seq in seqs.items():
+        packed = cache.region_seq(c, s)
+        for start in range(0, len(seq), 7):
+            for length in [0, 1, 3, 4, 5, 17]:
+                assert packed[start:start + length] == seq[start:start + length]
+        assert packed[-3:] == seq[-3:]
+        assert packed[5] == seq[5]
+        assert packed[-1] == seq[-1]
+        assert packed.startswith(seq[10:20], 10)
+        assert not packed.startswith('X', 10)
+
+    with pytest.raises(IndexError):
+        cache.region_seq(13, 100)[2000]
+
+
+def test_cache_path():
+    regions = [ChrInterval(13, 100, 200), ChrInterval(17, 300, 400)]
+
+    assert reference_cache.cache_path('/cache', 'GRCh38.p11', regions, 500) == \
+        reference_cache.cache_path('/cache', 'GRCh38.p11', list(reversed(regions)), 500)
+    assert reference_cache.cache_path('/cache', 'GRCh38.p11', regions, 500) != \
+        reference_cache.cache_path('/cache', 'GRCh38.p11', regions, 0)
+
+
+def test_seq_repo_wrapper_with_reference_cache(fetch_seq_mock_data, tmp_path):
+    cfg = load_config(os.path.join(pwd, '..', 'data_merging', 'test_files', 'gene_config_test.txt'))
+    regions = list(extract_gene_regions_dict(cfg, 'start_hg38_legacy_variants', 'end_hg38_legacy_variants').keys())
+
+    with patch.object(bioutils.seqfetcher, 'fetch_seq',
+                      side_effect=lambda ac, s, e: fetch_seq_mock_data[(str(ac), str(s), str(e))]):
+        expected = seq_utils.SeqRepoWrapper(regions_preload=regions)
+        built = seq_utils.SeqRepoWrapper(regions_preload=regions, reference_cache_dir=str(tmp_path))
+
+    # the cache is only built once, afterwards nothing is fetched anymore
+    with patch.object(bioutils.seqfetcher, 'fetch_seq', side_effect=Exception("no fetching expected")):
+        cached = seq_utils.SeqRepoWrapper(regions_preload=regions, reference_cache_dir=str(tmp_path))
+
+    for r in regions:
+        for pos in [r.start, r.start + 1234, r.end]:
+            assert built.get_seq_at(r.chr, pos, 10) == expected.get_seq_at(r.chr, pos, 10)
+            assert cached.get_seq_at(r.chr, pos, 10) == expected.get_seq_at(r.chr, pos, 10)
+
+        seq, start = seq_utils.WholeSeqSeqProvider(cached).get_seq_with_start(r.chr, r.start)
+        expected_seq, expected_start = seq_utils.WholeSeqSeqProvider(expected).get_seq_with_start(r.chr, r.start)
+        assert (str(seq), start) == (expected_seq, expected_start)
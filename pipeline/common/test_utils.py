@@ -16,3 +16,57 @@ def test_parallelize_dataframe():
 
     pd.testing.assert_series_equal(utils.parallelize_dataframe(df, double_numbers)['doubled'], expected,
                                    check_names=False)
+
+
+def test_static_interval_index_at():
+    index = utils.StaticIntervalIndex.from_tuples([(20, 30, 'b'), (10, 15, 'a'), (25, 40, 'c')])
+
+    assert [i.data for i in index.at(12)] == ['a']
+    assert [i.data for i in index.at(27)] == ['b', 'c']
+    assert [i.data for i in index.at(35)] == ['c']
+    assert index.at(15) == []
+    assert index.at(5) == []
+    assert len(index) == 3
+
+    begin, end, data = index.at(10)[0]
+    assert (begin, end, data) == (10, 15, 'a')
+
+
+def test_static_interval_index_overlap():
+    index = utils.StaticIntervalIndex.from_tuples([(20, 30, 'b'), (10, 15, 'a'), (25, 40, 'c')])
+
+    assert [i.data for i in index.overlap(14, 21)] == ['a', 'b']
+    assert [i.data for i in index.overlap(0, 50)] == ['a', 'b', 'c']
+    assert [i.data for i in index.overlap(35, 36)] == ['c']
+    assert index.overlap(15, 20) == []
+    assert index.overlap(40, 45) == []
+
+
+def test_static_interval_index_batch_at():
+    index = utils.StaticIntervalIndex.from_tuples([(10, 15, 'a'), (20, 50, 'b'), (25, 30, 'c')])
+
+    found = index.batch_at([5, 10, 14, 15, 22, 27, 35, 50])
+    assert [index.intervals[i].data if i >= 0 else None for i in found] == \
+        [None, 'a', 'a', None, 'b', 'c', 'b', None]
+    assert index.contains([9, 10]).tolist() == [False, True]
+    assert index.at_indices(27) == [1, 2]
+
+    empty = utils.StaticIntervalIndex()
+    assert not empty
+    assert empty.at(10) == []
+    assert empty.batch_at([1, 2]).tolist() == [-1, -1]
+
+
+def test_stage_timings(caplog):
+    timings = utils.StageTimings()
+    with timings.stage("first"):
+        pass
+    with timings.stage("second"):
+        pass
+
+    assert [name for name, _ in timings.timings] == ["first", "second"]
+    assert all(t >= 0 for _, t in timings.timings)
+
+    with caplog.at_level("INFO"):
+        timings.log_summary()
+    assert "first" in caplog.text and "Total" in caplog.text
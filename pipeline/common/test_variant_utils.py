@@ -1,8 +1,19 @@
 
+import bioutils.assemblies
+import hgvs.parser
 import pytest
+from hypothesis import given, settings, assume
+from hypothesis.strategies import integers, sampled_from, text, booleans
 
 from common import variant_utils
 
+# contig to accession map, like HgvsWrapper.contig_maps, without connecting to UTA
+CONTIG_MAP_38 = {s['name']: s['refseq_ac'] for s in bioutils.assemblies.get_assemblies()['GRCh38.p11']['sequences']
+                 if s['refseq_ac']}
+
+chromosomes = sampled_from([str(c) for c in range(1, 23)])
+alleles = text(alphabet='ACGT', max_size=8)
+
 variants = ['chr17:g.43094426:C>T',
             'chr17:g.43071235:CCCT>C',
             'chr13:g.32371231:T>TC',
@@ -34,3 +45,30 @@ def test_hgvs_to_vcf(hgvs_wrapper, v, expected, seq_fetcher):
     v = variant_utils.VCFVariant.from_hgvs_obj(hgvs_var, seq_fetcher)
 
     assert str(v) == expected
+
+
+@settings(deadline=None)
+@given(chromosomes, integers(min_value=1, max_value=250000000), alleles, alleles, booleans())
+def test_to_hgvs_str_equals_hgvs_library(chr, pos, ref, alt, include_ref):
+    assume(ref or alt)
+    v = variant_utils.VCFVariant(chr, pos, ref, alt)
+    hgvs_obj = v.to_hgvs_obj(CONTIG_MAP_38)
+    expected = hgvs_obj.format(conf={'max_ref_length': None}) if include_ref else str(hgvs_obj)
+
+    assert v.to_hgvs_str(CONTIG_MAP_38, include_ref=include_ref) == expected
+
+
+@settings(deadline=None)
+@given(chromosomes, integers(min_value=1, max_value=250000000), alleles.filter(bool), alleles.filter(bool))
+def test_from_hgvs_str_equals_hgvs_library(chr, pos, ref, alt):
+    s = variant_utils.VCFVariant(chr, pos, ref, alt).to_hgvs_str(CONTIG_MAP_38, include_ref=True)
+    parser = hgvs.parser.Parser()
+
+    assert variant_utils.VCFVariant.from_hgvs_str(s, parser) == \
+        variant_utils.VCFVariant.from_hgvs_obj(parser.parse(s))
+
+
+@pytest.mark.parametrize("v", variants)
+def test_from_hgvs_str_roundtripping(v):
+    s = variant_utils.VCFVariant.from_str(v).to_hgvs_str(CONTIG_MAP_38, include_ref=True)
+    assert str(variant_utils.VCFVariant.from_hgvs_str(s)) == v
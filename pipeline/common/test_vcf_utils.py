@@ -0,0 +1,83 @@
+import glob
+import io
+import os
+from copy import deepcopy
+
+import pytest
+import vcf
+
+from common import vcf_utils
+
+test_files_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..', 'data_merging', 'test_files')
+
+VCF = '''##fileformat=VCFv4.0
+##source=test
+##INFO=<ID=AF,Number=A,Type=Float,Description="allele frequency">
+##INFO=<ID=AN,Number=1,Type=Integer,Description="allele number">
+##INFO=<ID=Submitter,Number=.,Type=String,Description="">
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO
+13\t32314943\t.\tA\tG,T\t.\t.\tSubmitter=A,NA,.;AF=0.10,1e-05;AN=100;FLAG;Other=x
+'''
+
+
+def _roundtrip(reader_cls, writer_cls, path, strict_whitespace):
+    out = io.StringIO()
+    with open(path, 'r') as f:
+        reader = reader_cls(f, strict_whitespace=strict_whitespace)
+        writer = writer_cls(out, reader)
+        for record in reader:
+            writer.write_record(record)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize('path', sorted(glob.glob(os.path.join(test_files_dir, '*.vcf'))))
+def test_same_output_as_pyvcf(path):
+    assert _roundtrip(vcf_utils.Reader, vcf_utils.Writer, path, True) == \
+        _roundtrip(vcf.Reader, vcf.Writer, path, True)
+
+
+@pytest.mark.parametrize('path', sorted(glob.glob(os.path.join(test_files_dir, '*.vcf'))))
+def test_same_info_as_pyvcf(path):
+    with open(path, 'r') as f1, open(path, 'r') as f2:
+        for record, expected in zip(vcf_utils.Reader(f1, strict_whitespace=True), vcf.Reader(f2, strict_whitespace=True)):
+            assert (record.CHROM, record.POS, record.REF) == (expected.CHROM, expected.POS, expected.REF)
+            assert record.ALT == [str(a) for a in expected.ALT]
+            assert dict(record.INFO) == expected.INFO
+
+
+def test_info_values():
+    record = next(vcf_utils.Reader(io.StringIO(VCF), strict_whitespace=True))
+
+    assert record.INFO['AF'] == [0.1, 1e-05]
+    assert record.INFO['AN'] == 100
+    assert record.INFO['Submitter'] == ['A', None, None]
+    assert record.INFO['FLAG'] is True
+    assert record.INFO['Other'] == ['x']
+    assert 'BX_ID' not in record.INFO
+
+
+def test_info_converted_lazily():
+    record = next(vcf_utils.Reader(io.StringIO(VCF), strict_whitespace=True))
+
+    assert record.INFO['AN'] == 100
+    assert record.INFO._raw_keys == {'Submitter', 'AF', 'FLAG', 'Other'}
+
+
+def test_modified_records():
+    reader = vcf_utils.Reader(io.StringIO(VCF), strict_whitespace=True)
+    record = next(reader)
+
+    new_record = deepcopy(record)
+    new_record.ALT = ['T']
+    new_record.INFO['AF'] = [new_record.INFO['AF'][1]]
+    new_record.INFO['BX_ID'] = 2
+    del new_record.INFO['FLAG']
+
+    out = io.StringIO()
+    writer = vcf_utils.Writer(out, reader)
+    writer.write_record(record)
+    writer.write_record(new_record)
+
+    assert out.getvalue().splitlines()[-2:] == [
+        '13\t32314943\t.\tA\tG,T\t.\t.\tAF=0.1,1e-05;AN=100;Submitter=A,.,.;FLAG;Other=x',
+        '13\t32314943\t.\tA\tT\t.\t.\tAF=1e-05;AN=100;Submitter=A,.,.;BX_ID=2;Other=x']
@@ -1,18 +1,124 @@
+import bisect
+import hashlib
 import importlib
 import logging
+import time
 from collections import namedtuple
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Callable, Sequence, TypeVar, Union
 
 import numpy as np
 import pandas as pd
 import pathos
-from intervaltree import IntervalTree
+from intervaltree import Interval
 from toolz import groupby
 
 ChrInterval = namedtuple("ChrInterval", "chr, start, end")
 
 
+class StaticIntervalIndex:
+    '''
+    Immutable index of half open intervals [begin, end) with payload, answering which intervals contain a position.
+
+    Replaces intervaltree.IntervalTree for intervals which don't change after being built, like gene regions.
+    Lookups bisect sorted arrays of the interval boundaries instead of traversing a tree and allocating sets.
+    Besides single positions, whole arrays of positions can be looked up at once, see batch_at.
+    '''
+
+    def __init__(self, interval_tuples=()):
+        '''
+        :param interval_tuples: Iterable[Tuple[int, int, object]]: begin, end and payload of every interval
+        '''
+        self.intervals = sorted((Interval(*t) for t in interval_tuples), key=lambda i: (i.begin, i.end))
+
+        self._begins = np.array([i.begin for i in self.intervals], dtype=np.int64)
+        self._ends = np.array([i.end for i in self.intervals], dtype=np.int64)
+
+        # maximum end of all intervals up to an index, bounding how far to look back for overlapping intervals
+        self._max_ends = np.maximum.accumulate(self._ends) if len(self.intervals) else self._ends
+        self._overlapping = bool(np.any(self._begins[1:] < self._max_ends[:-1]))
+
+        self._begins_list = self._begins.tolist()
+        self._max_ends_list = self._max_ends.tolist()
+
+    @classmethod
+    def from_tuples(cls, interval_tuples):
+        return cls(interval_tuples)
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def __iter__(self):
+        return iter(self.intervals)
+
+    def at_indices(self, pos):
+        '''
+        :return: List[int]: indices into self.intervals of the intervals containing pos, ordered by begin
+        '''
+        idx = bisect.bisect_right(self._begins_list, pos) - 1
+
+        found = []
+        while idx >= 0 and self._max_ends_list[idx] > pos:
+            if self.intervals[idx].end > pos:
+                found.append(idx)
+            idx -= 1
+        found.reverse()
+        return found
+
+    def at(self, pos):
+        '''
+        :return: List[Interval]: intervals containing pos, ordered by begin
+        '''
+        return [self.intervals[i] for i in self.at_indices(pos)]
+
+    def overlap(self, begin, end):
+        '''
+        :return: List[Interval]: intervals overlapping [begin, end), ordered by begin
+        '''
+        idx = bisect.bisect_left(self._begins_list, end) - 1
+
+        found = []
+        while idx >= 0 and self._max_ends_list[idx] > begin:
+            if self.intervals[idx].end > begin:
+                found.append(self.intervals[idx])
+            idx -= 1
+        found.reverse()
+        return found
+
+    def batch_at(self, positions):
+        '''
+        Looks up many positions at once
+
+        :param positions: array like of positions
+        :return: np.ndarray: index into self.intervals of an interval containing every position, -1 if there is none.
+          For overlapping intervals, the one with the greatest begin is returned
+        '''
+        positions = np.asarray(positions, dtype=np.int64)
+        idx = np.searchsorted(self._begins, positions, side='right') - 1
+
+        valid = idx >= 0
+        contained = np.zeros(len(positions), dtype=bool)
+        contained[valid] = self._ends[idx[valid]] > positions[valid]
+        result = np.where(contained, idx, -1)
+
+        if self._overlapping:
+            # positions not within the closest interval may still be in an earlier, overlapping interval
+            for i in np.flatnonzero(~contained & valid):
+                found = self.at_indices(int(positions[i]))
+                if found:
+                    result[i] = found[-1]
+
+        return result
+
+    def contains(self, positions):
+        '''
+        :param positions: array like of positions
+        :return: np.ndarray[bool]: whether every position is within any interval
+        '''
+        return self.batch_at(positions) >= 0
+
+
 def build_interval_trees_by_chr(chr_intervals, interval_tuple_builder):
     '''
     Build a dictionary from chromosome to a interval tree.
@@ -21,7 +127,7 @@ def build_interval_trees_by_chr(chr_intervals, interval_tuple_builder):
 
     :param chr_intervals: Iterable[ChrInterval]
     :param interval_tuple_builder: Function[ChrInterval, object]
-    :return: dict[int, IntervalTree]
+    :return: dict[int, StaticIntervalIndex]
     '''
     d = {}
 
@@ -31,7 +137,7 @@ def build_interval_trees_by_chr(chr_intervals, interval_tuple_builder):
             (r.start, r.end + 1, interval_tuple_builder(c, r.start, r.end)) for
             r in regs]
 
-        d[c] = IntervalTree.from_tuples(
+        d[c] = StaticIntervalIndex.from_tuples(
                 interval_tuples)
 
     return d
@@ -67,6 +173,48 @@ def parallelize_dataframe(df: pd.DataFrame, func: Callable[[pd.DataFrame], pd.Da
     return df
 
 
+class StageTimings:
+    '''
+    Measures the wall clock time of the stages of a script and logs a summary, e.g.
+
+        timings = StageTimings()
+        with timings.stage("Normalization"):
+            ...
+        timings.log_summary()
+    '''
+
+    def __init__(self):
+        self.timings = []
+
+    @contextmanager
+    def stage(self, name):
+        logging.info(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings.append((name, time.perf_counter() - start))
+
+    def log_summary(self):
+        total = sum(t for _, t in self.timings)
+        logging.info("Timings per stage:")
+        for name, t in self.timings:
+            logging.info("  %-50s %9.1fs %5.1f%%", name, t, 100 * t / total if total else 0)
+        logging.info("  %-50s %9.1fs", "Total", total)
+
+
+def file_fingerprint(*paths: Union[Path, str]) -> str:
+    '''
+    Computes a SHA-256 hex digest over the contents of the given files, taken in the given order.
+    '''
+    h = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                h.update(block)
+    return h.hexdigest()
+
+
 def setup_logfile(log_path, log_level=logging.INFO):
     # https://stackoverflow.com/questions/20240464/python-logging-file-is-not-working-when-using-logging-basicconfig
     importlib.reload(logging)
@@ -1,16 +1,27 @@
+import re
 from collections import namedtuple
 
 import hgvs
+import hgvs.parser
 
 from common import seq_utils
 from bioutils.sequences import reverse_complement
 
 from typing import Iterable
 from pathlib import Path
-import tempfile
-import subprocess
-import logging
-import os
+
+# substitutions and delins with explicit reference bases on chromosome accessions, e.g. NC_000017.11:g.100_102delAAGinsA
+_SIMPLE_HGVS_G_RE = re.compile(r'NC_(\d+)\.\d+:g\.(\d+)(?:_\d+)?(?:([ACGT])>([ACGT])|del([ACGT]+)ins([ACGT]+))$')
+
+_hgvs_parser = None
+
+
+def _shared_hgvs_parser():
+    global _hgvs_parser
+    if _hgvs_parser is None:
+        _hgvs_parser = hgvs.parser.Parser()
+    return _hgvs_parser
+
 
 class VCFVariant(namedtuple("VCFVariant", "chr,pos,ref,alt")):
     __slots__ = ()
@@ -38,19 +49,61 @@ class VCFVariant(namedtuple("VCFVariant", "chr,pos,ref,alt")):
                                                     type='g',
                                                     posedit=posedit)
 
+    def to_hgvs_str(self, contig_ac_map, include_ref=False):
+        """
+        Same as str(self.to_hgvs_obj(contig_ac_map)), or formatting it with all reference bases if include_ref is True.
+        Substitutions and delins are formatted directly, other variants via the hgvs library.
+        """
+        ref = self.ref
+        alt = self.alt
+
+        if not ref or not alt or ref == alt:
+            hgvs_obj = self.to_hgvs_obj(contig_ac_map)
+            return hgvs_obj.format(conf={'max_ref_length': None}) if include_ref else str(hgvs_obj)
+
+        ac = contig_ac_map[str(self.chr)]
+        start = int(self.pos)
+
+        if len(ref) == 1 and len(alt) == 1:
+            return "{}:g.{}{}>{}".format(ac, start, ref, alt)
+
+        interval = str(start) if len(ref) == 1 else "{}_{}".format(start, start + len(ref) - 1)
+        return "{}:g.{}del{}ins{}".format(ac, interval, ref if include_ref else '', alt)
+
     def __str__(self):
         return "chr{}:g.{}:{}>{}".format(self.chr, self.pos, self.ref, self.alt)
 
     @staticmethod
     def from_str(s):
-        return VCFVariant(
-            int(s.split(':')[0].lstrip('chr')),
-            int(s.split(':')[1].lstrip('g.')),
-            s.split(':')[2].split('>')[0],
-            s.split(':')[2].split('>')[1])
+        chr, pos, ref_alt = s.split(':')
+        ref, alt = ref_alt.split('>')
+        return VCFVariant(int(chr.lstrip('chr')), int(pos.lstrip('g.')), ref, alt)
 
     @staticmethod
-    def from_hgvs_obj(hgvs_var, seq_fetcher=seq_utils.SeqRepoWrapper.get_instance()):
+    def from_hgvs_str(s, hgvs_parser=None, seq_fetcher=None):
+        """
+        Same as VCFVariant.from_hgvs_obj(hgvs_parser.parse(s)). Substitutions and delins with reference bases
+        are read directly, other variants via the hgvs library.
+
+        :param hgvs_parser: hgvs.parser.Parser for variants read via the hgvs library, a shared one if None
+        :param seq_fetcher: SeqRepoWrapper instance, only needed for variants read via the hgvs library
+        """
+        m = _SIMPLE_HGVS_G_RE.match(s)
+        if m:
+            chr, pos, sub_ref, sub_alt, delins_ref, delins_alt = m.groups()
+            if sub_ref:
+                return VCFVariant(int(chr), int(pos), sub_ref, sub_alt)
+            return VCFVariant(int(chr), int(pos), delins_ref, delins_alt)
+
+        if hgvs_parser is None:
+            hgvs_parser = _shared_hgvs_parser()
+        return VCFVariant.from_hgvs_obj(hgvs_parser.parse(s), seq_fetcher)
+
+    @staticmethod
+    def from_hgvs_obj(hgvs_var, seq_fetcher=None):
+        if seq_fetcher is None:
+            seq_fetcher = seq_utils.SeqRepoWrapper.get_instance()
+
         chr = int(hgvs_var.ac.split("_")[1].split('.')[0])
 
         alt = hgvs_var.posedit.edit.alt if hasattr(hgvs_var.posedit.edit, 'alt') else ''
@@ -95,37 +148,7 @@ class VCFVariant(namedtuple("VCFVariant", "chr,pos,ref,alt")):
 
 
 def convert_to_hg38(vars: Iterable[VCFVariant], chain_file, ref_file, resource_dir):
-    def pseudo_vcf_entry(v):
-        entries = [v.chr, v.pos, '.', v.ref, v.alt, '', '', '']
-        return '\t'.join([str(s) for s in entries])
-
-    lst = [pseudo_vcf_entry(v) for v in vars]
-
-    vcf_tmp = tempfile.mktemp('.vcf')
-    with open(vcf_tmp, 'w') as f:
-        f.write('\n'.join(lst))
-
-    vcf_tmp_out = tempfile.mktemp('.vcf')
-
-    args = ["CrossMap.py", "vcf",
-            chain_file,
-            vcf_tmp,
-            ref_file,
-            vcf_tmp_out]
-
-    logging.info("Running CrossMap.py to convert to hg38")
-    sp = subprocess.Popen(args)
-    out, err = sp.communicate()
-    if out:
-        logging.info("standard output of subprocess: {}".format(out))
-    if err:
-        logging.info("standard output of subprocess: {}".format(err))
-
-    vcf_out_lines = open(vcf_tmp_out, 'r').readlines()
-
-    if os.path.exists(vcf_tmp_out + '.unmap'):
-        vcf_out_failed_lines = open(vcf_tmp_out + '.unmap', 'r').readlines()
-        return ([VCFVariant(v[0], int(v[1]), v[3], v[4]) for v in [l.strip().split('\t') for l in vcf_out_lines]],
-                [VCFVariant(v[0], int(v[1]), v[3], v[4]) for v in [l.strip().split('\t') for l in vcf_out_failed_lines]])
-    else:
-        return ([VCFVariant(v[0], int(v[1]), v[3], v[4]) for v in [l.strip().split('\t') for l in vcf_out_lines]], [])
+    # common.liftover depends on this module, not the other way round
+    from common import liftover
+
+    return liftover.get_liftover(chain_file, ref_file).convert_variants(vars)
@@ -1,4 +1,3 @@
-import hgvs
 import pandas as pd
 
 from .hgvs_utils import HgvsWrapper
@@ -6,8 +5,8 @@ from .seq_utils import SeqRepoWrapper
 from .variant_utils import VCFVariant
 
 
-def cdna_str_to_genomic_var(cdna_hgvs_str, assembly=HgvsWrapper.GRCh38_Assem, hgvs_wrapper = HgvsWrapper.get_instance(),
-                            seq_fetcher=SeqRepoWrapper.get_instance()):
+def cdna_str_to_genomic_var(cdna_hgvs_str, assembly=HgvsWrapper.GRCh38_Assem, hgvs_wrapper=None,
+                            seq_fetcher=None):
     """
     Convert a CDNA HGVS string into a genomic coordinate.
     Normalizes in genomic space.
@@ -15,10 +14,15 @@ def cdna_str_to_genomic_var(cdna_hgvs_str, assembly=HgvsWrapper.GRCh38_Assem, hg
 
     :param cdna_hgvs_str: str
     :param assembly: str, assembly version
-    :param hgvs_wrapper: HgvsWrapper instance
-    :param seq_fetcher: SeqRepoWrapper instance
+    :param hgvs_wrapper: HgvsWrapper instance, HgvsWrapper.get_instance() if None
+    :param seq_fetcher: SeqRepoWrapper instance, SeqRepoWrapper.get_instance() if None
     :return: VCF variant object
     """
+    if hgvs_wrapper is None:
+        hgvs_wrapper = HgvsWrapper.get_instance()
+    if seq_fetcher is None:
+        seq_fetcher = SeqRepoWrapper.get_instance()
+
     # assembly_name of seq_fetcher may contain the patch version, like GRCh38.p11
     assert seq_fetcher.assembly_name.startswith(assembly), \
         "seq_fetcher assembly does not correspond to assembly. " \
@@ -28,7 +32,7 @@ def cdna_str_to_genomic_var(cdna_hgvs_str, assembly=HgvsWrapper.GRCh38_Assem, hg
 
     hgvs_g = hgvs_wrapper.nm_to_genomic(hgvs_cdna, assembly)
 
-    hgvs_g_norm = hgvs.normalizer.Normalizer(hgvs_wrapper.hgvs_dp, shuffle_direction=5).normalize(hgvs_g)
+    hgvs_g_norm = hgvs_wrapper.normalize(hgvs_g, shuffle_direction=5)
     return VCFVariant.from_hgvs_obj(hgvs_g_norm, seq_fetcher)
 
 
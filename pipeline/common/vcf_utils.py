@@ -0,0 +1,453 @@
+'''
+Lightweight VCF reader and writer for the merging stages of the pipeline.
+
+Records and headers are read and written the same way as PyVCF does, such that the
+output of a PyVCF based step doesn't change when switching over. Contrary to PyVCF,
+the INFO column is kept as it is in the line and only the entries actually accessed are
+converted to python values. Sample columns are not parsed and passed through as they are.
+'''
+import re
+from collections import OrderedDict, namedtuple
+from collections.abc import MutableMapping
+from copy import deepcopy
+
+INTEGER = 0
+STRING = 1
+FLOAT = 2
+FLAG = 3
+
+_TYPE_CODES = {
+    "Integer": INTEGER,
+    "String": STRING,
+    "Character": STRING,
+    "Float": FLOAT,
+    "Numeric": FLOAT,
+    "Flag": FLAG,
+}
+
+# INFO keys reserved by the VCF specification, used if a key isn't declared in the header
+RESERVED_INFO_CODES = {k: _TYPE_CODES[v] for k, v in {
+    "AA": "String", "AC": "Integer", "AF": "Float", "AN": "Integer", "BQ": "Float",
+    "CIGAR": "String", "DB": "Flag", "DP": "Integer", "END": "Integer", "H2": "Flag",
+    "H3": "Flag", "MQ": "Float", "MQ0": "Integer", "NS": "Integer", "SB": "String",
+    "SOMATIC": "Flag", "VALIDATED": "Flag", "1000G": "Flag",
+    # structural variants
+    "IMPRECISE": "Flag", "NOVEL": "Flag", "SVTYPE": "String", "SVLEN": "Integer",
+    "CIPOS": "Integer", "CIEND": "Integer", "HOMLEN": "Integer", "HOMSEQ": "String",
+    "BKPTID": "String", "MEINFO": "String", "METRANS": "String", "DGVID": "String",
+    "DBVARID": "String", "DBRIPID": "String", "MATEID": "String", "PARID": "String",
+    "EVENT": "String", "CILEN": "Integer", "DPADJ": "Integer", "CN": "Integer",
+    "CNADJ": "Integer", "CICN": "Integer", "CICNADJ": "Integer"}.items()}
+
+SINGULAR_METADATA = ["fileformat", "fileDate", "reference"]
+
+# special values of the Number attribute of INFO and FORMAT header lines
+FIELD_COUNTS = {".": None, "A": -1, "G": -2, "R": -3}
+_FIELD_COUNT_STRS = {v: k for k, v in FIELD_COUNTS.items()}
+
+MISSING_VALUES = frozenset([".", "", "NA"])
+
+Info = namedtuple("Info", ["id", "num", "type", "desc", "type_code"])
+Filter = namedtuple("Filter", ["id", "desc"])
+Alt = namedtuple("Alt", ["id", "desc"])
+Format = namedtuple("Format", ["id", "num", "type", "desc"])
+Contig = namedtuple("Contig", ["id", "length"])
+
+_INFO_PATTERN = re.compile(r'''\#\#INFO=<
+    ID=(?P<id>[^,]+),\s*
+    Number=(?P<number>-?\d+|\.|[AGR])?,\s*
+    Type=(?P<type>Integer|Float|Flag|Character|String),\s*
+    Description="(?P<desc>[^"]*)"
+    (?:,\s*Source="(?P<source>[^"]*)")?
+    (?:,\s*Version="?(?P<version>[^"]*)"?)?
+    >''', re.VERBOSE)
+_FILTER_PATTERN = re.compile(r'''\#\#FILTER=<
+    ID=(?P<id>[^,]+),\s*
+    Description="(?P<desc>[^"]*)"
+    >''', re.VERBOSE)
+_ALT_PATTERN = re.compile(r'''\#\#ALT=<
+    ID=(?P<id>[^,]+),\s*
+    Description="(?P<desc>[^"]*)"
+    >''', re.VERBOSE)
+_FORMAT_PATTERN = re.compile(r'''\#\#FORMAT=<
+    ID=(?P<id>.+),\s*
+    Number=(?P<number>-?\d+|\.|[AGR]),\s*
+    Type=(?P<type>.+),\s*
+    Description="(?P<desc>.*)"
+    >''', re.VERBOSE)
+_CONTIG_PATTERN = re.compile(r'''\#\#contig=<
+    ID=(?P<id>[^>,]+)
+    (,.*length=(?P<length>-?\d+))?
+    .*
+    >''', re.VERBOSE)
+_META_PATTERN = re.compile(r'''##(?P<key>.+?)=(?P<val>.+)''')
+_META_HASH_PATTERN = re.compile(r'''##.+=<''')
+
+
+def _field_count(num_str):
+    if num_str is None:
+        return None
+    if num_str in FIELD_COUNTS:
+        return FIELD_COUNTS[num_str]
+    return int(num_str)
+
+
+def _match_header_line(pattern, line, kind):
+    match = pattern.match(line)
+    if not match:
+        raise SyntaxError("One of the {} lines is malformed: {}".format(kind, line))
+    return match
+
+
+def _parse_meta_hash(line):
+    # values of a hash like ##key=<k1=v1,k2="v,2"> may be quoted and contain commas
+    key, _, hash_str = line.partition("=")
+    val = OrderedDict()
+    k, v = "", ""
+    state = 0
+    for c in hash_str.strip("[<>]"):
+        if state == 0:
+            if c == "=":
+                state = 1
+            else:
+                k += c
+        elif state == 1:
+            if v == "" and c == '"':
+                v += c
+                state = 2
+            elif c == ",":
+                val[k] = v
+                state = 0
+                k, v = "", ""
+            else:
+                v += c
+        else:
+            v += c
+            if c == '"':
+                state = 1
+    if k != "":
+        val[k] = v
+    return key.lstrip("#"), val
+
+
+def _parse_meta(line):
+    if _META_HASH_PATTERN.match(line):
+        return _parse_meta_hash(line)
+    match = _META_PATTERN.match(line)
+    if not match:
+        return line.lstrip("#"), "none"
+    return match.group("key"), match.group("val")
+
+
+def _stringify(value, delim=","):
+    if type(value) == list:
+        return delim.join("." if v is None else str(v) for v in value)
+    return "." if value is None else str(value)
+
+
+def _format_info_entry(key, value):
+    if isinstance(value, bool):
+        return str(key) if value else ""
+    return "%s=%s" % (key, _stringify(value))
+
+
+class _InfoTypes(dict):
+    '''
+    Maps INFO keys to their type code and whether they hold a single value. The type code
+    is None for keys neither declared in the header nor reserved, which are typed by their value.
+    '''
+
+    def __init__(self, infos):
+        super(_InfoTypes, self).__init__()
+        self._infos = infos
+
+    def __missing__(self, key):
+        info = self._infos.get(key)
+        if info is not None:
+            key_type = (info.type_code, info.num == 1)
+        else:
+            key_type = (RESERVED_INFO_CODES.get(key), False)
+        self[key] = key_type
+        return key_type
+
+
+class InfoFields(MutableMapping):
+    '''
+    INFO column of a record, mapping keys to values as PyVCF would parse them.
+
+    The column is split into its entries on first access and values are only
+    converted when they are accessed.
+    '''
+
+    def __init__(self, info_str, info_types):
+        self._info_str = info_str
+        self._info_types = info_types
+        # key -> value, or raw string (None for flags) if the key is in _raw_keys
+        self._fields = None
+        self._raw_keys = None
+
+    def _entries(self):
+        if self._fields is None:
+            self._fields = {}
+            if self._info_str != ".":
+                for entry in self._info_str.split(";"):
+                    key, sep, raw = entry.partition("=")
+                    self._fields[key] = raw if sep else None
+            self._raw_keys = set(self._fields)
+        return self._fields
+
+    def _convert(self, key, raw):
+        type_code, single = self._info_types[key]
+
+        if type_code == FLAG or (raw is None and type_code in (None, STRING)):
+            return True
+        if raw is None:
+            raise ValueError("Missing value for INFO key {}".format(key))
+
+        values = raw.split(",")
+        if type_code == INTEGER:
+            try:
+                value = [None if v in MISSING_VALUES else int(v) for v in values]
+            except ValueError:
+                # allowing integers to be parsed as floats in case of incorrectly declared types
+                value = [None if v in MISSING_VALUES else float(v) for v in values]
+        elif type_code == FLOAT:
+            value = [None if v in MISSING_VALUES else float(v) for v in values]
+        else:
+            value = [None if v in MISSING_VALUES else v for v in values]
+
+        if single:
+            value = value[0]
+        return value
+
+    def format_entry(self, key):
+        '''
+        Formats an entry for writing, reusing the raw string where converting the value
+        and formatting it again would result in the same string.
+        '''
+        fields = self._entries()
+        if key in self._raw_keys:
+            raw = fields[key]
+            type_code, single = self._info_types[key]
+            if type_code == FLAG or (raw is None and type_code in (None, STRING)):
+                return key
+            if type_code in (None, STRING) and not single:
+                values = raw.split(",")
+                # missing values other than "." are written as "."
+                if "" not in values and "NA" not in values:
+                    return "%s=%s" % (key, raw)
+        return _format_info_entry(key, self[key])
+
+    def __getitem__(self, key):
+        fields = self._fields if self._fields is not None else self._entries()
+        value = fields[key]
+        if key in self._raw_keys:
+            value = self._convert(key, value)
+            fields[key] = value
+            self._raw_keys.discard(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._entries()[key] = value
+        self._raw_keys.discard(key)
+
+    def __delitem__(self, key):
+        del self._entries()[key]
+        self._raw_keys.discard(key)
+
+    def __contains__(self, key):
+        return key in self._entries()
+
+    def __iter__(self):
+        return iter(self._entries())
+
+    def __len__(self):
+        return len(self._entries())
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __deepcopy__(self, memo):
+        # header information is shared by all records
+        copy = InfoFields(self._info_str, self._info_types)
+        if self._fields is not None:
+            copy._fields = deepcopy(self._fields, memo)
+            copy._raw_keys = set(self._raw_keys)
+        return copy
+
+
+class Record(object):
+    '''
+    A VCF record with the same attributes as a PyVCF record. ALT alleles are kept as strings.
+    '''
+
+    def __init__(self, CHROM, POS, ID, REF, ALT, QUAL, FILTER, INFO, FORMAT=None, samples=None):
+        self.CHROM = CHROM
+        self.POS = POS
+        self.ID = ID
+        self.REF = REF
+        self.ALT = ALT
+        self.QUAL = QUAL
+        self.FILTER = FILTER
+        self.INFO = INFO
+        self.FORMAT = FORMAT
+        self.samples = samples or []
+
+    def __repr__(self):
+        return "Record(CHROM=%(CHROM)s, POS=%(POS)s, REF=%(REF)s, ALT=%(ALT)s)" % self.__dict__
+
+
+class Reader(object):
+    '''
+    Iterates over the records of a VCF file, like vcf.Reader.
+
+    :param fsock: file like object to read from
+    :param strict_whitespace: if True, split columns on tabs only, otherwise on tabs and spaces
+    '''
+
+    def __init__(self, fsock, strict_whitespace=False):
+        self._row_pattern = None if strict_whitespace else re.compile("\t| +")
+        self._lines = (line.strip() for line in fsock if line.strip())
+
+        self.metadata = OrderedDict()
+        self.infos = OrderedDict()
+        self.filters = OrderedDict()
+        self.alts = OrderedDict()
+        self.formats = OrderedDict()
+        self.contigs = OrderedDict()
+        self._parse_header()
+        self._info_types = _InfoTypes(self.infos)
+
+    def _split(self, line):
+        if self._row_pattern is None:
+            return line.split("\t")
+        return self._row_pattern.split(line)
+
+    def _parse_header(self):
+        line = next(self._lines)
+        while line.startswith("##"):
+            if line.startswith("##INFO"):
+                m = _match_header_line(_INFO_PATTERN, line, "INFO")
+                self.infos[m.group("id")] = Info(m.group("id"), _field_count(m.group("number")), m.group("type"),
+                                                 m.group("desc"), _TYPE_CODES[m.group("type")])
+            elif line.startswith("##FILTER"):
+                m = _match_header_line(_FILTER_PATTERN, line, "FILTER")
+                self.filters[m.group("id")] = Filter(m.group("id"), m.group("desc"))
+            elif line.startswith("##ALT"):
+                m = _match_header_line(_ALT_PATTERN, line, "ALT")
+                self.alts[m.group("id")] = Alt(m.group("id"), m.group("desc"))
+            elif line.startswith("##FORMAT"):
+                m = _match_header_line(_FORMAT_PATTERN, line, "FORMAT")
+                self.formats[m.group("id")] = Format(m.group("id"), _field_count(m.group("number")), m.group("type"),
+                                                     m.group("desc"))
+            elif line.startswith("##contig"):
+                m = _match_header_line(_CONTIG_PATTERN, line, "contig")
+                self.contigs[m.group("id")] = Contig(m.group("id"), _field_count(m.group("length")))
+            else:
+                key, val = _parse_meta(line)
+                if key in SINGULAR_METADATA:
+                    self.metadata[key] = val
+                else:
+                    self.metadata.setdefault(key, []).append(val)
+            line = next(self._lines)
+
+        fields = self._split(line[1:])
+        self.column_headers = fields[:9]
+        self.samples = fields[9:]
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self._split(next(self._lines))
+
+        try:
+            qual = int(row[5])
+        except ValueError:
+            try:
+                qual = float(row[5])
+            except ValueError:
+                qual = None
+
+        filt = row[6]
+        if filt == ".":
+            filt = None
+        elif filt == "PASS":
+            filt = []
+        else:
+            filt = filt.split(";")
+
+        fmt = row[8] if len(row) > 8 and row[8] != "." else None
+
+        return Record(row[0], int(row[1]), None if row[2] == "." else row[2], row[3],
+                      [None if a in MISSING_VALUES else a for a in row[4].split(",")], qual, filt,
+                      InfoFields(row[7], self._info_types), fmt, row[9:9 + len(self.samples)] if fmt is not None else [])
+
+
+class Writer(object):
+    '''
+    Writes records to a VCF file, like vcf.Writer. The header is taken from a Reader.
+
+    :param stream: file like object to write to
+    :param template: Reader providing the header
+    '''
+
+    def __init__(self, stream, template):
+        self.stream = stream
+        self._info_order = {key: i for i, key in enumerate(template.infos)}
+        self._write_header(template)
+
+    def _write_header(self, template):
+        lines = []
+        for key, vals in template.metadata.items():
+            if key in SINGULAR_METADATA:
+                vals = [vals]
+            for val in vals:
+                if isinstance(val, dict):
+                    lines.append("##{0}=<{1}>".format(key, ",".join("{0}={1}".format(k, v) for k, v in val.items())))
+                else:
+                    lines.append("##{0}={1}".format(key, val))
+
+        four = '##{0}=<ID={1},Number={2},Type={3},Description="{4}">'
+        two = '##{0}=<ID={1},Description="{2}">'
+        for info in template.infos.values():
+            lines.append(four.format("INFO", info.id, _FIELD_COUNT_STRS.get(info.num, info.num), info.type, info.desc))
+        for fmt in template.formats.values():
+            lines.append(four.format("FORMAT", fmt.id, _FIELD_COUNT_STRS.get(fmt.num, fmt.num), fmt.type, fmt.desc))
+        for filt in template.filters.values():
+            lines.append(two.format("FILTER", *filt))
+        for alt in template.alts.values():
+            lines.append(two.format("ALT", *alt))
+        for contig in template.contigs.values():
+            if contig.length:
+                lines.append("##contig=<ID={0},length={1}>".format(*contig))
+            else:
+                lines.append("##contig=<ID={0}>".format(contig.id))
+
+        lines.append("#" + "\t".join(template.column_headers + template.samples))
+        self.stream.write("\n".join(lines) + "\n")
+
+    def _format_info(self, info):
+        if not info:
+            return "."
+
+        if isinstance(info, InfoFields):
+            format_entry = info.format_entry
+        else:
+            def format_entry(key):
+                return _format_info_entry(key, info[key])
+
+        n_infos = len(self._info_order)
+        return ";".join(format_entry(key) for key in
+                        sorted(info, key=lambda k: (self._info_order.get(k, n_infos), k)))
+
+    def write_record(self, record):
+        fields = [_stringify(record.CHROM), _stringify(record.POS), _stringify(record.ID), _stringify(record.REF),
+                  ",".join("." if a is None else str(a) for a in record.ALT),
+                  str(record.QUAL or "."),
+                  "PASS" if record.FILTER == [] else _stringify(record.FILTER, delim=";"),
+                  self._format_info(record.INFO)]
+        if record.FORMAT:
+            fields.append(record.FORMAT)
+            fields.extend(record.samples)
+        self.stream.write("\t".join(fields) + "\n")
@@ -7,6 +7,10 @@ When new tests are added, GENERATE_MOCK_DATA can be set to True, s.t. the webser
 is called and the result of this call (a sequence) added to a file in the 'data' directory.
 After this happened, the GENERATE_MOCK_DATA can be set to False and the call to that
 webservice is mocked using the data from the file just generated.
+
+Similarly, if transcript data exported from UTA (see common.hgvs_data_provider) is found
+in 'data/hgvs_local_data.json.gz', the HgvsWrapper used in tests reads from it instead of
+querying UTA.
 """
 import glob
 import os
@@ -22,6 +26,7 @@ from common.hgvs_utils import HgvsWrapper
 
 pwd = os.path.dirname(os.path.realpath(__file__))
 data_dir = os.path.join(pwd, 'data')
+hgvs_local_data_path = os.path.join(data_dir, 'hgvs_local_data.json.gz')
 
 
 @pytest.fixture(scope="session")
@@ -53,14 +58,16 @@ def generate_mock_data(ac, s, e):
 
 @pytest.fixture(scope="session")
 def hgvs_wrapper(fetch_seq_mock_data):
+    local_data_path = hgvs_local_data_path if os.path.exists(hgvs_local_data_path) else None
+
     if not GENERATE_MOCK_DATA:
         with patch.object(bioutils.seqfetcher, 'fetch_seq',
                               side_effect=lambda ac, s, e: fetch_seq_mock_data[(str(ac), str(s), str(e))]):
-            return HgvsWrapper()
+            return HgvsWrapper(local_data_path=local_data_path)
     else:
         with patch.object(bioutils.seqfetcher, 'fetch_seq',
                               side_effect=lambda ac, s, e: generate_mock_data(ac, s, e)):
-            return HgvsWrapper()
+            return HgvsWrapper(local_data_path=local_data_path)
 
 
 @pytest.fixture(scope="module")
@@ -3,6 +3,10 @@ import argparse
 import copy
 import csv
 import re
+
+import numpy as np
+import pandas as pd
+
 from data_merging.utilities import isEmpty, round_sigfigs
 
 csv.field_size_limit(10000000)
@@ -46,21 +50,33 @@ def main():
                         default="/hive/groups/cgl/brca/release1.0/merged_withVEP_cleaned.csv")
     parser.add_argument("-o", "--output",
                         default="/hive/groups/cgl/brca/release1.0/aggregated.csv")
+    parser.add_argument("-e", "--engine", choices=["rows", "columns"], default="rows",
+                        help="update rows one by one or whole columns at once (see aggregate_columns), "
+                             "producing identical output")
     args = parser.parse_args()
 
-    csvIn = csv.DictReader(open(args.input, "r"), delimiter='\t')
-    outputColumns = setOutputColumns(csvIn.fieldnames, FIELDS_TO_REMOVE,
-                                     FIELDS_TO_ADD, FIELDS_TO_RENAME)
-    csvOut = csv.DictWriter(open(args.output, "w"), delimiter='\t',
-                            fieldnames=outputColumns)
-    csvOut.writerow(dict((fn, fn) for fn in outputColumns))
-    rowCount = 0
-    for row in csvIn:
-        rowCount += 1
-        csvOut.writerow(updateRow(row, FIELDS_TO_RENAME, FIELDS_TO_REMOVE))
+    if args.engine == "columns":
+        rowCount = aggregateColumnar(args.input, args.output)
+    else:
+        rowCount = aggregateRows(args.input, args.output)
     print("Process complete, aggregated %s variants." % (rowCount))
 
 
+def aggregateRows(inputPath, outputPath):
+    with open(inputPath, "r") as fIn, open(outputPath, "w") as fOut:
+        csvIn = csv.DictReader(fIn, delimiter='\t')
+        outputColumns = setOutputColumns(csvIn.fieldnames, FIELDS_TO_REMOVE,
+                                         FIELDS_TO_ADD, FIELDS_TO_RENAME)
+        csvOut = csv.DictWriter(fOut, delimiter='\t',
+                                fieldnames=outputColumns)
+        csvOut.writerow(dict((fn, fn) for fn in outputColumns))
+        rowCount = 0
+        for row in csvIn:
+            rowCount += 1
+            csvOut.writerow(updateRow(row, FIELDS_TO_RENAME, FIELDS_TO_REMOVE))
+    return rowCount
+
+
 def setOutputColumns(fields, toRemove, toAdd, toRename):
     newFields = []
     for item in fields:
@@ -238,31 +254,40 @@ def selectMaxAlleleFrequency(newRow):
     return '-'
 
 
+def classifySignificance(significance):
+    hasPathogenicClassification = False
+    hasBenignClassification = False
+    for item in significance.split(","):
+        if re.search("^pathogenic$", item.lower()):
+            hasPathogenicClassification = True
+        if re.search("^pathologic$", item.lower()):
+            hasPathogenicClassification = True
+        if re.search("^likely_pathogenic$", item.lower()):
+            hasPathogenicClassification = True
+        if re.search("^probable_pathogenic$", item.lower()):
+            hasPathogenicClassification = True
+        if re.search("^benign$", item.lower()):
+            hasBenignClassification = True
+        if re.search("^probably_not_pathogenic$", item.lower()):
+            hasBenignClassification = True
+        if re.search("^likely_benign$", item.lower()):
+            hasBenignClassification = True
+        if re.search("^no_known_pathogenicity$", item.lower()):
+            hasBenignClassification = True
+        if re.search("^variant_of_unknown_significance$", item.lower()):
+            hasBenignClassification = True
+        if re.search("^uncertain_significance$", item.lower()):
+            hasBenignClassification = True
+    return (hasPathogenicClassification, hasBenignClassification)
+
+
 def checkDiscordantStatus(row):
     hasPathogenicClassification = False
     hasBenignClassification = False
     for column in (row["Clinical_Significance_ClinVar"], row["Clinical_significance_ENIGMA"]):
-        for item in column.split(","):
-            if re.search("^pathogenic$", item.lower()):
-                hasPathogenicClassification = True
-            if re.search("^pathologic$", item.lower()):
-                hasPathogenicClassification = True
-            if re.search("^likely_pathogenic$", item.lower()):
-                hasPathogenicClassification = True
-            if re.search("^probable_pathogenic$", item.lower()):
-                hasPathogenicClassification = True
-            if re.search("^benign$", item.lower()):
-                hasBenignClassification = True
-            if re.search("^probably_not_pathogenic$", item.lower()):
-                hasBenignClassification = True
-            if re.search("^likely_benign$", item.lower()):
-                hasBenignClassification = True
-            if re.search("^no_known_pathogenicity$", item.lower()):
-                hasBenignClassification = True
-            if re.search("^variant_of_unknown_significance$", item.lower()):
-                hasBenignClassification = True
-            if re.search("^uncertain_significance$", item.lower()):
-                hasBenignClassification = True
+        (pathogenic, benign) = classifySignificance(column)
+        hasPathogenicClassification = hasPathogenicClassification or pathogenic
+        hasBenignClassification = hasBenignClassification or benign
     if hasPathogenicClassification and hasBenignClassification:
         return "Discordant"
     else:
@@ -298,5 +323,179 @@ def setSynonym(row):
     return ','.join(synonyms)
 
 
+def aggregateColumnar(inputPath, outputPath):
+    """
+    Same as processing inputPath row by row with updateRow, but loading the merged variants at once
+    and updating whole columns with aggregate_columns.
+
+    The files are read and written with the csv module like in the row by row processing,
+    such that quoting and line endings are identical.
+
+    :return: number of variants
+    """
+    with open(inputPath, "r") as f:
+        reader = csv.reader(f, delimiter='\t')
+        header = next(reader)
+        df = pd.DataFrame(list(reader), columns=header, dtype=object)
+
+    outputColumns = setOutputColumns(header, FIELDS_TO_REMOVE, FIELDS_TO_ADD, FIELDS_TO_RENAME)
+    df = aggregate_columns(df)[outputColumns]
+
+    with open(outputPath, "w") as f:
+        writer = csv.writer(f, delimiter='\t')
+        writer.writerow(outputColumns)
+        writer.writerows(zip(*(df.iloc[:, i].to_numpy(dtype=object) for i in range(len(outputColumns)))))
+    return len(df)
+
+
+def _first_not_empty(df, columns):
+    # value of the first column which is not EMPTY, EMPTY if all are
+    values = df[columns[0]].to_numpy()
+    for c in columns[1:]:
+        values = np.where((values == EMPTY) & (df[c].to_numpy() != EMPTY), df[c].to_numpy(), values)
+    return values
+
+
+def _join_non_empty(first, second, has_first, has_second, delimiter):
+    return np.where(has_first & has_second, first + delimiter + second,
+                    np.where(has_first, first, np.where(has_second, second, "")))
+
+
+def _gnomad_allele_frequencies(df):
+    # determineGnomADAlleleFrequency for all rows at once
+    af = np.full(len(df), EMPTY, dtype=object)
+    has_af = ~(df['Allele_frequency_genome_GnomAD'].isin([EMPTY, '']) &
+               df['Allele_frequency_exome_GnomAD'].isin([EMPTY, ''])).to_numpy()
+    if not has_af.any():
+        return af
+
+    def _numeric(c):
+        values = df[c].to_numpy()[has_af]
+        return np.array([0 if isEmpty(v) else float(v) for v in values], dtype=float)
+
+    ac = _numeric('Allele_count_genome_GnomAD') + _numeric('Allele_count_exome_GnomAD')
+    an = _numeric('Allele_number_genome_GnomAD') + _numeric('Allele_number_exome_GnomAD')
+    af[has_af] = [EMPTY if n == 0 else round_sigfigs(float(c / n), 4) for c, n in zip(ac, an)]
+    return af
+
+
+def _allele_frequencies(df):
+    # selectAlleleFrequency for all rows at once
+    gnomad = _gnomad_allele_frequencies(df)
+    exac = df["Allele_frequency_ExAC"].to_numpy()
+    esp = df["Minor_allele_frequency_percent_ESP"].to_numpy()
+    g1k = df["Allele_frequency_1000_Genomes"].to_numpy()
+
+    has_gnomad = gnomad != EMPTY
+    has_exac = ~has_gnomad & (exac != EMPTY)
+    has_esp = ~has_gnomad & ~has_exac & (esp != EMPTY)
+    has_g1k = ~has_gnomad & ~has_exac & ~has_esp & (g1k != EMPTY)
+
+    af = np.full(len(df), EMPTY, dtype=object)
+    af[has_gnomad] = ["%s (GnomAD)" % v for v in gnomad[has_gnomad]]
+    af[has_exac] = ["%s (ExAC minus TCGA)" % v for v in exac[has_exac]]
+    # Percent must be converted to a fraction
+    af[has_esp] = ["%s (ESP)" % (float(v.split(',')[-1]) / 100) for v in esp[has_esp]]
+    af[has_g1k] = ["%s (1000 Genomes)" % v for v in g1k[has_g1k]]
+    return af
+
+
+def _discordant_status(df):
+    # checkDiscordantStatus for all rows at once, classifying every distinct significance once
+    def _classifications(column):
+        classifications = {v: classifySignificance(v) for v in column.unique()}
+        return (column.map(lambda v: classifications[v][0]).to_numpy(dtype=bool),
+                column.map(lambda v: classifications[v][1]).to_numpy(dtype=bool))
+
+    clinvar_pathogenic, clinvar_benign = _classifications(df["Clinical_Significance_ClinVar"])
+    enigma_pathogenic, enigma_benign = _classifications(df["Clinical_significance_ENIGMA"])
+    return np.where((clinvar_pathogenic | enigma_pathogenic) & (clinvar_benign | enigma_benign),
+                    "Discordant", "Concordant")
+
+
+def _source_urls(df):
+    # setSourceUrls for all rows at once
+    enigma = df["URL_ENIGMA"]
+    clinvar = df["SCV_ClinVar"]
+    clinvar_url = "http://www.ncbi.nlm.nih.gov/clinvar/?term="
+
+    urls = _join_non_empty(enigma.str.replace(",", ", ", regex=False).to_numpy(),
+                           (clinvar_url + clinvar.str.replace(",", ", " + clinvar_url, regex=False)).to_numpy(),
+                           (enigma != EMPTY).to_numpy(), (clinvar != EMPTY).to_numpy(), ", ")
+    return np.where(urls == "", EMPTY, urls)
+
+
+def aggregate_columns(df):
+    """
+    Applies updateRow to all rows of merged variants at once, updating whole columns instead of single rows.
+
+    :param df: pd.DataFrame of merged variants, all values being strings
+    :return: pd.DataFrame with the updated and added columns, in addition to the columns to remove
+    """
+    df = df.rename(columns=FIELDS_TO_RENAME)
+
+    # update_basic_fields
+    df["Hg38_Start"] = df["Pos"]
+    df["Hg38_End"] = (df["Pos"].astype(int) + df["Ref"].str.len() - 1).astype(str)
+    df["Gene_Symbol"] = np.where(df["Gene_Symbol"] == EMPTY,
+                                 np.where(df["Genomic_Coordinate_hg38"].str.startswith("chr17"), "BRCA1", "BRCA2"),
+                                 df["Gene_Symbol"])
+    df["HGVS_RNA"] = EMPTY
+
+    # hgvsCdnaUpdate, unpacking the first HGVS string available
+    reference_sequence = df["Reference_Sequence"].to_numpy(dtype=object, copy=True)
+    hgvs_cdna = df["HGVS_cDNA"].to_numpy(dtype=object, copy=True)
+    missing = hgvs_cdna == EMPTY
+    for c in ["HGVS_ClinVar", "HGVS_cDNA_LOVD", "HGVS_cDNA_exLOVD"]:
+        available = missing & (df[c].to_numpy() != EMPTY)
+        if available.any():
+            unpacked = [unpackHgvs(v) for v in df[c].to_numpy()[available]]
+            reference_sequence[available] = [u[0] for u in unpacked]
+            hgvs_cdna[available] = [u[1] for u in unpacked]
+        missing &= ~available
+    df["Reference_Sequence"] = reference_sequence
+    df["HGVS_cDNA"] = hgvs_cdna
+
+    # hgvsProteinUpdate, removing the reference sequence of every row
+    protein = pd.Series(_first_not_empty(df, ["HGVS_Protein", "Protein_ClinVar", "HGVS_protein_LOVD",
+                                              "HGVS_protein_exLOVD"]), index=df.index, dtype=object)
+    for ref in df["Reference_Sequence"].unique():
+        is_ref = df["Reference_Sequence"] == ref
+        protein[is_ref] = protein[is_ref].str.replace(re.compile(ref + ":"), "", regex=True)
+    df["HGVS_Protein"] = protein
+
+    # BICUpdate
+    df["BIC_Nomenclature"] = df["BIC_Nomenclature"].str.replace("|", ",", regex=False)
+    df["BIC_Nomenclature"] = _first_not_empty(df, ["BIC_Nomenclature", "BIC_Designation_BIC", "BIC_Nomenclature_exLOVD"])
+
+    # pathogenicityUpdate
+    enigma = df["Clinical_significance_ENIGMA"]
+    clinvar = df["Clinical_Significance_ClinVar"]
+    expert = np.where(enigma == EMPTY, "Not Yet Reviewed", enigma)
+    df["Pathogenicity_expert"] = np.where(expert == "Benign", "Benign / Little Clinical Significance", expert)
+    df["Pathogenicity_all"] = _join_non_empty((enigma + "(ENIGMA)").to_numpy(), (clinvar + " (ClinVar)").to_numpy(),
+                                              (enigma != EMPTY).to_numpy(), (clinvar != EMPTY).to_numpy(), "; ")
+
+    df["Allele_Frequency"] = _allele_frequencies(df)
+    df["Max_Allele_Frequency"] = '-'
+    df["Discordant"] = _discordant_status(df)
+    df["Source_URL"] = _source_urls(df)
+
+    # setSynonym, building the sets like it does such that their order is the same
+    synonym_fields = ["BIC_Nomenclature", "BIC_Nomenclature_exLOVD", "BIC_Designation_BIC", "Synonyms_ClinVar"]
+    synonyms = []
+    for values in zip(*[df[c].to_numpy() for c in synonym_fields]):
+        row_synonyms = set()
+        for v in values:
+            row_synonyms.update(s for s in v.split(',') if s != EMPTY)
+        synonyms.append(','.join(row_synonyms))
+    df["Synonyms"] = synonyms
+
+    df["Genomic_Coordinate_hg37"] = EMPTY
+    df["Hg37_Start"] = EMPTY
+    df["Hg37_End"] = EMPTY
+    return df
+
+
 if __name__ == "__main__":
     main()
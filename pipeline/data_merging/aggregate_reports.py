@@ -1,9 +1,11 @@
 #!/usr/bin/env python
-import os
 import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
 
-import vcf
-
+from common import vcf_utils
 from data_merging import variant_merging
 
 from data_merging.variant_merging_constants import (
@@ -14,40 +16,75 @@ from data_merging.variant_merging_constants import (
 )
 
 
-def write_reports_tsv(filename, columns, ready_files_dir, genome_regions_symbol_dict):
-    reports_output = open(filename, "w")
+def write_reports_tsv(filename, columns, ready_files_dir, genome_regions_symbol_dict, processes=1):
+    """
+    Writes the normalized reports of all sources in ready_files_dir to filename, ordered by source file
+    as returned by get_reports_files and by record within a source file.
 
+    Reports are streamed from every source file into a temporary file next to filename, such that only
+    the record at hand is kept in memory. With processes > 1, source files are normalized concurrently in a
+    process pool. The temporary files are concatenated in order afterwards.
+    """
     reports_files = [ready_files_dir + r for r in get_reports_files(ready_files_dir)]
 
-    reports = aggregate_reports(reports_files, columns, genome_regions_symbol_dict)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(filename))) as tmp_dir:
+        source_args = [(file, columns, genome_regions_symbol_dict, os.path.join(tmp_dir, "%d.tsv" % i))
+                       for i, file in enumerate(reports_files)]
 
-    reports_output.write("\t".join(columns)+"\n")
-
-    for report in reports:
-        if len(report) != len(columns):
-            raise Exception("mismatching number of columns in head and row")
-        for ii in range(len(report)):
-            if type(report[ii]) == list:
-                comma_delimited_string = ",".join(str(xx) for xx in report[ii])
-                report[ii] = comma_delimited_string
-            elif type(report[ii]) == int:
-                report[ii] = str(report[ii])
-        reports_output.write("\t".join(report)+"\n")
+        if processes > 1:
+            print("normalizing reports using {} processes".format(processes))
+            with multiprocessing.Pool(processes) as pool:
+                # results are returned in the order of source_args
+                counts = pool.starmap(write_normalized_reports, source_args)
+        else:
+            counts = [write_normalized_reports(*a) for a in source_args]
 
-    reports_output.close()
+        with open(filename, "w") as reports_output:
+            reports_output.write("\t".join(columns)+"\n")
+            for _, _, _, source_path in source_args:
+                with open(source_path, "r") as f:
+                    shutil.copyfileobj(f, reports_output)
 
-    print("final number of reports: %d" % len(reports))
+    print("final number of reports: %d" % sum(counts))
     print("Done")
 
 
+def write_normalized_reports(file, columns, genome_regions_symbol_dict, output_path):
+    """
+    Normalizes the reports of a single source file and writes them to output_path, without header
+
+    :return: number of reports written
+    """
+    count = 0
+    with open(output_path, "w") as f:
+        for report in iter_reports(file, columns, genome_regions_symbol_dict):
+            f.write(format_report(report, columns))
+            count += 1
+    print("finished normalizing %s" % (file))
+    return count
+
+
+def format_report(report, columns):
+    # joins list cells by commas and converts ints, returning a line of the reports tsv
+    if len(report) != len(columns):
+        raise Exception("mismatching number of columns in head and row")
+    cells = []
+    for value in report:
+        if type(value) == list:
+            value = ",".join(str(xx) for xx in value)
+        elif type(value) == int:
+            value = str(value)
+        cells.append(value)
+    return "\t".join(cells)+"\n"
+
+
 def aggregate_reports(reports_files, columns, genome_regions_symbol_dict):
     # Gathers all reports from an input directory, normalizes them, and combines them into a single list.
     reports = []
 
     for file in reports_files:
-        file_reports = normalize_reports(file, columns, genome_regions_symbol_dict)
+        reports.extend(normalize_reports(file, columns, genome_regions_symbol_dict))
         print("finished normalizing %s" % (file))
-        reports = reports + file_reports
 
     return reports
 
@@ -62,56 +99,53 @@ def get_reports_files(input_directory):
 
 
 def normalize_reports(file, columns, genome_regions_symbol_dict):
+    return list(iter_reports(file, columns, genome_regions_symbol_dict))
+
+
+def iter_reports(file, columns, genome_regions_symbol_dict):
+    # yields the normalized reports of a source file one by one
     filename, file_extension = os.path.splitext(file)
     if file_extension == ".vcf":
-        reports = normalize_vcf_reports(file, columns, filename, file_extension, genome_regions_symbol_dict)
+        reports = iter_vcf_reports(file, columns, filename, file_extension, genome_regions_symbol_dict)
     elif file_extension == ".tsv":
         if os.path.basename(file) != ENIGMA_FILE:
             raise Exception("ERROR: received tsv file that is not for ENIGMA: %s" % (file))
-        reports = normalize_enigma_tsv_reports(file, columns, filename, file_extension)
-    for report in reports:
-        if len(report) != len(columns):
-            report += [DEFAULT_CONTENTS] * len(FIELD_DICT[source])
+        reports = iter_enigma_tsv_reports(file, columns, filename, file_extension)
     for report in reports:
         if len(report) != len(columns):
             raise Exception("mismatching number of columns in head and row")
-    return reports
+        yield report
 
 
-def normalize_vcf_reports(file, columns, filename, file_extension, genome_regions_symbol_dict):
-    reports = []
+def iter_vcf_reports(file, columns, filename, file_extension, genome_regions_symbol_dict):
     if "clinvar" in filename.lower():
         # If fields contain spaces they cause strict whitespace failure
         strict_whitespace = False
     else:
         strict_whitespace = True
-    reader = vcf.Reader(open(file, "r"), strict_whitespace=strict_whitespace)
-    count = 0
     source_suffix = ".vcf"
     source = os.path.basename(file)[:-len(source_suffix)]
-    for record in reader:
-        count += 1
-        genome_coor = ("chr" + str(record.CHROM) + ":g." + str(record.POS) + ":" +
-                       record.REF + ">" + str(record.ALT[0]))
-
-        if variant_merging.is_outside_boundaries(record.CHROM, record.POS, genome_regions_symbol_dict):
-            logging.warning("Skipping report since the positions is outside the genome boundaries: " + str(record))
-            continue
-
-        report = variant_merging.associate_chr_pos_ref_alt_with_item(record, len(columns), source, genome_coor, genome_regions_symbol_dict)
-        for key, value in FIELD_DICT[source].items():
-            try:
-                column_name = key + "_" + source
-                column_index = columns.index(column_name)
-                report[column_index] = record.INFO[value]
-            except KeyError:
-                raise Exception("WARNING: Key error with report: %s \n\nError on value: %s \n\n Error in record.INFO: %s \n\nNeeds attn." % (report, value, record.INFO))
-        reports.append(report)
-    return reports
-
-
-def normalize_enigma_tsv_reports(file, columns, filename, file_extension):
-    reports = []
+    column_indexes = {key: columns.index(key + "_" + source) for key in FIELD_DICT[source]}
+    with open(file, "r") as f:
+        reader = vcf_utils.Reader(f, strict_whitespace=strict_whitespace)
+        for record, outside, _ in variant_merging.iter_records_with_boundaries(reader, genome_regions_symbol_dict):
+            genome_coor = ("chr" + str(record.CHROM) + ":g." + str(record.POS) + ":" +
+                           record.REF + ">" + str(record.ALT[0]))
+
+            if outside:
+                logging.warning("Skipping report since the positions is outside the genome boundaries: " + str(record))
+                continue
+
+            report = variant_merging.associate_chr_pos_ref_alt_with_item(record, len(columns), source, genome_coor, genome_regions_symbol_dict)
+            for key, value in FIELD_DICT[source].items():
+                try:
+                    report[column_indexes[key]] = record.INFO[value]
+                except KeyError:
+                    raise Exception("WARNING: Key error with report: %s \n\nError on value: %s \n\n Error in record.INFO: %s \n\nNeeds attn." % (report, value, record.INFO))
+            yield report
+
+
+def iter_enigma_tsv_reports(file, columns, filename, file_extension):
     enigma_file = open(file, 'r')
     line_num = 0
     enigma_column_indexes = {}
@@ -120,12 +154,11 @@ def normalize_enigma_tsv_reports(file, columns, filename, file_extension):
         if line_num == 1:
             enigma_columns = variant_merging.add_columns_to_enigma_data(line)
             for key, value in enumerate(enigma_columns):
-                enigma_column_indexes[key] = value
+                enigma_column_indexes[key] = columns.index(value)
         else:
             (items, chrom, pos, ref, alt) = variant_merging.associate_chr_pos_ref_alt_with_enigma_item(line)
             report = ['-'] * len(columns)
-            for key, value in enigma_column_indexes.items():
-                report[columns.index(value)] = items[key]
-            reports.append(report)
+            for key, column_index in enigma_column_indexes.items():
+                report[column_index] = items[key]
+            yield report
     enigma_file.close()
-    return reports
@@ -1,8 +1,9 @@
+import hashlib
+import json
 import logging
-import subprocess
-import tempfile
+import multiprocessing
+import os
 from typing import Dict, List, Iterable, Optional
-from os import path
 
 import click
 import hgvs.assemblymapper
@@ -10,10 +11,11 @@ import hgvs.dataproviders.uta
 import hgvs.projector
 import pandas as pd
 from hgvs.exceptions import HGVSError
-from hgvs.normalizer import Normalizer
 from hgvs.sequencevariant import SequenceVariant
 
 from common import config
+from common import hgvs_utils
+from common import liftover
 from common import utils
 from common.hgvs_utils import HgvsWrapper
 from common.variant_utils import VCFVariant
@@ -50,36 +52,122 @@ TMP_CDNA_NORM_FIELD = 'tmp_HGVS_CDNA_FIELD_norm'
 TMP_CDNA_NORM_LEFT_ALINGED_FIELD = 'tmp_HGVS_CDNA_FIELD_left'
 TMP_PROTEIN_LEFT_ALINGED_FIELD = 'tmp_Protein_Field_left'
 
+# columns computed from the input, in the order they are added
+DERIVED_COLUMNS = [GENOMIC_HGVS_HG38_COL, GENOMIC_HGVS_HG37_COL, PYHGVS_CDNA_COL, REFERENCE_SEQUENCE_COL, HGVS_CDNA_COL,
+                   PYHGVS_GENOMIC_COORDINATE_38_COL, PYHGVS_GENOMIC_COORDINATE_37_COL, PYHGVS_HG37_START_COL,
+                   PYHGVS_HG37_END_COL, PYHGVS_PROTEIN_COL, SYNONYMS_COL]
 
-def _normalize_genomic_coordinates(hgvs_obj: Optional[SequenceVariant], strand: str, hgvs_norm_3: Normalizer, hgvs_norm_5: Normalizer):
-    normalizer = hgvs_norm_3 if strand == config.POSITIVE_STRAND else hgvs_norm_5
-    if hgvs_obj is None:
-        return None
-    try:
-        return normalizer.normalize(hgvs_obj)
-    except HGVSError as e:
-        logging.warning("Issue normalizing genomic coordinates {}: {}".format(hgvs_obj, e))
-    return None
+# input columns the derived columns depend on, besides the configuration of the gene
+DERIVED_FROM_COLUMNS = [CHR_COL, POS_COL, REF_COL, ALT_COL, GENE_SYMBOL_COL, SYNONYMS_COL, HGVS_CDNA_COL,
+                        HG38_START_COL, HG38_END_COL]
 
+HG38_TO_HG37_CHAIN_FILE = "hg38ToHg19.over.chain.gz"
+HG37_REFERENCE_FILE = "hg19.fa"
 
-def _normalize_genomic_fnc(src_col: str, target_col: str, right_shift: bool, strand_dict: Dict[str, str]):
-    """Returns a function to normalize genomic coordinates
+# the data version stamp of an output is written next to it
+DATA_VERSION_SUFFIX = '.data_version.json'
+
+# to be increased whenever the derived columns are computed differently, such that previous outputs aren't reused
+DERIVED_COLUMNS_VERSION = 1
+
+
+def _shuffle_direction(strand: str, right_shift: bool):
+    # shifting towards the 3' end of the gene, i.e. to the right on the positive strand and to the left on the negative one
+    shift_3 = right_shift if strand == config.POSITIVE_STRAND else not right_shift
+    return 3 if shift_3 else 5
+
+
+def to_exchange_str(v: Optional[SequenceVariant]):
+    """Compact representation of a variant exchanged with worker processes, including reference bases which
+    are left out by str(v), such that parsing it results in an identical object"""
+    return v.format(conf={'max_ref_length': None}) if v is not None else None
+
+
+def _serialize(v: Optional[SequenceVariant]):
+    return to_exchange_str(v), str(v)
+
+
+# state of pool worker processes, set up once per process by _init_worker
+_WORKER_HGVS = None
+_WORKER_SYN_AC_DICT = None
+_WORKER_TX_FOR_GENE = None
+_WORKER_PROJECTORS = None
+
+
+def _init_worker(syn_ac_dict: Dict[str, List[str]]):
+    global _WORKER_HGVS, _WORKER_SYN_AC_DICT, _WORKER_TX_FOR_GENE, _WORKER_PROJECTORS
+
+    _WORKER_HGVS = HgvsWrapper()
+    _WORKER_SYN_AC_DICT = syn_ac_dict
+    _WORKER_TX_FOR_GENE = {}
+    _WORKER_PROJECTORS = {}
+
+
+def _parse(s: Optional[str]):
+    return _WORKER_HGVS.hgvs_parser.parse(s) if isinstance(s, str) else None
+
+
+def _normalize_worker(items):
+    """:param items: List[Tuple[str, int]]: variant and shuffle direction
+    :return: List[Tuple[str, str]]: exchange string and str of every normalized variant"""
+    results = [None] * len(items)
+    for direction in {d for _, d in items}:
+        idxs = [i for i, (_, d) in enumerate(items) if d == direction]
+        normalized = _WORKER_HGVS.bulk_normalize([_parse(items[i][0]) for i in idxs], direction)
+        for i, v in zip(idxs, normalized):
+            results[i] = _serialize(v)
+    _WORKER_HGVS.log_cache_stats("normalization")
+    return results
+
+
+def _cdna_worker(items):
+    """:param items: List[str]: genomic variants
+    :return: List[Tuple[str, str]]: exchange string and str of every cDNA variant"""
+    results = [_serialize(v) for v in _WORKER_HGVS.bulk_genomic_to_cdna([_parse(v) for v in items])]
+    _WORKER_HGVS.log_cache_stats("cDNA conversion")
+    return results
+
+
+def _protein_worker(items):
+    """:param items: List[str]: cDNA variants
+    :return: List[str]: protein changes"""
+    results = [str(p) for p in _WORKER_HGVS.bulk_cdna_to_protein([_parse(v) for v in items])]
+    _WORKER_HGVS.log_cache_stats("protein conversion")
+    return results
 
-    Used for parallelizing normalization
-    """
-    def _ret(df_part):
-        hgvs_proc = HgvsWrapper()  # create it again in subprocess to avoid pickle issues when otherwise copying it to subprocess
-        hgvs_norm_3 = hgvs.normalizer.Normalizer(hgvs_proc.hgvs_dp, shuffle_direction=3 if right_shift else 5)
-        hgvs_norm_5 = hgvs.normalizer.Normalizer(hgvs_proc.hgvs_dp, shuffle_direction=5 if right_shift else 3)
 
-        df_part[target_col] = df_part.apply(lambda r: _normalize_genomic_coordinates(r[src_col],
-                                                                                     strand_dict.get(
-                                                                                         r[GENE_SYMBOL_COL]),
-                                                                                     hgvs_norm_3,
-                                                                                     hgvs_norm_5), axis=1)
-        return df_part
+# variant representations needed to compute synonyms
+SYNONYM_INPUT_FIELDS = [GENE_SYMBOL_COL, TMP_CDNA_FROM_SOURCE, TMP_HGVS_HG37_LEFT_ALIGNED, TMP_HGVS_HG38_LEFT_ALIGNED,
+                        TMP_CDNA_NORM_FIELD, TMP_CDNA_NORM_LEFT_ALINGED_FIELD, TMP_PROTEIN_LEFT_ALINGED_FIELD]
+SYNONYM_PARSED_FIELDS = {TMP_HGVS_HG37_LEFT_ALIGNED, TMP_HGVS_HG38_LEFT_ALIGNED, TMP_CDNA_NORM_FIELD,
+                         TMP_CDNA_NORM_LEFT_ALINGED_FIELD}
 
-    return _ret
+
+def _synonyms_worker(items):
+    """:param items: List[Tuple]: values of SYNONYM_INPUT_FIELDS per variant
+    :return: List[List[str]]: synonyms of every variant"""
+    results = []
+    for values in items:
+        row = {f: _parse(v) if f in SYNONYM_PARSED_FIELDS else v for f, v in zip(SYNONYM_INPUT_FIELDS, values)}
+
+        gene = row[GENE_SYMBOL_COL]
+        if gene and gene not in _WORKER_TX_FOR_GENE:
+            _WORKER_TX_FOR_GENE[gene] = _WORKER_HGVS.hgvs_dp.get_tx_for_gene(gene)
+
+        results.append(get_synonyms(row, _WORKER_HGVS, _WORKER_SYN_AC_DICT, _WORKER_TX_FOR_GENE, _WORKER_PROJECTORS))
+    return results
+
+
+def _run_stage(pool, worker, items: List, n_chunks: int):
+    """Runs worker on chunks of items, in the pool if there is one, otherwise in this process"""
+    if not items:
+        return []
+
+    chunk_size = -(-len(items) // n_chunks)
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    results = pool.map(worker, chunks) if pool is not None else [worker(c) for c in chunks]
+    return [r for chunk_results in results for r in chunk_results]
 
 
 def cdna_from_cdna_field(row: pd.Series, cdna_ac_dict: Dict[str, str], hgvs_proc: HgvsWrapper):
@@ -96,59 +184,46 @@ def cdna_from_cdna_field(row: pd.Series, cdna_ac_dict: Dict[str, str], hgvs_proc
 
 
 def convert_to_hg37(vars: Iterable[VCFVariant], brca_resources_dir: str):
-    """Lifting over hg38 variants to hg37 using crossmap
+    """Lifting over hg38 variants to hg37 using the UCSC chain file
 
     Not using hgvs library since it doesn't handle intronic variants.
     """
-
-    def pseudo_vcf_entry(v):
-        entries = [v.chr, v.pos, '.', v.ref, v.alt, '', '', '']
-        return '\t'.join([str(s) for s in entries])
-
-    lst = [pseudo_vcf_entry(v) for v in vars]
-
-    vcf_tmp = tempfile.mktemp('.vcf')
-    with open(vcf_tmp, 'w') as f:
-        f.write('\n'.join(lst))
-
-    vcf_tmp_out = tempfile.mktemp('.vcf')
-    args = ["CrossMap.py", "vcf",
-            brca_resources_dir + "/hg38ToHg19.over.chain.gz",
-            vcf_tmp,
-            brca_resources_dir + "/hg19.fa",
-            vcf_tmp_out]
-
-    logging.info("Running CrossMap.py to convert to hg19")
-    sp = subprocess.Popen(args)
-    out, err = sp.communicate()
-    if out:
-        logging.info("standard output of subprocess: {}".format(out))
-    if err:
-        logging.info("standard output of subprocess: {}".format(err))
-
-    vcf_out_lines = open(vcf_tmp_out, 'r').readlines()
-
-    if path.exists(vcf_tmp_out + '.unmap'):
-        vcf_out_failed_lines = open(vcf_tmp_out + '.unmap', 'r').readlines()
-        return ([VCFVariant(v[0], int(v[1]), v[3], v[4]) for v in [l.strip().split('\t') for l in vcf_out_lines]],
-                [VCFVariant(v[0], int(v[1]), v[3], v[4]) for v in [l.strip().split('\t') for l in vcf_out_failed_lines]])
-    else:
-        return ([VCFVariant(v[0], int(v[1]), v[3], v[4]) for v in [l.strip().split('\t') for l in vcf_out_lines]], [])
+    logging.info("Lifting over variants to hg19")
+    lo = liftover.get_liftover(os.path.join(brca_resources_dir, HG38_TO_HG37_CHAIN_FILE),
+                               os.path.join(brca_resources_dir, HG37_REFERENCE_FILE))
+    return lo.convert_variants(vars)
 
 
 def handle_failed_hg37_translations(df, var_objs_hg37, var_objs_hg37_failed, tmp_hgvs_hg37_values, hgvs_proc):
     # set None values for any hg37 coordinates that cannot be derived and add to lists in proper order
     for v in var_objs_hg37_failed:
-        hgvs_obj = v.to_hgvs_obj(hgvs_proc.contig_maps[HgvsWrapper.GRCh38_Assem])
-        row_number = df[df[GENOMIC_HGVS_HG38_COL] == str(hgvs_obj)].index[0]
+        hgvs_str = v.to_hgvs_str(hgvs_proc.contig_maps[HgvsWrapper.GRCh38_Assem])
+        row_number = df[df[GENOMIC_HGVS_HG38_COL] == hgvs_str].index[0]
         var_objs_hg37.insert(row_number, None)
         tmp_hgvs_hg37_values.insert(row_number, None)
-        logging.info("Could not compute hg37 representation of internal for {}".format(str(hgvs_obj)))
+        logging.info("Could not compute hg37 representation of internal for {}".format(hgvs_str))
     return (var_objs_hg37, tmp_hgvs_hg37_values, df)
 
 
-def get_synonyms(row: pd.Series, hgvs_proc: HgvsWrapper, syn_ac_dict: Dict[str, List[str]]):
-    """ Determine other representations a variant may be known as """
+def _projector(hgvs_proc: HgvsWrapper, projectors: Optional[Dict], alt_ac: str, src_ac: str, dst_ac: str, method: str):
+    key = (alt_ac, src_ac, dst_ac, method)
+    if projectors is not None and key in projectors:
+        return projectors[key]
+
+    pj = hgvs.projector.Projector(hdp=hgvs_proc.hgvs_dp, alt_ac=alt_ac, src_ac=src_ac, dst_ac=dst_ac,
+                                  dst_alt_aln_method=method)
+    if projectors is not None:
+        projectors[key] = pj
+    return pj
+
+
+def get_synonyms(row: pd.Series, hgvs_proc: HgvsWrapper, syn_ac_dict: Dict[str, List[str]],
+                 tx_for_gene: Optional[Dict[str, List]] = None, projectors: Optional[Dict] = None):
+    """ Determine other representations a variant may be known as
+
+    tx_for_gene and projectors optionally hold the transcripts of genes and the projectors between transcripts
+    already looked up for other variants
+    """
 
     # take the representations from the source and all 'left' aligned (non-standard) representations
     synonyms = [str(row[TMP_CDNA_FROM_SOURCE]),
@@ -161,7 +236,11 @@ def get_synonyms(row: pd.Series, hgvs_proc: HgvsWrapper, syn_ac_dict: Dict[str,
         return []
 
     # calculate other representations wrt other accensions supported by the hgvs library
-    for _, _, _, dst, alt_ac, method in hgvs_proc.hgvs_dp.get_tx_for_gene(row[GENE_SYMBOL_COL]):
+    gene = row[GENE_SYMBOL_COL]
+    transcripts = tx_for_gene[gene] if tx_for_gene is not None and gene in tx_for_gene else \
+        hgvs_proc.hgvs_dp.get_tx_for_gene(gene)
+
+    for _, _, _, dst, alt_ac, method in transcripts:
         if row[GENE_SYMBOL_COL] not in syn_ac_dict:
             continue
 
@@ -178,10 +257,7 @@ def get_synonyms(row: pd.Series, hgvs_proc: HgvsWrapper, syn_ac_dict: Dict[str,
                     continue
 
                 try:
-                    pj = hgvs.projector.Projector(hdp=hgvs_proc.hgvs_dp,
-                                                  alt_ac=alt_ac,
-                                                  src_ac=vc.ac,
-                                                  dst_ac=dst, dst_alt_aln_method=method)
+                    pj = _projector(hgvs_proc, projectors, alt_ac, vc.ac, dst, method)
 
                     vp = pj.project_variant_forward(vc)
                     synonyms.append(vp)
@@ -208,6 +284,120 @@ def _merge_and_clean_synonyms(row: pd.Series):
     return ','.join(list_sorted_cleaned)
 
 
+def data_version(hgvs_proc: HgvsWrapper, brca_resources_dir: str):
+    """Identifies the data the derived columns are computed from besides the input"""
+    return {'derived_columns': DERIVED_COLUMNS_VERSION,
+            'hgvs': hgvs_utils.data_version(hgvs_proc.hgvs_dp),
+            'liftover': utils.file_fingerprint(os.path.join(brca_resources_dir, HG38_TO_HG37_CHAIN_FILE))}
+
+
+def input_digests(df: pd.DataFrame, cfg_df: pd.DataFrame):
+    """Digests of the inputs of the derived columns of every row, including the configuration of the gene
+
+    :return: pd.Series: digests, indexed like df
+    """
+    gene_cfg = {r[config.SYMBOL_COL]: [r[config.HGVS_CDNA_DEFAULT_AC], r[config.SYNONYM_AC_COL], r[config.STRAND_COL]]
+                for _, r in cfg_df.iterrows()}
+
+    def _digest(values):
+        gene = values[DERIVED_FROM_COLUMNS.index(GENE_SYMBOL_COL)]
+        s = '\t'.join(str(v) for v in list(values) + gene_cfg.get(gene, []))
+        return hashlib.sha256(s.encode('utf-8')).hexdigest()[:16]
+
+    return pd.Series([_digest(values) for values in df[DERIVED_FROM_COLUMNS].itertuples(index=False, name=None)],
+                     index=df.index, dtype=object)
+
+
+def write_data_version(path, version, digests: Iterable[str]):
+    with open(path, 'w') as f:
+        json.dump({'data_version': version, 'input_digests': sorted(set(digests))}, f)
+
+
+def read_data_version(path):
+    """:return: Tuple[Dict, Set[str]]: data version and input digests of an output"""
+    with open(path, 'r') as f:
+        stamp = json.load(f)
+    return stamp['data_version'], set(stamp['input_digests'])
+
+
+def merge_data_versions(paths, out_path):
+    """Combines the data version stamps of outputs which are concatenated, e.g. of shards of the genes"""
+    versions, digests = zip(*[read_data_version(p) for p in paths])
+    if any(v != versions[0] for v in versions):
+        raise ValueError("Data versions of {} differ".format(paths))
+    write_data_version(out_path, versions[0], set().union(*digests))
+
+
+def _variant_keys(df: pd.DataFrame):
+    return df[CHR_COL].astype(str) + ':' + df[POS_COL].astype(str) + ':' + df[REF_COL].astype(str) + ':' + \
+        df[ALT_COL].astype(str)
+
+
+def previous_derived_columns(df: pd.DataFrame, digests: pd.Series, version, previous_output, previous_data_version):
+    """Takes the derived columns of variants whose inputs didn't change from a previous output
+
+    :param digests: input digests of df, see input_digests
+    :param version: data version of the current run
+    :param previous_output: output of a previous run, e.g. of the previous release
+    :param previous_data_version: data version stamp of the previous output
+    :return: pd.DataFrame: derived columns of the previous output as written, indexed like the reused rows of df
+    """
+    none_reused = pd.DataFrame(columns=DERIVED_COLUMNS, dtype=object)
+
+    previous_version, previous_digests = read_data_version(previous_data_version)
+    if previous_version != version:
+        logging.info("Data version changed from {} to {}, not reusing {}".format(previous_version, version,
+                                                                                previous_output))
+        return none_reused
+
+    previous_df = pd.read_csv(previous_output, sep='\t', dtype=str, keep_default_na=False)
+    missing_columns = set(DERIVED_COLUMNS + DERIVED_FROM_COLUMNS) - set(previous_df.columns)
+    if missing_columns:
+        logging.info("Columns {} missing in {}, not reusing it".format(sorted(missing_columns), previous_output))
+        return none_reused
+
+    previous_df.index = _variant_keys(previous_df)
+    previous_df = previous_df[~previous_df.index.duplicated(keep=False)]
+
+    keys = _variant_keys(df)
+    reusable = digests.isin(previous_digests) & keys.isin(previous_df.index)
+
+    reused = previous_df.loc[keys[reusable], DERIVED_COLUMNS]
+    reused.index = df.index[reusable]
+    return reused
+
+
+def combine_derived_columns(df: pd.DataFrame, computed: Optional[pd.DataFrame], reused: pd.DataFrame):
+    """Combines the rows computed in this run with the derived columns taken over from a previous output
+
+    :param df: input rows
+    :param computed: computed rows, indexed like df, or None if all rows were taken over
+    :param reused: derived columns taken over, indexed like df, see previous_derived_columns
+    :return: pd.DataFrame: rows in the order of df with the columns of a full run
+    """
+    parts = [] if computed is None else [computed]
+    if len(reused):
+        unchanged = df.loc[reused.index].copy()
+        for c in DERIVED_COLUMNS:
+            unchanged[c] = reused[c]
+        parts.append(unchanged)
+
+    columns = list(df.columns) + [c for c in DERIVED_COLUMNS if c not in df.columns]
+    if not parts:
+        return df.reindex(columns=columns)
+
+    df_out = pd.concat(parts).loc[df.index, columns]
+
+    if len(reused):
+        # taken over as written, the types are determined by all rows like in a full run
+        df_out[PYHGVS_HG37_START_COL] = pd.to_numeric(df_out[PYHGVS_HG37_START_COL].replace('', float('nan')))
+        if df_out[PYHGVS_HG37_START_COL].notna().all():
+            df_out[PYHGVS_HG37_START_COL] = df_out[PYHGVS_HG37_START_COL].astype(int)
+        df_out[PYHGVS_HG37_END_COL] = df_out[PYHGVS_HG37_START_COL] + (df_out[HG38_END_COL] - df_out[HG38_START_COL])
+
+    return df_out
+
+
 @click.command()
 @click.argument('input', type=click.Path(readable=True))
 @click.argument('output', type=click.Path(writable=True))
@@ -215,7 +405,12 @@ def _merge_and_clean_synonyms(row: pd.Series):
 @click.option("--config-file", required=True, help="path to gene configuration file")
 @click.option('--resources', help="path to directory containing reference sequences")
 @click.option('--processes', type=int, help='Number of processes to use for parallelization', default=8)
-def main(input, output, log_path, config_file, resources, processes):
+@click.option('--previous-output', type=click.Path(readable=True),
+              help="output of a previous run, e.g. of the previous release. The derived columns of variants whose inputs "
+                   "didn't change are taken from it, unless the UTA, SeqRepo or liftover data changed")
+@click.option('--previous-data-version', type=click.Path(readable=True),
+              help="data version stamp of the previous output, defaults to the one next to it")
+def main(input, output, log_path, config_file, resources, processes, previous_output, previous_data_version):
     utils.setup_logfile(log_path)
 
     cfg_df = config.load_config(config_file)
@@ -225,80 +420,114 @@ def main(input, output, log_path, config_file, resources, processes):
     strand_dict = { r[config.SYMBOL_COL] : r[config.STRAND_COL] for _, r in cfg_df.iterrows() }
 
     hgvs_proc = HgvsWrapper()
+    timings = utils.StageTimings()
 
-    logging.info("Loading data from {}".format(input))
-    df = pd.read_csv(input, sep='\t')
-
-    df[VAR_OBJ_FIELD] = df.apply(lambda r: VCFVariant(r[CHR_COL], r[POS_COL], r[REF_COL], r[ALT_COL]), axis=1)
-
-    logging.info("Converting variants to hgvs objects")
-
-    df[TMP_HGVS_HG38] = df[VAR_OBJ_FIELD].apply(
-        lambda v: v.to_hgvs_obj(hgvs_proc.contig_maps[HgvsWrapper.GRCh38_Assem]))
-
-    logging.info("Normalize genomic representation")
-
-    df = utils.parallelize_dataframe(df, _normalize_genomic_fnc(TMP_HGVS_HG38,
-                                                                TMP_HGVS_HG38, True,
-                                                                strand_dict), processes)
-    df = utils.parallelize_dataframe(df, _normalize_genomic_fnc(TMP_HGVS_HG38,
-                                                                TMP_HGVS_HG38_LEFT_ALIGNED, False,
-                                                                strand_dict), processes)
+    with timings.stage("Loading data from {}".format(input)):
+        df = pd.read_csv(input, sep='\t')
 
-    df[GENOMIC_HGVS_HG38_COL] = df[TMP_HGVS_HG38].apply(str)
+    version = data_version(hgvs_proc, resources)
+    digests = input_digests(df, cfg_df)
 
-    logging.info("Compute hg37 representation of internal representation")
-    var_objs_hg37, var_objs_hg37_failed = convert_to_hg37(df[VAR_OBJ_FIELD], resources)
-
-    tmp_hgvs_hg37_values = [v.to_hgvs_obj(hgvs_proc.contig_maps[HgvsWrapper.GRCh37_Assem]) for v in var_objs_hg37]
-
-    var_objs_hg37, tmp_hgvs_hg37_values, df = handle_failed_hg37_translations(df, var_objs_hg37, var_objs_hg37_failed, tmp_hgvs_hg37_values, hgvs_proc)
-
-    df[TMP_HGVS_HG37] = pd.Series(tmp_hgvs_hg37_values)
+    if previous_output:
+        with timings.stage("Taking over unchanged variants from {}".format(previous_output)):
+            reused = previous_derived_columns(df, digests, version, previous_output,
+                                              previous_data_version or previous_output + DATA_VERSION_SUFFIX)
+    else:
+        reused = pd.DataFrame(columns=DERIVED_COLUMNS, dtype=object)
 
-    logging.info("Compute hg37 normalized representation of internal")
-    # normalizing again for the hg37 representation. An alternative would be to convert the normalized hg38 representation to hg37.
-    # If we use crossmap, we would need a way to convert the VCF like representation back to an hgvs object, which we currently
-    # are unable to do properly. That is, we can use VCFVariant.to_hgvs_obj, however, structural variants will be converted
-    # to delins, losing information if a variant was e.g. a del, ins, or dup.
+    changed = ~df.index.isin(reused.index)
+    logging.info("Computing derived columns of {} variants, taking over {}".format(changed.sum(), len(reused)))
 
-    df = utils.parallelize_dataframe(df, _normalize_genomic_fnc(TMP_HGVS_HG37,
-                                                                GENOMIC_HGVS_HG37_COL, True, strand_dict), processes)
-    df[GENOMIC_HGVS_HG37_COL] = df[GENOMIC_HGVS_HG37_COL].apply(str)
+    computed = None
+    if changed.any():
+        # long lived pool, such that every worker connects to UTA and sets up its HGVS state once for all stages
+        pool = multiprocessing.Pool(processes, initializer=_init_worker, initargs=(syn_ac_dict,)) if processes > 1 else None
+        if pool is None:
+            _init_worker(syn_ac_dict)
 
-    df = utils.parallelize_dataframe(df, _normalize_genomic_fnc(TMP_HGVS_HG37,
-                                                                TMP_HGVS_HG37_LEFT_ALIGNED, False, strand_dict), processes)
+        try:
+            computed = _generate_pseudonyms(df[changed].reset_index(drop=True), resources, processes, pool, hgvs_proc,
+                                            timings, cdna_default_ac_dict, strand_dict)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
 
-    logging.info("Compute cDNA representation")
+        computed.index = df.index[changed]
 
-    def _compute_cdna(df_part):
-        hgvs_proc = HgvsWrapper()  # create it to avoid pickle issues when copying to subprocess
-        df_part[TMP_CDNA_NORM_FIELD] = df_part[TMP_HGVS_HG38].apply(
-            lambda hgvs_obj: hgvs_proc.genomic_to_cdna(hgvs_obj))
-        df_part[TMP_CDNA_NORM_LEFT_ALINGED_FIELD] = df_part[TMP_HGVS_HG38_LEFT_ALIGNED].apply(
-            lambda hgvs_obj: hgvs_proc.genomic_to_cdna(hgvs_obj))
-        return df_part
+    with timings.stage("Writing out to {}".format(output)):
+        combine_derived_columns(df, computed, reused).to_csv(output, sep='\t', index=False)
+        write_data_version(output + DATA_VERSION_SUFFIX, version, digests)
 
-    df = utils.parallelize_dataframe(df, _compute_cdna, processes)
+    timings.log_summary()
 
-    # extract cdna from source if it could not be computed
-    df[TMP_CDNA_FROM_SOURCE] = df[HGVS_CDNA_COL]  # "backup" to be used later during synonym computation
-    df[TMP_CDNA_NORM_FIELD] = df.apply(
-        lambda r: cdna_from_cdna_field(r, cdna_default_ac_dict, hgvs_proc) if not r[TMP_CDNA_NORM_FIELD] else r[
-            TMP_CDNA_NORM_FIELD], axis=1)
 
-    #### CDNA and Genomic HGVS conversions
-    df[PYHGVS_CDNA_COL] = df[TMP_CDNA_NORM_FIELD].apply(str)
+def _generate_pseudonyms(df, resources, processes, pool, hgvs_proc, timings, cdna_default_ac_dict, strand_dict):
+    """Computes the derived columns in stages run in the pool. Variants are kept as exchange strings
+    (see to_exchange_str) in the temporary columns
 
-    available_cdna = df[PYHGVS_CDNA_COL].str.startswith("NM_")
-    df.loc[available_cdna, REFERENCE_SEQUENCE_COL] = df.loc[available_cdna, PYHGVS_CDNA_COL].str.split(':').apply(
-        lambda l: l[0])
-    df.loc[available_cdna, HGVS_CDNA_COL] = df.loc[available_cdna, PYHGVS_CDNA_COL].str.split(':').apply(lambda l: l[1])
+    :param df: input rows, indexed from 0
+    :return: pd.DataFrame: df with derived columns
+    """
 
-    # still setting a reference sequence for downstream steps, even though no cDNA could be determined
-    df.loc[~available_cdna, REFERENCE_SEQUENCE_COL] = df.loc[~available_cdna, GENE_SYMBOL_COL].apply(
-        lambda g: cdna_default_ac_dict[g])
-    df.loc[~available_cdna, HGVS_CDNA_COL] = '-'
+    def _normalize(src_col, right_shift):
+        # exchange strings and str of the normalized variants
+        items = [(v, _shuffle_direction(strand_dict.get(g), right_shift))
+                 for v, g in zip(df[src_col], df[GENE_SYMBOL_COL])]
+        results = _run_stage(pool, _normalize_worker, items, processes)
+        return [r[0] for r in results], [r[1] for r in results]
+
+    with timings.stage("Converting variants to hgvs objects"):
+        df[VAR_OBJ_FIELD] = df.apply(lambda r: VCFVariant(r[CHR_COL], r[POS_COL], r[REF_COL], r[ALT_COL]), axis=1)
+        df[TMP_HGVS_HG38] = df[VAR_OBJ_FIELD].apply(
+            lambda v: v.to_hgvs_str(hgvs_proc.contig_maps[HgvsWrapper.GRCh38_Assem], include_ref=True))
+
+    with timings.stage("Normalize genomic representation"):
+        df[TMP_HGVS_HG38], df[GENOMIC_HGVS_HG38_COL] = _normalize(TMP_HGVS_HG38, True)
+        df[TMP_HGVS_HG38_LEFT_ALIGNED], _ = _normalize(TMP_HGVS_HG38, False)
+
+    with timings.stage("Compute hg37 representation of internal representation"):
+        var_objs_hg37, var_objs_hg37_failed = convert_to_hg37(df[VAR_OBJ_FIELD], resources)
+
+        tmp_hgvs_hg37_values = [v.to_hgvs_str(hgvs_proc.contig_maps[HgvsWrapper.GRCh37_Assem], include_ref=True)
+                                for v in var_objs_hg37]
+
+        var_objs_hg37, tmp_hgvs_hg37_values, df = handle_failed_hg37_translations(df, var_objs_hg37, var_objs_hg37_failed, tmp_hgvs_hg37_values, hgvs_proc)
+
+        df[TMP_HGVS_HG37] = pd.Series(tmp_hgvs_hg37_values)
+
+    with timings.stage("Compute hg37 normalized representation of internal"):
+        # normalizing again for the hg37 representation. An alternative would be to convert the normalized hg38 representation to hg37.
+        # If we use crossmap, we would need a way to convert the VCF like representation back to an hgvs object, which we currently
+        # are unable to do properly. That is, we can use VCFVariant.to_hgvs_obj, however, structural variants will be converted
+        # to delins, losing information if a variant was e.g. a del, ins, or dup.
+        df[TMP_HGVS_HG37], df[GENOMIC_HGVS_HG37_COL] = _normalize(TMP_HGVS_HG37, True)
+        df[TMP_HGVS_HG37_LEFT_ALIGNED], _ = _normalize(TMP_HGVS_HG37, False)
+
+    with timings.stage("Compute cDNA representation"):
+        df[TMP_CDNA_NORM_FIELD] = [r[0] for r in _run_stage(pool, _cdna_worker, list(df[TMP_HGVS_HG38]), processes)]
+        df[TMP_CDNA_NORM_LEFT_ALINGED_FIELD] = [
+            r[0] for r in _run_stage(pool, _cdna_worker, list(df[TMP_HGVS_HG38_LEFT_ALIGNED]), processes)]
+
+        # extract cdna from source if it could not be computed
+        df[TMP_CDNA_FROM_SOURCE] = df[HGVS_CDNA_COL]  # "backup" to be used later during synonym computation
+        df[TMP_CDNA_NORM_FIELD] = df.apply(
+            lambda r: to_exchange_str(cdna_from_cdna_field(r, cdna_default_ac_dict, hgvs_proc)) if not r[TMP_CDNA_NORM_FIELD] else r[
+                TMP_CDNA_NORM_FIELD], axis=1)
+
+        #### CDNA and Genomic HGVS conversions
+        df[PYHGVS_CDNA_COL] = df[TMP_CDNA_NORM_FIELD].apply(
+            lambda v: str(hgvs_proc.hgvs_parser.parse(v)) if isinstance(v, str) else str(None))
+
+        available_cdna = df[PYHGVS_CDNA_COL].str.startswith("NM_")
+        df.loc[available_cdna, REFERENCE_SEQUENCE_COL] = df.loc[available_cdna, PYHGVS_CDNA_COL].str.split(':').apply(
+            lambda l: l[0])
+        df.loc[available_cdna, HGVS_CDNA_COL] = df.loc[available_cdna, PYHGVS_CDNA_COL].str.split(':').apply(lambda l: l[1])
+
+        # still setting a reference sequence for downstream steps, even though no cDNA could be determined
+        df.loc[~available_cdna, REFERENCE_SEQUENCE_COL] = df.loc[~available_cdna, GENE_SYMBOL_COL].apply(
+            lambda g: cdna_default_ac_dict[g])
+        df.loc[~available_cdna, HGVS_CDNA_COL] = '-'
 
     #### Internal Genomic Coordinates
     df[PYHGVS_GENOMIC_COORDINATE_38_COL] = df[VAR_OBJ_FIELD].apply(lambda v: str(v))
@@ -313,39 +542,24 @@ def main(input, output, log_path, config_file, resources, processes):
     df[PYHGVS_HG37_END_COL] = df[PYHGVS_HG37_START_COL] + (df[HG38_END_COL] - df[HG38_START_COL])
 
     #### Protein
-    logging.info("Protein Conversion")
-
-    def _compute_proteins(df_part):
-        hgvs_proc = HgvsWrapper()
-        df_part[PYHGVS_PROTEIN_COL] = df_part[TMP_CDNA_NORM_FIELD].apply(lambda x: str(hgvs_proc.cdna_to_protein(x)))
-        df_part[TMP_PROTEIN_LEFT_ALINGED_FIELD] = df_part[TMP_CDNA_NORM_LEFT_ALINGED_FIELD].apply(
-            lambda x: str(hgvs_proc.cdna_to_protein(x)))
-        return df_part
-
-    df = utils.parallelize_dataframe(df, _compute_proteins, processes)
+    with timings.stage("Protein Conversion"):
+        df[PYHGVS_PROTEIN_COL] = _run_stage(pool, _protein_worker, list(df[TMP_CDNA_NORM_FIELD]), processes)
+        df[TMP_PROTEIN_LEFT_ALINGED_FIELD] = _run_stage(pool, _protein_worker,
+                                                        list(df[TMP_CDNA_NORM_LEFT_ALINGED_FIELD]), processes)
 
     #### Synonyms
-    logging.info("Compute Synonyms")
-
-    def _compute_synonyms(df_part):
-        hgvs_proc = HgvsWrapper()
-        df_part[NEW_SYNONYMS_FIELD] = df_part.apply(lambda s: get_synonyms(s, hgvs_proc, syn_ac_dict), axis=1)
-        return df_part
+    with timings.stage("Compute Synonyms"):
+        items = list(df[SYNONYM_INPUT_FIELDS].itertuples(index=False, name=None))
+        df[NEW_SYNONYMS_FIELD] = _run_stage(pool, _synonyms_worker, items, processes)
 
-    df = utils.parallelize_dataframe(df, _compute_synonyms, processes)
+        df[SYNONYMS_COL] = df[SYNONYMS_COL].fillna('').str.strip()
 
-    df[SYNONYMS_COL] = df[SYNONYMS_COL].fillna('').str.strip()
+        # merge existing synonyms with generated ones and sort them
+        df[SYNONYMS_COL] = df.apply(_merge_and_clean_synonyms, axis=1)
 
-    # merge existing synonyms with generated ones and sort them
-    df[SYNONYMS_COL] = df.apply(_merge_and_clean_synonyms, axis=1)
-
-    #### Writing out
     # removing temporary fields
     tmp_fields = [c for c in df.columns if c.startswith('tmp_')]
-    df = df.drop(columns=[VAR_OBJ_FIELD, NEW_SYNONYMS_FIELD] + tmp_fields)
-
-    logging.info(f"Writing out to {output}")
-    df.to_csv(output, sep='\t', index=False)
+    return df.drop(columns=[VAR_OBJ_FIELD, NEW_SYNONYMS_FIELD] + tmp_fields)
 
 
 if __name__ == "__main__":
@@ -8,8 +8,11 @@ import logging
 import os
 from os import listdir
 from os.path import isfile, join, abspath
+
+import numpy as np
+
+from common import vcf_utils
 from data_merging.aggregate_reports import get_reports_files
-import vcf
 
 csv.field_size_limit(10000000)
 
@@ -40,52 +43,59 @@ def main():
 
 
 def get_bx_ids():
-    # Get all bx_ids present in source files organized by source
+    # Get all bx_ids present in source files organized by source, as sorted arrays
     bx_ids = {}
 
     files = get_reports_files(ARGS.ready_input_dir)
 
     for file in files:
         file_path = abspath(os.path.join(ARGS.ready_input_dir, file))
+        ids = []
         if file_path.endswith('.tsv'):
             source = "ENIGMA"
-            bx_ids[source] = []
-            tsv_file = csv.DictReader(open(file_path, "r"), delimiter='\t')
-            for report in tsv_file:
-                ids = list(map(int, report['BX_ID'].split(',')))
-                bx_ids[source] = bx_ids[source] + ids
+            with open(file_path, "r") as f:
+                for report in csv.DictReader(f, delimiter='\t'):
+                    ids.extend(map(int, report['BX_ID'].split(',')))
         else:
             suffix = '.vcf'
             source = file[:(len(file)-len(suffix))]
-            bx_ids[source] = []
-            vcf_reader = vcf.Reader(open(file_path, 'r'), strict_whitespace=True)
-            try:
-                for record in vcf_reader:
-                    ids = list(map(int, record.INFO['BX_ID']))
-                    bx_ids[source] = bx_ids[source] + ids
-            except ValueError as e:
-                print(e)
+            with open(file_path, 'r') as f:
+                vcf_reader = vcf_utils.Reader(f, strict_whitespace=True)
+                try:
+                    for record in vcf_reader:
+                        ids.extend(map(int, record.INFO['BX_ID']))
+                except ValueError as e:
+                    print(e)
+        bx_ids[source] = np.sort(np.array(ids, dtype=np.int64))
 
     return bx_ids
 
 
+def contains_ids(sorted_ids, ids):
+    """
+    :param sorted_ids: sorted np.ndarray of ids
+    :param ids: list of ids
+    :return: np.ndarray[bool]: whether every id of ids is in sorted_ids
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(sorted_ids) == 0:
+        return np.zeros(len(ids), dtype=bool)
+    idx = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return sorted_ids[idx] == ids
+
+
 def find_matches_per_source(bx_ids):
-    matches_per_source = {}
     built = csv.DictReader(open(ARGS.built, "r"), delimiter='\t')
     column_prefix = "BX_ID_"
-    bx_id_columns = [f for f in built.fieldnames if column_prefix in f]
+    bx_id_columns = [(f, f[len(column_prefix):]) for f in built.fieldnames if column_prefix in f]
     matches_per_source = {}
     for variant in built:
-        for column in bx_id_columns:
-            source = column[len(column_prefix):]
+        variant_sources = variant["Source"].split(',')
+        for column, source in bx_id_columns:
             if source not in matches_per_source:
                 matches_per_source[source] = []
             source_bx_ids = variant[column]
-            variant_sources = variant["Source"].split(',')
-            match = False
-            for src in variant_sources:
-                if source == src:
-                    match = True
+            match = source in variant_sources
             if isEmpty(source_bx_ids):
                 if match:
                     logging.warning("Variant %s has source %s but no report ids from that source", variant, source)
@@ -94,8 +104,8 @@ def find_matches_per_source(bx_ids):
                     logging.warning("Variant %s has report(s) %s from source %s, but source is not associated with variant", variant, source_bx_ids, source)
                 else:
                     source_bx_ids = list(map(int, source_bx_ids.split(',')))
-                    for source_bx_id in source_bx_ids:
-                        if source_bx_id in bx_ids[source]:
+                    for source_bx_id, found in zip(source_bx_ids, contains_ids(bx_ids[source], source_bx_ids)):
+                        if found:
                             matches_per_source[source].append(source_bx_id)
                         else:
                             logging.warning("Report(s) %s found on variant %s, but report does not exist from source %s", source_bx_ids, variant, source)
@@ -106,7 +116,7 @@ def find_missing_reports(matches_per_source, bx_ids):
     missing_reports = {}
     for source in matches_per_source:
         matches_set = get_set_of_ids(matches_per_source[source])
-        original_ids_set = get_set_of_ids(bx_ids[source])
+        original_ids_set = get_set_of_ids(bx_ids[source].tolist())
         missing_reports[source] = matches_set.symmetric_difference(original_ids_set)
     return missing_reports
 
@@ -33,7 +33,7 @@ def _handle_transform_fields(df, df_metadata):
     assert TRANSFORM_FIELDS == transform_fields, \
         f"Expected {transform_fields} to be handled specially according to metadata file, but in code there is {TRANSFORM_FIELDS}."
 
-    hgvs_wrapper = hgvs_utils.HgvsWrapper().get_instance()
+    hgvs_wrapper = hgvs_utils.HgvsWrapper.get_instance()
 
     hgvs_obj = df[NORMALIZED_GENOMIC_COORD_FIELD].apply(
         lambda v: hgvs_wrapper.hgvs_parser.parse(v) if not isinstance(v, float) else v)
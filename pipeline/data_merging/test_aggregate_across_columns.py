@@ -1,5 +1,9 @@
+import csv
+import sys
+
 import pytest
 import unittest
+from . import aggregate_across_columns
 from .aggregate_across_columns import selectMaxAlleleFrequency, selectAlleleFrequency, FIELDS_TO_REMOVE, FIELDS_TO_ADD, FIELDS_TO_RENAME, setOutputColumns, update_basic_fields, EMPTY
 
 class TestStringMethods(unittest.TestCase):
@@ -370,5 +374,75 @@ class TestStringMethods(unittest.TestCase):
         self.assertEqual(AF, '0.5 (GnomAD)')
 
 
+def merged_variant_rows():
+    """
+    Rows of merged.tsv derived from the fixture of TestStringMethods, covering the branches of updateRow
+    """
+    fixture = TestStringMethods()
+    fixture.setUp()
+    base = {k: v for k, v in fixture.oldRow.items() if k not in FIELDS_TO_ADD}
+    base.update({c: EMPTY for c in list(fixture.newRowAlleleFrequencies) + FIELDS_TO_REMOVE if c not in base})
+    base['Synonyms_ClinVar'] = EMPTY
+
+    variations = [
+        {},
+        {'Genomic_Coordinate': 'chr17:g.43045712:A>G', 'Chr': '17', 'Pos': '43045712'},
+        {'HGVS_cDNA_ENIGMA': EMPTY, 'HGVS_ClinVar': 'NM_000059.3:c.-764A>G,NM_000059.3:c.-765A>G'},
+        {'HGVS_cDNA_ENIGMA': EMPTY, 'HGVS_ClinVar': EMPTY, 'HGVS_cDNA_LOVD': 'NM_007294.3.c.5A>G'},
+        {'HGVS_cDNA_ENIGMA': EMPTY, 'HGVS_ClinVar': EMPTY, 'HGVS_cDNA_exLOVD': 'NM_007294.3.n.5A>G'},
+        {'HGVS_protein_ENIGMA': EMPTY, 'Protein_ClinVar': 'NM_000059.3:p.(Arg1Gly)'},
+        {'HGVS_protein_ENIGMA': EMPTY, 'HGVS_protein_LOVD': 'p.(Arg2Gly)'},
+        {'BIC_Nomenclature_ENIGMA': '1A>G|2A>G', 'Synonyms_ClinVar': '2A>G,U43746.1:c.1A>G'},
+        {'BIC_Nomenclature_ENIGMA': EMPTY, 'BIC_Designation_BIC': '3A>G', 'BIC_Nomenclature_exLOVD': '3A>G,-'},
+        {'Clinical_significance_ENIGMA': EMPTY, 'Clinical_Significance_ClinVar': EMPTY},
+        {'Clinical_significance_ENIGMA': 'Pathogenic', 'Clinical_Significance_ClinVar': 'Benign,Pathogenic'},
+        {'Clinical_significance_ENIGMA': 'Likely_benign', 'Clinical_Significance_ClinVar': 'Likely_pathogenic'},
+        {'Allele_frequency_genome_GnomAD': '0.345', 'Allele_count_genome_GnomAD': '345',
+         'Allele_number_genome_GnomAD': '1000', 'Allele_count_exome_GnomAD': '0', 'Allele_number_exome_GnomAD': '0'},
+        {'Allele_frequency_exome_GnomAD': '0.1', 'Allele_count_exome_GnomAD': '1', 'Allele_number_exome_GnomAD': '3'},
+        {'Allele_frequency_exome_GnomAD': '0', 'Allele_count_exome_GnomAD': '0', 'Allele_number_exome_GnomAD': '0',
+         'Allele_frequency_ExAC': '0.001'},
+        {'Allele_frequency_genome_GnomAD': '0', 'Allele_count_genome_GnomAD': '0', 'Allele_number_genome_GnomAD': '8'},
+        {'Allele_frequency_ExAC': '8.2e-06'},
+        {'Allele_frequency_ExAC': ''},
+        {'Minor_allele_frequency_percent_ESP': '0.1,20.345'},
+        {'Allele_frequency_1000_Genomes': EMPTY},
+        {'URL_ENIGMA': 'http://a,http://b', 'SCV_ClinVar': 'SCV000244909,SCV000244910'},
+        {'URL_ENIGMA': '', 'SCV_ClinVar': EMPTY},
+        {'SCV_ClinVar': EMPTY},
+        {'Comment_on_clinical_significance_ENIGMA': 'quoted "comment"'},
+    ]
+
+    rows = []
+    for v in variations:
+        row = dict(base)
+        row.update(v)
+        rows.append(row)
+    return rows
+
+
+def write_merged_tsv(path, rows):
+    with open(path, 'w') as f:
+        writer = csv.DictWriter(f, delimiter='\t', fieldnames=list(rows[0].keys()), lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+@pytest.mark.parametrize("scale", [1, 3])
+def test_columnar_engine_identical_to_rows(tmp_path, monkeypatch, scale):
+    merged_path = str(tmp_path / 'merged.tsv')
+    write_merged_tsv(merged_path, merged_variant_rows() * scale)
+
+    outputs = {}
+    for engine in ['rows', 'columns']:
+        outputs[engine] = str(tmp_path / 'aggregated_{}.tsv'.format(engine))
+        monkeypatch.setattr(sys, 'argv', ['aggregate_across_columns.py', '-i', merged_path, '-o', outputs[engine],
+                                          '-e', engine])
+        aggregate_across_columns.main()
+
+    with open(outputs['rows'], 'rb') as f_rows, open(outputs['columns'], 'rb') as f_columns:
+        assert f_columns.read() == f_rows.read()
+
+
 if __name__ == '__main__':
     pass
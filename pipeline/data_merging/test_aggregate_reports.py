@@ -1,4 +1,5 @@
 from common import config
+import tempfile
 import unittest
 import os
 from os import path
@@ -390,6 +391,25 @@ class TestStringMethods(unittest.TestCase):
         for variant in reports:
             self.assertIn(variant[variant_effect_lovd_index][0], ['?/.', '+/+'])
 
+    def test_write_reports_tsv(self):
+        reports_files = [INPUT_DIRECTORY + r for r in aggregate_reports.get_reports_files(INPUT_DIRECTORY)]
+        reports = aggregate_reports.aggregate_reports(reports_files, self.columns, self.genome_regions_symbol_dict)
+        expected = "\t".join(self.columns) + "\n" + \
+            "".join(aggregate_reports.format_report(r, self.columns) for r in reports)
+
+        for processes in [1, 3]:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                reports_path = os.path.join(tmp_dir, "reports.tsv")
+                aggregate_reports.write_reports_tsv(reports_path, self.columns, INPUT_DIRECTORY,
+                                                    self.genome_regions_symbol_dict, processes=processes)
+                with open(reports_path) as f:
+                    self.assertEqual(f.read(), expected)
+                self.assertEqual(os.listdir(tmp_dir), ["reports.tsv"])
+
+    def test_format_report(self):
+        self.assertEqual(aggregate_reports.format_report(["a", ["b", 1], 2], ["x", "y", "z"]), "a\tb,1\t2\n")
+        with self.assertRaises(Exception):
+            aggregate_reports.format_report(["a"], ["x", "y"])
 
 
 if __name__ == '__main__':
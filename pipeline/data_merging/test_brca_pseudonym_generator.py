@@ -0,0 +1,128 @@
+import os
+
+import hgvs.parser
+import pandas as pd
+import pytest
+
+from common import config
+from data_merging import brca_pseudonym_generator as pg
+
+
+@pytest.mark.parametrize("v", ["NC_000017.11:g.43045711_43045713delGTA", "NC_000017.11:g.43045711dupG",
+                               "NM_007294.3:c.5266_5267insC", "NC_000013.11:g.32340300G>A"])
+def test_exchange_str_roundtrip(v):
+    parser = hgvs.parser.Parser()
+    obj = parser.parse(v)
+
+    assert parser.parse(pg.to_exchange_str(obj)) == obj
+    assert pg.to_exchange_str(None) is None
+
+
+def test_run_stage_in_process():
+    def worker(items):
+        return [i * 2 for i in items]
+
+    assert pg._run_stage(None, worker, list(range(10)), 3) == [i * 2 for i in range(10)]
+    assert pg._run_stage(None, worker, [], 3) == []
+
+
+CFG_DF = pd.DataFrame({config.SYMBOL_COL: ['BRCA1'], config.HGVS_CDNA_DEFAULT_AC: ['NM_007294.3'],
+                       config.SYNONYM_AC_COL: ['NM_007300.3'], config.STRAND_COL: ['-']})
+
+
+def _input_df():
+    return pd.DataFrame({pg.CHR_COL: [17, 17, 17], pg.POS_COL: [100, 200, 300], pg.REF_COL: ['A', 'C', 'GT'],
+                         pg.ALT_COL: ['G', 'T', 'G'], pg.GENE_SYMBOL_COL: ['BRCA1'] * 3,
+                         pg.SYNONYMS_COL: ['a', '', 'c'], pg.HGVS_CDNA_COL: ['c.1A>G', '-', 'c.3del'],
+                         pg.HG38_START_COL: [100, 200, 300], pg.HG38_END_COL: [100, 200, 301], 'Source': ['x', 'y', 'z']})
+
+
+def _full_run(df, hg37_starts):
+    # derived columns as computed by _generate_pseudonyms
+    out = df.copy()
+    for c in pg.DERIVED_COLUMNS:
+        out[c] = ['{}_{}'.format(c, i) for i in range(len(df))]
+    out[pg.PYHGVS_HG37_START_COL] = pd.Series(hg37_starts)
+    out[pg.PYHGVS_HG37_END_COL] = out[pg.PYHGVS_HG37_START_COL] + (out[pg.HG38_END_COL] - out[pg.HG38_START_COL])
+    return out
+
+
+@pytest.mark.parametrize("hg37_starts", [[50, 150, 250], [50, None, 250]])
+def test_incremental_run_equals_full_run(tmp_path, hg37_starts):
+    df = _input_df()
+    version = {'hgvs': 'uta_20180821'}
+
+    previous_path = str(tmp_path / 'previous.tsv')
+    full_run = _full_run(df, hg37_starts)
+    full_run.to_csv(previous_path, sep='\t', index=False)
+    pg.write_data_version(previous_path + pg.DATA_VERSION_SUFFIX, version, pg.input_digests(df, CFG_DF))
+
+    # second variant changed, such that it is computed again
+    df.loc[1, 'Source'] = 'y,w'
+    df.loc[1, pg.SYNONYMS_COL] = 'b'
+    full_run = _full_run(df, hg37_starts)
+
+    digests = pg.input_digests(df, CFG_DF)
+    reused = pg.previous_derived_columns(df, digests, version, previous_path,
+                                         previous_path + pg.DATA_VERSION_SUFFIX)
+    assert list(reused.index) == [0, 2]
+
+    combined = pg.combine_derived_columns(df, full_run.loc[[1]], reused)
+    assert combined.to_csv(sep='\t', index=False) == full_run.to_csv(sep='\t', index=False)
+
+    assert pg.previous_derived_columns(df, digests, {'hgvs': 'uta_20210129'}, previous_path,
+                                       previous_path + pg.DATA_VERSION_SUFFIX).empty
+
+
+def test_input_digests_depend_on_gene_config():
+    df = _input_df()
+    cfg_df = CFG_DF.copy()
+    cfg_df[config.STRAND_COL] = ['+']
+
+    assert pg.input_digests(df, CFG_DF)[0] != pg.input_digests(df, cfg_df)[0]
+    assert pg.input_digests(df, CFG_DF).equals(pg.input_digests(df.copy(), CFG_DF))
+
+
+def test_consecutive_incremental_releases(tmp_path, monkeypatch):
+    # every release runs the pseudonym generator on all of its variants, taking over unchanged ones from the output
+    # of the previous release, see BuildAggregatedOutput
+    def full_run(df):
+        out = df.copy()
+        for c in pg.DERIVED_COLUMNS:
+            out[c] = c + '_' + df[pg.POS_COL].astype(str) + '_' + df[pg.SYNONYMS_COL].astype(str)
+        out[pg.PYHGVS_HG37_START_COL] = df[pg.POS_COL] - 50
+        out[pg.PYHGVS_HG37_END_COL] = out[pg.PYHGVS_HG37_START_COL] + (df[pg.HG38_END_COL] - df[pg.HG38_START_COL])
+        return out
+
+    computed = []
+
+    def generate_pseudonyms(df, *args):
+        computed.append(list(df[pg.POS_COL]))
+        return full_run(df)
+
+    monkeypatch.setattr(pg, 'HgvsWrapper', lambda: None)
+    monkeypatch.setattr(pg, 'data_version', lambda hgvs_proc, resources: {'hgvs': 'uta_20180821'})
+    monkeypatch.setattr(pg, '_generate_pseudonyms', generate_pseudonyms)
+
+    config_path = os.path.join(os.path.dirname(__file__), '..', 'workflow', 'gene_config_brca_only.txt')
+
+    df = _input_df()
+    previous_output = None
+    for release, changed_variant in enumerate([None, 1, 2]):
+        if changed_variant is not None:
+            df.loc[changed_variant, pg.SYNONYMS_COL] = 'release_{}'.format(release)
+
+        input_path = str(tmp_path / 'aggregated_{}.tsv'.format(release))
+        output_path = str(tmp_path / 'built_{}.tsv'.format(release))
+        df.to_csv(input_path, sep='\t', index=False)
+        args = [input_path, output_path, '--log-path', str(tmp_path / 'log_{}.txt'.format(release)),
+                '--config-file', config_path, '--processes', '1']
+        if previous_output:
+            args += ['--previous-output', previous_output]
+        pg.main.main(args, standalone_mode=False)
+
+        # variants taken over from the previous release are part of the output, such that the next one reuses them
+        assert pd.read_csv(output_path, sep='\t').equals(full_run(pd.read_csv(input_path, sep='\t')))
+        previous_output = output_path
+
+    assert computed == [[100, 200, 300], [200], [300]]
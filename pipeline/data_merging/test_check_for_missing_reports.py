@@ -0,0 +1,70 @@
+import argparse
+import csv
+import logging
+from os import path
+
+import numpy as np
+import pytest
+
+from . import check_for_missing_reports
+
+INPUT_DIRECTORY = path.join(path.dirname(__file__), 'test_files/')
+
+
+@pytest.fixture()
+def args(tmp_path, monkeypatch):
+    args = argparse.Namespace(ready_input_dir=INPUT_DIRECTORY, built=str(tmp_path / 'built.tsv'),
+                              artifacts_dir=str(tmp_path))
+    monkeypatch.setattr(check_for_missing_reports, 'ARGS', args)
+    return args
+
+
+def write_built(path, rows):
+    fieldnames = ['Source', 'BX_ID_ClinVar', 'BX_ID_BIC', 'BX_ID_LOVD']
+    with open(path, 'w') as f:
+        writer = csv.DictWriter(f, delimiter='\t', fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def test_get_bx_ids(args):
+    bx_ids = check_for_missing_reports.get_bx_ids()
+
+    assert set(bx_ids.keys()) == {'ENIGMA', 'ESP', 'ExAC', 'exLOVD', '1000_Genomes', 'GnomADv3',
+                                  'ENIGMA_BRCA12_Functional_Assays', 'BIC', 'GnomAD', 'LOVD', 'ClinVar'}
+    assert all(np.all(np.diff(ids) >= 0) for ids in bx_ids.values())
+    assert len(bx_ids['BIC']) == 3
+
+
+def test_contains_ids():
+    sorted_ids = np.array([2, 5, 9])
+
+    assert check_for_missing_reports.contains_ids(sorted_ids, [9, 1, 5, 10, 3]).tolist() == \
+        [True, False, True, False, False]
+    assert check_for_missing_reports.contains_ids(np.array([], dtype=np.int64), [1]).tolist() == [False]
+
+
+def test_find_missing_reports(args, caplog):
+    bx_ids = check_for_missing_reports.get_bx_ids()
+    clinvar_ids = bx_ids['ClinVar'].tolist()
+    bic_ids = bx_ids['BIC'].tolist()
+
+    write_built(args.built, [
+        {'Source': 'ClinVar,BIC', 'BX_ID_ClinVar': str(clinvar_ids[0]),
+         'BX_ID_BIC': ','.join(str(i) for i in bic_ids[:2] + [99999]), 'BX_ID_LOVD': '-'},
+        # source without report ids and report ids without source
+        {'Source': 'LOVD', 'BX_ID_ClinVar': str(clinvar_ids[1]), 'BX_ID_BIC': '-', 'BX_ID_LOVD': '-'}])
+
+    with caplog.at_level(logging.WARNING):
+        matches_per_source = check_for_missing_reports.find_matches_per_source(bx_ids)
+
+    assert matches_per_source == {'ClinVar': clinvar_ids[:1], 'BIC': bic_ids[:2], 'LOVD': []}
+    assert [r.getMessage().split(' ')[0] for r in caplog.records] == ['Report(s)', 'Variant', 'Variant']
+    assert 'but report does not exist from source BIC' in caplog.records[0].getMessage()
+    assert 'but source is not associated with variant' in caplog.records[1].getMessage()
+    assert 'has source LOVD but no report ids' in caplog.records[2].getMessage()
+
+    missing_reports = check_for_missing_reports.find_missing_reports(matches_per_source, bx_ids)
+
+    assert missing_reports == {'ClinVar': set(clinvar_ids[1:]), 'BIC': set(bic_ids[2:]),
+                               'LOVD': set(bx_ids['LOVD'].tolist())}
@@ -1,5 +1,8 @@
+import collections
+import glob
 import itertools
 import os
+import sys
 import unittest
 
 import pytest
@@ -11,13 +14,20 @@ from hypothesis.strategies import integers, tuples, sampled_from, lists
 from mock import patch
 
 from common import seq_utils
-from common.config import load_config, extract_gene_regions_dict
+from common.config import load_config, extract_gene_regions_dict, split_config, save_config
 from .utilities import round_sigfigs
-from .variant_equivalence import variant_equal, find_equivalent_variant, find_equivalent_variants_whole_seq
+from .variant_equivalence import variant_equal, find_equivalent_variant, find_equivalent_variants_whole_seq, \
+    find_equivalent_variants_rolling_hash, find_equivalent_variants_canonical, calculate_canonical_key, \
+    cross_check_equivalence
+from . import variant_merging
 from .variant_merging import normalize_values, add_variant_to_dict, \
-    COLUMN_SOURCE, append_exac_allele_frequencies, EXAC_SUBPOPULATIONS
+    COLUMN_SOURCE, append_exac_allele_frequencies, EXAC_SUBPOPULATIONS, is_outside_boundaries, \
+    belongs_to_other_shard, iter_records_with_boundaries, restrict_to_shard
+from common.utils import StaticIntervalIndex
 
 
+from workflow import sharding
+from . import variant_merging_constants as constants
 from .variant_merging_constants import VCFVariant
 
 runtimes = 500000
@@ -454,6 +464,199 @@ def test_find_equivalent_variant_whole_seq(fetch_seq_mock_data):
             find_equivalent_variants_whole_seq(variant_dict, whole_seq_provider))
 
 
+def test_find_equivalent_variants_rolling_hash(fetch_seq_mock_data):
+    with patch.object(bioutils.seqfetcher, 'fetch_seq', side_effect=lambda ac, s, e: fetch_seq_mock_data[(str(ac), str(s), str(e))]):
+        gene_config_path = os.path.join(pwd, 'test_files', 'gene_config_test.txt')
+
+        cfg = load_config(gene_config_path)
+        regions = list(extract_gene_regions_dict(cfg, 'start_hg38_legacy_variants', 'end_hg38_legacy_variants').keys())
+        seq_wrapper = seq_utils.SeqRepoWrapper(regions_preload=regions)
+
+        rolling_hash_seq_provider = seq_utils.RollingHashSeqProvider(seq_wrapper)
+
+        # empty case
+        assert [] == find_equivalent_variants_rolling_hash({}, rolling_hash_seq_provider)
+
+        # a bunch of variants. If they appear in the same set, they are considered equivalent
+        example_variants = [
+            frozenset({'chr13:g.32355030:A>AA'}),
+            frozenset({'chr13:g.32339774:GAT>G', 'chr13:g.32339776:TAT>T'}),
+            frozenset({'chr17:g.43090921:G>GCA', 'chr17:g.43090921:GCA>GCACA'}),
+            frozenset({'chr17:g.43090921:G>T'})
+        ]
+
+        variant_dict = {v: VCFVariant(
+            int(v.split(':')[0].lstrip('chr')),
+            int(v.split(':')[1].lstrip('g.')),
+            v.split(':')[2].split('>')[0],
+            v.split(':')[2].split('>')[1]) for eq_variants in example_variants for v
+            in eq_variants
+        }
+
+        assert frozenset(example_variants) == frozenset(
+            find_equivalent_variants_rolling_hash(variant_dict, rolling_hash_seq_provider))
+
+        # same groups as when editing the whole sequence
+        whole_seq_provider = seq_utils.WholeSeqSeqProvider(seq_wrapper)
+        assert frozenset(find_equivalent_variants_whole_seq(variant_dict, whole_seq_provider)) == frozenset(
+            find_equivalent_variants_rolling_hash(variant_dict, rolling_hash_seq_provider))
+
+
+def test_find_equivalent_variants_canonical(fetch_seq_mock_data):
+    with patch.object(bioutils.seqfetcher, 'fetch_seq', side_effect=lambda ac, s, e: fetch_seq_mock_data[(str(ac), str(s), str(e))]):
+        gene_config_path = os.path.join(pwd, 'test_files', 'gene_config_test.txt')
+
+        cfg = load_config(gene_config_path)
+        regions = list(extract_gene_regions_dict(cfg, 'start_hg38_legacy_variants', 'end_hg38_legacy_variants').keys())
+        seq_wrapper = seq_utils.SeqRepoWrapper(regions_preload=regions)
+
+    whole_seq_provider = seq_utils.WholeSeqSeqProvider(seq_wrapper)
+
+    # empty case
+    assert [] == find_equivalent_variants_canonical({}, whole_seq_provider)
+
+    assert calculate_canonical_key(VCFVariant(13, 32339776, 'TAT', 'T'), whole_seq_provider) == \
+           calculate_canonical_key(VCFVariant(13, 32339774, 'GAT', 'G'), whole_seq_provider)
+
+    example_variants = [
+        frozenset({'chr13:g.32355030:A>AA'}),
+        frozenset({'chr13:g.32339774:GAT>G', 'chr13:g.32339776:TAT>T'}),
+        frozenset({'chr17:g.43090921:G>GCA', 'chr17:g.43090921:GCA>GCACA'}),
+        frozenset({'chr17:g.43090921:G>T'})
+    ]
+
+    variant_dict = {v: VCFVariant(
+        int(v.split(':')[0].lstrip('chr')),
+        int(v.split(':')[1].lstrip('g.')),
+        v.split(':')[2].split('>')[0],
+        v.split(':')[2].split('>')[1]) for eq_variants in example_variants for v
+        in eq_variants
+    }
+
+    assert frozenset(example_variants) == frozenset(
+        find_equivalent_variants_canonical(variant_dict, whole_seq_provider))
+
+    # cross checking with whole seq strategy on variants of the test files
+    for vcf_path in glob.glob(os.path.join(pwd, 'test_files', '*.vcf')):
+        for record in vcf.Reader(open(vcf_path, 'r'), strict_whitespace=True):
+            for alt in record.ALT:
+                v = VCFVariant(int(record.CHROM), int(record.POS), record.REF, str(alt))
+                if seq_wrapper.get_preloaded_seq_at(v.chr, v.pos) and \
+                        seq_wrapper.get_seq_at(v.chr, v.pos, len(v.ref)) == v.ref:
+                    variant_dict[str(v)] = v
+
+    assert (set(), set()) == cross_check_equivalence(
+        find_equivalent_variants_canonical(variant_dict, whole_seq_provider),
+        find_equivalent_variants_whole_seq(variant_dict, whole_seq_provider))
+
+
+def test_iter_records_with_boundaries():
+    Record = collections.namedtuple('Record', 'CHROM, POS')
+    gene_regions_trees = {13: StaticIntervalIndex([(100, 200, 'BRCA2')]),
+                          17: StaticIntervalIndex([(500, 600, 'BRCA1'), (550, 700, 'OVERLAPPING')])}
+    shard_regions_trees = restrict_to_shard(gene_regions_trees, {17: StaticIntervalIndex([(500, 600, 'BRCA1')])})
+    records = [Record(c, p) for c in ['13', '17'] for p in [50, 100, 199, 200, 550, 650, 700]]
+
+    for shard in [None, shard_regions_trees]:
+        classified = list(iter_records_with_boundaries(records, gene_regions_trees, shard, chunk_size=3))
+        assert classified == [(r, is_outside_boundaries(r.CHROM, r.POS, gene_regions_trees),
+                               belongs_to_other_shard(r.CHROM, r.POS, gene_regions_trees, shard)) for r in records]
+
+    # records on chromosomes without relevant genes are discarded like those outside of the genes
+    for shard in [None, shard_regions_trees]:
+        unknown_chr = [Record('2', 10), Record('13', 150)]
+        assert list(iter_records_with_boundaries(unknown_chr, gene_regions_trees, shard)) == \
+               [(unknown_chr[0], True, False), (unknown_chr[1], False, shard is not None)]
+
+
+# source files of variant_merging.py and the test files standing in for them
+MERGING_TEST_FILES = {constants.GENOME1K_FILE: '1000_Genomes.vcf',
+                      constants.CLINVAR_FILE: 'ClinVar.vcf',
+                      constants.LOVD_FILE: 'LOVD.vcf',
+                      constants.EX_LOVD_FILE: 'exLOVD.vcf',
+                      constants.BIC_FILE: 'BIC.vcf',
+                      constants.EXAC_FILE: 'ExAC.vcf',
+                      constants.ESP_FILE: 'ESP.vcf',
+                      constants.GNOMAD_V2_FILE: 'GnomAD.vcf',
+                      constants.GNOMAD_V3_FILE: 'GnomADv3.vcf',
+                      constants.FUNCTIONAL_ASSAYS_SCORES_FILE: 'ENIGMA_BRCA12_Functional_Assays.vcf',
+                      constants.ENIGMA_FILE: 'enigma_from_clinvar.tsv'}
+
+
+def copy_merging_test_files(input_dir):
+    for source_file, test_file in MERGING_TEST_FILES.items():
+        with open(os.path.join(pwd, 'test_files', test_file), 'r') as f_in, \
+                open(os.path.join(input_dir, source_file), 'w') as f_out:
+            for line in f_in:
+                # the mocked sequences don't cover the leading base of deletions at the end of a gene
+                fields = line.split('\t')
+                if test_file.endswith('.vcf') and not line.startswith('#') and '-' in fields[3:5]:
+                    continue
+                f_out.write(line)
+
+
+def test_preprocessing_processes_deterministic(tmp_path, monkeypatch, fetch_seq_mock_data):
+    input_dir = tmp_path / 'input'
+    input_dir.mkdir()
+    copy_merging_test_files(str(input_dir))
+    # preprocessing runs the shell scripts next to variant_merging.py
+    monkeypatch.chdir(pwd)
+
+    outputs = {}
+    with patch.object(bioutils.seqfetcher, 'fetch_seq',
+                      side_effect=lambda ac, s, e: fetch_seq_mock_data[(str(ac), str(s), str(e))]):
+        for processes in [1, 2]:
+            artifacts_dir = tmp_path / 'artifacts_{}'.format(processes)
+            artifacts_dir.mkdir()
+            monkeypatch.setattr(sys, 'argv', ['variant_merging.py', '-i', str(input_dir) + '/',
+                                              '-o', str(artifacts_dir) + '/', '-a', str(artifacts_dir) + '/',
+                                              '-c', os.path.join(pwd, 'test_files', 'gene_config_test.txt'),
+                                              '-p', str(processes)])
+            variant_merging.main()
+            outputs[processes] = {f: (artifacts_dir / f).read_bytes() for f in ['merged.tsv', 'reports.tsv']}
+
+    assert outputs[1] == outputs[2]
+
+    merged = outputs[1]['merged.tsv'].decode().splitlines()
+    header = merged[0].split('\t')
+    bx_id_idxs = [i for i, c in enumerate(header) if c.startswith('BX_ID_')]
+    assert len(merged) > 1 and bx_id_idxs
+    assert any(line.split('\t')[i] not in ('', '-') for line in merged[1:] for i in bx_id_idxs)
+
+
+def test_sharded_merging_same_as_unsharded(tmp_path, monkeypatch, fetch_seq_mock_data):
+    input_dir = tmp_path / 'input'
+    input_dir.mkdir()
+    copy_merging_test_files(str(input_dir))
+    monkeypatch.chdir(pwd)
+    gene_config = os.path.join(pwd, 'test_files', 'gene_config_test.txt')
+
+    def merge(artifacts_dir, *args):
+        artifacts_dir.mkdir()
+        monkeypatch.setattr(sys, 'argv', ['variant_merging.py', '-i', str(input_dir) + '/',
+                                          '-o', str(artifacts_dir) + '/', '-a', str(artifacts_dir) + '/',
+                                          '-c', gene_config] + list(args))
+        variant_merging.main()
+        return str(artifacts_dir)
+
+    with patch.object(bioutils.seqfetcher, 'fetch_seq',
+                      side_effect=lambda ac, s, e: fetch_seq_mock_data[(str(ac), str(s), str(e))]):
+        unsharded_dir = merge(tmp_path / 'unsharded')
+
+        shard_dirs = []
+        for shard, shard_config_df in split_config(load_config(gene_config)).items():
+            shard_config = str(tmp_path / (shard + '_gene_config.txt'))
+            save_config(shard_config_df, shard_config)
+            shard_dirs.append(merge(tmp_path / shard, '--shard-config', shard_config))
+
+    combined_dir = tmp_path / 'combined'
+    combined_dir.mkdir()
+    sharding.combine_merged_artifacts(shard_dirs, str(combined_dir), constants.ENIGMA_FILE)
+
+    with open(os.path.join(unsharded_dir, 'merged.tsv')) as f:
+        assert (combined_dir / 'merged.tsv').read_text() == f.read()
+
+
 def test_chunking():
     def chunker(vars, margin):
         return seq_utils.ChunkBasedSeqProvider.generate_chunks(vars, margin)
@@ -0,0 +1,89 @@
+import copy
+
+import pytest
+
+from .variant_merging import add_variant_to_dict, add_empty_columns, write_new_tsv
+from .variant_table import VariantTable
+
+
+@pytest.fixture
+def variants():
+    return {'chr13:g.32339228:GAA>G': ['ENIGMA', 'BRCA2', 'chr13:32339228:GAA>G', '13', '32339228', 'GAA', 'G', '46'],
+            'chr17:g.43090921:G>T': [['ClinVar', 'LOVD'], 'BRCA1', '-', 17, 43090921, 'G', 'T', [1, '2', None]]}
+
+
+def test_roundtrip(variants):
+    table = VariantTable.from_dict(8, variants)
+
+    assert len(table) == 2
+    assert 'chr13:g.32339228:GAA>G' in table
+    assert dict(table.items()) == variants
+
+    # keeping types of values
+    row = table['chr17:g.43090921:G>T']
+    assert [type(v) for v in row[7]] == [int, str, type(None)]
+    assert type(row[3]) == int
+
+
+def test_rows_are_copies(variants):
+    table = VariantTable.from_dict(8, variants)
+
+    row = table['chr17:g.43090921:G>T']
+    row[0].append('BIC')
+    assert table['chr17:g.43090921:G>T'][0] == ['ClinVar', 'LOVD']
+
+    table['chr17:g.43090921:G>T'] = row
+    assert table['chr17:g.43090921:G>T'][0] == ['ClinVar', 'LOVD', 'BIC']
+
+
+def test_mismatching_number_of_columns(variants):
+    table = VariantTable.from_dict(8, variants)
+
+    with pytest.raises(ValueError):
+        table['chr13:g.1:A>C'] = ['-'] * 7
+
+
+def test_add_columns(variants):
+    table = VariantTable.from_dict(8, variants)
+    add_empty_columns(table, 2)
+    add_empty_columns(variants, 2)
+
+    assert table.n_columns == 10
+    assert dict(table.items()) == variants
+
+
+def test_delete_and_rekey(variants):
+    table = VariantTable.from_dict(8, variants)
+
+    del table['chr13:g.32339228:GAA>G']
+    assert 'chr13:g.32339228:GAA>G' not in table
+
+    # reusing storage of deleted row
+    table['chr13:g.32339229:A>G'] = variants['chr13:g.32339228:GAA>G']
+    assert table._n_allocated_rows == 2
+
+    table.rekey('chr13:g.32339229:A>G', 'chr13:g.32339228:GAA>G')
+    assert table['chr13:g.32339228:GAA>G'] == variants['chr13:g.32339228:GAA>G']
+
+    with pytest.raises(KeyError):
+        table.rekey('chr13:g.32339228:GAA>G', 'chr17:g.43090921:G>T')
+
+
+def test_merge_same_as_dict(variants):
+    table = VariantTable.from_dict(8, copy.deepcopy(variants))
+
+    new_values = ['BIC', 'BRCA2', 'chr13:32339228:GAA>G', '13', '32339228', 'GAA', 'G', '677']
+    add_variant_to_dict(variants, 'chr13:g.32339228:GAA>G', list(new_values))
+    add_variant_to_dict(table, 'chr13:g.32339228:GAA>G', list(new_values))
+
+    assert dict(table.items()) == variants
+
+
+def test_write_new_tsv(tmp_path, variants):
+    columns = ['Source', 'Gene', 'Genomic_Coordinate', 'Chr', 'Pos', 'Ref', 'Alt', 'BX_ID']
+    table = VariantTable.from_dict(8, variants)
+
+    write_new_tsv(str(tmp_path / 'table.tsv'), columns, table)
+    write_new_tsv(str(tmp_path / 'dict.tsv'), columns, variants)
+
+    assert (tmp_path / 'table.tsv').read_text() == (tmp_path / 'dict.tsv').read_text()
@@ -3,17 +3,16 @@ from collections import defaultdict
 
 from data_merging.variant_merging_constants import VCFVariant
 
+WHOLE_SEQ_STRATEGY = 'whole_seq'
+ROLLING_HASH_STRATEGY = 'rolling_hash'
+CANONICAL_STRATEGY = 'canonical'
+# running canonical strategy, but logging differences to the whole seq strategy
+CANONICAL_CROSS_CHECK_STRATEGY = 'canonical_cross_check'
 
-def calculate_edited_seq(vcf_var, seq_provider):
-    '''
-    Applies sequence edit of a variant to a reference sequence fragment.
+EQUIVALENCE_STRATEGIES = [WHOLE_SEQ_STRATEGY, ROLLING_HASH_STRATEGY, CANONICAL_STRATEGY, CANONICAL_CROSS_CHECK_STRATEGY]
 
-    :param vcf_var: VCFVariant record
-    :param seq_provider: seq_provider instance returning a sequence fragment along with an offset
-    :return: Tuple[int, int, str]: chromosome, offset (wrt chromosome), edited string fragment starting at offset
-    '''
-    seq, seq_start = seq_provider.get_seq_with_start(vcf_var.chr, vcf_var.pos)
 
+def _validated_edit_position(vcf_var, seq, seq_start):
     pos_seq = int(vcf_var.pos) - seq_start
 
     len_ref = len(vcf_var.ref)
@@ -21,15 +20,194 @@ def calculate_edited_seq(vcf_var, seq_provider):
     assert pos_seq >= 0,  "position is below the reference for {}. Truncating for comparison".format(vcf_var)
 
     if pos_seq + len_ref < len(seq):
-        assert seq[pos_seq:].startswith(vcf_var.ref), "Sequences don't match"
+        assert seq.startswith(vcf_var.ref, pos_seq), "Sequences don't match"
     else:
         logging.warning("Sequence goes on above the reference for {}. ref len {}. seq len {}".format(vcf_var, len_ref, len(seq)))
         assert vcf_var.ref.startswith(seq[pos_seq:]), "Sequences don't match for variant going over reference"
 
-    edited = ''.join([seq[0:pos_seq], vcf_var.alt, seq[pos_seq + len_ref:]])
+    return pos_seq
+
+
+def calculate_edited_seq(vcf_var, seq_provider):
+    '''
+    Applies sequence edit of a variant to a reference sequence fragment.
+
+    :param vcf_var: VCFVariant record
+    :param seq_provider: seq_provider instance returning a sequence fragment along with an offset
+    :return: Tuple[int, int, str]: chromosome, offset (wrt chromosome), edited string fragment starting at offset
+    '''
+    seq, seq_start = seq_provider.get_seq_with_start(vcf_var.chr, vcf_var.pos)
+
+    pos_seq = _validated_edit_position(vcf_var, seq, seq_start)
+
+    edited = ''.join([seq[0:pos_seq], vcf_var.alt, seq[pos_seq + len(vcf_var.ref):]])
     return vcf_var.chr, seq_start, edited
 
 
+def calculate_edited_seq_hash(vcf_var, rolling_hash_seq_provider):
+    '''
+    Computes a hash of the reference sequence fragment edited by a variant
+    without building the edited string.
+
+    :param vcf_var: VCFVariant record
+    :param rolling_hash_seq_provider: RollingHashSeqProvider instance
+    :return: Tuple[int, int, int, int]: chromosome, offset (wrt chromosome), length and hash of the edited string fragment
+    '''
+    seq, seq_start = rolling_hash_seq_provider.get_seq_with_start(vcf_var.chr, vcf_var.pos)
+
+    pos_seq = _validated_edit_position(vcf_var, seq, seq_start)
+
+    edited_len, edited_hash = rolling_hash_seq_provider.edited_seq_hash(
+        vcf_var.chr, seq_start, pos_seq, len(vcf_var.ref), vcf_var.alt)
+
+    return vcf_var.chr, seq_start, edited_len, edited_hash
+
+
+def _edits_equal(v1, v2, seq, seq_start):
+    '''
+    Checks whether two variants produce the same edited sequence.
+
+    Only the window spanned by both edits needs to be compared, since the
+    sequences outside of it are identical as soon as the edited lengths agree.
+    '''
+    p1, p2 = int(v1.pos) - seq_start, int(v2.pos) - seq_start
+    end1 = min(p1 + len(v1.ref), len(seq))
+    end2 = min(p2 + len(v2.ref), len(seq))
+
+    if end1 - p1 - len(v1.alt) != end2 - p2 - len(v2.alt):
+        return False
+
+    lo, hi = min(p1, p2), max(end1, end2)
+    return (''.join([seq[lo:p1], v1.alt, seq[end1:hi]]) ==
+            ''.join([seq[lo:p2], v2.alt, seq[end2:hi]]))
+
+
+def find_equivalent_variants_rolling_hash(variants_dict, rolling_hash_seq_provider):
+    '''
+    Determines equivalent variants like find_equivalent_variants_whole_seq, but
+    without building the edited sequence of the entire gene for every variant.
+
+    The hash of the edited sequence is derived from precomputed prefix hashes
+    of the preloaded regions. Variants ending up with the same hash are verified
+    to be actually equivalent by comparing the edited sequences in the window
+    spanned by the variants.
+
+    :param variants_dict: dictionary from variant (VCF String, e.g chr13:g.32326103:C>G) to its corresponding VCF row
+    :param rolling_hash_seq_provider: RollingHashSeqProvider instance
+    :return: list of sets of equivalent variants represented as VCF string
+    '''
+
+    logging.info("Running find_equivalent_variants using rolling hashes")
+
+    # dictionary from hashed edited references to a list of variant names
+    hash_dict = defaultdict(list)
+    for v_name, v_rec in variants_dict.items():
+        hash_dict[calculate_edited_seq_hash(v_rec, rolling_hash_seq_provider)].append(v_name)
+
+    # list of sets
+    equivalent_variants = []
+
+    for (c, seq_start, _, _), var_lst in hash_dict.items():
+        if len(var_lst) == 1:
+            equivalent_variants.append(frozenset(var_lst))
+            continue
+
+        seq, _ = rolling_hash_seq_provider.get_seq_with_start(c, seq_start)
+
+        groups = []
+        for vn in var_lst:
+            for group in groups:
+                if _edits_equal(variants_dict[group[0]], variants_dict[vn], seq, seq_start):
+                    group.append(vn)
+                    break
+            else:
+                groups.append([vn])
+
+        if len(groups) > 1:
+            logging.debug(
+                "Hash Collisions. Involved variants were {}".format(var_lst))
+
+        for group in groups:
+            equivalent_variants.append(frozenset(group))
+
+    return equivalent_variants
+
+
+def calculate_canonical_key(vcf_var, whole_seq_provider):
+    '''
+    Computes the canonical representation of a variant by trimming it and
+    shifting it to the left as far as possible wrt to the reference.
+
+    Two variants resulting in the same edited sequence have the same canonical
+    representation. Only the repeat window around the variant is looked at.
+
+    :param vcf_var: VCFVariant record
+    :param whole_seq_provider: WholeSeqSeqProvider instance
+    :return: VCFVariant: canonical variant. Variants not changing the reference are
+      mapped to a key with empty ref and alt at the start of the preloaded region
+    '''
+    seq, seq_start = whole_seq_provider.get_seq_with_start(vcf_var.chr, vcf_var.pos)
+
+    pos_seq = _validated_edit_position(vcf_var, seq, seq_start)
+
+    # a variant going over the reference only edits the sequence up to its end
+    ref = vcf_var.ref[:max(len(seq) - pos_seq, 0)]
+    alt = vcf_var.alt
+
+    if ref == alt:
+        return VCFVariant(vcf_var.chr, seq_start, '', '')
+
+    while True:
+        if ref and alt and ref[-1] == alt[-1]:
+            ref, alt = ref[:-1], alt[:-1]
+        elif (not ref or not alt) and pos_seq > 0:
+            pos_seq -= 1
+            ref = seq[pos_seq] + ref
+            alt = seq[pos_seq] + alt
+        else:
+            break
+
+    while len(ref) > 1 and len(alt) > 1 and ref[0] == alt[0]:
+        ref, alt = ref[1:], alt[1:]
+        pos_seq += 1
+
+    return VCFVariant(vcf_var.chr, pos_seq + seq_start, ref, alt)
+
+
+def find_equivalent_variants_canonical(variants_dict, whole_seq_provider):
+    '''
+    Determines equivalent variants by grouping them by their canonical, i.e.
+    trimmed and left shifted, representation.
+
+    :param variants_dict: dictionary from variant (VCF String, e.g chr13:g.32326103:C>G) to its corresponding VCF row
+    :param whole_seq_provider: WholeSeqSeqProvider instance
+    :return: list of sets of equivalent variants represented as VCF string
+    '''
+
+    logging.info("Running find_equivalent_variants using canonical variant keys")
+
+    # dictionary from canonical variants to a list of variant names
+    canonical_dict = defaultdict(list)
+    for v_name, v_rec in variants_dict.items():
+        canonical_dict[calculate_canonical_key(v_rec, whole_seq_provider)].append(v_name)
+
+    return [frozenset(var_lst) for var_lst in canonical_dict.values()]
+
+
+def cross_check_equivalence(equivalent_variants, expected_equivalent_variants):
+    '''
+    Compares the equivalence groups obtained by two different strategies.
+
+    :param equivalent_variants: list of sets of equivalent variants to check
+    :param expected_equivalent_variants: list of sets of equivalent variants to compare with
+    :return: Tuple[Set[frozenset], Set[frozenset]]: groups only found in the first and only in the second argument
+    '''
+    groups = frozenset(equivalent_variants)
+    expected_groups = frozenset(expected_equivalent_variants)
+
+    return set(groups - expected_groups), set(expected_groups - groups)
+
+
 def find_equivalent_variants_whole_seq(variants_dict, whole_seq_provider):
     '''
     Determines equivalent variants by editing the reference according to pos,
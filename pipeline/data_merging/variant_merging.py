@@ -5,25 +5,36 @@ it also merges equivalent variants together
 """
 import argparse
 import csv
+import json
 import logging
+import multiprocessing
 import os
 import pickle
 import re
 import subprocess
 from copy import deepcopy
+from itertools import islice
 from numbers import Number
 from shutil import copy
 
-import vcf
+import numpy as np
 
 from data_merging import aggregate_reports
-from common import seq_utils, config
+from common import seq_utils, config, vcf_utils
+from common.utils import StaticIntervalIndex, file_fingerprint
 from data_merging import utilities
 from data_merging import variant_equivalence
 from data_merging.variant_merging_constants import *
+from data_merging.variant_table import VariantTable
 
 DISCARDED_REPORTS_WRITER = None
 
+# fingerprints of the inputs of the preprocessing of every source, written to the output directory
+PREPROCESSING_FINGERPRINTS_FILE = "preprocessing_fingerprints.json"
+
+# number of vcf records whose positions are checked against the gene boundaries at once
+BOUNDARY_CHECK_CHUNK_SIZE = 10000
+
 def options(parser):
     parser.add_argument("-i", "--input", help="Input VCF directory",
                         default="/home/brca/pipeline-data/pipeline-input/")
@@ -32,6 +43,18 @@ def options(parser):
     parser.add_argument("-c", "--config")
     parser.add_argument('-a', "--artifacts_dir", help='Artifacts directory with pipeline artifact files.')
     parser.add_argument("-v", "--verbose", action="count", default=False, help="determines logging")
+    parser.add_argument("-p", "--processes", type=int, default=1,
+                        help="number of processes used to preprocess the sources and normalize their reports concurrently")
+    parser.add_argument("--previous-artifacts-dir",
+                        help="artifacts directory of a previous run. Preprocessed files of sources with unchanged input are reused")
+    parser.add_argument("--compact-variant-table", action="store_true",
+                        help="keep variants in a columnar VariantTable instead of a dictionary of lists to reduce memory")
+    parser.add_argument("--equivalence-strategy", choices=variant_equivalence.EQUIVALENCE_STRATEGIES,
+                        default=variant_equivalence.WHOLE_SEQ_STRATEGY,
+                        help="how to determine equivalent variants in the dna sequence comparison merge")
+    parser.add_argument("--shard-config",
+                        help="gene config of a shard of the genes in config. Only variants of the genes in the shard are "
+                             "merged, records of the remaining genes are skipped as they are merged in another shard")
 
 
 def main():
@@ -50,7 +73,20 @@ def main():
 
     genome_regions_symbol_dict = config.get_genome_regions_symbol_dict(gene_config_df, 'start_hg38_legacy_variants', 'end_hg38_legacy_variants')
 
-    seq_provider = seq_utils.SeqRepoWrapper(regions_preload=gene_regions_dict.keys())
+    regions_preload = list(gene_regions_dict.keys())
+    shard_regions_trees = None
+    reports_regions_symbol_dict = genome_regions_symbol_dict
+    if args.shard_config:
+        shard_config_df = config.load_config(args.shard_config)
+        shard_regions_dict = config.extract_gene_regions_dict(shard_config_df, 'start_hg38_legacy_variants', 'end_hg38_legacy_variants')
+        shard_regions_trees = restrict_to_shard(
+            gene_regions_trees, seq_utils.build_interval_trees_by_chr(shard_regions_dict.keys(), lambda c,s,e: None))
+        reports_regions_symbol_dict = restrict_to_shard(
+            genome_regions_symbol_dict,
+            config.get_genome_regions_symbol_dict(shard_config_df, 'start_hg38_legacy_variants', 'end_hg38_legacy_variants'))
+        regions_preload = list(shard_regions_dict.keys())
+
+    seq_provider = seq_utils.SeqRepoWrapper(regions_preload=regions_preload)
 
     if args.verbose:
         logging_level = logging.DEBUG
@@ -69,7 +105,13 @@ def main():
     DISCARDED_REPORTS_WRITER.writeheader()
 
     # merge repeats within data sources before merging between data sources
-    source_dict, columns, variants = preprocessing(args.input, args.output, seq_provider, gene_regions_trees)
+    source_dict, columns, variants = preprocessing(args.input, args.output, seq_provider, gene_regions_trees,
+                                                   args.processes, regions_preload,
+                                                   args.previous_artifacts_dir, args.config,
+                                                   shard_regions_trees, args.shard_config)
+
+    if args.compact_variant_table:
+        variants = VariantTable.from_dict(len(columns), variants)
 
     # merges repeats from different data sources, adds necessary columns and data
     print("\n------------merging different datasets------------------------------")
@@ -83,7 +125,7 @@ def main():
 
     # compare dna sequence results of variants and merge if equivalent
     print("------------dna sequence comparison merge-------------------------------")
-    variants = string_comparison_merge(variants, seq_provider)
+    variants = string_comparison_merge(variants, seq_provider, args.equivalence_strategy)
 
     # write final output to file
     write_new_tsv(args.output + "merged.tsv", columns, variants)
@@ -92,7 +134,8 @@ def main():
     copy(os.path.join(args.input, ENIGMA_FILE), args.output)
 
     # write reports to reports file
-    aggregate_reports.write_reports_tsv(args.output + "reports.tsv", columns, args.output, genome_regions_symbol_dict)
+    aggregate_reports.write_reports_tsv(args.output + "reports.tsv", columns, args.output, reports_regions_symbol_dict,
+                                        args.processes)
 
     discarded_reports_file.close()
 
@@ -159,6 +202,8 @@ def variant_standardize(columns, seq_provider, gene_regions_tree, variants="pick
             logging.debug("Changed genomic coordinate representation, replacing %s with %s", ev, newHgvs)
             variants_to_remove.append(ev)
             variants_to_add = add_variant_to_dict(variants_to_add, newHgvs, items)
+        else:
+            variants[ev] = items
 
     variants = remove_bad_variants(variants_to_remove, variants)
     variants = add_and_merge_new_variant_representations(variants_to_add, variants)
@@ -226,6 +271,7 @@ def add_variant_to_dict(variant_dict, genomic_coordinate, values):
                 logging.debug("Merged properties: %s", merged_properties)
 
         logging.debug('Merged output: \n %s', existing_variant)
+        variant_dict[genomic_coordinate] = existing_variant
     else:
         variant_dict[genomic_coordinate] = values
 
@@ -344,7 +390,7 @@ def variant_is_false(ref, alt):
     return ref == alt
 
 
-def string_comparison_merge(variants, seq_wrapper):
+def string_comparison_merge(variants, seq_wrapper, equivalence_strategy=variant_equivalence.WHOLE_SEQ_STRATEGY):
     # makes sure the input genomic coordinate strings are unique (no dupes)
     assert (len(variants.keys()) == len(set(variants.keys())))
 
@@ -354,9 +400,28 @@ def string_comparison_merge(variants, seq_wrapper):
                                         v[COLUMN_VCF_REF],
                                         v[COLUMN_VCF_ALT]) for k, v in variants.items() }
 
-    whole_seq_provider = seq_utils.WholeSeqSeqProvider(seq_wrapper)
-
-    equivalence = variant_equivalence.find_equivalent_variants_whole_seq(vcf_variant_dict, whole_seq_provider)
+    if equivalence_strategy == variant_equivalence.ROLLING_HASH_STRATEGY:
+        rolling_hash_seq_provider = seq_utils.RollingHashSeqProvider(seq_wrapper)
+        equivalence = variant_equivalence.find_equivalent_variants_rolling_hash(vcf_variant_dict, rolling_hash_seq_provider)
+    elif equivalence_strategy in (variant_equivalence.CANONICAL_STRATEGY,
+                                  variant_equivalence.CANONICAL_CROSS_CHECK_STRATEGY):
+        whole_seq_provider = seq_utils.WholeSeqSeqProvider(seq_wrapper)
+        equivalence = variant_equivalence.find_equivalent_variants_canonical(vcf_variant_dict, whole_seq_provider)
+
+        if equivalence_strategy == variant_equivalence.CANONICAL_CROSS_CHECK_STRATEGY:
+            only_canonical, only_whole_seq = variant_equivalence.cross_check_equivalence(
+                equivalence,
+                variant_equivalence.find_equivalent_variants_whole_seq(vcf_variant_dict, whole_seq_provider))
+
+            for group in only_canonical:
+                logging.warning("Equivalence group only found using canonical keys: %s", sorted(group))
+            for group in only_whole_seq:
+                logging.warning("Equivalence group only found using whole seqs: %s", sorted(group))
+            print("%d equivalence groups differ between canonical and whole seq strategy" % (
+                len(only_canonical) + len(only_whole_seq)))
+    else:
+        whole_seq_provider = seq_utils.WholeSeqSeqProvider(seq_wrapper)
+        equivalence = variant_equivalence.find_equivalent_variants_whole_seq(vcf_variant_dict, whole_seq_provider)
 
     n_before_merge = 0
     for each in equivalence:
@@ -419,7 +484,19 @@ def string_comparison_merge(variants, seq_wrapper):
     return variants
 
 
-def preprocessing(input_dir, output_dir, seq_provider, gene_regions_trees):
+def preprocessing(input_dir, output_dir, seq_provider, gene_regions_trees, processes=1, regions_preload=None,
+                  previous_artifacts_dir=None, config_path=None, shard_regions_trees=None, shard_config_path=None):
+    """
+    Preprocesses every source independently, i.e. splitting multi allelic records, merging repeats within
+    a source and checking the reference. With processes > 1, sources are preprocessed concurrently
+    in a process pool, each worker having its own SeqRepoWrapper preloading regions_preload.
+
+    If previous_artifacts_dir is given, the preprocessed files of sources whose input file and gene config
+    (config_path) didn't change since that run are copied over instead of being computed again.
+
+    If shard_regions_trees is given, records within gene_regions_trees but outside of the regions of
+    the shard are skipped, see belongs_to_other_shard.
+    """
     # Preprocessing variants:
     source_dict = {
                    "1000_Genomes": GENOME1K_FILE + "for_pipeline",
@@ -440,67 +517,162 @@ def preprocessing(input_dir, output_dir, seq_provider, gene_regions_trees):
         print(source_name, ":", file_name)
     print("\n------------preprocessing--------------------------------")
     print("remove sample columns and two erroneous rows from 1000 Genome file")
-    f_1000G = open(os.path.join(input_dir, GENOME1K_FILE + "for_pipeline"), "w")
+    # writing to a temporary file first, as several shards may be preprocessing the same input directory
+    path_1000G = os.path.join(input_dir, GENOME1K_FILE + "for_pipeline")
+    f_1000G = open("{}.{}".format(path_1000G, os.getpid()), "w")
     subprocess.call(
        ["bash", "1000g_preprocess.sh", os.path.join(input_dir, GENOME1K_FILE)], stdout=f_1000G)
+    f_1000G.close()
+    os.replace(f_1000G.name, path_1000G)
+
+    d_wrong = output_dir + "wrong_genome_coors/"
+    if not os.path.exists(d_wrong):
+        os.makedirs(d_wrong)
+
+    fingerprint_paths = [p for p in [config_path, shard_config_path] if p]
+    fingerprints = {source_name: file_fingerprint(*fingerprint_paths, os.path.join(input_dir, file_name))
+                    for source_name, file_name in source_dict.items()}
+
+    reused_right_files = {}
+    if previous_artifacts_dir:
+        previous_fingerprints = read_preprocessing_fingerprints(previous_artifacts_dir)
+        for source_name in source_dict.keys():
+            if previous_fingerprints.get(source_name) == fingerprints[source_name]:
+                right_file = reuse_preprocessed_source(previous_artifacts_dir, output_dir, source_name)
+                if right_file:
+                    print("reusing preprocessed files of unchanged source ", source_name)
+                    reused_right_files[source_name] = right_file
+
+    source_args = [(input_dir, output_dir, source_name, file_name) for source_name, file_name in source_dict.items()
+                   if source_name not in reused_right_files]
+
+    if processes > 1:
+        print("preprocessing sources using {} processes".format(processes))
+        with multiprocessing.Pool(processes, initializer=_init_preprocessing_worker,
+                                  initargs=(regions_preload, gene_regions_trees, shard_regions_trees)) as pool:
+            # results are returned in the order of source_args
+            right_files = pool.starmap(_preprocess_source_in_worker, source_args)
+    else:
+        right_files = [preprocess_source(*a, seq_provider, gene_regions_trees, shard_regions_trees) for a in source_args]
 
-    # merge multiple variant per vcf into multiple lines
-    for source_name, file_name in source_dict.items():
-        print("convert to one variant per line in ", source_name)
-        f_in = open(os.path.join(input_dir, file_name), "r")
-        f_out = open(os.path.join(output_dir, source_name + ".vcf"), "w")
-        # Individual reports (lines in VCF/TSV) are given ids as part of the one_variant_transform method.
-        one_variant_transform(f_in, f_out, source_name)
-        f_in.close()
-        f_out.close()
-
-        print("merge repetitive variants within ", source_name)
-        f_in = open(os.path.join(output_dir, source_name + ".vcf"), "r")
-        f_out = open(os.path.join(output_dir, source_name + "ready.vcf"), "w")
-        repeat_merging(f_in, f_out)
-        source_dict[source_name] = f_out.name
-
-    print("-------check if genomic coordinates are correct----------")
-    (columns, variants) = save_enigma_to_dict(os.path.join(input_dir, ENIGMA_FILE), output_dir, seq_provider, gene_regions_trees)
-
-    new_source_dict = {}
-    for source_name, file_name in source_dict.items():
-        f = open(file_name, "r")
-        d_wrong = output_dir + "wrong_genome_coors/"
-        if not os.path.exists(d_wrong):
-            os.makedirs(d_wrong)
-        f_wrong = open(output_dir + "wrong_genome_coors/" +
-                       source_name + "_wrong_genome_coor.vcf", "w")
-        f_right = open(output_dir+ "right" + source_name, "w")
-
-        new_source_dict[source_name] = f_right.name
-
-        vcf_reader = vcf.Reader(f, strict_whitespace=True)
-        vcf_wrong_writer = vcf.Writer(f_wrong, vcf_reader)
-        vcf_right_writer = vcf.Writer(f_right, vcf_reader)
-        n_wrong, n_total = 0, 0
-        for record in vcf_reader:
-            ref = record.REF.replace("-", "")
-            v = [record.CHROM, record.POS, ref, "dummy"]
-            if not ref_correct(record.CHROM, record.POS, record.REF, record.ALT, seq_provider) or is_outside_boundaries(record.CHROM, record.POS, gene_regions_trees):
-                logging.warning("Reference incorrect for Chrom: %s, Pos: %s, Ref: %s, and Alt: %s",
-                                record.CHROM, record.POS, record.REF, record.ALT)
-                vcf_wrong_writer.write_record(record)
-                n_wrong += 1
-            else:
-                vcf_right_writer.write_record(record)
-            n_total += 1
-        f_right.close()
-        f_wrong.close()
-        print("in {0}, wrong: {1}, total: {2}".format(source_name, n_wrong, n_total))
+    right_files_dict = {source_name: right_file for (_, _, source_name, _), right_file in zip(source_args, right_files)}
+    right_files_dict.update(reused_right_files)
+    new_source_dict = {source_name: right_files_dict[source_name] for source_name in source_dict.keys()}
+
+    with open(os.path.join(output_dir, PREPROCESSING_FINGERPRINTS_FILE), "w") as f:
+        json.dump(fingerprints, f, indent=2, sort_keys=True)
+
+    print("-------check if genomic coordinates are correct for ENIGMA----------")
+    (columns, variants) = save_enigma_to_dict(os.path.join(input_dir, ENIGMA_FILE), output_dir, seq_provider, gene_regions_trees,
+                                              shard_regions_trees)
 
     return new_source_dict, columns, variants
 
 
+def read_preprocessing_fingerprints(artifacts_dir):
+    path = os.path.join(artifacts_dir, PREPROCESSING_FINGERPRINTS_FILE)
+    if not os.path.exists(path):
+        logging.warning("No preprocessing fingerprints found in %s, not reusing any preprocessed files", artifacts_dir)
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def preprocessed_source_files(source_name):
+    """
+    Returns the paths of the files written by preprocess_source relative to the output directory.
+    """
+    return [source_name + ".vcf", source_name + "ready.vcf", "right" + source_name,
+            os.path.join("wrong_genome_coors", source_name + "_wrong_genome_coor.vcf")]
+
+
+def reuse_preprocessed_source(previous_artifacts_dir, output_dir, source_name):
+    """
+    Copies the preprocessed files of a source from a previous run and returns the path of the file
+    containing the records with correct genomic coordinates, or None if files are missing.
+    """
+    files = preprocessed_source_files(source_name)
+    if not all(os.path.exists(os.path.join(previous_artifacts_dir, f)) for f in files):
+        logging.warning("Preprocessed files of %s missing in %s", source_name, previous_artifacts_dir)
+        return None
+
+    for f in files:
+        copy(os.path.join(previous_artifacts_dir, f), os.path.join(output_dir, f))
+    return output_dir + "right" + source_name
+
+
+_WORKER_SEQ_PROVIDER = None
+_WORKER_GENE_REGIONS_TREES = None
+_WORKER_SHARD_REGIONS_TREES = None
+
+
+def _init_preprocessing_worker(regions_preload, gene_regions_trees, shard_regions_trees):
+    global _WORKER_SEQ_PROVIDER, _WORKER_GENE_REGIONS_TREES, _WORKER_SHARD_REGIONS_TREES
+
+    _WORKER_SEQ_PROVIDER = seq_utils.SeqRepoWrapper(regions_preload=regions_preload)
+    _WORKER_GENE_REGIONS_TREES = gene_regions_trees
+    _WORKER_SHARD_REGIONS_TREES = shard_regions_trees
+
+
+def _preprocess_source_in_worker(input_dir, output_dir, source_name, file_name):
+    return preprocess_source(input_dir, output_dir, source_name, file_name,
+                             _WORKER_SEQ_PROVIDER, _WORKER_GENE_REGIONS_TREES, _WORKER_SHARD_REGIONS_TREES)
+
+
+def preprocess_source(input_dir, output_dir, source_name, file_name, seq_provider, gene_regions_trees,
+                      shard_regions_trees=None):
+    """
+    Preprocesses the VCF file of a single source and returns the path of the file
+    containing the records with correct genomic coordinates.
+    """
+    # merge multiple variant per vcf into multiple lines
+    print("convert to one variant per line in ", source_name)
+    f_in = open(os.path.join(input_dir, file_name), "r")
+    f_out = open(os.path.join(output_dir, source_name + ".vcf"), "w")
+    # Individual reports (lines in VCF/TSV) are given ids as part of the one_variant_transform method.
+    one_variant_transform(f_in, f_out, source_name)
+    f_in.close()
+    f_out.close()
+
+    print("merge repetitive variants within ", source_name)
+    f_in = open(os.path.join(output_dir, source_name + ".vcf"), "r")
+    f_out = open(os.path.join(output_dir, source_name + "ready.vcf"), "w")
+    repeat_merging(f_in, f_out)
+
+    print("check if genomic coordinates are correct in ", source_name)
+    f = open(f_out.name, "r")
+    f_wrong = open(output_dir + "wrong_genome_coors/" +
+                   source_name + "_wrong_genome_coor.vcf", "w")
+    f_right = open(output_dir + "right" + source_name, "w")
+
+    vcf_reader = vcf_utils.Reader(f, strict_whitespace=True)
+    vcf_wrong_writer = vcf_utils.Writer(f_wrong, vcf_reader)
+    vcf_right_writer = vcf_utils.Writer(f_right, vcf_reader)
+    n_wrong, n_total = 0, 0
+    for record, outside, other_shard in iter_records_with_boundaries(vcf_reader, gene_regions_trees,
+                                                                     shard_regions_trees):
+        if other_shard:
+            continue
+        if outside or not ref_correct(record.CHROM, record.POS, record.REF, record.ALT, seq_provider):
+            logging.warning("Reference incorrect for Chrom: %s, Pos: %s, Ref: %s, and Alt: %s",
+                            record.CHROM, record.POS, record.REF, record.ALT)
+            vcf_wrong_writer.write_record(record)
+            n_wrong += 1
+        else:
+            vcf_right_writer.write_record(record)
+        n_total += 1
+    f.close()
+    f_right.close()
+    f_wrong.close()
+    print("in {0}, wrong: {1}, total: {2}".format(source_name, n_wrong, n_total))
+
+    return f_right.name
+
+
 def repeat_merging(f_in, f_out):
     """takes a vcf file, collapses repetitive variant rows and write out
         to a new vcf file (without header)"""
-    vcf_reader = vcf.Reader(f_in, strict_whitespace=True)
+    vcf_reader = vcf_utils.Reader(f_in, strict_whitespace=True)
     variant_dict = {}  # str -> Record
     num_repeats = 0
     for record in vcf_reader:
@@ -547,7 +719,7 @@ def repeat_merging(f_in, f_out):
                         merged_value = [_f for _f in merged_value if _f]
                         variant_dict[genome_coor].INFO[key] = deepcopy(merged_value)
     print("number of repeat records: ", num_repeats, "\n")
-    vcf_writer = vcf.Writer(f_out, vcf_reader)
+    vcf_writer = vcf_utils.Writer(f_out, vcf_reader)
     for record in variant_dict.values():
         vcf_writer.write_record(record)
     f_in.close()
@@ -566,8 +738,8 @@ def one_variant_transform(f_in, f_out, source_name):
     """takes a vcf file, read each row, if the ALT field contains more than
        one item, create multiple variant row based on that row. also adds
        ids to all individual reports (each line in the vcf). writes new vcf"""
-    vcf_reader = vcf.Reader(f_in, strict_whitespace=True)
-    vcf_writer = vcf.Writer(f_out, vcf_reader)
+    vcf_reader = vcf_utils.Reader(f_in, strict_whitespace=True)
+    vcf_writer = vcf_utils.Writer(f_out, vcf_reader)
     count = 1
     for record in vcf_reader:
         n = len(record.ALT)
@@ -617,10 +789,26 @@ def append_exac_allele_frequencies(record, new_record=None, i=None):
         return new_record
 
 
+def merged_sort_key(chr, pos, ref, alt):
+    """
+    Returns the key rows of merged.tsv are sorted by, e.g. chr13:g.32326103:C>G
+
+    The key only depends on the VCF columns of a row, such that the merged.tsv files of the shards of a sharded
+    run are combined in the same order (see workflow.sharding).
+    """
+    return "chr%s:g.%s:%s>%s" % (chr, pos, ref, alt)
+
+
 def write_new_tsv(filename, columns, variants):
+    def row_key(key):
+        variant = variants[key]
+        return merged_sort_key(variant[COLUMN_VCF_CHR], variant[COLUMN_VCF_POS],
+                               variant[COLUMN_VCF_REF], variant[COLUMN_VCF_ALT])
+
     merged_file = open(filename, "w")
     merged_file.write("\t".join(columns)+"\n")
-    for key, variant in sorted(variants.items()):
+    for key in sorted(variants.keys(), key=row_key):
+        variant = variants[key]
         if len(variant) != len(columns):
             raise Exception("mismatching number of columns in head and row")
         for ii in range(len(variant)):
@@ -638,44 +826,53 @@ def add_new_source(columns, variants, source, source_file, source_dict, genome_r
     old_column_num = len(columns)
     for column_title in source_dict.keys():
         columns.append(column_title+"_{0}".format(source))
-    vcf_reader = vcf.Reader(open(source_file, 'r'), strict_whitespace=True)
+    # add cells of "-" for the new columns to all existing variants. They are overwritten for variants in the source.
+    add_empty_columns(variants, len(source_dict))
+    vcf_reader = vcf_utils.Reader(open(source_file, 'r'), strict_whitespace=True)
     overlap = 0
     variants_num = 0
     for record in vcf_reader:
         variants_num += 1
         genome_coor = ("chr" + str(record.CHROM) + ":g." + str(record.POS) + ":" +
                        record.REF + ">" + str(record.ALT[0]))
-        if genome_coor in variants.keys():
+        if genome_coor in variants:
             overlap += 1
-            if type(variants[genome_coor][COLUMN_SOURCE]) != list:
-                variants[genome_coor][COLUMN_SOURCE] = [variants[genome_coor][COLUMN_SOURCE]]
-            variants[genome_coor][COLUMN_SOURCE].append(source)
+            variant = variants[genome_coor][:old_column_num]
+            if type(variant[COLUMN_SOURCE]) != list:
+                variant[COLUMN_SOURCE] = [variant[COLUMN_SOURCE]]
+            variant[COLUMN_SOURCE].append(source)
         else:
-            variants[genome_coor] = associate_chr_pos_ref_alt_with_item(record, old_column_num, source, genome_coor, genome_regions_symbol_dict)
+            variant = associate_chr_pos_ref_alt_with_item(record, old_column_num, source, genome_coor, genome_regions_symbol_dict)
         for value in source_dict.values():
             try:
-                variants[genome_coor].append(record.INFO[value])
+                variant.append(record.INFO[value])
             except KeyError:
-                logging.warning("KeyError appending VCF record.INFO[value] to variant. Variant: %s \n Record.INFO: %s \n value: %s", variants[genome_coor], record.INFO, value)
+                logging.warning("KeyError appending VCF record.INFO[value] to variant. Variant: %s \n Record.INFO: %s \n value: %s", variant, record.INFO, value)
                 if source == "BIC":
-                    variants[genome_coor].append(DEFAULT_CONTENTS)
+                    variant.append(DEFAULT_CONTENTS)
                     logging.debug("Could not find value %s for source %s in variant %s, inserting default content %s instead.", value, source, DEFAULT_CONTENTS)
                 else:
-                    raise Exception("There was a problem appending a value for %s to variant %s" % (value, variants[genome_coor]))
-    # for those enigma record that doesn't have a hit with new genome coordinate
-    # add extra cells of "-" to the end of old record
-    for value in variants.values():
-        if len(value) != len(columns):
-            value += [DEFAULT_CONTENTS] * len(source_dict)
+                    raise Exception("There was a problem appending a value for %s to variant %s" % (value, variant))
+        variants[genome_coor] = variant
     print("number of variants in " + source + " is ", variants_num)
     print("overlap with previous dataset: ", overlap)
     print("number of total variants with the addition of " + source + " is: ", len(variants), "\n")
-    for index, value in variants.items():
-        if len(value) != len(columns):
-            raise Exception("mismatching number of columns in head and row")
+    # a VariantTable checks the number of columns on every write
+    if not isinstance(variants, VariantTable):
+        for index, value in variants.items():
+            if len(value) != len(columns):
+                raise Exception("mismatching number of columns in head and row")
     return (columns, variants)
 
 
+def add_empty_columns(variants, n):
+    if isinstance(variants, VariantTable):
+        variants.add_columns(n, DEFAULT_CONTENTS)
+    else:
+        for value in variants.values():
+            value += [DEFAULT_CONTENTS] * n
+
+
 def associate_chr_pos_ref_alt_with_item(line, column_num, source, genome_coor, genome_regions_symbol_dict):
     # places genomic coordinate data in correct positions to align with relevant columns in output tsv file.
     item = ['-'] * column_num
@@ -730,7 +927,7 @@ def add_columns_to_enigma_data(line):
     return columns
 
 
-def save_enigma_to_dict(path, output_dir, seq_provider, gene_regions_trees):
+def save_enigma_to_dict(path, output_dir, seq_provider, gene_regions_trees, shard_regions_trees=None):
     global DISCARDED_REPORTS_WRITER
 
     enigma_file = open(path, "r")
@@ -752,6 +949,9 @@ def save_enigma_to_dict(path, output_dir, seq_provider, gene_regions_trees):
             bx_id = items[bx_id_column_index]
             hgvs = "chr%s:g.%s:%s>%s" % (str(chrom), str(pos), ref, alt)
 
+            if pos != 'None' and belongs_to_other_shard(chrom, pos, gene_regions_trees, shard_regions_trees):
+                continue
+
             if ref_correct(chrom, pos, ref, alt, seq_provider) and not is_outside_boundaries(chrom, pos, gene_regions_trees):
                 variants = add_variant_to_dict(variants, hgvs, items)
             elif pos == 'None':
@@ -783,6 +983,65 @@ def is_outside_boundaries(c, pos, gene_regions_trees):
     return len(chr_regions.at(pos)) == 0
 
 
+def outside_boundaries(chrs, positions, gene_regions_trees):
+    """
+    is_outside_boundaries for many positions at once, looking up the positions of every chromosome in one batch.
+    Positions on chromosomes without relevant genes are outside of the boundaries
+
+    :return: np.ndarray[bool]
+    """
+    chrs = np.asarray([int(c) for c in chrs], dtype=np.int64)
+    positions = np.asarray([int(p) for p in positions], dtype=np.int64)
+
+    outside = np.ones(len(positions), dtype=bool)
+    for c in np.unique(chrs).tolist():
+        if c not in gene_regions_trees.keys():
+            continue
+        on_chr = chrs == c
+        outside[on_chr] = ~gene_regions_trees[c].contains(positions[on_chr])
+    return outside
+
+
+def iter_records_with_boundaries(records, gene_regions_trees, shard_regions_trees=None,
+                                 chunk_size=BOUNDARY_CHECK_CHUNK_SIZE):
+    """
+    Classifies vcf records in chunks by their position
+
+    :return: Iterator[Tuple[Record, bool, bool]]: every record, whether it's outside of the gene boundaries and
+      whether it belongs to another shard (see belongs_to_other_shard)
+    """
+    records = iter(records)
+    for chunk in iter(lambda: list(islice(records, chunk_size)), []):
+        chrs = [r.CHROM for r in chunk]
+        positions = [r.POS for r in chunk]
+        outside = outside_boundaries(chrs, positions, gene_regions_trees)
+        if shard_regions_trees is None:
+            other_shard = np.zeros(len(chunk), dtype=bool)
+        else:
+            other_shard = ~outside & outside_boundaries(chrs, positions, shard_regions_trees)
+        yield from zip(chunk, outside.tolist(), other_shard.tolist())
+
+
+def restrict_to_shard(regions_trees, shard_regions_trees):
+    """
+    Returns the interval trees of a shard for every chromosome in regions_trees, such that positions on
+    chromosomes without genes in the shard are outside of its boundaries rather than raising an error.
+    """
+    return {c: shard_regions_trees.get(c, StaticIntervalIndex()) for c in regions_trees.keys()}
+
+
+def belongs_to_other_shard(c, pos, gene_regions_trees, shard_regions_trees):
+    """
+    Checks whether a position is within the regions of the genes, but outside of the regions of the shard
+    processed, i.e. whether it's merged in another shard. Always False if no shard is processed.
+    """
+    if shard_regions_trees is None or int(c) not in gene_regions_trees:
+        return False
+
+    return (not is_outside_boundaries(c, pos, gene_regions_trees) and
+            is_outside_boundaries(c, pos, shard_regions_trees))
+
+
 def ref_correct(chr, pos, ref, alt, seq_provider):
     if pos == "None":
         return False
@@ -0,0 +1,137 @@
+from array import array
+from collections.abc import MutableMapping
+
+from data_merging.variant_merging_constants import DEFAULT_CONTENTS
+
+
+class VariantTable(MutableMapping):
+    '''
+    Columnar store for the variants of the merge stage, mapping a genomic coordinate
+    string (e.g. chr13:g.32326103:C>G) to a row of cells, like the plain dictionary
+    of lists used otherwise.
+
+    Instead of keeping a Python list per variant, every column is an array of integer codes.
+    Scalar cell values are interned, i.e. every distinct value is stored only once in a value pool.
+    List valued cells are stored in an offsets + values layout referring to the value pool,
+    where equal lists are stored only once as well.
+
+    Rows are materialized as new lists on access. Hence, modifications of a row need to be written
+    back by assigning the row to the table again.
+    '''
+
+    def __init__(self, n_columns=0):
+        self._columns = [array('l') for _ in range(n_columns)]
+
+        # genomic coordinate -> row number
+        self._index = {}
+        # row numbers of deleted rows, reused for new rows
+        self._free_rows = []
+        self._n_allocated_rows = 0
+
+        # code -> scalar value
+        self._values = []
+        # (type, scalar value) -> code
+        self._value_codes = {}
+
+        # list number n holds the codes in _list_values[_list_offsets[n]:_list_offsets[n + 1]]
+        self._list_offsets = array('l', [0])
+        self._list_values = array('l')
+        # codes of a list as bytes -> list number
+        self._list_numbers = {}
+
+    @classmethod
+    def from_dict(cls, n_columns, variants):
+        table = cls(n_columns)
+        for key, row in variants.items():
+            table[key] = row
+        return table
+
+    @property
+    def n_columns(self):
+        return len(self._columns)
+
+    def add_columns(self, n, value=DEFAULT_CONTENTS):
+        '''
+        Appends n columns, filled with value for all existing rows.
+        '''
+        code = self._encode(value)
+        for _ in range(n):
+            self._columns.append(array('l', [code]) * self._n_allocated_rows)
+
+    def rekey(self, old_key, new_key):
+        '''
+        Moves a row to a new key without copying its cells.
+        '''
+        if new_key in self._index:
+            raise KeyError("Key {} already exists".format(new_key))
+        self._index[new_key] = self._index.pop(old_key)
+
+    def _encode_scalar(self, value):
+        key = (value.__class__, value)
+        code = self._value_codes.get(key)
+        if code is None:
+            code = len(self._values)
+            self._values.append(value)
+            self._value_codes[key] = code
+        return code
+
+    def _encode(self, value):
+        if not isinstance(value, list):
+            return self._encode_scalar(value)
+
+        codes = array('l', [self._encode_scalar(v) for v in value])
+        list_key = codes.tobytes()
+        list_number = self._list_numbers.get(list_key)
+        if list_number is None:
+            list_number = len(self._list_offsets) - 1
+            self._list_values.extend(codes)
+            self._list_offsets.append(len(self._list_values))
+            self._list_numbers[list_key] = list_number
+
+        # negative codes refer to lists
+        return -list_number - 1
+
+    def _decode(self, code):
+        if code >= 0:
+            return self._values[code]
+
+        list_number = -code - 1
+        return [self._values[c] for c in
+                self._list_values[self._list_offsets[list_number]:self._list_offsets[list_number + 1]]]
+
+    def _allocate_row(self):
+        if self._free_rows:
+            return self._free_rows.pop()
+
+        for column in self._columns:
+            column.append(0)
+        self._n_allocated_rows += 1
+        return self._n_allocated_rows - 1
+
+    def __getitem__(self, key):
+        row_number = self._index[key]
+        return [self._decode(column[row_number]) for column in self._columns]
+
+    def __setitem__(self, key, row):
+        if len(row) != len(self._columns):
+            raise ValueError("mismatching number of columns in table and row")
+
+        row_number = self._index.get(key)
+        if row_number is None:
+            row_number = self._allocate_row()
+            self._index[key] = row_number
+
+        for column, value in zip(self._columns, row):
+            column[row_number] = self._encode(value)
+
+    def __delitem__(self, key):
+        self._free_rows.append(self._index.pop(key))
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
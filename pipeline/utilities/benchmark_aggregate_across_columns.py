@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+"""
+Compares the row by row and the columnar engine of data_merging/aggregate_across_columns.py.
+
+The merged variants are read from a merged.tsv of a pipeline run or, if none is given, built from the
+fixture rows of data_merging/test_aggregate_across_columns.py, repeated --scale times. Both engines are run
+on the same input and their outputs are checked to be byte identical.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+from data_merging.aggregate_across_columns import aggregateRows, aggregateColumnar
+from data_merging.test_aggregate_across_columns import merged_variant_rows, write_merged_tsv
+
+
+def timed(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", help="merged.tsv. Fixture rows of the tests if not given")
+    parser.add_argument("-s", "--scale", type=int, default=100, help="number of copies of the fixture rows")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="number of repetitions, the best time is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = args.input
+        if not input_path:
+            input_path = os.path.join(tmp_dir, "merged.tsv")
+            write_merged_tsv(input_path, merged_variant_rows() * args.scale)
+
+        outputs = {}
+        times = {}
+        for name, func in [("rows", aggregateRows), ("columns", aggregateColumnar)]:
+            outputs[name] = os.path.join(tmp_dir, "aggregated_{}.tsv".format(name))
+            times[name] = timed(lambda: func(input_path, outputs[name]), args.repeat)
+
+        with open(outputs["rows"], "rb") as f_rows, open(outputs["columns"], "rb") as f_columns:
+            if f_rows.read() != f_columns.read():
+                raise Exception("Output of the columnar engine differs from the row by row engine")
+
+        with open(input_path) as f:
+            n = sum(1 for _ in f) - 1
+
+    print("{} variants".format(n))
+    print("{:<10}{:>12}{:>16}".format("engine", "total [s]", "per var [us]"))
+    for name in ["rows", "columns"]:
+        print("{:<10}{:>12.3f}{:>16.2f}".format(name, times[name], 1e6 * times[name] / n))
+    print("speedup {:.1f}x".format(times["rows"] / times["columns"]))
+
+
+if __name__ == "__main__":
+    main()
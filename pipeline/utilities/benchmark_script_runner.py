@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+"""
+Breaks down the startup overhead of the python scripts run by the tasks of workflow/CompileVCFFiles.py,
+comparing a subprocess per script with the in process script runner of workflow/pipeline_utils.py.
+
+Every script is run with --help, which pays the interpreter startup and the imports of the script but does no work.
+Per script, the following times are reported:
+  - subprocess: `python script.py --help`, as run_process does without a script runner
+  - first: the first in process run in a worker, which imports the dependencies not imported by earlier scripts yet
+  - warm: a repeated in process run, i.e. the overhead left per task once the worker is warm. The pipeline's own
+    modules are imported again by every run, third party dependencies stay imported
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+PIPELINE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), '..')
+sys.path.insert(0, PIPELINE_DIR)
+
+from workflow import pipeline_utils
+
+WORKFLOW_SCRIPTS = [
+    "clinvar/filter_clinvar.py",
+    "clinvar/clinVarParse.py",
+    "data_merging/convert_tsv_to_vcf.py",
+    "lovd/normalizeLOVDSubmissions.py",
+    "lovd/combineEquivalentVariantSubmissions.py",
+    "lovd/lovd2vcf.py",
+    "clinvar/filter_enigma_data.py",
+    "clinvar/enigma_from_clinvar.py",
+    "functional_assays/convert_functional_assay_tsv_to_vcf.py",
+    "data_merging/variant_merging.py",
+    "data_merging/aggregate_across_columns.py",
+    "data_merging/brca_pseudonym_generator.py",
+    "data_merging/get_ca_id.py",
+    "data_merging/getMupitStructure.py",
+    "splicingfilter/filterBlacklistedVars.py",
+    "data_merging/check_for_missing_reports.py",
+    "utilities/releaseDiff.py",
+    "data_merging/generate_variants_output_file.py",
+    "data_merging/buildVersionMetadata.py",
+    "utilities/generateMD5Sums.py",
+]
+
+
+def time_subprocess(script_dir, script_args):
+    start = time.perf_counter()
+    sp = subprocess.run([sys.executable] + script_args, cwd=script_dir, stdout=subprocess.DEVNULL,
+                        stderr=subprocess.PIPE)
+    return time.perf_counter() - start, sp.returncode
+
+
+def time_in_process(runner, script_dir, script_args):
+    start = time.perf_counter()
+    result = runner.run(script_args, script_dir, os.devnull)
+    return time.perf_counter() - start, result.returncode
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("scripts", nargs="*", default=WORKFLOW_SCRIPTS,
+                        help="scripts relative to the pipeline directory. All scripts of the workflow if not given")
+    args = parser.parse_args()
+
+    env_path = os.environ.get("PYTHONPATH")
+    os.environ["PYTHONPATH"] = os.pathsep.join(p for p in [os.path.realpath(PIPELINE_DIR), env_path] if p)
+
+    runner = pipeline_utils.ScriptRunner(1)
+    # starting the worker isn't part of any task
+    runner.start()
+
+    print("{:<58}{:>14}{:>11}{:>11}{:>13}".format("script", "subprocess [s]", "first [s]", "warm [s]", "saved [s]"))
+    totals = [0.0, 0.0, 0.0]
+    for script in args.scripts:
+        script_dir, script_name = os.path.split(os.path.join(PIPELINE_DIR, script))
+        script_args = [script_name, "--help"]
+
+        t_subprocess, rc_subprocess = time_subprocess(script_dir, script_args)
+        t_first, rc_first = time_in_process(runner, script_dir, script_args)
+        t_warm, _ = time_in_process(runner, script_dir, script_args)
+        if rc_subprocess != rc_first:
+            print("{}: return code {} in a subprocess but {} in process".format(script, rc_subprocess, rc_first),
+                  file=sys.stderr)
+
+        totals = [t + d for t, d in zip(totals, [t_subprocess, t_first, t_warm])]
+        print("{:<58}{:>14.3f}{:>11.3f}{:>11.3f}{:>13.3f}".format(script, t_subprocess, t_first, t_warm,
+                                                                 t_subprocess - t_warm))
+
+    print("{:<58}{:>14.3f}{:>11.3f}{:>11.3f}{:>13.3f}".format("total", totals[0], totals[1], totals[2],
+                                                             totals[0] - totals[2]))
+    runner.shutdown()
+
+
+if __name__ == "__main__":
+    main()
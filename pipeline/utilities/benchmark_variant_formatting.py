@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Compares the per variant cost of converting between VCFVariant and genomic HGVS strings
+via hgvs objects and via VCFVariant.to_hgvs_str/VCFVariant.from_hgvs_str.
+
+Two passes are timed for each implementation:
+  - format: VCFVariant to HGVS string, like the pseudonym generator does for every variant
+  - parse: HGVS string to VCFVariant
+
+Variants are read from a TSV file with Chr, Pos, Ref and Alt columns (e.g. the input of the pseudonym generator)
+or generated randomly. The outputs of both implementations are checked to be identical.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import bioutils.assemblies
+import hgvs.parser
+import pandas as pd
+
+from common.variant_utils import VCFVariant
+
+
+def random_variants(n, seed=42):
+    r = random.Random(seed)
+
+    def allele():
+        # mostly SNVs
+        return ''.join(r.choice('ACGT') for _ in range(r.choice([1, 1, 1, 2, 5])))
+
+    return [VCFVariant(r.choice(['13', '17']), r.randint(30000000, 50000000), allele(), allele()) for _ in range(n)]
+
+
+def load_variants(path):
+    df = pd.read_csv(path, sep='\t', usecols=['Chr', 'Pos', 'Ref', 'Alt'], dtype=str)
+    return [VCFVariant(r.Chr, int(r.Pos), r.Ref, r.Alt) for r in df.itertuples()]
+
+
+def timed(func, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", help="TSV file with Chr, Pos, Ref and Alt columns. Random variants if not given")
+    parser.add_argument("-n", "--number", type=int, default=20000, help="number of random variants")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="number of repetitions, the best time is reported")
+    args = parser.parse_args()
+
+    variants = load_variants(args.input) if args.input else random_variants(args.number)
+    contig_map = {s['name']: s['refseq_ac'] for s in bioutils.assemblies.get_assemblies()['GRCh38.p11']['sequences']
+                  if s['refseq_ac']}
+    hgvs_parser = hgvs.parser.Parser()
+
+    hgvs_strs = [v.to_hgvs_str(contig_map, include_ref=True) for v in variants]
+
+    print("{} variants".format(len(variants)))
+    print("{:<10}{:>16}{:>16}{:>10}".format("pass", "hgvs [us/var]", "fast [us/var]", "speedup"))
+    for name, library_func, fast_func in [
+            ("format", lambda: [v.to_hgvs_obj(contig_map).format(conf={'max_ref_length': None}) for v in variants],
+             lambda: [v.to_hgvs_str(contig_map, include_ref=True) for v in variants]),
+            ("parse", lambda: [VCFVariant.from_hgvs_obj(hgvs_parser.parse(s)) for s in hgvs_strs],
+             lambda: [VCFVariant.from_hgvs_str(s, hgvs_parser) for s in hgvs_strs])]:
+        t_library, expected = timed(library_func, args.repeat)
+        t_fast, result = timed(fast_func, args.repeat)
+        if result != expected:
+            raise Exception("Output of the fast path differs from the hgvs library for pass {}".format(name))
+        print("{:<10}{:>16.2f}{:>16.2f}{:>9.1f}x".format(name, 1e6 * t_library / len(variants),
+                                                        1e6 * t_fast / len(variants), t_library / t_fast))
+
+
+if __name__ == "__main__":
+    main()
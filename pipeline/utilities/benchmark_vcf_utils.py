@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+"""
+Compares the runtime of PyVCF and common.vcf_utils on a VCF file, e.g. a full ClinVar release VCF.
+
+Two passes are timed for each implementation:
+  - copy: reading all records and writing them out again, like one_variant_transform or repeat_merging do
+  - extract: reading the INFO keys a source contributes to the merged file, like add_new_source does
+
+The outputs of both implementations are checked to be identical.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+import vcf
+
+from common import vcf_utils
+from data_merging.variant_merging_constants import FIELD_DICT
+
+
+def copy_records(reader_cls, writer_cls, path):
+    out = io.StringIO()
+    with open(path, 'r') as f:
+        reader = reader_cls(f, strict_whitespace=True)
+        writer = writer_cls(out, reader)
+        for record in reader:
+            writer.write_record(record)
+    return out.getvalue()
+
+
+def extract_fields(reader_cls, path, keys):
+    values = []
+    with open(path, 'r') as f:
+        for record in reader_cls(f, strict_whitespace=True):
+            values.append([record.CHROM, record.POS, record.REF, str(record.ALT[0])] +
+                          [record.INFO.get(k) for k in keys])
+    return values
+
+
+def timed(func, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-i", "--input", required=True, help="VCF file to read")
+    parser.add_argument("-s", "--source", default="ClinVar", choices=sorted(FIELD_DICT.keys()),
+                        help="source whose INFO keys are extracted")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="number of repetitions, the best time is reported")
+    args = parser.parse_args()
+
+    keys = list(FIELD_DICT[args.source].values())
+
+    print("{:<10}{:>12}{:>15}{:>10}".format("pass", "PyVCF [s]", "vcf_utils [s]", "speedup"))
+    for name, pyvcf_func, vcf_utils_func in [
+            ("copy", lambda: copy_records(vcf.Reader, vcf.Writer, args.input),
+             lambda: copy_records(vcf_utils.Reader, vcf_utils.Writer, args.input)),
+            ("extract", lambda: extract_fields(vcf.Reader, args.input, keys),
+             lambda: extract_fields(vcf_utils.Reader, args.input, keys))]:
+        t_pyvcf, expected = timed(pyvcf_func, args.repeat)
+        t_vcf_utils, result = timed(vcf_utils_func, args.repeat)
+        if result != expected:
+            raise Exception("Output of vcf_utils differs from PyVCF for pass {}".format(name))
+        print("{:<10}{:>12.3f}{:>15.3f}{:>9.1f}x".format(name, t_pyvcf, t_vcf_utils, t_pyvcf / t_vcf_utils))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import argparse
+import fnmatch
 import hashlib
 import logging
 import os
@@ -13,6 +14,11 @@ def read_file_list(path: Path) -> Set[Path]:
         return {Path(line.strip()) for line in f.readlines()}
 
 
+def in_file_list(filepath: Path, file_list: Set[Path]) -> bool:
+    # entries containing "*" are patterns, where "*" also matches subdirectories
+    return filepath in file_list or any(fnmatch.fnmatchcase(str(filepath), str(p)) for p in file_list if '*' in str(p))
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("-i", "--inputDir", help="Input directory for generating md5sums")
@@ -20,7 +26,8 @@ def main():
     parser.add_argument("-f", "--keepListFilePath", help="only consider files whose paths are given in this file."
                                                          "Paths are expected to be relative to --inputDir")
     parser.add_argument("-d", "--discardListFilePath",
-                        help="paths in this file are ignored, i.e. not included in final tarball. Paths are expected to be relative to --inputDir")
+                        help="paths in this file are ignored, i.e. not included in final tarball. Paths are expected to be relative to --inputDir. "
+                             "Paths may contain '*', which also matches subdirectories")
 
     args = parser.parse_args()
 
@@ -51,7 +58,7 @@ def main():
                 if filepath not in keep_list:
                     logging.info(f"Won't include file {filepath} in tarball")
 
-                    if filepath not in discard_list:
+                    if not in_file_list(filepath, discard_list):
                         # If a file is neither in the keep list nor the discard,list, fail, as it is an unexpected file.
                         # This way we are making sure we don't forget to include a newly created file into the tarball
                         sys.exit(f"Found found file {filepath} neither in keep list nor discard list. ")
@@ -1,12 +1,18 @@
 #!/usr/bin/env python
 import argparse
 import csv
+import multiprocessing
 import re
 import json
 import logging
+from collections import deque, namedtuple
 from math import floor, log10
 import dateutil.parser
+import heapq
+import itertools
 import os
+import shutil
+import tempfile
 
 csv.field_size_limit(10000000)
 
@@ -17,6 +23,12 @@ total_variants_with_additions = 0
 diff_json = {}
 reports = False
 
+# Number of rows sorted in memory at once when sorting a release by identifier, see sortByIdentifier
+SORT_CHUNK_SIZE = 100000
+
+# Number of rows compared per task when comparing rows in a process pool, see diffRows
+DIFF_BATCH_SIZE = 1000
+
 # Change types as used in the DB to signify changes to variants between versions
 CHANGE_TYPES = {
                 "REMOVED": "deleted",
@@ -90,6 +102,210 @@ EXAC_AF_FIELDS = [
 ]
 
 
+# Columns which aren't compared by transformer.compareRow
+COLUMNS_TO_IGNORE = frozenset([
+    "change_type", "Assertion_method_citation_ENIGMA",
+    "Genomic_Coordinate_hg37", "Genomic_Coordinate_hg38", "HGVS_cDNA", "HGVS_Protein",
+    "Hg37_Start", "Hg37_End", "BX_ID_ENIGMA", "BX_ID_ClinVar",
+    "BX_ID_BIC", "BX_ID_ExAC", "BX_ID_LOVD", "BX_ID_exLOVD", "BX_ID_1000_Genomes", "BX_ID_ESP", "BX_ID_GnomAD",
+    "BX_ID_GnomADv3", "BX_ID_Findlay_BRCA1_Ring_Function_Scores", "Polyphen_Prediction", "Polyphen_Score", "Sift_Prediction", "Sift_Score",
+    "Minor_allele_frequency_ESP", "Max_Allele_Frequency", "mupit_structure", "Genomic_HGVS_37",
+    "Genomic_HGVS_38"])
+
+# Changes of a row as determined by transformer.diffRow
+RowDiff = namedtuple('RowDiff', ['variant', 'variant_intro', 'changeset', 'added_data', 'json_diffs', 'change_type'])
+
+# Results of comparing a field, see FieldComparator
+FIELD_UNCHANGED = 0
+FIELD_ADDED_DATA = 1
+FIELD_MAJOR_CHANGE = 2
+
+_SUBMITTER_INVITAE_RE = re.compile("Invitae_")
+_PROTEIN_NM_000059_RE = re.compile("NM_000059")
+_PROTEIN_P_RE = re.compile("p.")
+_PROTEIN_END_RE = re.compile("$")
+_PROTEIN_SEPARATOR_RE = re.compile(".p.")
+_REF_SEQ_NM_000059_RE = re.compile("NM_000059")
+_REF_SEQ_NM_007294_RE = re.compile("NM_007294")
+_EXAC_RE = re.compile(r"\(ExAC\)")
+_SIFT_RE = re.compile(r"\(*$")
+_EMPTY_RE = re.compile("")
+
+
+def _normalizeSubmitterClinVar(value):
+    # Nagging trailing underscore and other random disparities...
+    value = _SUBMITTER_INVITAE_RE.sub("Invitae", value)
+    value = value.replace("The_Consortium_of_Investigators_of_Modifiers_of_BRCA1/2_(CIMBA)", "Consortium_of_Investigators_of_Modifiers_of_BRCA1/2_(CIMBA)")
+    value = value.replace("_c/o_University_of_Cambridge", "c/o_University_of_Cambridge")
+    return value.replace("LabCorp", "Laboratory_Corporation_of_America")
+
+
+def _normalizeHGVSProtein(value):
+    # overlook the following:
+    # - version numbers being provided in the new but not old accession
+    # - the addition of parentheses as delimiters
+    # - colons as delimiters before the 'p'
+    return _PROTEIN_SEPARATOR_RE.sub(":p.",
+                                     _PROTEIN_END_RE.sub(")",
+                                                         _PROTEIN_P_RE.sub("p.(",
+                                                                           _PROTEIN_NM_000059_RE.sub("NP_000050.2", value))))
+
+
+def _normalizeReferenceSequence(value):
+    # Handle reference sequence is accessions
+    return _REF_SEQ_NM_000059_RE.sub("NM_000059.3", _REF_SEQ_NM_007294_RE.sub("NM_007294.3", value))
+
+
+def _normalizeAlleleFrequency(value):
+    if 'ExAC' not in value:
+        return value
+    # Ensure value is rounded to 3 sig figs
+    value_source_list = value.split(' ', 1)
+    val = value_source_list[0]
+    source_string = value_source_list[1]
+    val = str(round_sigfigs(float(val), 3))
+    value = val + ' ' + source_string
+    # (ExAC) was changed to (ExAC minus TCGA)
+    return _EXAC_RE.sub("(ExAC minus TCGA)", value)
+
+
+def _normalizeSiftPrediction(value):
+    # for sift predictions, some data combines the
+    # numerical and categorical scores
+    return _SIFT_RE.sub("", value)
+
+
+def _normalizeClinicalSignificanceCitations(value):
+    # In some data, empty fields are indicated by a single hyphen
+    return _EMPTY_RE.sub("-", value)
+
+
+def _normalizeDate(value):
+    try:
+        date_obj = dateutil.parser.parse(value)
+        value = date_obj.strftime('%Y-%m-%d')
+    except ValueError:
+        logging.debug("Was not able to parse %s", value)
+    return value
+
+
+# Field specific normalization applied by transformer._normalize
+FIELD_NORMALIZERS = {
+    "Submitter_ClinVar": _normalizeSubmitterClinVar,
+    "HGVS_Protein": _normalizeHGVSProtein,
+    "Reference_Sequence": _normalizeReferenceSequence,
+    "Allele_Frequency": _normalizeAlleleFrequency,
+    "Sift_Prediction": _normalizeSiftPrediction,
+    "Clinical_significance_citations_ENIGMA": _normalizeClinicalSignificanceCitations,
+    "Date_last_evaluated_ENIGMA": _normalizeDate,
+    # Updated wording for non-expert-reviewed...
+    "Pathogenicity_expert": lambda value: value.replace("Not Yet Classified", "Not Yet Reviewed"),
+    "BIC_Nomenclature": lambda value: value.replace(' ', ''),
+    "Synonyms": lambda value: value.replace(" ", "")
+}
+
+
+def fieldNormalizer(field):
+    """
+    Returns a function normalizing values of field to make them similar for improved comparison
+    """
+    fieldSpecific = FIELD_NORMALIZERS.get(field)
+    roundExAC = field in EXAC_AF_FIELDS
+
+    def normalize(value):
+        # Replace all blank values with dashes for easier comparison
+        if value == "" or value is None:
+            value = "-"
+        # Some values start with ", " which throws off the comparison -- overwrite it.
+        if value[:1] == ",":
+            value = value[1:]
+        # Some values end with "," which throws off the comparison -- overwrite it.
+        if value[len(value)-1] == ",":
+            value = value[:len(value)-1]
+
+        if fieldSpecific is not None:
+            value = fieldSpecific(value)
+
+        if roundExAC and value != "-":
+            value = str(round_sigfigs(float(value), 3))
+
+        # Strip leading and trailing whitespace
+        return value.strip()
+
+    return normalize
+
+
+def _consistentTokens(oldValues, newValues):
+    # same elements of comma-separated lists, in any order
+    return set(s.strip() for s in oldValues.split(",")) == set(s.strip() for s in newValues.split(","))
+
+
+def _consistentPathogenicityAll(oldValues, newValues):
+    (added, removed) = determineDiffForPathogenicityAll(oldValues, newValues)
+    return added is None and removed is None
+
+
+class FieldComparator(object):
+    """
+    Compares the values of a field of the new data with the corresponding field of the old data,
+    with normalization and the check for reordered lists chosen for the field up front
+    """
+    __slots__ = ['field', 'oldField', 'isNewColumn', 'normalize', 'consistentLists']
+
+    def __init__(self, field, oldField, isNewColumn):
+        """
+        :param oldField: name of the field in the old data, None if there is none
+        :param isNewColumn: whether the field is new, i.e. compared to no data at all
+        """
+        self.field = field
+        self.oldField = oldField
+        self.isNewColumn = isNewColumn
+        self.normalize = fieldNormalizer(field)
+        if field == "Pathogenicity_all":
+            self.consistentLists = _consistentPathogenicityAll
+        elif field in LIST_KEYS:
+            self.consistentLists = _consistentTokens
+        else:
+            self.consistentLists = None
+
+    def compare(self, oldRow, newRow):
+        """
+        :return: tuple of FIELD_UNCHANGED, FIELD_ADDED_DATA or FIELD_MAJOR_CHANGE and the normalized old and new value
+        """
+        if self.isNewColumn:
+            newValue = self.normalize(newRow[self.field])
+            if newValue == "-":
+                # Ignore new columns with no data in diff
+                return FIELD_UNCHANGED, None, newValue
+            return FIELD_ADDED_DATA, "-", newValue
+
+        if self.oldField is None:
+            raise KeyError(self.field)
+        rawOldValue = oldRow[self.oldField]
+        rawNewValue = newRow[self.field]
+        if rawOldValue == rawNewValue:
+            # identical values are identical after normalization
+            return FIELD_UNCHANGED, None, None
+
+        oldValue = self.normalize(rawOldValue)
+        newValue = self.normalize(rawNewValue)
+        if oldValue == newValue:
+            return FIELD_UNCHANGED, oldValue, newValue
+        try:
+            # This handles special cases dealing with scientific notation and
+            # equivalent values with different representations (e.g. 0 == 0.0)
+            if float(oldValue) == float(newValue):
+                return FIELD_UNCHANGED, oldValue, newValue
+        except ValueError:
+            pass
+        if self.consistentLists is not None and self.consistentLists(oldValue, newValue):
+            return FIELD_UNCHANGED, oldValue, newValue
+        elif oldValue == "-" or oldValue in newValue:
+            return FIELD_ADDED_DATA, oldValue, newValue
+        else:
+            return FIELD_MAJOR_CHANGE, oldValue, newValue
+
+
 class transformer(object):
     """
     Make the expected changes to update data from one version to another
@@ -97,9 +313,15 @@ class transformer(object):
     _renamedColumns = {}
 
     def __init__(self, oldColumns, newColumns):
+        self.oldColumns = list(oldColumns)
+        self.newColumns = list(newColumns)
         (self._oldColumnsRemoved, self._newColumnsAdded,
          self._newColumnNameToOld) = self._mapColumnNames(oldColumns,
                                                           newColumns)
+        # comparison plan, i.e. a comparator per field of the new data
+        self._comparators = {}
+        for field in newColumns:
+            self._comparator(field)
 
     def _mapColumnNames(self, oldColumns, newColumns):
         """
@@ -125,98 +347,28 @@ class transformer(object):
                 newColumnsAdded.append(ncol)
         return (oldColumnsRemoved, newColumnsAdded, newToOldNameMapping)
 
+    def _comparator(self, field):
+        # comparators of fields in rows but not in the header are added on first use
+        comparator = self._comparators.get(field)
+        if comparator is None:
+            isNewColumn = field in self._newColumnsAdded and field not in self._renamedColumns.values()
+            comparator = FieldComparator(field, self._newColumnNameToOld.get(field), isNewColumn)
+            self._comparators[field] = comparator
+        return comparator
+
     def _consistentDelimitedLists(self, oldValues, newValues, field):
         """Determine if the old and new values are comma-separated
         lists in which the same elements have been assembled in
         a differnt order
         """
-        listsAreConsistent = False
         if oldValues is None or newValues is None:
             return False
-        elif field == "Pathogenicity_all":
-            (added, removed) = determineDiffForPathogenicityAll(oldValues, newValues)
-            return (added is None and removed is None)
-        elif field in LIST_KEYS:
-            oldTokens = set([s.strip() for s in oldValues.split(",")])
-            newTokens = set([s.strip() for s in newValues.split(",")])
-            numberSharedTokens = 0
-            for token in oldTokens:
-                if token in newTokens:
-                    numberSharedTokens += 1
-            if numberSharedTokens == len(newTokens) and \
-                    numberSharedTokens == len(oldTokens):
-                listsAreConsistent = True
-        return listsAreConsistent
+        consistentLists = self._comparator(field).consistentLists
+        return consistentLists is not None and consistentLists(oldValues, newValues)
 
     def _normalize(self, value, field):
         """Make all values similar for improved comparison"""
-
-        # Replace all blank values with dashes for easier comparison
-        if value == "" or value is None:
-            value = "-"
-        # Some values start with ", " which throws off the comparison -- overwrite it.
-        if value[:1] == ",":
-            value = value[1:]
-        # Some values end with "," which throws off the comparison -- overwrite it.
-        if value[len(value)-1] == ",":
-            value = value[:len(value)-1]
-
-        if field == "Submitter_ClinVar":
-            # Nagging trailing underscore and other random disparities...
-            value = re.sub("Invitae_", "Invitae", value)
-            value = value.replace("The_Consortium_of_Investigators_of_Modifiers_of_BRCA1/2_(CIMBA)", "Consortium_of_Investigators_of_Modifiers_of_BRCA1/2_(CIMBA)")
-            value = value.replace("_c/o_University_of_Cambridge", "c/o_University_of_Cambridge")
-            value = value.replace("LabCorp", "Laboratory_Corporation_of_America")
-        elif field == "HGVS_Protein":
-            # overlook the following:
-            # - version numbers being provided in the new but not old accession
-            # - the addition of parentheses as delimiters
-            # - colons as delimiters before the 'p'
-            value = re.sub(".p.", ":p.",
-                           re.sub("$", ")",
-                                  re.sub("p.", "p.(",
-                                         re.sub("NM_000059", "NP_000050.2", value))))
-        elif field == "Reference_Sequence":
-            # Handle reference sequence is accessions
-            value = re.sub("NM_000059", "NM_000059.3",
-                           re.sub("NM_007294", "NM_007294.3", value))
-        elif field == "Allele_Frequency" and 'ExAC' in value:
-            # Ensure value is rounded to 3 sig figs
-            value_source_list = value.split(' ', 1)
-            val = value_source_list[0]
-            source_string = value_source_list[1]
-            val = str(round_sigfigs(float(val), 3))
-            value = val + ' ' + source_string
-            # (ExAC) was changed to (ExAC minus TCGA)
-            value = re.sub(r"\(ExAC\)", "(ExAC minus TCGA)", value)
-        elif field == "Sift_Prediction":
-            # for sift predictions, some data combines the
-            # numerical and categorical scores
-            value = re.sub(r"\(*$", "", value)
-        elif field == "Clinical_significance_citations_ENIGMA":
-            # In some data, empty fields are indicated by a single hyphen
-            value = re.sub("", "-", value)
-        elif field == "Date_last_evaluated_ENIGMA":
-            try:
-                date_obj = dateutil.parser.parse(value)
-                value = date_obj.strftime('%Y-%m-%d')
-            except ValueError:
-                logging.debug("Was not able to parse %s", value)
-        elif field == "Pathogenicity_expert":
-            # Updated wording for non-expert-reviewed...
-            value = value.replace("Not Yet Classified", "Not Yet Reviewed")
-        elif field == "BIC_Nomenclature":
-            value = value.replace(' ', '')
-        elif field == "Synonyms":
-            value = value.replace(" ", "")
-
-        if field in EXAC_AF_FIELDS and value != "-":
-            value = str(round_sigfigs(float(value), 3))
-
-        # Strip leading and trailing whitespace
-        value = value.strip()
-
-        return value
+        return self._comparator(field).normalize(value)
 
     def compareField(self, oldRow, newRow, field):
         """
@@ -224,109 +376,61 @@ class transformer(object):
         the field is added, has cosmetic changes, has major changes, or
         is unchanged.
         """
-        global added_data
-        identifier = getIdentifier(newRow, reports)
-        if identifier is None:
-            pass
-        variant = newRow[identifier]
-        newValue = self._normalize(newRow[field], field)
-        if field in self._newColumnsAdded and field not in list(self._renamedColumns.values()):
-            if newValue == "-":
-                # Ignore new columns with no data in diff
-                return "unchanged"
-            else:
-                oldValue = "-"
-                appendToJSON(variant, field, oldValue, newValue)
-                return "added data: %s | %s" % (oldValue, newValue)
-        else:
-            oldValue = self._normalize(oldRow[self._newColumnNameToOld[field]], field)
-            try:
-                # This handles special cases dealing with scientific notation and
-                # equivalent values with different representations (e.g. 0 == 0.0)
-                oldValueCopy = float(oldValue)
-                newValueCopy = float(newValue)
-                if oldValueCopy == newValueCopy:
-                    return "unchanged"
-            except ValueError:
-                pass
-            if oldValue == newValue:
-                return "unchanged"
-            elif self._consistentDelimitedLists(oldValue, newValue, field):
-                return "unchanged"
-            elif oldValue == "-" or oldValue in newValue:
-                appendToJSON(variant, field, oldValue, newValue)
-                return "added data: %s | %s" % (oldValue, newValue)
-            else:
-                appendToJSON(variant, field, oldValue, newValue)
-                return "major change: %s | %s" % (oldValue, newValue)
+        variant = newRow[getIdentifier(newRow, reports)]
+        result, oldValue, newValue = self._comparator(field).compare(oldRow, newRow)
+        if result == FIELD_UNCHANGED:
+            return "unchanged"
+        appendToJSON(variant, field, oldValue, newValue)
+        if result == FIELD_ADDED_DATA:
+            return "added data: %s | %s" % (oldValue, newValue)
+        return "major change: %s | %s" % (oldValue, newValue)
 
     def compareRow(self, oldRow, newRow, isReport):
         """
         Compare the contents of an old row to a new row.  Indicate any minor
         (cosmetic) changes, major changes, or new values
         """
-        global added_data
-        global diff
-        global total_variants_with_additions
-        global total_variants_with_changes
-
-        # Uncomment if using old data schema (e.g. pre pyhgvs_Genomic_Coordinate_38)
-        columns_to_ignore = ["change_type", "Assertion_method_citation_ENIGMA",
-                             "Genomic_Coordinate_hg37", "Genomic_Coordinate_hg38", "HGVS_cDNA", "HGVS_Protein",
-                             "Hg37_Start", "Hg37_End", "BX_ID_ENIGMA", "BX_ID_ClinVar",
-                             "BX_ID_BIC", "BX_ID_ExAC", "BX_ID_LOVD", "BX_ID_exLOVD", "BX_ID_1000_Genomes", "BX_ID_ESP", "BX_ID_GnomAD",
-                             "BX_ID_GnomADv3", "BX_ID_Findlay_BRCA1_Ring_Function_Scores", "Polyphen_Prediction", "Polyphen_Score", "Sift_Prediction", "Sift_Score",
-                             "Minor_allele_frequency_ESP", "Max_Allele_Frequency", "mupit_structure", "Genomic_HGVS_37",
-                             "Genomic_HGVS_38"]
+        return writeRowDiff(self.diffRow(oldRow, newRow, isReport))
 
+    def diffRow(self, oldRow, newRow, isReport):
+        """
+        Same as compareRow, but returning the changes as RowDiff instead of writing them to the diff outputs,
+        such that rows can be compared in other processes
+        """
         # Header to group all logs the same variant
         variant_intro = "\n\n %s \n Old Source: %s \n New Source: %s \n\n" % (newRow[getIdentifier(newRow, isReport)],
                                                                               oldRow["Source"], newRow["Source"])
+        variant = newRow[getIdentifier(newRow, reports)]
 
         changeset = ""
         added_data_str = ""
+        json_diffs = []
         changed_classification = False
 
-        for field in list(newRow.keys()):
-            if field not in columns_to_ignore:
-                result = self.compareField(oldRow, newRow, field)
-                if re.search("major change", result):
-                    result = re.sub("major change: ", "", result)
-                    changeset += "%s: %s \n" % (field, result)
-                    if field == CLASSIFICATION_FIELD:
-                        changed_classification = True
-                if re.search("added data", result):
-                    result = re.sub("added data: ", "", result)
-                    added_data_str += "%s: %s \n" % (field, result)
-                    if field == CLASSIFICATION_FIELD:
-                        changed_classification = True
+        for field in newRow:
+            if field in COLUMNS_TO_IGNORE:
+                continue
+            result, oldValue, newValue = self._comparator(field).compare(oldRow, newRow)
+            if result == FIELD_UNCHANGED:
+                continue
+            json_diffs.append(determineDiffForJSON(field, oldValue, newValue))
+            if result == FIELD_MAJOR_CHANGE:
+                changeset += "%s: %s | %s \n" % (field, oldValue, newValue)
+            else:
+                added_data_str += "%s: %s | %s \n" % (field, oldValue, newValue)
+            if field == CLASSIFICATION_FIELD:
+                changed_classification = True
 
         # If a field is no longer present in the new data, make sure to include it in the diff
-        for field in list(oldRow.keys()):
-            if field not in columns_to_ignore and field not in list(newRow.keys()):
-                identifier = getIdentifier(newRow, reports)
-                if identifier is None:
-                    pass
-                variant = newRow[identifier]
+        for field in oldRow:
+            if field not in COLUMNS_TO_IGNORE and field not in newRow:
                 oldValue = self._normalize(oldRow[field], field)
                 newValue = "-"
                 if oldValue != newValue:
-                    appendToJSON(variant, field, oldValue, newValue)
+                    json_diffs.append(determineDiffForJSON(field, oldValue, newValue))
                     result = "%s | %s" % (oldValue, newValue)
                     changeset += "%s: %s \n" % (field, result)
 
-        # If there are any changes, log them in the diff
-        if len(changeset) > 0:
-            diff.write(variant_intro)
-            diff.write(changeset)
-            total_variants_with_changes += 1
-
-        # If there are any additions, log them in added_data
-        if len(added_data_str) > 0:
-            added_data.write(variant_intro)
-            added_data.write(added_data_str)
-            total_variants_with_additions += 1
-
         logging.debug('Determining change type: \n Changed Classification: %s \n Changeset: %s \n Added Data: %s',
                       changed_classification, changeset, added_data_str)
 
@@ -334,13 +438,42 @@ class transformer(object):
         # Added information). Note that new variants never make it to this function call and have already been
         # classified. Removed variants are not encountered because they do not exist in v2.
         if changed_classification:
-            return CHANGE_TYPES['CLASSIFICATION']
+            change_type = CHANGE_TYPES['CLASSIFICATION']
         elif len(changeset) > 0:
-            return CHANGE_TYPES['CHANGED_INFO']
+            change_type = CHANGE_TYPES['CHANGED_INFO']
         elif len(added_data_str) > 0:
-            return CHANGE_TYPES['ADDED_INFO']
+            change_type = CHANGE_TYPES['ADDED_INFO']
         else:
-            return None
+            change_type = None
+
+        return RowDiff(variant, variant_intro, changeset, added_data_str, json_diffs, change_type)
+
+
+def writeRowDiff(rowDiff):
+    """
+    Writes the changes of a row to the diff outputs (diff, added_data and diff_json)
+
+    :return: the change type of the row
+    """
+    global total_variants_with_additions
+    global total_variants_with_changes
+
+    # If there are any changes, log them in the diff
+    if len(rowDiff.changeset) > 0:
+        diff.write(rowDiff.variant_intro)
+        diff.write(rowDiff.changeset)
+        total_variants_with_changes += 1
+
+    # If there are any additions, log them in added_data
+    if len(rowDiff.added_data) > 0:
+        added_data.write(rowDiff.variant_intro)
+        added_data.write(rowDiff.added_data)
+        total_variants_with_additions += 1
+
+    if rowDiff.json_diffs:
+        diff_json.setdefault(rowDiff.variant, []).extend(rowDiff.json_diffs)
+
+    return rowDiff.change_type
 
 
 class v1ToV2(transformer):
@@ -613,6 +746,289 @@ def getIdentifier(obj, isReport):
         return "pyhgvs_Genomic_Coordinate_38"
 
 
+def identifiedRows(path, isReport, isOld):
+    """
+    Reads a release tsv, yielding (identifier, rowValues) for every row, rowValues being the list of values
+    in the order of the header. The identifier is None for reports whose diff we don't care about.
+    """
+    with open(path, "r") as f:
+        reader = csv.reader(f, delimiter="\t")
+        fieldnames = next(reader)
+        for values in reader:
+            row = dict(zip(fieldnames, values))
+            identifier = getIdentifier(row, isReport)
+            if isReport:
+                # if a new identifier is assigned, this will skip over old data that don't have the property
+                if identifier is not None and (not isOld or identifier in row):
+                    yield row[identifier], values
+                else:
+                    yield None, values
+            else:
+                yield addGsIfNecessary(row)[identifier], values
+
+
+def sortByIdentifier(rows, tmp_dir, chunkSize=SORT_CHUNK_SIZE):
+    """
+    Sorts (identifier, rowValues) pairs by identifier, keeping the order of rows with the same identifier.
+    At most chunkSize rows are kept in memory: sorted chunks are written to tmp_dir and merged afterwards.
+    """
+    chunkDir = tempfile.mkdtemp(dir=tmp_dir)
+    chunkPaths = []
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunkSize))
+        if not chunk:
+            break
+        chunk.sort(key=lambda r: r[0])
+        chunkPath = os.path.join(chunkDir, "chunk_%d.tsv" % len(chunkPaths))
+        with open(chunkPath, "w") as f:
+            writer = csv.writer(f, delimiter="\t")
+            for identifier, values in chunk:
+                writer.writerow([identifier] + values)
+        chunkPaths.append(chunkPath)
+
+    def readChunk(chunkPath):
+        with open(chunkPath, "r") as f:
+            for r in csv.reader(f, delimiter="\t"):
+                yield r[0], r[1:]
+
+    # heapq.merge is stable, i.e. rows of earlier chunks come first
+    return heapq.merge(*[readChunk(c) for c in chunkPaths], key=lambda r: r[0])
+
+
+def groupByIdentifier(sortedRows, path):
+    """
+    Groups (identifier, rowValues) pairs sorted by identifier, yielding (identifier, [rowValues, ...])
+    """
+    previous = None
+    for identifier, group in itertools.groupby(sortedRows, key=lambda r: r[0]):
+        if previous is not None and identifier < previous:
+            raise Exception("%s is not sorted by identifier: %s comes after %s" % (path, identifier, previous))
+        previous = identifier
+        yield identifier, [values for _, values in group]
+
+
+def sortedRowGroups(path, isReport, isOld, tmp_dir, presorted, unidentified=None, chunkSize=SORT_CHUNK_SIZE):
+    """
+    Yields the rows of a release tsv grouped by identifier and in order of the identifiers.
+    If presorted, the file has to be sorted by identifier already, in the order of python string comparison
+    (e.g. as by "LC_ALL=C sort"), otherwise it is sorted externally in tmp_dir.
+
+    Rows without identifier are skipped, calling unidentified with their values if given.
+    """
+    def withIdentifier():
+        for identifier, values in identifiedRows(path, isReport, isOld):
+            if identifier is not None:
+                yield identifier, values
+            elif unidentified is not None:
+                unidentified(values)
+
+    rows = withIdentifier()
+    if not presorted:
+        rows = sortByIdentifier(rows, tmp_dir, chunkSize)
+    return groupByIdentifier(rows, path)
+
+
+class DiffJSONWriter(object):
+    """
+    Writes the diff json incrementally, variant by variant, instead of dumping diff_json at once.
+    The result is the same json object as written by generateDiffJSONFile, with variants in order of writing.
+    """
+
+    def __init__(self, diff_json_file):
+        self._f = open(diff_json_file, 'w')
+        self._f.write("{")
+        self._empty = True
+
+    def write(self, diffs):
+        for variant, variantDiffs in diffs.items():
+            if not self._empty:
+                self._f.write(", ")
+            self._f.write(json.dumps(variant) + ": " + json.dumps(variantDiffs))
+            self._empty = False
+
+    def close(self):
+        self._f.write("}")
+        self._f.close()
+
+
+_WORKER_TRANSFORMER = None
+
+
+def _initDiffWorker(transformerClass, oldColumns, newColumns, isReport):
+    global _WORKER_TRANSFORMER
+    global reports
+    reports = isReport
+    _WORKER_TRANSFORMER = transformerClass(oldColumns, newColumns)
+
+
+def _diffRowsInWorker(pairs):
+    return [_WORKER_TRANSFORMER.diffRow(oldRow, newRow, reports) if oldRow is not None and newRow is not None else None
+            for oldRow, newRow in pairs]
+
+
+def diffRows(v1v2, items, processes=1, batchSize=DIFF_BATCH_SIZE):
+    """
+    Compares rows with v1v2.diffRow, yielding (rowDiff, payload) for every (oldRow, newRow, payload) of items
+    in the order of items. rowDiff is None if oldRow or newRow is None.
+
+    With processes > 1, batches of batchSize rows are compared in a process pool. At most two batches per process
+    are pending at a time, such that items are consumed lazily, and results are yielded in order of items.
+    Hence the outputs don't depend on the number of processes.
+    """
+    if processes <= 1:
+        for oldRow, newRow, payload in items:
+            rowDiff = v1v2.diffRow(oldRow, newRow, reports) if oldRow is not None and newRow is not None else None
+            yield rowDiff, payload
+        return
+
+    items = iter(items)
+    batches = iter(lambda: list(itertools.islice(items, batchSize)), [])
+
+    def results(batch, asyncResult):
+        return zip(asyncResult.get(), (payload for _, _, payload in batch))
+
+    with multiprocessing.Pool(processes, initializer=_initDiffWorker,
+                              initargs=(type(v1v2), v1v2.oldColumns, v1v2.newColumns, reports)) as pool:
+        pending = deque()
+        for batch in batches:
+            pairs = [(oldRow, newRow) for oldRow, newRow, _ in batch]
+            pending.append((batch, pool.apply_async(_diffRowsInWorker, (pairs,))))
+            if len(pending) >= 2 * processes:
+                yield from results(*pending.popleft())
+        while pending:
+            yield from results(*pending.popleft())
+
+
+def mergeByIdentifier(oldGroups, newGroups):
+    """
+    Merges the row groups of two releases sorted by identifier, see sortedRowGroups
+
+    :return: iterator of (identifier, oldRows, newRows) in order of identifiers, oldRows or newRows being
+      None if the identifier is only in one of the releases
+    """
+    old = next(oldGroups, None)
+    new = next(newGroups, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0]):
+            yield old[0], old[1], None
+            old = next(oldGroups, None)
+        elif old is None or new[0] < old[0]:
+            yield new[0], None, new[1]
+            new = next(newGroups, None)
+        else:
+            yield new[0], old[1], new[1]
+            old = next(oldGroups, None)
+            new = next(newGroups, None)
+
+
+def sortedMergeDiff(args, v1v2, removed, added, tmp_dir, chunkSize=SORT_CHUNK_SIZE, processes=1):
+    """
+    Diffs v1 and v2 in a single merge pass over both releases sorted by identifier, writing removed, added,
+    the diff json and the output with change types as the variants are encountered. Memory doesn't depend on
+    the size of the releases, but variants are written in order of their identifiers instead of the order of
+    v2 (followed by the reports whose diff we don't care about).
+
+    As in the in memory diff, the last row of rows with the same identifier is compared.
+    """
+    v1Fieldnames = removed.fieldnames
+    v2Fieldnames = added.fieldnames
+
+    def asRow(fieldnames, values):
+        row = dict(zip(fieldnames, values))
+        return row if reports else addGsIfNecessary(row)
+
+    unidentifiedPath = os.path.join(tmp_dir, "unidentified.tsv")
+    diffJSON = DiffJSONWriter(args.diff_json)
+    with open(args.output, 'w') as f_out, open(unidentifiedPath, 'w') as f_unidentified:
+        writer = csv.writer(f_out, delimiter='\t')
+        writer.writerow(v2Fieldnames + ['change_type'])
+        unidentifiedWriter = csv.writer(f_unidentified, delimiter='\t')
+
+        def writeWithChangeType(rows, changeType):
+            writer.writerows(values + [changeType] for values in rows)
+
+        oldGroups = sortedRowGroups(args.v1, reports, True, tmp_dir, args.presorted, chunkSize=chunkSize)
+        newGroups = sortedRowGroups(args.v2, reports, False, tmp_dir, args.presorted,
+                                    unidentified=lambda values: unidentifiedWriter.writerow(values + [None]),
+                                    chunkSize=chunkSize)
+
+        items = ((asRow(v1Fieldnames, oldRows[-1]), asRow(v2Fieldnames, newRows[-1]), (identifier, oldRows, newRows))
+                 if oldRows is not None and newRows is not None else (None, None, (identifier, oldRows, newRows))
+                 for identifier, oldRows, newRows in mergeByIdentifier(oldGroups, newGroups))
+
+        for rowDiff, (identifier, oldRows, newRows) in diffRows(v1v2, items, processes):
+            if newRows is None:
+                removed.writerow(asRow(v1Fieldnames, oldRows[-1]))
+            elif oldRows is None:
+                added.writerow(asRow(v2Fieldnames, newRows[-1]))
+                writeWithChangeType(newRows, CHANGE_TYPES['ADDED'])
+            else:
+                change_type = writeRowDiff(rowDiff)
+                logging.debug("newV: %s change_type: %s", identifier, change_type)
+                writeWithChangeType(newRows, change_type)
+                diffJSON.write(diff_json)
+                diff_json.clear()
+
+        f_unidentified.close()
+        with open(unidentifiedPath, 'r') as f:
+            shutil.copyfileobj(f, f_out)
+    diffJSON.close()
+
+
+def diffInMemory(args, v1In, v2In, v1v2, removed, added, processes=1):
+    """
+    Diffs v1 and v2 loading both releases into memory, keeping the order of v2 in the outputs
+    """
+    # Keep track of change types for all variants to append to final output file
+    variantChangeTypes = {}
+
+    # Save the old variants in a dictionary for which the pyhgvs_genomic_coordinate_38
+    # string is the key, and for which the value is the full row.
+    oldData = {}
+    newData = {}
+    if reports is True:
+        # handle reports
+        for oldRow in v1In:
+            identifier = getIdentifier(oldRow, reports)
+            # if a new identifier is assigned, this will skip over old data that don't have the property
+            if identifier is not None and identifier in list(oldRow.keys()):
+                oldData[oldRow[identifier]] = oldRow
+
+        for newRow in v2In:
+            identifier = getIdentifier(newRow, reports)
+            if identifier is not None:
+                newData[newRow[identifier]] = newRow
+
+    else:
+        # handle variants
+        for oldRow in v1In:
+            oldRow = addGsIfNecessary(oldRow)
+            oldData[oldRow[getIdentifier(oldRow, reports)]] = oldRow
+        for newRow in v2In:
+            newRow = addGsIfNecessary(newRow)
+            newData[newRow[getIdentifier(newRow, reports)]] = newRow
+    for oldVariant in list(oldData.keys()):
+        if oldVariant not in newData:
+            removed.writerow(oldData[oldVariant])
+
+    items = ((oldData.get(newVariant), newRow, newVariant) for newVariant, newRow in newData.items())
+    for rowDiff, newVariant in diffRows(v1v2, items, processes):
+        if newVariant not in oldData:
+            variantChangeTypes[newVariant] = CHANGE_TYPES['ADDED']
+            added.writerow(newData[newVariant])
+        else:
+            change_type = writeRowDiff(rowDiff)
+            logging.debug("newV: %s change_type: %s", newVariant, change_type)
+            assert(newVariant not in variantChangeTypes)
+            variantChangeTypes[newVariant] = change_type
+
+    # Adds change_type column and values for each variant in v2 to the output
+    appendVariantChangeTypesToOutput(variantChangeTypes, args.v2, args.output)
+
+    generateDiffJSONFile(diff_json, args.diff_json)
+
+
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--v2", default="built.tsv",
@@ -636,6 +1052,13 @@ def main():
     parser.add_argument("--diff_dir", help='Diff directory with outputs from this file.')
     parser.add_argument("--reports", help='True means the diff is run across reports instead of variants.',
                         default="False")
+    parser.add_argument("--sorted-merge", action="store_true",
+                        help="diff in a single merge pass over both files sorted by identifier instead of "
+                             "loading them into memory. Outputs are ordered by identifier")
+    parser.add_argument("--presorted", action="store_true",
+                        help="with --sorted-merge, v1 and v2 are sorted by identifier already and aren't sorted again")
+    parser.add_argument("-p", "--processes", type=int, default=1,
+                        help="number of processes comparing variants concurrently. Outputs don't depend on it")
 
     args = parser.parse_args()
 
@@ -664,55 +1087,13 @@ def main():
     else:
         reports = False
 
-    # Keep track of change types for all variants to append to final output file
-    variantChangeTypes = {}
-
     v1v2 = v1ToV2(v1In.fieldnames, v2In.fieldnames)
 
-    # Save the old variants in a dictionary for which the pyhgvs_genomic_coordinate_38
-    # string is the key, and for which the value is the full row.
-    oldData = {}
-    newData = {}
-    if reports is True:
-        # handle reports
-        for oldRow in v1In:
-            identifier = getIdentifier(oldRow, reports)
-            # if a new identifier is assigned, this will skip over old data that don't have the property
-            if identifier is not None and identifier in list(oldRow.keys()):
-                oldData[oldRow[identifier]] = oldRow
-
-        for newRow in v2In:
-            identifier = getIdentifier(newRow, reports)
-            if identifier is not None:
-                newData[newRow[identifier]] = newRow
-
+    if args.sorted_merge:
+        with tempfile.TemporaryDirectory(dir=args.artifacts_dir) as tmp_dir:
+            sortedMergeDiff(args, v1v2, removed, added, tmp_dir, processes=args.processes)
     else:
-        # handle variants
-        for oldRow in v1In:
-            oldRow = addGsIfNecessary(oldRow)
-            oldData[oldRow[getIdentifier(oldRow, reports)]] = oldRow
-        for newRow in v2In:
-            newRow = addGsIfNecessary(newRow)
-            newData[newRow[getIdentifier(newRow, reports)]] = newRow
-    for oldVariant in list(oldData.keys()):
-        if oldVariant not in newData:
-            removed.writerow(oldData[oldVariant])
-
-    for newVariant in list(newData.keys()):
-        if newVariant not in oldData:
-            variantChangeTypes[newVariant] = CHANGE_TYPES['ADDED']
-            added.writerow(newData[newVariant])
-        else:
-            logging.debug('Finding change type...')
-            change_type = v1v2.compareRow(oldData[newVariant], newData[newVariant], reports)
-            logging.debug("newV: %s change_type: %s", newVariant, change_type)
-            assert(newVariant not in variantChangeTypes)
-            variantChangeTypes[newVariant] = change_type
-
-    # Adds change_type column and values for each variant in v2 to the output
-    appendVariantChangeTypesToOutput(variantChangeTypes, args.v2, args.output)
-
-    generateDiffJSONFile(diff_json, args.diff_json)
+        diffInMemory(args, v1In, v2In, v1v2, removed, added, args.processes)
 
     generateReadme(args)
 
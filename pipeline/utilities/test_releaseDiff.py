@@ -2,6 +2,9 @@ import pytest
 import unittest
 import tempfile
 import csv
+import json
+import subprocess
+import sys
 from . import releaseDiff
 import copy
 from os import path
@@ -845,5 +848,141 @@ class TestStringMethods(unittest.TestCase):
         self.assertIsNone(change_type)
 
 
+def test_field_comparators():
+    v1v2 = releaseDiff.v1ToV2(['Source', 'Synonyms', 'SIFT_VEP', 'Allele_frequency_ExAC'],
+                              ['Source', 'Synonyms', 'Sift_Prediction', 'Allele_frequency_ExAC', 'Submitters_LOVD'])
+
+    def compare(field, oldRow, newRow):
+        return v1v2._comparator(field).compare(oldRow, newRow)[0]
+
+    assert compare('Synonyms', {'Synonyms': 'a, b'}, {'Synonyms': 'b,a'}) == releaseDiff.FIELD_UNCHANGED
+    assert compare('Synonyms', {'Synonyms': 'a'}, {'Synonyms': 'a,b'}) == releaseDiff.FIELD_ADDED_DATA
+    assert compare('Synonyms', {'Synonyms': 'a'}, {'Synonyms': 'b'}) == releaseDiff.FIELD_MAJOR_CHANGE
+    assert compare('Allele_frequency_ExAC', {'Allele_frequency_ExAC': '1.2341e-4'},
+                   {'Allele_frequency_ExAC': '0.0001234'}) == releaseDiff.FIELD_UNCHANGED
+    # renamed column
+    assert compare('Sift_Prediction', {'SIFT_VEP': 'deleterious('},
+                   {'Sift_Prediction': 'deleterious'}) == releaseDiff.FIELD_UNCHANGED
+    # new column
+    assert compare('Submitters_LOVD', {}, {'Submitters_LOVD': '-'}) == releaseDiff.FIELD_UNCHANGED
+    assert compare('Submitters_LOVD', {}, {'Submitters_LOVD': 'a'}) == releaseDiff.FIELD_ADDED_DATA
+
+
+def test_sort_by_identifier(tmp_path):
+    rows = [('b', ['1']), ('a', ['2']), ('c', ['3']), ('a', ['4']), ('b', ['5\t"x"'])]
+
+    sorted_rows = list(releaseDiff.sortByIdentifier(rows, str(tmp_path), chunkSize=2))
+
+    assert sorted_rows == sorted(rows, key=lambda r: r[0])
+    assert list(releaseDiff.groupByIdentifier(sorted_rows, 'test.tsv')) == \
+        [('a', [['2'], ['4']]), ('b', [['1'], ['5\t"x"']]), ('c', [['3']])]
+
+    with pytest.raises(Exception):
+        list(releaseDiff.groupByIdentifier(rows, 'test.tsv'))
+
+
+def _write_release(path, fieldnames, rows):
+    with open(path, 'w') as f:
+        writer = csv.DictWriter(f, delimiter='\t', fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _run_release_diff(v1, v2, out_dir, extra_args):
+    outputs = {name: path.join(out_dir, name) for name in
+               ['removed.tsv', 'added.tsv', 'added_data.tsv', 'diff.txt', 'diff.json', 'output.tsv']}
+    subprocess.run([sys.executable, path.join(path.dirname(releaseDiff.__file__), 'releaseDiff.py'),
+                    '--v1', v1, '--v2', v2,
+                    '--removed', outputs['removed.tsv'], '--added', outputs['added.tsv'],
+                    '--added_data', outputs['added_data.tsv'], '--diff', outputs['diff.txt'],
+                    '--diff_json', outputs['diff.json'], '--output', outputs['output.tsv'],
+                    '--artifacts_dir', out_dir, '--diff_dir', out_dir, '--v1_release_date', '2020-01-01'] + extra_args, check=True)
+    return outputs
+
+
+def _write_test_releases(tmp_path):
+    fieldnames = ['Source', 'pyhgvs_Genomic_Coordinate_38', 'pyhgvs_Genomic_Coordinate_37', 'SCV_ClinVar',
+                  'Submission_ID_LOVD', 'Pathogenicity_all', 'Synonyms']
+
+    def row(i, source='ClinVar', pathogenicity='Benign (ClinVar)', synonyms='-', coordinate='chr17:g.{}:A>G'):
+        return {'Source': source, 'pyhgvs_Genomic_Coordinate_38': coordinate.format(43000000 + i),
+                'pyhgvs_Genomic_Coordinate_37': 'chr17:g.{}:A>G'.format(41000000 + i),
+                'SCV_ClinVar': 'SCV{:09d}'.format(i), 'Submission_ID_LOVD': str(i),
+                'Pathogenicity_all': pathogenicity, 'Synonyms': synonyms}
+
+    # older releases lack the 'g.' in genomic coordinates
+    v1_rows = [row(5), row(1), row(3, coordinate='chr17:{}:A>G'), row(2), row(7, source='LOVD'), row(8, source='BIC')]
+    v2_rows = [row(3, pathogenicity='Pathogenic (ClinVar)'), row(4), row(9, source='ExAC'), row(1, synonyms='c.1A>G'),
+               row(7, source='LOVD'), row(6), row(2), row(6, synonyms='c.6A>G')]
+    v1 = str(tmp_path / 'v1.tsv')
+    v2 = str(tmp_path / 'v2.tsv')
+    _write_release(v1, fieldnames, v1_rows)
+    _write_release(v2, fieldnames, v2_rows)
+    return v1, v2
+
+
+@pytest.mark.parametrize("is_report", [False, True])
+def test_sorted_merge_diff_same_as_in_memory(tmp_path, is_report):
+    v1, v2 = _write_test_releases(tmp_path)
+
+    (tmp_path / 'in_memory').mkdir()
+    (tmp_path / 'sorted_merge').mkdir()
+    extra_args = ['--reports', 'True'] if is_report else []
+    expected = _run_release_diff(v1, v2, str(tmp_path / 'in_memory'), extra_args)
+    result = _run_release_diff(v1, v2, str(tmp_path / 'sorted_merge'), extra_args + ['--sorted-merge'])
+
+    def read_lines(p):
+        with open(p) as f:
+            lines = f.read().splitlines()
+        return lines[0], sorted(lines[1:])
+
+    for name in ['removed.tsv', 'added.tsv', 'output.tsv']:
+        assert read_lines(result[name]) == read_lines(expected[name])
+    with open(result['output.tsv']) as f:
+        assert 'changed_classification' in f.read()
+
+    for name in ['added_data.tsv', 'diff.txt']:
+        with open(result[name]) as f_result, open(expected[name]) as f_expected:
+            assert sorted(f_result.read().split('\n\n')) == sorted(f_expected.read().split('\n\n'))
+
+    with open(result['diff.json']) as f_result, open(expected['diff.json']) as f_expected:
+        assert json.load(f_result) == json.load(f_expected)
+
+
+@pytest.mark.parametrize("extra_args", [[], ['--sorted-merge'], ['--reports', 'True', '--sorted-merge']])
+def test_release_diff_output_independent_of_processes(tmp_path, extra_args):
+    v1, v2 = _write_test_releases(tmp_path)
+
+    outputs = []
+    for processes in ['1', '3']:
+        out_dir = tmp_path / processes
+        out_dir.mkdir()
+        outputs.append(_run_release_diff(v1, v2, str(out_dir), extra_args + ['--processes', processes]))
+
+    for name in outputs[0]:
+        with open(outputs[0][name], 'rb') as f_single, open(outputs[1][name], 'rb') as f_parallel:
+            assert f_parallel.read() == f_single.read()
+
+
+def test_diff_rows_in_process_pool():
+    fieldnames = ['Source', 'pyhgvs_Genomic_Coordinate_38', 'pyhgvs_Genomic_Coordinate_37', 'Synonyms']
+    v1v2 = releaseDiff.v1ToV2(fieldnames, fieldnames)
+
+    def row(i, synonyms):
+        return {'Source': 'ClinVar', 'pyhgvs_Genomic_Coordinate_38': 'chr17:g.{}:A>G'.format(i),
+                'pyhgvs_Genomic_Coordinate_37': 'chr17:g.{}:A>G'.format(i), 'Synonyms': synonyms}
+
+    items = [(row(i, 'a'), row(i, 'a,b' if i % 3 else 'c'), i) for i in range(10)] + [(None, row(10, 'a'), 10)]
+
+    expected = list(releaseDiff.diffRows(v1v2, iter(items)))
+    result = list(releaseDiff.diffRows(v1v2, iter(items), processes=2, batchSize=2))
+
+    assert result == expected
+    assert [payload for _, payload in result] == list(range(11))
+    assert [d.change_type for d, _ in result[:4]] == ['changed_information', 'added_information',
+                                                      'added_information', 'changed_information']
+    assert result[-1][0] is None
+
+
 if __name__ == '__main__':
     unittest.main()
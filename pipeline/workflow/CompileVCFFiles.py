@@ -3,7 +3,6 @@ import json
 import os
 import shutil
 import subprocess
-import tarfile
 import tempfile
 from pathlib import Path
 from shutil import copy
@@ -13,13 +12,15 @@ from luigi.util import requires
 
 luigi.auto_namespace(scope=__name__)
 
-from workflow import analysis, esp_processing, gnomad_processing, pipeline_common, pipeline_utils
-from workflow.pipeline_common import DefaultPipelineTask, clinvar_method_dir, lovd_method_dir, \
+from workflow import analysis, esp_processing, gnomad_processing, incremental_build, pipeline_common, pipeline_utils, \
+    sharding
+from workflow.pipeline_common import DefaultPipelineTask, PipelineParams, clinvar_method_dir, lovd_method_dir, \
     functional_assays_method_dir, data_merging_method_dir, priors_method_dir, priors_filter_method_dir, \
     utilities_method_dir, vr_method_dir, splice_ai_method_dir, field_metadata_path, field_metadata_path_additional
 
-from common import utils
-from data_merging import generate_variants_output_file
+from common import config, utils
+from data_merging import brca_pseudonym_generator, generate_variants_output_file, variant_merging
+from data_merging.variant_merging_constants import ENIGMA_FILE, FIELD_DICT
 
 #######################################
 # Default Globals / Env / Directories #
@@ -62,12 +63,15 @@ class ConvertClinvarXMLToTXT(DefaultPipelineTask):
     def output(self):
         return luigi.LocalTarget(self.clinvar_file_dir + "/ClinVar.txt")
 
+    def side_outputs(self):
+        return [self.clinvar_file_dir + "/clinvar_xml_to_txt.log"]
+
     def run(self):
         os.chdir(clinvar_method_dir)
 
         args = ["python", "clinVarParse.py",
                 self.input().path,
-                "--logs", self.clinvar_file_dir + "/clinvar_xml_to_txt.log",
+                "--logs", self.side_outputs()[0],
                 "--assembly", "GRCh38"]
 
         pipeline_utils.run_process(args, redirect_stdout_path=self.output().path)
@@ -163,13 +167,16 @@ class ConvertEXLOVDBRCA1ExtractToVCF(DefaultPipelineTask):
     def output(self):
         return luigi.LocalTarget(os.path.join(self.ex_lovd_file_dir, "exLOVD_brca1.hg19.vcf"))
 
+    def side_outputs(self):
+        return [os.path.join(self.artifacts_dir, "exLOVD_BRCA1_error_variants.txt")]
+
     def run(self):
         os.chdir(lovd_method_dir)
 
         args = ["./lovd2vcf.py", "-i", self.ex_lovd_file_dir + "/BRCA1.txt", "-o",
                 self.output().path, "-a",
                 "exLOVDAnnotation", "-e",
-                os.path.join(self.artifacts_dir, "exLOVD_BRCA1_error_variants.txt"),
+                self.side_outputs()[0],
                 "-s", "exLOVD"]
 
         pipeline_utils.run_process(args)
@@ -182,13 +189,16 @@ class ConvertEXLOVDBRCA2ExtractToVCF(DefaultPipelineTask):
     def output(self):
         return luigi.LocalTarget(self.ex_lovd_file_dir + "/exLOVD_brca2.hg19.vcf")
 
+    def side_outputs(self):
+        return [os.path.join(self.artifacts_dir, "exLOVD_BRCA2_error_variants.txt")]
+
     def run(self):
         os.chdir(lovd_method_dir)
 
         args = ["./lovd2vcf.py", "-i", self.ex_lovd_file_dir + "/BRCA2.txt", "-o",
                 self.output().path, "-a",
                 "exLOVDAnnotation", "-e",
-                os.path.join(self.artifacts_dir, "exLOVD_BRCA2_error_variants.txt"),
+                self.side_outputs()[0],
                 "-s", "exLOVD"]
 
         pipeline_utils.run_process(args)
@@ -213,6 +223,9 @@ class CrossmapConcatenatedEXLOVDData(DefaultPipelineTask):
     def output(self):
         return luigi.LocalTarget(self.ex_lovd_file_dir + "/exLOVD_brca12.hg38.vcf")
 
+    def side_outputs(self):
+        return [pipeline_utils.crossmap_unmapped_path(self.output().path)]
+
     def run(self):
         brca_resources_dir = self.cfg.resources_dir
 
@@ -305,12 +318,15 @@ class NormalizeLOVDSubmissions(DefaultPipelineTask):
     def output(self):
         return luigi.LocalTarget(f"{self.lovd_file_dir}/LOVD_normalized.tsv")
 
+    def side_outputs(self):
+        return [f"{self.artifacts_dir}/LOVD_bracket_variants.tsv"]
+
     def run(self):
         os.chdir(lovd_method_dir)
         args = ["python", "normalizeLOVDSubmissions.py", "-i",
                 self.input().path, "-o",
                 self.output().path, "-b",
-                f"{self.artifacts_dir}/LOVD_bracket_variants.tsv"]
+                self.side_outputs()[0]]
         pipeline_utils.run_process(args)
         pipeline_utils.check_file_for_contents(self.output().path)
 
@@ -334,11 +350,14 @@ class ConvertSharedLOVDToVCF(DefaultPipelineTask):
     def output(self):
         return luigi.LocalTarget(f"{self.lovd_file_dir}/sharedLOVD.hg19.vcf")
 
+    def side_outputs(self):
+        return [f"{self.artifacts_dir}/LOVD_error_variants.txt"]
+
     def run(self):
         os.chdir(lovd_method_dir)
         args = ["python", "lovd2vcf.py", "-i", self.input().path, "-o",
                 self.output().path, "-a", "sharedLOVDAnnotation", "-e",
-                f"{self.artifacts_dir}/LOVD_error_variants.txt",
+                self.side_outputs()[0],
                 "-s", "LOVD"]
         pipeline_utils.run_process(args)
         pipeline_utils.check_file_for_contents(self.output().path)
@@ -349,6 +368,9 @@ class CrossmapConcatenatedSharedLOVDData(DefaultPipelineTask):
     def output(self):
         return luigi.LocalTarget(f"{self.lovd_file_dir}/sharedLOVD.hg38.vcf")
 
+    def side_outputs(self):
+        return [pipeline_utils.crossmap_unmapped_path(self.output().path)]
+
     def run(self):
         brca_resources_dir = self.cfg.resources_dir
 
@@ -462,6 +484,9 @@ class ExtractEnigmaFromClinvar(DefaultPipelineTask):
     def output(self):
         return luigi.LocalTarget(os.path.join(self.enigma_file_dir, 'enigma_from_clinvar.tsv'))
 
+    def side_outputs(self):
+        return [os.path.join(self.enigma_file_dir, 'enigma_from_clinvar.log')]
+
     def run(self):
         os.chdir(clinvar_method_dir)
 
@@ -469,7 +494,7 @@ class ExtractEnigmaFromClinvar(DefaultPipelineTask):
 
         args = ["python", "enigma_from_clinvar.py", self.input().path,
                 self.output().path,
-                '--logs', os.path.join(self.enigma_file_dir, 'enigma_from_clinvar.log')
+                '--logs', self.side_outputs()[0]
                ] + genes_opts
 
         pipeline_utils.run_process(args)
@@ -508,12 +533,15 @@ class ConvertFunctionalAssaysToVCF(DefaultPipelineTask):
     def output(self):
         return luigi.LocalTarget(self.assays_dir + "/ENIGMA_BRCA12_functional_assays_scores.hg19.vcf")
 
+    def side_outputs(self):
+        return [self.artifacts_dir + "/functional_assays_error_variants.log"]
+
     def run(self):
         os.chdir(functional_assays_method_dir)
 
         args = ["python", "convert_functional_assay_tsv_to_vcf.py", "-v", "-i", self.input().path, "-o",
                 self.output().path, "-a", "functionalAssayAnnotation",
-                "-l", self.artifacts_dir + "/functional_assays_error_variants.log",
+                "-l", self.side_outputs()[0],
                 "-s", "ENIGMABRCA12FunctionalAssaysFunctionScores"]
 
         pipeline_utils.run_process(args)
@@ -525,6 +553,9 @@ class CrossmapFunctionalAssays(DefaultPipelineTask):
     def output(self):
         return luigi.LocalTarget(os.path.join(self.assays_dir, "ENIGMA_BRCA12_functional_assays_scores.hg38.vcf"))
 
+    def side_outputs(self):
+        return [pipeline_utils.crossmap_unmapped_path(self.output().path)]
+
     def run(self):
         brca_resources_dir = self.cfg.resources_dir
 
@@ -563,84 +594,340 @@ class CopyFunctionalAssaysOutputToOutputDir(DefaultPipelineTask):
 ###############################################
 
 
-class MergeVCFsIntoTSVFile(DefaultPipelineTask):
+def source_requirements():
+    return [pipeline_common.CopyOutputToOutputDir(PipelineParams.get_instance().output_dir,
+                                                  esp_processing.DownloadStaticESPData()),
+            pipeline_common.CopyOutputToOutputDir(PipelineParams.get_instance().output_dir,
+                                                  gnomad_processing.DownloadStaticGnomADVCF()),
+            CopyClinvarVCFToOutputDir(),
+            CopyBICOutputToOutputDir(),
+            CopyG1KOutputToOutputDir(),
+            CopyEXACOutputToOutputDir(),
+            CopyEXLOVDOutputToOutputDir(),
+            CopySharedLOVDOutputToOutputDir(),
+            CopyEnigmaOutputToOutputDir(),
+            CopyFunctionalAssaysOutputToOutputDir()]
+
+
+def variant_merging_args(input_dir, output_dir, gene_config_path, processes):
+    return ["python", "variant_merging.py", "-i", input_dir + "/",
+            "-o", output_dir + '/',
+            "-a", output_dir + '/', "-v",
+            "-c", gene_config_path,
+            "-p", str(processes)]
+
+
+def variant_merging_side_outputs(output_dir):
+    """
+    Paths of the files variant_merging.py writes to its output directory besides merged.tsv and reports.tsv, e.g. the
+    preprocessed sources read by check_for_missing_reports.py.
+    """
+    names = ["variant_merging.log", "discarded_reports.tsv", ENIGMA_FILE, sharding.ENIGMA_WRONG_GENOME_FILE,
+             variant_merging.PREPROCESSING_FINGERPRINTS_FILE, sharding.WRONG_GENOME_COORS_DIR]
+    for source_name in FIELD_DICT:
+        names.extend(f for f in variant_merging.preprocessed_source_files(source_name)
+                     if os.path.dirname(f) != sharding.WRONG_GENOME_COORS_DIR)
+    return [os.path.join(output_dir, n) for n in names]
+
+
+def aggregate_args(input_path, output_path):
+    return ["python", "aggregate_across_columns.py",
+            "-i", input_path,
+            "-o", output_path,
+            "--engine", "columns"]
+
+
+def pseudonym_generator_args(input_path, output_path, log_path, gene_config_path, resources_dir, previous_args=()):
+    return ["python", "brca_pseudonym_generator.py",
+            input_path,
+            output_path,
+            "--log-path", log_path,
+            "--config-file", gene_config_path,
+            "--resources", resources_dir] + list(previous_args)
+
+
+def pseudonym_generator_side_outputs(output_path, log_dir):
+    """
+    Paths of the log of brca_pseudonym_generator.py and of the data version it writes next to its output.
+    """
+    return [os.path.join(log_dir, "brca-pseudonym-generator.log"),
+            output_path + brca_pseudonym_generator.DATA_VERSION_SUFFIX]
+
+
+def previous_pseudonyms_args(cfg, tmp_dir):
+    """
+    Arguments for the pseudonym generator to take over the derived columns of unchanged variants
+    from the previous release if enabled via PipelineParams.reuse_previous_pseudonyms and the previous release
+    contains the output of the pseudonym generator and its data version.
+    """
+    if not cfg.reuse_previous_pseudonyms or cfg.previous_release_tar == str(None):
+        return []
+
+    try:
+        previous_output = pipeline_utils.extract_file(cfg.previous_release_tar, tmp_dir,
+                                                      incremental_build.PREVIOUS_PSEUDONYMS_PATH)
+        previous_data_version = pipeline_utils.extract_file(cfg.previous_release_tar, tmp_dir,
+                                                            incremental_build.PREVIOUS_PSEUDONYMS_DATA_VERSION_PATH)
+    except KeyError:
+        print("No pseudonym generator output found in previous release, computing all variants")
+        return []
+
+    return ["--previous-output", previous_output, "--previous-data-version", previous_data_version]
+
+
+class ShardTask(DefaultPipelineTask):
+    """
+    Task run for a single shard of the genes (see common.config.split_config) when sharding is enabled
+    via PipelineParams.shard_by. Outputs are written to a separate artifacts directory per shard.
+    """
+    shard = luigi.Parameter()
+
+    def __init__(self, *args, **kwargs):
+        super(ShardTask, self).__init__(*args, **kwargs)
+
+        self.shard_dir = pipeline_utils.create_path_if_nonexistent(
+            os.path.join(self.artifacts_dir, sharding.SHARDS_DIR, self.shard))
+
+
+class WriteShardGeneConfig(ShardTask):
+    def output(self):
+        return luigi.LocalTarget(os.path.join(self.shard_dir, sharding.SHARD_GENE_CONFIG_FILE))
+
+    def run(self):
+        config.save_config(self.cfg.gene_shards[self.shard], self.output().path)
+
+
+class MergeShardVCFsIntoTSVFile(ShardTask):
     def requires(self):
-        yield pipeline_common.CopyOutputToOutputDir(self.cfg.output_dir,
-                                                    esp_processing.DownloadStaticESPData())
-        yield pipeline_common.CopyOutputToOutputDir(self.cfg.output_dir,
-                                                    gnomad_processing.DownloadStaticGnomADVCF())
-        yield CopyClinvarVCFToOutputDir()
-        yield CopyBICOutputToOutputDir()
-        yield CopyG1KOutputToOutputDir()
-        yield CopyEXACOutputToOutputDir()
-        yield CopyEXLOVDOutputToOutputDir()
-        yield CopySharedLOVDOutputToOutputDir()
-        yield CopyEnigmaOutputToOutputDir()
-        yield CopyFunctionalAssaysOutputToOutputDir()
+        return {'sources': source_requirements(),
+                'gene_config': WriteShardGeneConfig(shard=self.shard)}
 
     def output(self):
-        return {'merged': luigi.LocalTarget(os.path.join(self.artifacts_dir, "merged.tsv")),
-                'reports': luigi.LocalTarget(os.path.join(self.artifacts_dir, "reports.tsv"))}
+        return {'merged': luigi.LocalTarget(os.path.join(self.shard_dir, "merged.tsv")),
+                'reports': luigi.LocalTarget(os.path.join(self.shard_dir, "reports.tsv"))}
+
+    def side_outputs(self):
+        return variant_merging_side_outputs(self.shard_dir)
 
     def run(self):
         os.chdir(data_merging_method_dir)
 
-        args = ["python", "variant_merging.py", "-i", self.cfg.output_dir + "/",
-                "-o",
-                self.artifacts_dir + '/', "-a",
-                self.artifacts_dir + '/', "-v",
-                "-c", self.cfg.gene_config_path]
+        args = variant_merging_args(self.cfg.output_dir, self.shard_dir, self.cfg.gene_config_path,
+                                    self.cfg.merge_processes)
+        args.extend(["--shard-config", self.input()['gene_config'].path])
+
+        if self.cfg.incremental_build and str(self.cfg.previous_artifacts_dir) != str(None):
+            args.extend(["--previous-artifacts-dir",
+                         os.path.join(self.cfg.previous_artifacts_dir, sharding.SHARDS_DIR, self.shard) + '/'])
 
         pipeline_utils.run_process(args)
 
-        pipeline_utils.check_file_for_contents(self.output()['merged'].path)
         pipeline_utils.check_file_for_contents(self.output()['reports'].path)
 
 
-@requires(MergeVCFsIntoTSVFile)
-class AggregateMergedOutput(DefaultPipelineTask):
+@requires(MergeShardVCFsIntoTSVFile)
+class AggregateShardMergedOutput(ShardTask):
     def output(self):
-        return luigi.LocalTarget(os.path.join(self.artifacts_dir, "aggregated.tsv"))
+        return luigi.LocalTarget(os.path.join(self.shard_dir, "aggregated.tsv"))
 
     def run(self):
         os.chdir(data_merging_method_dir)
 
-        args = ["python", "aggregate_across_columns.py",
-                "-i", self.input()['merged'].path,
-                "-o", self.output().path]
-
-        pipeline_utils.run_process(args)
+        pipeline_utils.run_process(aggregate_args(self.input()['merged'].path, self.output().path))
 
         pipeline_utils.check_input_and_output_tsvs_for_same_number_variants(
             self.input()['merged'].path,
             self.output().path)
 
 
-@requires(AggregateMergedOutput)
-class BuildAggregatedOutput(DefaultPipelineTask):
+@requires(AggregateShardMergedOutput)
+class BuildShardAggregatedOutput(ShardTask):
     def output(self):
-        return luigi.LocalTarget(os.path.join(self.artifacts_dir, "built.tsv"))
+        return luigi.LocalTarget(os.path.join(self.shard_dir, "built.tsv"))
+
+    def side_outputs(self):
+        return pseudonym_generator_side_outputs(self.output().path, self.shard_dir)
 
     def run(self):
-        brca_resources_dir = self.cfg.resources_dir
         os.chdir(data_merging_method_dir)
+        tmp_dir = tempfile.mkdtemp()
 
-        args = ["python", "brca_pseudonym_generator.py",
-                self.input().path,
-                self.output().path,
-                "--log-path", os.path.join(self.artifacts_dir, "brca-pseudonym-generator.log"),
-                "--config-file", self.cfg.gene_config_path,
-                "--resources", brca_resources_dir]
+        args = pseudonym_generator_args(self.input().path, self.output().path,
+                                        self.side_outputs()[0],
+                                        os.path.join(self.shard_dir, sharding.SHARD_GENE_CONFIG_FILE),
+                                        self.cfg.resources_dir,
+                                        previous_pseudonyms_args(self.cfg, tmp_dir))
 
         pipeline_utils.run_process(args)
+        shutil.rmtree(tmp_dir)
 
         pipeline_utils.check_input_and_output_tsvs_for_same_number_variants(
             self.input().path,
             self.output().path)
 
 
+class MergeVCFsIntoTSVFile(DefaultPipelineTask):
+    def requires(self):
+        # with sharding enabled, the shards are merged in parallel and only combined here
+        return {'sources': source_requirements(),
+                'shards': [MergeShardVCFsIntoTSVFile(shard=s) for s in self.cfg.gene_shards]}
+
+    def output(self):
+        return {'merged': luigi.LocalTarget(os.path.join(self.artifacts_dir, "merged.tsv")),
+                'reports': luigi.LocalTarget(os.path.join(self.artifacts_dir, "reports.tsv"))}
+
+    def side_outputs(self):
+        return variant_merging_side_outputs(self.artifacts_dir) + \
+               [os.path.join(self.metadata_dir, incremental_build.BUILD_FINGERPRINTS_FILE)]
+
+    def run(self):
+        if self.cfg.gene_shards:
+            sharding.combine_merged_artifacts([os.path.dirname(t['merged'].path) for t in self.input()['shards']],
+                                              self.artifacts_dir, ENIGMA_FILE)
+        else:
+            self._merge()
+
+        pipeline_utils.check_file_for_contents(self.output()['merged'].path)
+        pipeline_utils.check_file_for_contents(self.output()['reports'].path)
+
+        # fingerprints of the inputs, part of the release archive to allow for incremental builds of the next release
+        incremental_build.write_fingerprints(
+            self.side_outputs()[-1],
+            incremental_build.build_fingerprints(self.cfg.gene_config_path, [t.path for t in self.input()['sources']]))
+
+    def _merge(self):
+        os.chdir(data_merging_method_dir)
+
+        args = variant_merging_args(self.cfg.output_dir, self.artifacts_dir, self.cfg.gene_config_path,
+                                    self.cfg.merge_processes)
+
+        if self.cfg.incremental_build and str(self.cfg.previous_artifacts_dir) != str(None):
+            args.extend(["--previous-artifacts-dir", self.cfg.previous_artifacts_dir + '/'])
+
+        pipeline_utils.run_process(args)
+
+
+class AggregateMergedOutput(DefaultPipelineTask):
+    def requires(self):
+        return {'merged': MergeVCFsIntoTSVFile(),
+                'shards': [AggregateShardMergedOutput(shard=s) for s in self.cfg.gene_shards]}
+
+    def output(self):
+        return luigi.LocalTarget(os.path.join(self.artifacts_dir, "aggregated.tsv"))
+
+    def run(self):
+        merged_path = self.input()['merged']['merged'].path
+
+        if self.cfg.gene_shards:
+            sharding.concatenate_tsvs([t.path for t in self.input()['shards']], self.output().path,
+                                      sort_variants=True)
+        else:
+            os.chdir(data_merging_method_dir)
+            pipeline_utils.run_process(aggregate_args(merged_path, self.output().path))
+
+        pipeline_utils.check_input_and_output_tsvs_for_same_number_variants(
+            merged_path,
+            self.output().path)
+
+
+@requires(AggregateMergedOutput)
+class ExtractChangedVariants(DefaultPipelineTask):
+    """
+    Extracts the variants whose merged row is new or changed since the previous release for incremental builds.
+    """
+    def output(self):
+        return luigi.LocalTarget(os.path.join(self.artifacts_dir, "aggregated_changed.tsv"))
+
+    def run(self):
+        tmp_dir = tempfile.mkdtemp()
+
+        fingerprints = incremental_build.read_fingerprints(
+            os.path.join(self.metadata_dir, incremental_build.BUILD_FINGERPRINTS_FILE))
+        try:
+            previous_fingerprints = incremental_build.read_fingerprints(pipeline_utils.extract_file(
+                self.cfg.previous_release_tar, tmp_dir, incremental_build.PREVIOUS_FINGERPRINTS_PATH))
+        except KeyError:
+            print("No fingerprints found in previous release")
+            previous_fingerprints = None
+
+        if previous_fingerprints is None or previous_fingerprints['gene_config'] != fingerprints['gene_config']:
+            print("Gene config changed or unknown, processing all variants")
+            _, rows = incremental_build.read_rows_by_key(self.input().path, incremental_build.BUILT_KEY_COLUMN)
+            changed_keys = set(rows.keys())
+        else:
+            print("Sources changed since previous release: %s" % (
+                incremental_build.changed_sources(fingerprints, previous_fingerprints)))
+            previous_merged_path = pipeline_utils.extract_file(
+                self.cfg.previous_release_tar, tmp_dir, incremental_build.PREVIOUS_MERGED_PATH)
+            changed_keys = incremental_build.changed_variant_keys(
+                previous_merged_path, os.path.join(self.artifacts_dir, "merged.tsv"))
+
+            # computed again as their rows can't be taken over, see AppendVRId
+            previous_built_path = pipeline_utils.extract_file(
+                self.cfg.previous_release_tar, tmp_dir, incremental_build.PREVIOUS_BUILT_PATH)
+            missing_keys = incremental_build.missing_variant_keys(self.input().path, previous_built_path)
+            print("Number of variants missing in previous release: %s" % (len(missing_keys - changed_keys)))
+            changed_keys |= missing_keys
+
+        n_changed = incremental_build.write_rows_with_keys(self.input().path, self.output().path, changed_keys)
+        print("Number of new or changed variants: %s" % (n_changed))
+
+        shutil.rmtree(tmp_dir)  # cleaning up
+
+
+class BuildAggregatedOutput(DefaultPipelineTask):
+    def requires(self):
+        requirements = {'aggregated': AggregateMergedOutput(),
+                        'shards': [BuildShardAggregatedOutput(shard=s) for s in self.cfg.gene_shards]}
+        # only new or changed variants are processed further in incremental builds, see AppendVRId
+        if self.cfg.incremental_build:
+            requirements['changed'] = ExtractChangedVariants()
+        return requirements
+
+    def output(self):
+        return luigi.LocalTarget(os.path.join(self.artifacts_dir, "built.tsv"))
+
+    def side_outputs(self):
+        side_outputs = pseudonym_generator_side_outputs(self.output().path, self.artifacts_dir)
+        if self.cfg.incremental_build:
+            side_outputs.append(os.path.join(self.artifacts_dir, "built_changed.tsv"))
+        return side_outputs
+
+    def run(self):
+        aggregated_path = self.input()['aggregated'].path
+
+        if self.input()['shards']:
+            shard_paths = [t.path for t in self.input()['shards']]
+            sharding.concatenate_tsvs(shard_paths, self.output().path, sort_variants=True)
+            brca_pseudonym_generator.merge_data_versions(
+                [p + brca_pseudonym_generator.DATA_VERSION_SUFFIX for p in shard_paths], self.side_outputs()[1])
+        else:
+            os.chdir(data_merging_method_dir)
+            tmp_dir = tempfile.mkdtemp()
+            args = pseudonym_generator_args(aggregated_path, self.output().path, self.side_outputs()[0],
+                                            self.cfg.gene_config_path, self.cfg.resources_dir,
+                                            previous_pseudonyms_args(self.cfg, tmp_dir))
+            pipeline_utils.run_process(args)
+            shutil.rmtree(tmp_dir)
+
+        pipeline_utils.check_input_and_output_tsvs_for_same_number_variants(
+            aggregated_path,
+            self.output().path)
+
+        if self.cfg.incremental_build:
+            # built.tsv keeps all variants, such that the next release can take over their derived columns
+            _, changed_rows = incremental_build.read_rows_by_key(self.input()['changed'].path,
+                                                                 incremental_build.BUILT_KEY_COLUMN)
+            incremental_build.write_rows_with_keys(self.output().path, self.side_outputs()[2], set(changed_rows.keys()))
+            pipeline_utils.check_input_and_output_tsvs_for_same_number_variants(
+                self.input()['changed'].path,
+                self.side_outputs()[2])
+
+
 @requires(BuildAggregatedOutput)
 class AppendCAID(DefaultPipelineTask):
+    # the ids are looked up in the ClinGen allele registry
+    cache_output = False
 
     def output(self):
         artifacts_dir = self.cfg.output_dir + "/release/artifacts/"
@@ -652,8 +939,11 @@ class AppendCAID(DefaultPipelineTask):
         brca_resources_dir = self.cfg.resources_dir
         os.chdir(data_merging_method_dir)
 
+        # only new or changed variants in incremental builds, see BuildAggregatedOutput
+        built_file = "built_changed.tsv" if self.cfg.incremental_build else "built.tsv"
+
         args = ["python", "get_ca_id.py", "-i",
-                artifacts_dir + "built.tsv", "-o",
+                artifacts_dir + built_file, "-o",
                 artifacts_dir + "/built_with_ca_ids.tsv", "-l",
                 artifacts_dir + "/get_ca_id.log"]
         print("Running get_ca_id.py with the following args: %s" % (
@@ -663,7 +953,7 @@ class AppendCAID(DefaultPipelineTask):
         pipeline_utils.print_subprocess_output_and_error(sp)
 
         pipeline_utils.check_input_and_output_tsvs_for_same_number_variants(
-            artifacts_dir + "built.tsv",
+            artifacts_dir + built_file,
             artifacts_dir + "built_with_ca_ids.tsv")
 
 
@@ -753,15 +1043,26 @@ class AppendVRId(DefaultPipelineTask):
     def output(self):
         return luigi.LocalTarget(os.path.join(self.artifacts_dir, "built_with_vr_ids.tsv"))
 
+    def side_outputs(self):
+        # only the variants which changed since the previous release are computed in incremental builds
+        if self.cfg.incremental_build:
+            return [os.path.join(self.artifacts_dir, "built_with_vr_ids_changed.tsv")]
+        return []
+
     def run(self):
         artifacts_dir_host = self.cfg.output_dir_host + "/release/artifacts/"
         os.chdir(vr_method_dir)
 
+        if self.cfg.incremental_build:
+            vr_ids_file = 'built_with_vr_ids_changed.tsv'
+        else:
+            vr_ids_file = 'built_with_vr_ids.tsv'
+
         args = [
             'bash', 'appendvrids.sh',
             artifacts_dir_host,
             'built_with_priors_clean.tsv',
-            'built_with_vr_ids.tsv',
+            vr_ids_file,
              self.cfg.seq_repo_dir
         ]
 
@@ -770,7 +1071,27 @@ class AppendVRId(DefaultPipelineTask):
         # we shouldn't be gaining or losing any variants
         pipeline_utils.check_input_and_output_tsvs_for_same_number_variants(
             self.input().path,
-            self.output().path)
+            os.path.join(self.artifacts_dir, vr_ids_file))
+
+        if self.cfg.incremental_build:
+            self._splice_unchanged_variants(os.path.join(self.artifacts_dir, vr_ids_file))
+
+    def _splice_unchanged_variants(self, changed_path):
+        # taking over rows of variants which didn't change from the previous release
+        tmp_dir = tempfile.mkdtemp()
+        previous_data_path = pipeline_utils.extract_file(
+            self.cfg.previous_release_tar, tmp_dir, incremental_build.PREVIOUS_BUILT_PATH)
+
+        _, changed_rows = incremental_build.read_rows_by_key(
+            os.path.join(self.artifacts_dir, "aggregated_changed.tsv"), incremental_build.BUILT_KEY_COLUMN)
+
+        n_changed, n_unchanged = incremental_build.splice_unchanged_rows(
+            os.path.join(self.artifacts_dir, "aggregated.tsv"), set(changed_rows.keys()), changed_path,
+            previous_data_path, self.output().path)
+        print("Number of recomputed variants: %s \nNumber of variants taken from previous release: %s\n" % (
+            n_changed, n_unchanged))
+
+        shutil.rmtree(tmp_dir)  # cleaning up
 
 
 @requires(analysis.runPopfreqAssessment)
@@ -807,6 +1128,9 @@ class RunDiffAndAppendChangeTypesToOutput(DefaultPipelineTask):
                 'diff_json': luigi.LocalTarget(os.path.join(self.diff_dir , "diff.json")),
                 'README': luigi.LocalTarget(os.path.join(self.diff_dir , "README.txt"))}
 
+    def side_outputs(self):
+        return [os.path.join(self.artifacts_dir, "releaseDiff.log")]
+
     def run(self):
         os.chdir(utilities_method_dir)
 
@@ -831,7 +1155,8 @@ class RunDiffAndAppendChangeTypesToOutput(DefaultPipelineTask):
                 "--output", os.path.join(self.release_dir, "built_with_change_types.tsv"),
                 "--artifacts_dir", self.artifacts_dir,
                 "--diff_dir", self.diff_dir, "--v1_release_date",
-                previous_release_date_str, "--reports", "False"]
+                previous_release_date_str, "--reports", "False",
+                "--processes", str(self.cfg.diff_processes)]
 
         pipeline_utils.run_process(args)
 
@@ -864,6 +1189,9 @@ class RunDiffAndAppendChangeTypesToOutputReports(DefaultPipelineTask):
                     os.path.join(self.diff_dir, "diff_reports.json")),
                 'README': luigi.LocalTarget(os.path.join(self.diff_dir, "README.txt"))}
 
+    def side_outputs(self):
+        return [os.path.join(self.artifacts_dir, "releaseDiff.log")]
+
     def run(self):
         os.chdir(utilities_method_dir)
 
@@ -888,7 +1216,9 @@ class RunDiffAndAppendChangeTypesToOutputReports(DefaultPipelineTask):
                 "--output", self.output()['reports_with_change_types'].path,
                 "--artifacts_dir", self.artifacts_dir,
                 "--diff_dir", self.diff_dir, "--v1_release_date",
-                previous_release_date_str, "--reports", "True"]
+                previous_release_date_str, "--reports", "True",
+                # reports outnumber variants by far, diffing them without holding both releases in memory
+                "--sorted-merge", "--processes", str(self.cfg.diff_processes)]
 
         pipeline_utils.run_process(args)
 
@@ -901,6 +1231,9 @@ class RunDiffAndAppendChangeTypesToOutputReports(DefaultPipelineTask):
 
 @requires(RunDiffAndAppendChangeTypesToOutput)
 class LinkBuiltFinal(DefaultPipelineTask):
+    # the output is a symlink, which the output cache would materialize as a copy of the file
+    cache_output = False
+
     def output(self):
         return luigi.LocalTarget(os.path.join(self.release_dir, "built_final.tsv"))
 
@@ -1016,16 +1349,5 @@ class GenerateReleaseArchive(DefaultPipelineTask):
         return luigi.LocalTarget(Path(self.cfg.output_dir).parent / archive_name)
 
     def run(self):
-        # parse md5sum list.
-        with open(self.input().path) as f:
-            file_list = [line.strip().split(' ')[-1] for line in f.readlines()]
-
-        # include md5sum in tar as well
-        file_list.append(Path(self.input().path).name)
-
-        output_dir = Path(self.cfg.output_dir)
-        with tarfile.open(self.output().path, "w:gz") as tar:
-            for file in file_list:
-                file_path = output_dir / file
-                tar.add(file_path, arcname=Path(output_dir.name) / file)
+        pipeline_utils.write_release_archive(self.input().path, self.cfg.output_dir, self.output().path)
 
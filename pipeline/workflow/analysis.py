@@ -12,6 +12,9 @@ from workflow import bayesdel_processing
 
 @requires(bayesdel_processing.AddBayesdelScores)
 class DownloadResources(DefaultPipelineTask):
+    # downloads data, its input only orders it after the bayesdel scores
+    cache_output = False
+
     def output(self):
         return(luigi.LocalTarget(Path(self.cfg.output_dir) / 'release' / 'artifacts' / 'analysis'))
 
@@ -47,6 +47,9 @@ class ConvertGnomADToVCF(GnomADTask):
         return { "v2": luigi.LocalTarget(f"{self.gnomad_file_dir}/gnomADv2.hg19.vcf"),
                  "v3": luigi.LocalTarget(f"{self.gnomad_file_dir}/gnomADv3.hg38.vcf")}
 
+    def side_outputs(self):
+        return [self.artifacts_dir + "/gnomADv2_error_variants.log"]
+
     def run(self):
         os.chdir(gnomAD_method_dir)
 
@@ -57,7 +60,7 @@ class ConvertGnomADToVCF(GnomADTask):
                 annotation = "gnomADAnnotation"
             args = ["python", "gnomad_to_vcf.py", "-i", v.path, "-o",
                     self.output()[k].path, "-a", annotation,
-                    "-l", self.artifacts_dir + "/gnomADv2_error_variants.log",
+                    "-l", self.side_outputs()[0],
                     "-s", "gnomAD"]
 
             pipeline_utils.run_process(args)
@@ -69,6 +72,9 @@ class CrossmapGnomADV2Data(GnomADTask):
     def output(self):
         return luigi.LocalTarget(os.path.join(self.gnomad_file_dir, "gnomADv2.hg38.vcf"))
 
+    def side_outputs(self):
+        return [pipeline_utils.crossmap_unmapped_path(self.output().path)]
+
     def run(self):
         brca_resources_dir = self.cfg.resources_dir
 
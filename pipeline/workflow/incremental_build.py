@@ -0,0 +1,197 @@
+"""
+Helpers for building a release incrementally on top of the previous one.
+
+Variants whose merged row didn't change since the previous release are not run through the per variant
+annotation tasks again. Instead, their rows are taken over from the previous release's output.
+"""
+import json
+import logging
+import os
+
+from common.utils import file_fingerprint
+
+BUILD_FINGERPRINTS_FILE = "build_fingerprints.json"
+
+# paths within the release archive
+PREVIOUS_MERGED_PATH = 'output/release/artifacts/merged.tsv'
+PREVIOUS_BUILT_PATH = 'output/release/built_with_change_types.tsv'
+PREVIOUS_FINGERPRINTS_PATH = 'output/release/metadata/' + BUILD_FINGERPRINTS_FILE
+# output of the pseudonym generator and its data version stamp (see brca_pseudonym_generator.DATA_VERSION_SUFFIX),
+# covering all variants in incremental builds as well
+PREVIOUS_PSEUDONYMS_PATH = 'output/release/artifacts/built.tsv'
+PREVIOUS_PSEUDONYMS_DATA_VERSION_PATH = PREVIOUS_PSEUDONYMS_PATH + '.data_version.json'
+
+# column identifying a variant in merged.tsv and in the files derived from aggregated.tsv, respectively
+MERGED_KEY_COLUMN = "Genomic_Coordinate"
+BUILT_KEY_COLUMN = "Genomic_Coordinate_hg38"
+
+# report ids per source (e.g. BX_ID_ClinVar). They are numbered by the order of the reports in the source files,
+# so they shift for all variants whenever a source changes, without the variants' data changing
+REPORT_ID_COLUMN_PREFIX = "BX_ID_"
+
+
+def is_report_id_column(column):
+    return column.startswith(REPORT_ID_COLUMN_PREFIX)
+
+
+def build_fingerprints(gene_config_path, source_paths):
+    """
+    Fingerprints the inputs of a release, i.e. the gene config and the VCF/TSV file of every source.
+    """
+    return {'gene_config': file_fingerprint(gene_config_path),
+            'sources': {os.path.basename(p): file_fingerprint(p) for p in source_paths}}
+
+
+def write_fingerprints(path, fingerprints):
+    with open(path, 'w') as f:
+        json.dump(fingerprints, f, indent=2, sort_keys=True)
+
+
+def read_fingerprints(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def changed_sources(fingerprints, previous_fingerprints):
+    return sorted(s for s, fp in fingerprints['sources'].items()
+                  if previous_fingerprints['sources'].get(s) != fp)
+
+
+def _read_header(f, key_column):
+    header = f.readline().rstrip('\n').split('\t')
+    return header, header.index(key_column)
+
+
+def read_rows_by_key(path, key_column):
+    """
+    Reads a tsv file into a dictionary from the key column to the unparsed line.
+
+    :return: Tuple[List[str], Dict[str, str]]: header and rows by key
+    """
+    with open(path, 'r') as f:
+        header, key_idx = _read_header(f, key_column)
+        rows = {line.split('\t')[key_idx].rstrip('\n'): line for line in f}
+    return header, rows
+
+
+def read_keys(path, key_column):
+    with open(path, 'r') as f:
+        _, key_idx = _read_header(f, key_column)
+        return {line.split('\t')[key_idx].rstrip('\n') for line in f}
+
+
+def _content_values(header):
+    """
+    Returns a function mapping a tsv line to its values other than the report ids
+    """
+    content_idxs = [i for i, c in enumerate(header) if not is_report_id_column(c)]
+
+    def values(line):
+        all_values = line.rstrip('\n').split('\t')
+        return [all_values[i] for i in content_idxs]
+
+    return values
+
+
+def changed_variant_keys(previous_merged_path, merged_path, key_column=MERGED_KEY_COLUMN):
+    """
+    Determines variants whose merged row is new or differs from the previous release.
+    Report ids are not compared, see REPORT_ID_COLUMN_PREFIX.
+    All variants are considered changed if the columns differ.
+
+    :return: set of variant keys
+    """
+    previous_header, previous_rows = read_rows_by_key(previous_merged_path, key_column)
+    header, rows = read_rows_by_key(merged_path, key_column)
+
+    if header != previous_header:
+        logging.info("Columns of %s changed, considering all variants as changed", merged_path)
+        return set(rows.keys())
+
+    values = _content_values(header)
+    return {k for k, line in rows.items() if k not in previous_rows or values(previous_rows[k]) != values(line)}
+
+
+def missing_variant_keys(all_variants_path, previous_path, key_column=BUILT_KEY_COLUMN):
+    """
+    Determines variants which can't be taken over from the previous release as they are missing in its output,
+    e.g. as they were removed by RemoveProblemVariant.
+
+    :return: set of variant keys
+    """
+    return read_keys(all_variants_path, key_column) - read_keys(previous_path, key_column)
+
+
+def write_rows_with_keys(in_path, out_path, keys, key_column=BUILT_KEY_COLUMN):
+    """
+    Writes the header and the rows of in_path whose key is contained in keys to out_path.
+
+    :return: number of rows written
+    """
+    n = 0
+    with open(in_path, 'r') as f_in, open(out_path, 'w') as f_out:
+        header, key_idx = _read_header(f_in, key_column)
+        f_out.write('\t'.join(header) + '\n')
+        for line in f_in:
+            if line.split('\t')[key_idx].rstrip('\n') in keys:
+                f_out.write(line)
+                n += 1
+    return n
+
+
+def splice_unchanged_rows(all_variants_path, changed_keys, changed_path, previous_path, out_path,
+                          key_column=BUILT_KEY_COLUMN):
+    """
+    Combines the rows computed for the changed variants with the rows of the previous release for the
+    remaining variants. Rows of the previous release are restricted to the columns of the changed rows and
+    get the current report ids from all_variants_path.
+
+    :param all_variants_path: tsv file listing all variants of the current release, determining the order of the output
+    :param changed_keys: keys of the changed variants, which are never taken from the previous release. All other
+      variants must be part of the previous release, see missing_variant_keys
+    :param changed_path: tsv file with rows of the changed variants
+    :param previous_path: tsv file with rows of the previous release
+    :param out_path: path of the combined tsv file
+    :return: Tuple[int, int]: number of changed and unchanged rows written
+    """
+    with open(changed_path, 'r') as f:
+        header, _ = _read_header(f, key_column)
+    _, changed_rows = read_rows_by_key(changed_path, key_column)
+
+    with open(previous_path, 'r') as f:
+        previous_header, previous_key_idx = _read_header(f, key_column)
+        missing_columns = set(header) - set(previous_header)
+        if missing_columns:
+            raise ValueError("Columns {} missing in previous release, a full build is required".format(
+                sorted(missing_columns)))
+
+        column_idxs = [previous_header.index(c) for c in header]
+        previous_rows = {}
+        for line in f:
+            values = line.rstrip('\n').split('\t')
+            previous_rows[values[previous_key_idx]] = [values[i] for i in column_idxs]
+
+    n_changed, n_unchanged = 0, 0
+    with open(all_variants_path, 'r') as f_all, open(out_path, 'w') as f_out:
+        all_header, key_idx = _read_header(f_all, key_column)
+        # (index in the output, index in all_variants_path) of the report id columns
+        id_idxs = [(i, all_header.index(c)) for i, c in enumerate(header) if is_report_id_column(c) and c in all_header]
+
+        f_out.write('\t'.join(header) + '\n')
+        for line in f_all:
+            values = line.rstrip('\n').split('\t')
+            key = values[key_idx]
+            if key in changed_rows:
+                f_out.write(changed_rows[key])
+                n_changed += 1
+            elif key not in changed_keys:
+                if key not in previous_rows:
+                    raise ValueError("Unchanged variant {} missing in previous release".format(key))
+                row = previous_rows[key]
+                for i, all_i in id_idxs:
+                    row[i] = values[all_i]
+                f_out.write('\t'.join(row) + '\n')
+                n_unchanged += 1
+            # changed variants without a computed row were dropped on the way, e.g. by RemoveProblemVariant
+
+    return n_changed, n_unchanged
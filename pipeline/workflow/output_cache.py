@@ -0,0 +1,313 @@
+"""
+Content addressed cache of the outputs of pipeline tasks.
+
+A task's outputs are stored under a key hashing everything the task's run depends on: the contents of its input
+files, its significant parameters, the pipeline configuration, the HGVS data configured by the environment (see
+hgvs_utils.configured_data_version) and the code run in process, i.e. the module defining the task and the workflow
+and common modules it uses. The code version of the python and shell scripts the task runs
+via pipeline_utils.run_process is only known after the run. It is recorded with the entry and checked again when
+looking it up.
+
+Files the run writes besides the task's outputs, e.g. logs, are cached together with the outputs if the task declares
+them as side outputs (see DefaultPipelineTask.side_outputs). A run writing undeclared files next to its outputs or
+side outputs isn't stored, as materializing its outputs alone would leave these files missing.
+
+On a hit, the outputs are materialized from the cache by hardlinking, or copying across file systems, instead of
+running the task. Cached files are shared with the outputs they were materialized to, so outputs must not be
+modified in place once the task finished.
+"""
+import glob
+import hashlib
+import inspect
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import luigi
+from luigi.task import flatten
+
+from common import hgvs_utils
+from common.utils import file_fingerprint
+from workflow import pipeline_utils
+
+logger = logging.getLogger('output_cache')
+
+MANIFEST_FILE = "manifest.json"
+
+PIPELINE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# modules shared by the scripts of all tasks
+COMMON_CODE_DIR = os.path.join(PIPELINE_DIR, 'common')
+# modules of the tasks and the helpers they run in process
+WORKFLOW_CODE_DIR = os.path.join(PIPELINE_DIR, 'workflow')
+
+# configuration determining where outputs go rather than what they contain
+LOCATION_PARAMS = {'output_dir', 'output_dir_host', 'file_parent_dir', 'output_cache_dir'}
+
+
+def path_fingerprint(path):
+    """
+    Fingerprints the contents of a file or, recursively, of a directory including the names of its files.
+    """
+    if not os.path.isdir(path):
+        return file_fingerprint(path)
+
+    files = sorted(os.path.relpath(p, path) for p in glob.glob(os.path.join(path, '**'), recursive=True)
+                   if os.path.isfile(p))
+    return file_fingerprint(*[os.path.join(path, f) for f in files]) + ':' + ','.join(files)
+
+
+def config_fingerprint(cfg):
+    """
+    Fingerprints the significant pipeline configuration. Parameters naming a file are represented by the file's
+    contents, so that e.g. two builds using an identical gene config at different locations share outputs.
+    """
+    values = {}
+    for name, value in cfg.to_str_params(only_significant=True).items():
+        if name in LOCATION_PARAMS:
+            continue
+        values[name] = file_fingerprint(value) if os.path.isfile(value) else value
+    return values
+
+
+def script_code_version(script):
+    """
+    Fingerprints a script together with the modules and scripts it may use, i.e. those in its directory and the
+    modules in common/.
+    """
+    script_dir = os.path.dirname(script)
+    modules = sorted(set(glob.glob(os.path.join(script_dir, '*.py')) + glob.glob(os.path.join(script_dir, '*.sh')) +
+                         glob.glob(os.path.join(COMMON_CODE_DIR, '*.py'))))
+    return file_fingerprint(script, *[m for m in modules if m != script])
+
+
+def _pipeline_module_path(module):
+    path = getattr(module, '__file__', None)
+    if path and os.path.abspath(path).startswith(PIPELINE_DIR + os.sep):
+        return os.path.abspath(path)
+    return None
+
+
+def task_code_version(task):
+    """
+    Fingerprints the code of the pipeline run in process by the task: the modules defining the task and its base
+    classes, the pipeline modules imported by the task's module, e.g. data_merging helpers, and all modules in
+    workflow/ and common/.
+    """
+    task_module = sys.modules[type(task).__module__]
+    modules = [task_module] + [sys.modules.get(cls.__module__) for cls in type(task).__mro__] + \
+              [v for v in vars(task_module).values() if inspect.ismodule(v)]
+
+    paths = {p for p in (_pipeline_module_path(m) for m in modules) if p}
+    for code_dir in [WORKFLOW_CODE_DIR, COMMON_CODE_DIR]:
+        paths.update(p for p in glob.glob(os.path.join(code_dir, '*.py')) if not os.path.basename(p).startswith('test_'))
+
+    files = sorted(paths)
+    return file_fingerprint(*files) + ':' + ','.join(os.path.relpath(p, PIPELINE_DIR) for p in files)
+
+
+def _text_fingerprint(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def output_paths(task):
+    """
+    :return: paths of the task's outputs or None if the task has outputs other than local files
+    """
+    outputs = flatten(task.output())
+    if not outputs or not all(isinstance(o, luigi.LocalTarget) for o in outputs):
+        return None
+    return [o.path for o in outputs]
+
+
+def side_output_paths(task):
+    """
+    :return: paths of the files or directories the task's run writes besides its outputs, see
+      DefaultPipelineTask.side_outputs
+    """
+    side_outputs = getattr(task, 'side_outputs', None)
+    return [str(p) for p in side_outputs()] if side_outputs else []
+
+
+def _files_state(directory):
+    if not os.path.isdir(directory):
+        return {}
+    return {e.path: (e.stat().st_mtime_ns, e.stat().st_size) for e in os.scandir(directory) if e.is_file()}
+
+
+class WrittenFilesWatch:
+    """
+    Finds the files created or modified in the given directories, not recursing into subdirectories.
+    """
+    def __init__(self, directories):
+        self.before = {d: _files_state(d) for d in set(directories)}
+
+    def written_files(self):
+        written = []
+        for directory, before in self.before.items():
+            written.extend(p for p, state in _files_state(directory).items() if before.get(p) != state)
+        return sorted(written)
+
+
+def task_cache_key(task, config_values):
+    """
+    :return: hex digest identifying the task's outputs or None if the task can't be cached,
+      i.e. it doesn't have any local input files or some of them don't exist
+    """
+    inputs = flatten(task.input())
+    if not inputs or not all(isinstance(i, luigi.LocalTarget) and i.exists() for i in inputs):
+        return None
+
+    description = {
+        'task': task.get_task_family(),
+        'params': task.to_str_params(only_significant=True),
+        'config': config_values,
+        # the UTA and SeqRepo data scripts compute HGVS conversions from aren't among the inputs
+        'hgvs_data': hgvs_utils.configured_data_version(),
+        'code': task_code_version(task),
+        'inputs': [path_fingerprint(i.path) for i in inputs]
+    }
+    return _text_fingerprint(json.dumps(description, sort_keys=True))
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _materialize(src, dst):
+    """
+    Places src at dst via a temporary path next to dst, so that dst never exists partially.
+    """
+    tmp = "{}.tmp-{}".format(dst.rstrip('/'), uuid.uuid4().hex)
+    if os.path.isdir(src):
+        shutil.copytree(src, tmp, copy_function=_link_or_copy)
+    else:
+        _link_or_copy(src, tmp)
+
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    os.replace(tmp, dst)
+
+
+class OutputCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = pipeline_utils.create_path_if_nonexistent(cache_dir)
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def lookup(self, key):
+        """
+        :return: manifest of the entry for the key or None if there is none or the code of its scripts changed
+        """
+        manifest_path = os.path.join(self._entry_dir(key), MANIFEST_FILE)
+        if not os.path.exists(manifest_path):
+            return None
+
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+
+        for script, code_version in manifest['scripts'].items():
+            if not os.path.exists(script) or script_code_version(script) != code_version:
+                logger.info("Cached outputs for %s are outdated, code of %s changed", key, script)
+                return None
+        return manifest
+
+    def restore(self, key, manifest, paths, side_paths):
+        if len(paths) != manifest['outputs'] or any(i >= len(side_paths) for i in manifest['side_outputs']):
+            return False
+
+        entry_dir = self._entry_dir(key)
+        entries = [(str(i), path) for i, path in enumerate(paths)] + \
+                  [('side-{}'.format(i), side_paths[i]) for i in manifest['side_outputs']]
+        for name, path in entries:
+            pipeline_utils.create_path_if_nonexistent(os.path.dirname(os.path.abspath(path)))
+            _materialize(os.path.join(entry_dir, name), path)
+        return True
+
+    def store(self, key, paths, side_paths, scripts):
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(entry_dir):
+            shutil.rmtree(entry_dir)
+
+        # written next to the entry and renamed, so that concurrent lookups never see an incomplete entry
+        tmp_dir = tempfile.mkdtemp(dir=pipeline_utils.create_path_if_nonexistent(os.path.dirname(entry_dir)))
+        for i, path in enumerate(paths):
+            _materialize(path, os.path.join(tmp_dir, str(i)))
+
+        # side outputs a run didn't write, e.g. logs of errors which didn't occur, aren't restored either
+        side_outputs = [i for i, path in enumerate(side_paths) if os.path.exists(path)]
+        for i in side_outputs:
+            _materialize(side_paths[i], os.path.join(tmp_dir, 'side-{}'.format(i)))
+
+        manifest = {'outputs': len(paths), 'side_outputs': side_outputs,
+                    'scripts': {s: script_code_version(s) for s in sorted(set(scripts))}}
+        with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            # stored concurrently by another worker
+            shutil.rmtree(tmp_dir)
+
+    def run(self, task, run, config_values):
+        """
+        Materializes the task's outputs from the cache if possible, otherwise runs it and stores its outputs.
+        """
+        task_id = task.task_id
+        paths = output_paths(task)
+        key = task_cache_key(task, config_values) if paths else None
+        if key is None:
+            logger.info("Output cache: not caching %s", task_id)
+            return run()
+
+        side_paths = side_output_paths(task)
+        manifest = self.lookup(key)
+        if manifest and self.restore(key, manifest, paths, side_paths):
+            self.hits += 1
+            logger.info("Output cache hit for %s (key %s). %s", task_id, key, self.summary())
+            return None
+
+        self.misses += 1
+        logger.info("Output cache miss for %s (key %s). %s", task_id, key, self.summary())
+
+        declared = {os.path.abspath(p) for p in paths + side_paths}
+        watch = WrittenFilesWatch(os.path.dirname(p) for p in declared)
+        with pipeline_utils.record_invoked_scripts() as scripts:
+            result = run()
+
+        # written by the run or, with several luigi workers, by a task running at the same time
+        undeclared = [p for p in watch.written_files() if p not in declared]
+        if undeclared:
+            logger.warning("Output cache: not storing %s, files besides its outputs and side outputs were written: %s",
+                           task_id, ", ".join(undeclared))
+        elif all(os.path.exists(p) for p in paths):
+            self.store(key, paths, side_paths, scripts)
+        return result
+
+    def summary(self):
+        total = self.hits + self.misses
+        return "{} hits, {} misses so far ({:.0%} hit rate)".format(self.hits, self.misses,
+                                                                    self.hits / total if total else 0)
+
+
+_OUTPUT_CACHES = {}
+
+
+def get_output_cache(cache_dir):
+    """
+    :return: the output cache of the directory, shared by all tasks of the process to keep the statistics in one place
+    """
+    if cache_dir not in _OUTPUT_CACHES:
+        _OUTPUT_CACHES[cache_dir] = OutputCache(cache_dir)
+    return _OUTPUT_CACHES[cache_dir]
+
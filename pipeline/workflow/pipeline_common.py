@@ -1,11 +1,13 @@
 import datetime
+import functools
+import inspect
 import os
 from shutil import copy
 
 import luigi
 
 from common import config
-from workflow import pipeline_utils
+from workflow import output_cache, pipeline_utils
 
 DEFAULT_BRCA_RESOURCES_DIR = (os.path.abspath('../brca/brca-resources'))
 DEFAULT_OUTPUT_DIR = (
@@ -73,6 +75,43 @@ class PipelineParams(luigi.Config):
     victor_data_dir = luigi.Parameter(default=str(None),
                                                description='data dir with the required data for victor')
 
+    merge_processes = luigi.IntParameter(default=1, significant=False,
+                                         description='number of processes to preprocess the sources concurrently during variant merging')
+
+    diff_processes = luigi.IntParameter(default=1, significant=False,
+                                        description='number of processes to compare variants and reports concurrently \
+                                        when diffing against the previous release')
+
+    script_processes = luigi.IntParameter(default=0, significant=False,
+                                          description='number of long lived worker processes running the python scripts \
+                                          of the tasks in process instead of starting a new interpreter per script. \
+                                          With 0, every script is run in its own subprocess')
+
+    output_cache_dir = luigi.Parameter(default=str(None), significant=False,
+                                       description='directory of a cache of task outputs keyed by the task\'s inputs, \
+                                       parameters, configuration and code. Tasks whose key is found materialize their \
+                                       outputs from the cache instead of running. Not caching if not given')
+
+    incremental_build = luigi.BoolParameter(default=False,
+                                            description='only run the per variant annotation tasks for variants whose merged row \
+                                            changed since the previous release (previous_release_tar), taking over all other rows. \
+                                            The pseudonym generator still outputs all variants, combine with \
+                                            reuse_previous_pseudonyms to take over its columns as well')
+
+    reuse_previous_pseudonyms = luigi.BoolParameter(default=False,
+                                                    description='take over the columns derived by the pseudonym generator \
+                                                    for variants whose inputs are unchanged from the previous release \
+                                                    (previous_release_tar) instead of computing them again')
+
+    previous_artifacts_dir = luigi.Parameter(default=str(None),
+                                             description='artifacts directory of the previous release. In incremental builds, \
+                                             preprocessed files of unchanged sources are reused from it')
+
+    shard_by = luigi.Parameter(default=str(None),
+                               description='run variant merging and pseudonym generation per shard of the genes in parallel, \
+                               either per gene ("gene") or per chromosome ("chr"). The number of shards processed at the same \
+                               time is determined by the number of luigi workers')
+
     def run(self):
         pass
 
@@ -80,6 +119,12 @@ class PipelineParams(luigi.Config):
     def gene_metadata(self):
         return config.load_config(str(self.gene_config_path))
 
+    @property
+    def gene_shards(self):
+        if str(self.shard_by) == str(None):
+            return {}
+        return config.split_config(self.gene_metadata, str(self.shard_by))
+
     __instance = None
 
     @staticmethod
@@ -90,10 +135,20 @@ class PipelineParams(luigi.Config):
 
 
 class DefaultPipelineTask(luigi.Task):
+    # whether outputs may be taken from the output cache. Tasks reading data that isn't among their inputs,
+    # e.g. downloads, must not be cached
+    cache_output = True
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'run' in cls.__dict__ and not inspect.isgeneratorfunction(cls.run):
+            cls.run = _run_with_output_cache(cls.run)
+
     def __init__(self, *args, **kwargs):
         super(DefaultPipelineTask, self).__init__(*args, **kwargs)
 
         self.cfg = PipelineParams.get_instance()
+        pipeline_utils.configure_script_runner(self.cfg.script_processes)
 
         self.artifacts_dir = pipeline_utils.create_path_if_nonexistent(self.cfg.output_dir + "/release/artifacts")
         self.release_dir = pipeline_utils.create_path_if_nonexistent(self.cfg.output_dir + "/release/")
@@ -110,6 +165,13 @@ class DefaultPipelineTask(luigi.Task):
         self.enigma_file_dir = pipeline_utils.create_path_if_nonexistent(self.cfg.file_parent_dir + '/enigma')
         self.assays_dir = pipeline_utils.create_path_if_nonexistent(self.cfg.file_parent_dir + '/functional_assays')
 
+    def side_outputs(self):
+        """
+        Paths of the files or directories the run writes besides the task's outputs, e.g. logs. The output cache
+        stores and restores them together with the outputs.
+        """
+        return []
+
     def on_failure(self, exception):
         # renaming files by prefixing filename with "FAILURE_". This way, on rerunning the pipeline the failed task is
         # automatically run again, but instead of just deleting the file, it can still be inspected.
@@ -128,6 +190,24 @@ class DefaultPipelineTask(luigi.Task):
         return super().on_failure(exception)
 
 
+def _run_with_output_cache(run):
+    @functools.wraps(run)
+    def wrapper(self):
+        cache_dir = str(self.cfg.output_cache_dir)
+        # run of a base class called by the run of the task, which is cached already
+        if not self.cache_output or cache_dir == str(None) or getattr(self, '_running_with_output_cache', False):
+            return run(self)
+
+        self._running_with_output_cache = True
+        try:
+            return output_cache.get_output_cache(cache_dir).run(
+                self, lambda: run(self), output_cache.config_fingerprint(self.cfg))
+        finally:
+            self._running_with_output_cache = False
+
+    return wrapper
+
+
 class CopyOutputToOutputDir(DefaultPipelineTask):
     out_dir = luigi.Parameter()
     req_task = luigi.TaskParameter()
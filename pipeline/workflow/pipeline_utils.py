@@ -1,14 +1,22 @@
+import concurrent.futures
 import contextlib
 import csv
 import datetime
+import logging
+import multiprocessing
 import os
+import runpy
 import subprocess
+import sys
+import time
+import traceback
 import tarfile
 import urllib.error
 import urllib.parse
 import urllib.request
 import shutil
 import glob
+from pathlib import Path
 
 from retrying import retry
 
@@ -27,6 +35,15 @@ def create_path_if_nonexistent(path):
 
 def run_process(args, redirect_stdout_path=None, expected_returncode=0,
                 shell=False):
+    script = None if shell else invoked_script(args)
+    if script:
+        for scripts in _INVOKED_SCRIPTS:
+            scripts.append(script)
+
+    if SCRIPT_RUNNER and SCRIPT_RUNNER.is_available() and not shell and is_python_script(args):
+        run_script_in_process(args, redirect_stdout_path, expected_returncode)
+        return
+
     if redirect_stdout_path:
         stdout_cm = open(redirect_stdout_path, 'w')
     else:
@@ -53,6 +70,230 @@ def print_subprocess_output_and_error(sp):
         print(err)
 
 
+# lists of the scripts run via run_process while being recorded, see record_invoked_scripts
+_INVOKED_SCRIPTS = []
+
+SCRIPT_INTERPRETERS = ("python", "python3", "bash", "sh")
+SCRIPT_EXTENSIONS = (".py", ".sh")
+
+
+def invoked_script(args):
+    """
+    :return: absolute path of the python or shell script run by the command or None, e.g. for external tools
+    """
+    if len(args) > 1 and os.path.basename(args[0]) in SCRIPT_INTERPRETERS and os.path.isfile(args[1]):
+        return os.path.abspath(args[1])
+    if args and args[0].endswith(SCRIPT_EXTENSIONS) and os.path.isfile(args[0]):
+        return os.path.abspath(args[0])
+    return None
+
+
+@contextlib.contextmanager
+def record_invoked_scripts():
+    """
+    Records the absolute paths of the scripts run via run_process within the context in the yielded list.
+    """
+    scripts = []
+    _INVOKED_SCRIPTS.append(scripts)
+    try:
+        yield scripts
+    finally:
+        _INVOKED_SCRIPTS.remove(scripts)
+
+
+##########################
+# In process script runs #
+##########################
+
+# set by configure_script_runner. If None, every python script is run in its own subprocess
+SCRIPT_RUNNER = None
+
+PIPELINE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def is_python_script(args):
+    return len(args) > 1 and os.path.basename(args[0]) in ("python", "python3") and args[1].endswith(".py")
+
+
+def configure_script_runner(processes):
+    """
+    Runs the python scripts passed to run_process in `processes` long lived worker processes instead of starting a
+    new interpreter per script. With 0 processes, scripts are run in subprocesses again.
+    """
+    global SCRIPT_RUNNER
+
+    if processes > 0 and (SCRIPT_RUNNER is None or SCRIPT_RUNNER.processes != processes):
+        if SCRIPT_RUNNER:
+            SCRIPT_RUNNER.shutdown()
+        SCRIPT_RUNNER = ScriptRunner(processes)
+    elif processes <= 0 and SCRIPT_RUNNER:
+        SCRIPT_RUNNER.shutdown()
+        SCRIPT_RUNNER = None
+
+    return SCRIPT_RUNNER
+
+
+def run_script_in_process(args, redirect_stdout_path=None, expected_returncode=0):
+    print(f"Running in process with the following args: {args}", flush=True)
+    result = SCRIPT_RUNNER.run(args[1:], os.getcwd(), redirect_stdout_path)
+    print(f"Finished {os.path.basename(args[1])} in {result.elapsed:.2f}s in worker {result.pid}")
+
+    if result.returncode != expected_returncode:
+        raise RuntimeError(f"Script returned with code {result.returncode} instead of {expected_returncode}")
+
+
+class ScriptResult:
+    def __init__(self, returncode, elapsed, pid):
+        self.returncode = returncode
+        self.elapsed = elapsed
+        self.pid = pid
+
+
+class ScriptRunner:
+    """
+    Runs python scripts as __main__ in long lived worker processes, so that the interpreter startup and the imports
+    of pandas, hgvs, vcf etc. are only paid once per worker rather than once per script.
+
+    Every run gets a fresh __main__ namespace, the arguments as sys.argv, the working directory of the caller and
+    the script's directory as sys.path[0], just like `python script.py` would. The pipeline modules the script
+    imported, e.g. those in common/, are imported again by the next script, so their module level state such as the
+    SeqRepoWrapper and HgvsWrapper instances doesn't carry over. Only third party modules like pandas or hgvs stay
+    imported. Logging handlers the script configured are closed afterwards, so logging.basicConfig works again in
+    the next script. The output of the script goes to the standard output and error of the worker, which are those
+    of the process starting the workers. Standard output is redirected on the level of file descriptors, so output of
+    C extensions and child processes of the script is redirected as well.
+
+    The workers are started lazily and only used by the process which created the runner, see is_available.
+    """
+
+    def __init__(self, processes=1):
+        self.processes = processes
+        self._executor = None
+        self._pid = os.getpid()
+
+    def is_available(self):
+        """
+        Processes forked after the runner was created, e.g. by luigi running every task in its own process with
+        several workers, run scripts in subprocesses instead. Workers started there would only serve a single task
+        and keep the process from exiting.
+        """
+        return self._pid == os.getpid()
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawned rather than forked, as the workers outlive the task which started them. Unlike
+            # multiprocessing.Pool, the workers aren't daemonic, so scripts can start their own processes
+            self._executor = concurrent.futures.ProcessPoolExecutor(
+                self.processes, mp_context=multiprocessing.get_context("spawn"), initializer=_init_script_worker)
+        return self._executor
+
+    def start(self):
+        executor = self._get_executor()
+        for future in [executor.submit(os.getpid) for _ in range(self.processes)]:
+            future.result()
+
+    def run(self, script_args, cwd=None, stdout_path=None):
+        return self._get_executor().submit(_run_script, list(script_args), cwd or os.getcwd(), stdout_path).result()
+
+    def shutdown(self):
+        if self._executor is not None and self.is_available():
+            self._executor.shutdown()
+        self._executor = None
+
+
+def _init_script_worker():
+    # passing on the output of scripts as it is written rather than in blocks
+    sys.stdout.reconfigure(line_buffering=True)
+    sys.stderr.reconfigure(line_buffering=True)
+
+
+def _exit_code(exit_exception):
+    code = exit_exception.code
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _reset_logging():
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(logging.WARNING)
+
+
+@contextlib.contextmanager
+def _standard_fds(stdout_path):
+    """
+    Points the standard output of the process, i.e. file descriptor 1, at stdout_path if given, such that the output
+    of C extensions, os.system and child processes of the script ends up there as well, not just that written to
+    sys.stdout. Restores file descriptors 1 and 2 afterwards, whatever the script did to them.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = {fd: os.dup(fd) for fd in (1, 2)}
+    try:
+        if stdout_path:
+            with open(stdout_path, 'w') as f:
+                os.dup2(f.fileno(), 1)
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        for fd, saved_fd in saved_fds.items():
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+
+
+def _is_pipeline_module(module, script_dir):
+    module_file = getattr(module, '__file__', None)
+    if not module_file:
+        return False
+    module_path = os.path.abspath(module_file)
+    return any(module_path.startswith(d + os.sep) for d in [script_dir, PIPELINE_DIR])
+
+
+def _run_script(script_args, cwd, stdout_path):
+    script = os.path.abspath(os.path.join(cwd, script_args[0]))
+    script_dir = os.path.dirname(script)
+    saved_cwd, saved_argv, saved_path = os.getcwd(), sys.argv, sys.path[:]
+    modules_before = set(sys.modules)
+
+    os.chdir(cwd)
+    sys.argv = [script] + script_args[1:]
+    sys.path.insert(0, script_dir)
+    _reset_logging()
+
+    start = time.perf_counter()
+    try:
+        # sys.stdout and sys.stderr of the worker write to file descriptors 1 and 2
+        with _standard_fds(stdout_path):
+            try:
+                runpy.run_path(script, run_name="__main__")
+                returncode = 0
+            except SystemExit as e:
+                returncode = _exit_code(e)
+            except BaseException:
+                traceback.print_exc()
+                returncode = 1
+            _reset_logging()
+    finally:
+        elapsed = time.perf_counter() - start
+        os.chdir(saved_cwd)
+        sys.argv = saved_argv
+        sys.path[:] = saved_path
+        # siblings of the script must not shadow equally named modules of the next script and module level state of
+        # the pipeline's modules must not carry over to it
+        for name in set(sys.modules) - modules_before:
+            if _is_pipeline_module(sys.modules[name], script_dir):
+                del sys.modules[name]
+
+    return ScriptResult(returncode, elapsed, os.getpid())
+
+
 @retry(stop_max_attempt_number=3, wait_fixed=3000)
 def urlopen_with_retry(url):
     return urllib.request.urlopen(url)
@@ -102,6 +343,13 @@ def download_file_with_basic_auth(url, file_name, username, password):
     print("Finished downloading %s" % (file_name))
 
 
+def crossmap_unmapped_path(output_path):
+    """
+    :return: path of the file CrossMap writes the records it couldn't lift over to
+    """
+    return output_path + ".unmap"
+
+
 def check_file_for_contents(file_path):
     handle_process_success_or_failure(os.stat(file_path).st_size != 0,
                                       file_path)
@@ -168,6 +416,21 @@ def handle_process_success_or_failure(process_succeeded, file_path):
         print("**** Failure creating %s ****\n" % (file_name))
 
 
+def write_release_archive(md5sums_path, output_dir, archive_path):
+    """
+    Archives the files listed in the md5sums file, and the md5sums file itself, below the name of output_dir.
+    """
+    with open(md5sums_path) as f:
+        file_list = [line.strip().split(' ')[-1] for line in f.readlines()]
+
+    file_list.append(Path(md5sums_path).name)
+
+    output_dir = Path(output_dir)
+    with tarfile.open(archive_path, "w:gz") as tar:
+        for file in file_list:
+            tar.add(output_dir / file, arcname=Path(output_dir.name) / file)
+
+
 def extract_file(archive_path, tmp_dir, file_path):
     with tarfile.open(archive_path, "r:gz") as tar:
         tar.extract(file_path, tmp_dir)
@@ -0,0 +1,136 @@
+"""
+Helpers for running variant merging and the per variant annotation tasks on shards of the genes in parallel.
+
+Every shard runs variant_merging.py on all input files, restricted to the genes of the shard (see
+common.config.split_config), such that reports keep the ids of an unsharded run. The outputs of the
+shards are then combined into the files an unsharded run writes to the artifacts directory.
+"""
+import os
+import shutil
+
+from data_merging.variant_merging import merged_sort_key
+
+SHARDS_DIR = "shards"
+SHARD_GENE_CONFIG_FILE = "gene_config.txt"
+
+WRONG_GENOME_COORS_DIR = "wrong_genome_coors"
+ENIGMA_WRONG_GENOME_FILE = "ENIGMA_wrong_genome.txt"
+
+
+def variant_sort_key(header):
+    """
+    Returns a function mapping a tsv row to the key variants are sorted by in merged.tsv, e.g. chr13:g.32326103:C>G
+    (see data_merging.variant_merging.write_new_tsv)
+
+    :param header: list of column names, containing Chr, Pos, Ref and Alt
+    """
+    chr_idx, pos_idx, ref_idx, alt_idx = [header.index(c) for c in ["Chr", "Pos", "Ref", "Alt"]]
+
+    def key(line):
+        values = line.rstrip('\n').split('\t')
+        return merged_sort_key(values[chr_idx], values[pos_idx], values[ref_idx], values[alt_idx])
+
+    return key
+
+
+def concatenate_tsvs(paths, out_path, sort_variants=False, drop_duplicates=False):
+    """
+    Concatenates tsv files with identical header rows.
+
+    :param paths: tsv files in the order to concatenate them
+    :param out_path: output path
+    :param sort_variants: sort rows by variant like merged.tsv, restoring the order of an unsharded run
+    :param drop_duplicates: only keep the first occurrence of identical rows, e.g. of ENIGMA reports found in every shard
+    :return: number of rows written
+    """
+    header, rows = None, []
+    for path in paths:
+        with open(path, 'r', newline='') as f:
+            h = f.readline()
+            if header is not None and h != header:
+                raise ValueError("Header of {} differs from header of {}".format(path, paths[0]))
+            header = h
+            rows.extend(f)
+
+    if drop_duplicates:
+        rows = list(dict.fromkeys(rows))
+
+    if sort_variants:
+        rows.sort(key=variant_sort_key(header.rstrip('\n').split('\t')))
+
+    with open(out_path, 'w', newline='') as f:
+        f.write(header)
+        f.writelines(rows)
+
+    return len(rows)
+
+
+def _read_header_and_rows(path, vcf):
+    with open(path, 'r', newline='') as f:
+        lines = f.readlines()
+
+    if vcf:
+        n_header = next((i for i, line in enumerate(lines) if not line.startswith('#')), len(lines))
+    else:
+        n_header = min(1, len(lines))
+    return lines[:n_header], lines[n_header:]
+
+
+def union_in_reference_order(paths, reference_path, out_path, vcf=True):
+    """
+    Writes the rows found in any of the files in paths in the order they have in reference_path, e.g. records
+    with wrong genomic coordinates of all shards in the order of the preprocessed source file.
+    The header is taken from the first file.
+
+    :param vcf: whether the files are vcf files with a '#' prefixed header or tsv files with a single header row
+    :return: number of rows written
+    """
+    header, _ = _read_header_and_rows(paths[0], vcf)
+    union = set()
+    for path in paths:
+        union.update(_read_header_and_rows(path, vcf)[1])
+
+    _, reference_rows = _read_header_and_rows(reference_path, vcf)
+    rows = [r for r in reference_rows if r in union]
+
+    with open(out_path, 'w', newline='') as f:
+        f.writelines(header)
+        f.writelines(rows)
+
+    return len(rows)
+
+
+def combine_merged_artifacts(shard_dirs, out_dir, enigma_file):
+    """
+    Combines the outputs of variant_merging.py of all shards.
+
+    Preprocessed source files, which are identical for all shards, are copied from the first shard, whereas the
+    files containing the right and wrong records of a source are combined in the order of the preprocessed file.
+
+    :param shard_dirs: output directories of the shards
+    :param out_dir: directory to write the combined files to
+    :param enigma_file: name of the ENIGMA input file, copied to the output directory by variant_merging.py
+    """
+    def _paths(name):
+        return [os.path.join(d, name) for d in shard_dirs]
+
+    concatenate_tsvs(_paths("merged.tsv"), os.path.join(out_dir, "merged.tsv"), sort_variants=True)
+    concatenate_tsvs(_paths("reports.tsv"), os.path.join(out_dir, "reports.tsv"), drop_duplicates=True)
+    concatenate_tsvs(_paths("discarded_reports.tsv"), os.path.join(out_dir, "discarded_reports.tsv"),
+                     drop_duplicates=True)
+
+    first_dir = shard_dirs[0]
+    os.makedirs(os.path.join(out_dir, WRONG_GENOME_COORS_DIR), exist_ok=True)
+    for name in sorted(os.listdir(first_dir)):
+        if name.startswith("right"):
+            source = name[len("right"):]
+            ready_path = os.path.join(first_dir, source + "ready.vcf")
+            union_in_reference_order(_paths(name), ready_path, os.path.join(out_dir, name))
+
+            wrong_name = os.path.join(WRONG_GENOME_COORS_DIR, source + "_wrong_genome_coor.vcf")
+            union_in_reference_order(_paths(wrong_name), ready_path, os.path.join(out_dir, wrong_name))
+        elif name.endswith(".vcf") or name == enigma_file or name.endswith(".json"):
+            shutil.copy(os.path.join(first_dir, name), os.path.join(out_dir, name))
+
+    union_in_reference_order(_paths(ENIGMA_WRONG_GENOME_FILE), os.path.join(first_dir, enigma_file),
+                             os.path.join(out_dir, ENIGMA_WRONG_GENOME_FILE), vcf=False)
@@ -0,0 +1,110 @@
+import pytest
+
+from workflow import incremental_build
+
+MERGED_HEADER = "Source\tGenomic_Coordinate\tBX_ID_ClinVar\n"
+BUILT_HEADER = "Source\tGenomic_Coordinate_hg38\tBX_ID_ClinVar\tCAID\n"
+
+
+def _write(path, content):
+    path.write_text(content)
+    return str(path)
+
+
+def test_changed_variant_keys(tmp_path):
+    previous = _write(tmp_path / 'previous.tsv', MERGED_HEADER +
+                      "ClinVar\tchr13:g.1:A>C\t1\n"
+                      "ClinVar\tchr13:g.2:A>C\t2\n"
+                      "ClinVar\tchr13:g.3:A>C\t3\n")
+    current = _write(tmp_path / 'current.tsv', MERGED_HEADER +
+                     "ClinVar\tchr13:g.1:A>C\t1\n"
+                     "ClinVar,LOVD\tchr13:g.2:A>C\t2\n"
+                     "ClinVar\tchr13:g.4:A>C\t5\n")
+
+    assert incremental_build.changed_variant_keys(previous, current) == {'chr13:g.2:A>C', 'chr13:g.4:A>C'}
+
+
+def test_changed_variant_keys_one_source_changed(tmp_path):
+    header = "Source\tGenomic_Coordinate\tClinical_significance_ClinVar\tBX_ID_ClinVar\tBX_ID_LOVD\n"
+    previous = _write(tmp_path / 'previous.tsv', header +
+                      "ClinVar\tchr13:g.1:A>C\tBenign\t1\t-\n"
+                      "ClinVar,LOVD\tchr13:g.2:A>C\tBenign\t2\t1\n"
+                      "ClinVar\tchr13:g.3:A>C\tBenign\t3\t-\n")
+    # a new ClinVar report shifts the ClinVar report ids of all following variants
+    current = _write(tmp_path / 'current.tsv', header +
+                     "ClinVar\tchr13:g.0:A>C\tBenign\t1\t-\n"
+                     "ClinVar\tchr13:g.1:A>C\tBenign\t2\t-\n"
+                     "ClinVar,LOVD\tchr13:g.2:A>C\tBenign\t3\t1\n"
+                     "ClinVar\tchr13:g.3:A>C\tPathogenic\t4\t-\n")
+
+    assert incremental_build.changed_variant_keys(previous, current) == {'chr13:g.0:A>C', 'chr13:g.3:A>C'}
+
+
+def test_changed_variant_keys_different_columns(tmp_path):
+    previous = _write(tmp_path / 'previous.tsv', "Source\tGenomic_Coordinate\n" "ClinVar\tchr13:g.1:A>C\n")
+    current = _write(tmp_path / 'current.tsv', MERGED_HEADER + "ClinVar\tchr13:g.1:A>C\t1\n")
+
+    assert incremental_build.changed_variant_keys(previous, current) == {'chr13:g.1:A>C'}
+
+
+def test_splice_unchanged_rows(tmp_path):
+    all_variants = _write(tmp_path / 'aggregated.tsv', "Genomic_Coordinate_hg38\n"
+                          "chr13:g.1:A>C\nchr13:g.2:A>C\nchr13:g.3:A>C\nchr13:g.4:A>C\n")
+    changed = _write(tmp_path / 'changed.tsv', "Source\tGenomic_Coordinate_hg38\tCAID\n"
+                     "ClinVar\tchr13:g.2:A>C\tCA2\n")
+    previous = _write(tmp_path / 'previous.tsv', BUILT_HEADER +
+                      "ClinVar\tchr13:g.1:A>C\t1\tCA1\n"
+                      "ClinVar\tchr13:g.2:A>C\t2\tCA2_old\n"
+                      "ClinVar\tchr13:g.4:A>C\t4\tCA4\n")
+    out = tmp_path / 'spliced.tsv'
+
+    # chr13:g.3:A>C got removed on the way and chr13:g.4:A>C changed, hence both must not be taken over
+    n_changed, n_unchanged = incremental_build.splice_unchanged_rows(
+        all_variants, {'chr13:g.2:A>C', 'chr13:g.3:A>C', 'chr13:g.4:A>C'}, changed, previous, str(out))
+
+    assert (n_changed, n_unchanged) == (1, 1)
+    assert out.read_text() == ("Source\tGenomic_Coordinate_hg38\tCAID\n"
+                               "ClinVar\tchr13:g.1:A>C\tCA1\n"
+                               "ClinVar\tchr13:g.2:A>C\tCA2\n")
+
+
+def test_splice_unchanged_rows_missing_in_previous_release(tmp_path):
+    all_variants = _write(tmp_path / 'aggregated.tsv', "Genomic_Coordinate_hg38\n"
+                          "chr13:g.1:A>C\nchr13:g.2:A>C\nchr13:g.3:A>C\n")
+    changed = _write(tmp_path / 'changed.tsv', BUILT_HEADER + "ClinVar\tchr13:g.2:A>C\t2\tCA2\n")
+    previous = _write(tmp_path / 'previous.tsv', BUILT_HEADER +
+                      "ClinVar\tchr13:g.1:A>C\t1\tCA1\n"
+                      "ClinVar\tchr13:g.2:A>C\t2\tCA2_old\n")
+
+    assert incremental_build.missing_variant_keys(all_variants, previous) == {'chr13:g.3:A>C'}
+
+    # variants which are neither recomputed nor part of the previous release must not get lost
+    with pytest.raises(ValueError):
+        incremental_build.splice_unchanged_rows(all_variants, {'chr13:g.2:A>C'}, changed, previous,
+                                                str(tmp_path / 'out.tsv'))
+
+    assert incremental_build.splice_unchanged_rows(all_variants, {'chr13:g.2:A>C', 'chr13:g.3:A>C'}, changed,
+                                                   previous, str(tmp_path / 'out.tsv')) == (1, 1)
+
+
+def test_splice_unchanged_rows_current_report_ids(tmp_path):
+    all_variants = _write(tmp_path / 'aggregated.tsv', "Genomic_Coordinate_hg38\tBX_ID_ClinVar\n"
+                          "chr13:g.0:A>C\t1\nchr13:g.1:A>C\t2\n")
+    changed = _write(tmp_path / 'changed.tsv', BUILT_HEADER + "ClinVar\tchr13:g.0:A>C\t1\tCA0\n")
+    previous = _write(tmp_path / 'previous.tsv', BUILT_HEADER + "ClinVar\tchr13:g.1:A>C\t1\tCA1\n")
+    out = tmp_path / 'spliced.tsv'
+
+    assert incremental_build.splice_unchanged_rows(all_variants, {'chr13:g.0:A>C'}, changed, previous,
+                                                   str(out)) == (1, 1)
+    assert out.read_text() == (BUILT_HEADER +
+                               "ClinVar\tchr13:g.0:A>C\t1\tCA0\n"
+                               "ClinVar\tchr13:g.1:A>C\t2\tCA1\n")
+
+
+def test_splice_unchanged_rows_missing_column(tmp_path):
+    all_variants = _write(tmp_path / 'aggregated.tsv', "Genomic_Coordinate_hg38\nchr13:g.1:A>C\n")
+    changed = _write(tmp_path / 'changed.tsv', "Genomic_Coordinate_hg38\tNew_Column\n")
+    previous = _write(tmp_path / 'previous.tsv', BUILT_HEADER + "ClinVar\tchr13:g.1:A>C\t1\tCA1\n")
+
+    with pytest.raises(ValueError):
+        incremental_build.splice_unchanged_rows(all_variants, set(), changed, previous, str(tmp_path / 'out.tsv'))
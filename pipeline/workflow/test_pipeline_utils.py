@@ -0,0 +1,198 @@
+import multiprocessing
+import os
+import textwrap
+import threading
+import time
+
+import pytest
+
+from workflow import pipeline_utils
+
+
+@pytest.fixture()
+def script_runner():
+    yield pipeline_utils.configure_script_runner(1)
+    pipeline_utils.configure_script_runner(0)
+
+
+def write_script(directory, name, source):
+    path = directory / name
+    path.write_text(textwrap.dedent(source))
+    return path
+
+
+def test_is_python_script():
+    assert pipeline_utils.is_python_script(["python", "script.py", "-i", "x"])
+    assert pipeline_utils.is_python_script(["/usr/bin/python3", "script.py"])
+    assert not pipeline_utils.is_python_script(["bash", "script.sh"])
+    assert not pipeline_utils.is_python_script(["python", "-m", "module"])
+
+
+def test_invoked_script(tmp_path, monkeypatch):
+    write_script(tmp_path, "script.py", "")
+    write_script(tmp_path, "script.sh", "")
+    monkeypatch.chdir(tmp_path)
+
+    assert pipeline_utils.invoked_script(["python", "script.py", "-i", "x"]) == str(tmp_path / "script.py")
+    assert pipeline_utils.invoked_script(["bash", "script.sh", "x"]) == str(tmp_path / "script.sh")
+    assert pipeline_utils.invoked_script(["./script.py", "-i", "x"]) == str(tmp_path / "script.py")
+    assert pipeline_utils.invoked_script(["vcf-sort", "script.py"]) is None
+    assert pipeline_utils.invoked_script(["CrossMap.py", "vcf"]) is None
+
+
+def test_run_script_in_worker(script_runner, tmp_path, monkeypatch, capfd):
+    write_script(tmp_path, "sibling.py", "VALUE = 'first'\n")
+    write_script(tmp_path, "script.py", """
+        import logging
+        import sys
+
+        import sibling
+
+        def main():
+            logging.basicConfig(filename=sys.argv[2], level=logging.INFO)
+            logging.info("argument %s", sys.argv[1])
+            print(sibling.VALUE, sys.argv[1])
+            print("a warning", file=sys.stderr)
+
+        if __name__ == "__main__":
+            main()
+        """)
+    monkeypatch.chdir(tmp_path)
+
+    first = script_runner.run(["script.py", "a", "first.log"], str(tmp_path))
+    assert first.returncode == 0
+    assert capfd.readouterr() == ("first a\n", "a warning\n")
+
+    # the second run gets its own log file and a freshly imported sibling module, but the same worker
+    write_script(tmp_path, "sibling.py", "VALUE = 'second'\n")
+    second = script_runner.run(["script.py", "b", "second.log"], str(tmp_path))
+    assert capfd.readouterr().out == "second b\n"
+    assert second.pid == first.pid
+    assert "argument a" in (tmp_path / "first.log").read_text()
+    assert "argument a" not in (tmp_path / "second.log").read_text()
+    assert "argument b" in (tmp_path / "second.log").read_text()
+
+
+def test_run_script_module_state(script_runner, tmp_path, monkeypatch, capfd):
+    # module level state of the pipeline's modules, e.g. singletons of common/, doesn't carry over to the next script
+    write_script(tmp_path, "script.py", """
+        from common import utils
+
+        print(getattr(utils, "RUNS", 0))
+        utils.RUNS = 1
+        """)
+    monkeypatch.chdir(tmp_path)
+
+    for _ in range(2):
+        script_runner.run(["script.py"], str(tmp_path))
+        assert capfd.readouterr().out == "0\n"
+
+
+def test_run_script_streams_output(script_runner, tmp_path, monkeypatch, capfd):
+    write_script(tmp_path, "script.py", """
+        import os
+        import time
+
+        print("started")
+        while not os.path.exists("continue"):
+            time.sleep(0.05)
+        print("finished")
+        """)
+    monkeypatch.chdir(tmp_path)
+
+    run = threading.Thread(target=script_runner.run, args=(["script.py"], str(tmp_path)))
+    run.start()
+    try:
+        output = ""
+        deadline = time.time() + 60
+        while "started" not in output and time.time() < deadline:
+            time.sleep(0.05)
+            output += capfd.readouterr().out
+        # written while the script is still running
+        assert output == "started\n"
+    finally:
+        (tmp_path / "continue").touch()
+        run.join()
+    assert capfd.readouterr().out == "finished\n"
+
+
+def test_run_process_in_forked_process(script_runner, tmp_path, monkeypatch):
+    write_script(tmp_path, "script.py", """
+        import multiprocessing
+        import sys
+
+        print("subprocess" if multiprocessing.parent_process() is None else "worker", file=open(sys.argv[1], "w"))
+        """)
+    monkeypatch.chdir(tmp_path)
+    # workers of the runner are running already when luigi forks the process of a task
+    pipeline_utils.run_process(["python", "script.py", "parent.txt"])
+
+    child = multiprocessing.get_context("fork").Process(target=pipeline_utils.run_process,
+                                                        args=(["python", "script.py", "child.txt"],))
+    child.start()
+    child.join(60)
+    if child.is_alive():
+        child.kill()
+
+    # the forked process runs the script in a subprocess and exits without waiting for workers of its own
+    assert child.exitcode == 0
+    assert (tmp_path / "parent.txt").read_text() == "worker\n"
+    assert (tmp_path / "child.txt").read_text() == "subprocess\n"
+
+
+def test_run_process_in_worker(script_runner, tmp_path, monkeypatch, capfd):
+    write_script(tmp_path, "exits.py", """
+        import sys
+        print("output")
+        sys.exit(int(sys.argv[1]))
+        """)
+    write_script(tmp_path, "fails.py", "raise ValueError('broken script')\n")
+    monkeypatch.chdir(tmp_path)
+
+    pipeline_utils.run_process(["python", "exits.py", "0"], redirect_stdout_path=str(tmp_path / "out.txt"))
+    assert (tmp_path / "out.txt").read_text() == "output\n"
+
+    pipeline_utils.run_process(["python", "exits.py", "3"], expected_returncode=3)
+    assert "output" in capfd.readouterr().out
+
+    with pytest.raises(RuntimeError, match="code 1 instead of 0"):
+        pipeline_utils.run_process(["python", "fails.py"])
+    assert "ValueError: broken script" in capfd.readouterr().err
+
+    assert os.getcwd() == str(tmp_path)
+
+
+def test_run_script_file_descriptors(script_runner, tmp_path, monkeypatch, capfd):
+    write_script(tmp_path, "script.py", """
+        import os
+        import subprocess
+        import sys
+
+        print("python")
+        os.write(1, b"fd\\n")
+        subprocess.run(["echo", "child"], check=True)
+        os.system("echo shell >&2")
+        # left over by the script, but not by its run
+        os.dup2(os.open(os.devnull, os.O_WRONLY), 2)
+        """)
+    monkeypatch.chdir(tmp_path)
+
+    # output written to the file descriptors by C code or child processes goes where the script's output goes
+    pipeline_utils.run_process(["python", "script.py"], redirect_stdout_path=str(tmp_path / "out.txt"))
+    assert (tmp_path / "out.txt").read_text() == "python\nfd\nchild\n"
+    assert "shell\n" in capfd.readouterr().err
+
+    pipeline_utils.run_process(["python", "script.py"])
+    captured = capfd.readouterr()
+    assert "python\nfd\nchild\n" in captured.out
+    assert "shell\n" in captured.err
+    assert (tmp_path / "out.txt").read_text() == "python\nfd\nchild\n"
+
+
+def test_run_process_without_script_runner(tmp_path, monkeypatch):
+    write_script(tmp_path, "script.py", "print('output')\n")
+    monkeypatch.chdir(tmp_path)
+
+    assert pipeline_utils.SCRIPT_RUNNER is None
+    pipeline_utils.run_process(["python", "script.py"], redirect_stdout_path=str(tmp_path / "out.txt"))
+    assert (tmp_path / "out.txt").read_text() == "output\n"
@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from workflow import CompileVCFFiles, incremental_build, pipeline_common, pipeline_utils, sharding
+
+WORKFLOW_DIR = os.path.dirname(os.path.abspath(__file__))
+UTILITIES_DIR = os.path.join(WORKFLOW_DIR, '..', 'utilities')
+
+
+def generate_md5sums(output_dir):
+    md5sums_path = os.path.join(output_dir, "md5sums.txt")
+    subprocess.run([sys.executable, "generateMD5Sums.py", "-i", output_dir, "-o", md5sums_path,
+                    "--keepListFilePath", os.path.join(WORKFLOW_DIR, "tarball_files_keep_list.txt"),
+                    "--discardListFilePath", os.path.join(WORKFLOW_DIR, "tarball_files_discard_list.txt")],
+                   cwd=UTILITIES_DIR, check=True)
+    return md5sums_path
+
+
+def write_output_file(output_dir, relative_path, content):
+    path = os.path.join(output_dir, relative_path)
+    pipeline_utils.create_path_if_nonexistent(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def test_previous_pseudonyms_args_from_release_archive(tmp_path):
+    output_dir = str(tmp_path / 'output')
+    files = {'release/artifacts/built.tsv': "Genomic_Coordinate_hg38\nchr13:g.1:A>C\n",
+             'release/artifacts/built.tsv.data_version.json': '{"data_version": {}, "input_digests": []}',
+             'release/artifacts/aggregated.tsv': "Genomic_Coordinate_hg38\nchr13:g.1:A>C\n"}
+    for path, content in files.items():
+        write_output_file(output_dir, path, content)
+
+    archive = str(tmp_path / 'release.tar.gz')
+    pipeline_utils.write_release_archive(generate_md5sums(output_dir), output_dir, archive)
+
+    extract_dir = tmp_path / 'extracted'
+    extract_dir.mkdir()
+    # reusing the previous release is opt in
+    cfg = pipeline_common.PipelineParams(previous_release_tar=archive)
+    assert CompileVCFFiles.previous_pseudonyms_args(cfg, str(extract_dir)) == []
+
+    cfg = pipeline_common.PipelineParams(previous_release_tar=archive, reuse_previous_pseudonyms=True)
+    args = CompileVCFFiles.previous_pseudonyms_args(cfg, str(extract_dir))
+
+    assert args[0::2] == ["--previous-output", "--previous-data-version"]
+    assert args[1].endswith(incremental_build.PREVIOUS_PSEUDONYMS_PATH)
+    assert args[3].endswith(incremental_build.PREVIOUS_PSEUDONYMS_DATA_VERSION_PATH)
+    with open(args[1]) as f:
+        assert f.read() == files['release/artifacts/built.tsv']
+
+
+def test_md5sums_with_shard_artifacts(tmp_path):
+    output_dir = str(tmp_path / 'output')
+    write_output_file(output_dir, 'release/artifacts/merged.tsv', "Source\n")
+    for shard in ['BRCA1', 'BRCA2']:
+        shard_dir = os.path.join('release/artifacts', sharding.SHARDS_DIR, shard)
+        write_output_file(output_dir, os.path.join(shard_dir, 'merged.tsv'), "Source\n")
+        write_output_file(output_dir, os.path.join(shard_dir, 'wrong_genome_coors', 'ClinVar_wrong_genome_coor.vcf'), "")
+
+    with open(generate_md5sums(output_dir)) as f:
+        assert [line.split()[-1] for line in f] == ['release/artifacts/merged.tsv']
+
+    write_output_file(output_dir, 'release/artifacts/unexpected.tsv', "")
+    with pytest.raises(subprocess.CalledProcessError):
+        generate_md5sums(output_dir)
@@ -0,0 +1,77 @@
+import pytest
+
+from data_merging import variant_merging
+from workflow import sharding
+
+HEADER = "Source\tChr\tPos\tRef\tAlt\n"
+
+
+def _write(path, content):
+    path.write_text(content)
+    return str(path)
+
+
+def test_concatenate_tsvs_sorted(tmp_path):
+    shard1 = _write(tmp_path / 'shard1.tsv', HEADER + "ClinVar\t17\t43044300\tA\tC\n")
+    shard2 = _write(tmp_path / 'shard2.tsv', HEADER + "ClinVar\t13\t32315500\tA\tC\nClinVar\t13\t32315500\tA\tAT\n")
+    out = tmp_path / 'merged.tsv'
+
+    assert sharding.concatenate_tsvs([shard1, shard2], str(out), sort_variants=True) == 3
+    # same order as the keys of the variants in variant_merging.write_new_tsv
+    assert out.read_text() == (HEADER +
+                               "ClinVar\t13\t32315500\tA\tAT\n"
+                               "ClinVar\t13\t32315500\tA\tC\n"
+                               "ClinVar\t17\t43044300\tA\tC\n")
+
+
+def test_concatenate_tsvs_sorted_like_unsharded(tmp_path):
+    columns = ["Source", "Gene_Symbol", "Genomic_Coordinate", "Chr", "Pos", "Ref", "Alt"]
+
+    def variants():
+        # keys of equivalent variants merged by string_comparison_merge don't start with the row's coordinates
+        return {"chr13:g.1:A>G,chr13:g.9:A>G": ["ClinVar", "BRCA2", "chr13:g.9:A>G", "13", 9, "A", "G"],
+                "chr13:g.5:A>C": ["LOVD", "BRCA2", "chr13:g.5:A>C", "13", 5, "A", "C"],
+                "chr17:g.2:C>T": ["LOVD", "BRCA1", "chr17:g.2:C>T", "17", 2, "C", "T"]}
+
+    unsharded = tmp_path / 'unsharded.tsv'
+    variant_merging.write_new_tsv(str(unsharded), columns, variants())
+
+    shards = []
+    for i, chr in enumerate(["17", "13"]):
+        shard = str(tmp_path / 'shard{}.tsv'.format(i))
+        variant_merging.write_new_tsv(shard, columns, {k: v for k, v in variants().items() if v[3] == chr})
+        shards.append(shard)
+    out = tmp_path / 'merged.tsv'
+
+    sharding.concatenate_tsvs(shards, str(out), sort_variants=True)
+    assert out.read_text() == unsharded.read_text()
+
+
+def test_concatenate_tsvs_drop_duplicates(tmp_path):
+    shard1 = _write(tmp_path / 'shard1.tsv', HEADER + "ENIGMA\t13\t1\tA\tC\nClinVar\t17\t2\tA\tC\n")
+    shard2 = _write(tmp_path / 'shard2.tsv', HEADER + "ENIGMA\t13\t1\tA\tC\nClinVar\t13\t3\tA\tC\n")
+    out = tmp_path / 'reports.tsv'
+
+    assert sharding.concatenate_tsvs([shard1, shard2], str(out), drop_duplicates=True) == 3
+    assert out.read_text() == HEADER + "ENIGMA\t13\t1\tA\tC\nClinVar\t17\t2\tA\tC\nClinVar\t13\t3\tA\tC\n"
+
+
+def test_concatenate_tsvs_different_headers(tmp_path):
+    shard1 = _write(tmp_path / 'shard1.tsv', HEADER)
+    shard2 = _write(tmp_path / 'shard2.tsv', "Source\n")
+
+    with pytest.raises(ValueError):
+        sharding.concatenate_tsvs([shard1, shard2], str(tmp_path / 'out.tsv'))
+
+
+def test_union_in_reference_order(tmp_path):
+    vcf_header = "##fileformat=VCFv4.0\n#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+    records = ["13\t%d\t.\tA\tC\t.\t.\tBX_ID=%d\n" % (i, i) for i in range(1, 5)]
+    ready = _write(tmp_path / 'ready.vcf', vcf_header + ''.join(records))
+    # a record outside of all genes is considered wrong by every shard
+    shard1 = _write(tmp_path / 'wrong1.vcf', vcf_header + records[3] + records[0])
+    shard2 = _write(tmp_path / 'wrong2.vcf', vcf_header + records[2] + records[3])
+    out = tmp_path / 'wrong.vcf'
+
+    assert sharding.union_in_reference_order([shard1, shard2], ready, str(out)) == 3
+    assert out.read_text() == vcf_header + records[0] + records[2] + records[3]